@@ -161,7 +161,8 @@ resource "aws_iam_role_policy" "lambda_policy" {
           "sqs:ReceiveMessage",
           "sqs:DeleteMessage",
           "sqs:GetQueueAttributes",
-          "sqs:SendMessage"
+          "sqs:SendMessage",
+          "sqs:ChangeMessageVisibility"
         ]
         Resource = [
           aws_sqs_queue.embedding_queue.arn,
@@ -215,6 +216,7 @@ resource "aws_lambda_function" "review_crawler_trigger" {
   timeout          = 300
   memory_size      = 512
   source_code_hash = data.archive_file.review_crawler_trigger_zip.output_base64sha256
+  layers           = [module.pipeline_common.layer_arn]
 
   environment {
     variables = {
@@ -378,7 +380,7 @@ resource "aws_lambda_function" "save_restaurant_metadata" {
   timeout          = 900
   memory_size      = 1024
   source_code_hash = data.archive_file.save_restaurant_metadata_zip.output_base64sha256
-  layers           = [aws_lambda_layer_version.db_layer.arn]
+  layers           = [aws_lambda_layer_version.db_layer.arn, module.pipeline_common.layer_arn]
 
   # VPC 설정 추가
   vpc_config {
@@ -394,6 +396,8 @@ resource "aws_lambda_function" "save_restaurant_metadata" {
       RESTAURANT_DB_USER         = var.restaurant_db_user
       RESTAURANT_DB_PASSWORD     = var.restaurant_db_password
       RESTAURANT_DB_NAME         = var.restaurant_db_name
+      # 이 크기(UTF-8 바이트) 이하의 벡터 payload는 outbox 메시지에 실어 save-vector의 S3 읽기를 생략
+      OUTBOX_INLINE_MAX_BYTES = "245760"
     }
   }
 
@@ -434,7 +438,7 @@ resource "aws_lambda_function" "outbox_polling" {
   timeout          = 300
   memory_size      = 512
   source_code_hash = data.archive_file.outbox_polling_zip.output_base64sha256
-  layers           = [aws_lambda_layer_version.db_layer.arn]
+  layers           = [aws_lambda_layer_version.db_layer.arn, module.pipeline_common.layer_arn]
 
   # VPC 설정 추가
   vpc_config {
@@ -481,7 +485,7 @@ resource "aws_lambda_function" "save_vector" {
   timeout                        = 900
   memory_size                    = 1024
   source_code_hash               = data.archive_file.save_vector_zip.output_base64sha256
-  layers                         = [aws_lambda_layer_version.db_layer.arn]
+  layers                         = [aws_lambda_layer_version.db_layer.arn, module.pipeline_common.layer_arn]
   reserved_concurrent_executions = 10
   # VPC 설정 추가
   vpc_config {
@@ -498,6 +502,9 @@ resource "aws_lambda_function" "save_vector" {
       RECOMMEND_DB_NAME          = var.recommend_db_name
       RECOMMEND_DB_USER          = var.recommend_db_user
       RECOMMEND_DB_PASSWORD      = var.recommend_db_password
+      # DB 지연/잠금 오류에 따라 호출당 처리 메시지 수를 batch_size 안에서 조절
+      BACKPRESSURE_TARGET_LATENCY_MS = "2000"
+      RECOMMEND_DB_LOCK_TIMEOUT_MS   = "5000"
     }
   }
 
@@ -511,8 +518,10 @@ resource "aws_lambda_function" "save_vector" {
 resource "aws_lambda_event_source_mapping" "sqs_save_vector_trigger" {
   event_source_arn = aws_sqs_queue.save_restaurant_vector_queue.arn
   function_name    = aws_lambda_function.save_vector.arn
-  batch_size       = 1 # 한 번에 하나씩 처리
+  batch_size       = 10 # 상한. 실제 처리 수는 함수 안의 backpressure가 DB 상태에 맞춰 줄임
   enabled          = true
+  # 처리하지 않고 돌려준 메시지만 다시 받음
+  function_response_types = ["ReportBatchItemFailures"]
 }
 
 # EventBridge Rule - 1시간마다 outbox 폴링
@@ -538,6 +547,110 @@ resource "aws_lambda_permission" "eventbridge_outbox_polling" {
   source_arn    = aws_cloudwatch_event_rule.outbox_polling_schedule.arn
 }
 
+# Recommend DB 유지보수 Lambda용 CloudWatch 로그 그룹
+resource "aws_cloudwatch_log_group" "recommend_db_maintenance_lambda_logs" {
+  name              = "/aws/lambda/data-pipeline-recommend-db-maintenance"
+  retention_in_days = 14
+}
+
+# Recommend DB 유지보수 Lambda용 아카이브 파일
+data "archive_file" "recommend_db_maintenance_zip" {
+  type        = "zip"
+  source_dir  = "${path.module}/recommend-db-maintenance"
+  output_path = "${path.module}/recommend-db-maintenance.zip"
+}
+
+# Recommend DB 유지보수 Lambda 함수 (리뷰 Bloom 필터 재구축, 벡터 인덱스 재생성/IVFFlat 재학습을 적재 경로 밖에서 실행)
+resource "aws_lambda_function" "recommend_db_maintenance" {
+  filename         = data.archive_file.recommend_db_maintenance_zip.output_path
+  function_name    = "data-pipeline-recommend-db-maintenance"
+  role             = aws_iam_role.lambda_role.arn
+  handler          = "lambda_function.handler"
+  runtime          = "python3.9"
+  timeout          = 900
+  memory_size      = 512
+  source_code_hash = data.archive_file.recommend_db_maintenance_zip.output_base64sha256
+  layers           = [aws_lambda_layer_version.db_layer.arn, module.pipeline_common.layer_arn]
+
+  # VPC 설정 추가
+  vpc_config {
+    subnet_ids         = var.private_subnet_ids
+    security_group_ids = [var.api_server_security_group_id]
+  }
+
+  environment {
+    variables = {
+      RECOMMEND_DB_HOST     = var.recommend_db_host
+      RECOMMEND_DB_PORT     = var.recommend_db_port
+      RECOMMEND_DB_NAME     = var.recommend_db_name
+      RECOMMEND_DB_USER     = var.recommend_db_user
+      RECOMMEND_DB_PASSWORD = var.recommend_db_password
+      # 같은 Recommend DB를 쓰는 파이프라인의 버킷을 쉼표로 나열 (Step Functions 경로가 다른 버킷이면 추가)
+      REVIEW_BLOOM_BUCKETS = var.S3_bucket_name
+    }
+  }
+
+  depends_on = [
+    aws_cloudwatch_log_group.recommend_db_maintenance_lambda_logs,
+    aws_iam_role_policy.lambda_policy
+  ]
+}
+
+# EventBridge Rule - 1시간마다 리뷰 Bloom 필터 재구축
+resource "aws_cloudwatch_event_rule" "review_bloom_refresh_schedule" {
+  name                = "review-bloom-refresh-schedule"
+  description         = "Rebuild review bloom filter every hour"
+  schedule_expression = "rate(1 hour)"
+}
+
+# EventBridge Target - 리뷰 Bloom 필터 재구축
+resource "aws_cloudwatch_event_target" "review_bloom_refresh_target" {
+  rule      = aws_cloudwatch_event_rule.review_bloom_refresh_schedule.name
+  target_id = "ReviewBloomRefreshLambda"
+  arn       = aws_lambda_function.recommend_db_maintenance.arn
+  input     = jsonencode({ tasks = ["review_bloom"] })
+}
+
+# EventBridge Rule - 10분마다 벡터 인덱스 확인
+# 대량 적재가 내려둔 인덱스는 다시 만들 때까지 조회가 순차 스캔이 되므로 짧은 주기로 확인
+# (할 일이 없으면 카탈로그 조회만 하고, 실행이 겹치면 advisory lock으로 건너뜀)
+resource "aws_cloudwatch_event_rule" "vector_index_maintenance_schedule" {
+  name                = "vector-index-maintenance-schedule"
+  description         = "Rebuild dropped vector indexes and retrain IVFFlat indexes"
+  schedule_expression = "rate(10 minutes)"
+}
+
+# EventBridge Target - 벡터 인덱스 재생성/재학습
+resource "aws_cloudwatch_event_target" "vector_index_maintenance_target" {
+  rule      = aws_cloudwatch_event_rule.vector_index_maintenance_schedule.name
+  target_id = "VectorIndexMaintenanceLambda"
+  arn       = aws_lambda_function.recommend_db_maintenance.arn
+  input     = jsonencode({ tasks = ["vector_index"] })
+}
+
+# EventBridge에서 Lambda 호출 권한
+resource "aws_lambda_permission" "eventbridge_review_bloom_refresh" {
+  statement_id  = "AllowEventBridgeInvokeReviewBloom"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.recommend_db_maintenance.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.review_bloom_refresh_schedule.arn
+}
+
+resource "aws_lambda_permission" "eventbridge_vector_index_maintenance" {
+  statement_id  = "AllowEventBridgeInvokeVectorIndex"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.recommend_db_maintenance.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.vector_index_maintenance_schedule.arn
+}
+
+# 파이프라인 공용 모듈 Lambda Layer
+module "pipeline_common" {
+  source     = "../pipeline-common"
+  layer_name = "data-pipeline-common-layer"
+}
+
 # Lambda Layer 생성 (pymysql 포함)
 resource "aws_lambda_layer_version" "db_layer" {
   filename            = "${path.module}/lambda-layer/lambda-layer.zip"
@@ -1,21 +1,25 @@
 """
 Outbox 테이블을 폴링하여 처리되지 않은 메시지를 SQS로 전송하는 Lambda 함수
 EventBridge에서 1시간마다 호출되어 실행
+inline_payload가 있는 행은 벡터 payload를 메시지에 함께 실어 보냄 (pipeline_common.outbox_payload)
 """
 import json
-import boto3
 import os
-import pymysql
 from datetime import datetime
+from pipeline_common.metrics import span
+from pipeline_common.aws_clients import get_client
+from pipeline_common.outbox_payload import build_outbox_message
 
-# AWS 클라이언트 초기화
-sqs_client = boto3.client("sqs", region_name='ap-northeast-2')
+# AWS 클라이언트는 처음 사용할 때 생성 (pipeline_common.aws_clients)
+AWS_REGION = "ap-northeast-2"
 
 # 환경변수
 OUTBOX_QUEUE_URL = os.environ.get("OUTBOX_QUEUE_URL")
 
 def get_restaurant_db_connection():
     """restaurant 데이터베이스 연결을 생성합니다. (MySQL)"""
+    import pymysql
+
     return pymysql.connect(
         host=os.environ.get("RESTAURANT_DB_HOST"),
         user=os.environ.get("RESTAURANT_DB_USER"),
@@ -36,7 +40,7 @@ def get_unprocessed_outbox_messages():
         
         # is_processed = 0인 메시지들을 조회
         select_query = """
-            SELECT id, restaurant_id, payload, created_at 
+            SELECT id, restaurant_id, payload, inline_payload, created_at 
             FROM outbox 
             WHERE is_processed = 0 
             ORDER BY created_at ASC
@@ -88,16 +92,14 @@ def mark_outbox_as_processed(message_id):
         if connection:
             connection.close()
 
-def send_to_outbox_queue(payload, restaurant_id):
-    """SQS 큐로 메시지를 전송합니다."""
+def send_to_outbox_queue(payload, restaurant_id, inline_payload=None):
+    """SQS 큐로 메시지를 전송합니다. inline_payload가 있으면 메시지에 함께 싣습니다."""
     try:
-        message_body = {
-            "s3Key": payload,
-            "restaurantId": restaurant_id        }
+        message_body = build_outbox_message(payload, restaurant_id, inline_payload)
         
-        response = sqs_client.send_message(
+        response = get_client("sqs", AWS_REGION).send_message(
             QueueUrl=OUTBOX_QUEUE_URL,
-            MessageBody=json.dumps(message_body)
+            MessageBody=message_body
         )
         
         print(f"Successfully sent message to outbox queue: {response['MessageId']}")
@@ -119,28 +121,34 @@ def handler(event, context):
     
     try:
         # 처리되지 않은 outbox 메시지 조회
-        unprocessed_messages = get_unprocessed_outbox_messages()
+        with span("db_read") as metric:
+            unprocessed_messages = get_unprocessed_outbox_messages()
+            metric.add_rows(len(unprocessed_messages))
         
-        for message in unprocessed_messages:
-            try:
-                message_id = message['id']
-                restaurant_id = message['restaurant_id']
-                payload = message['payload']
+        with span("sqs_publish") as metric:
+            for message in unprocessed_messages:
+                try:
+                    message_id = message['id']
+                    restaurant_id = message['restaurant_id']
+                    payload = message['payload']
+                    inline_payload = message.get('inline_payload')
                 
-                print(f"Processing outbox message: {message_id}, payload: {payload}")
+                    print(f"Processing outbox message: {message_id}, payload: {payload}, inline: {inline_payload is not None}")
                 
-                # SQS로 메시지 전송
-                if send_to_outbox_queue(payload, restaurant_id):
-                    # 전송 성공 시 outbox를 처리 완료로 표시
-                    mark_outbox_as_processed(message_id)
-                    processed_count += 1
-                else:
-                    error_count += 1
+                    # SQS로 메시지 전송
+                    if send_to_outbox_queue(payload, restaurant_id, inline_payload):
+                        # 전송 성공 시 outbox를 처리 완료로 표시
+                        mark_outbox_as_processed(message_id)
+                        processed_count += 1
+                    else:
+                        error_count += 1
                     
-            except Exception as e:
-                print(f"Error processing message {message.get('id', 'unknown')}: {str(e)}")
-                error_count += 1
-                continue
+                except Exception as e:
+                    print(f"Error processing message {message.get('id', 'unknown')}: {str(e)}")
+                    error_count += 1
+                    continue
+            metric.add_rows(processed_count)
+            metric.set_metric("Failed", error_count, "Count")
         
         print(f"Outbox polling completed. Processed: {processed_count}, Errors: {error_count}")
         
@@ -0,0 +1,104 @@
+"""
+Recommend DB 유지보수 Lambda 함수
+EventBridge 일정마다 이벤트의 tasks에 적힌 작업을 실행
+- review_bloom: crawling_review hash로 리뷰 Bloom 필터를 다시 만들어 업로드 (필터를 쓰는 유일한 곳, pipeline_common.review_bloom)
+- vector_index: 대량 적재가 내려둔 벡터 인덱스를 다시 만들고 IVFFlat 인덱스를 재학습
+  (적재 트랜잭션 밖에서 CREATE INDEX CONCURRENTLY, pipeline_common.vector_index)
+"""
+import json
+import os
+from pipeline_common.vector_index import maintain_vector_indexes
+from pipeline_common.review_bloom import refresh_review_bloom
+from pipeline_common.metrics import span
+from pipeline_common.aws_clients import get_client
+
+# AWS 클라이언트는 처음 사용할 때 생성 (pipeline_common.aws_clients)
+AWS_REGION = "ap-northeast-2"
+
+# 환경변수
+RECOMMEND_DB_HOST = os.environ.get("RECOMMEND_DB_HOST")
+RECOMMEND_DB_PORT = os.environ.get("RECOMMEND_DB_PORT", "3306")
+RECOMMEND_DB_NAME = os.environ.get("RECOMMEND_DB_NAME")
+RECOMMEND_DB_USER = os.environ.get("RECOMMEND_DB_USER")
+RECOMMEND_DB_PASSWORD = os.environ.get("RECOMMEND_DB_PASSWORD")
+# 리뷰 Bloom 필터를 둔 버킷 (쉼표로 구분, 같은 DB를 쓰는 파이프라인마다)
+REVIEW_BLOOM_BUCKETS = [
+    bucket.strip()
+    for bucket in os.environ.get("REVIEW_BLOOM_BUCKETS", os.environ.get("S3_BUCKET_NAME", "")).split(",")
+    if bucket.strip()
+]
+
+# 벡터 인덱스를 확인할 테이블
+VECTOR_TABLES = ("restaurant_vector", "crawling_review")
+DEFAULT_TASKS = ("review_bloom", "vector_index")
+
+def get_db_connection():
+    """PostgreSQL 데이터베이스 연결을 생성합니다."""
+    import psycopg2
+
+    try:
+        conn = psycopg2.connect(
+            host=RECOMMEND_DB_HOST,
+            port=int(RECOMMEND_DB_PORT),
+            database=RECOMMEND_DB_NAME,
+            user=RECOMMEND_DB_USER,
+            password=RECOMMEND_DB_PASSWORD,
+        )
+        return conn
+    except Exception as e:
+        print(f"Database connection error: {str(e)}")
+        raise e
+
+def refresh_review_blooms(conn):
+    """버킷마다 리뷰 Bloom 필터를 DB에서 다시 만들어 업로드하고 hash 수를 반환합니다."""
+    counts = {}
+    cursor = conn.cursor()
+    try:
+        for bucket in REVIEW_BLOOM_BUCKETS:
+            with span("bloom_refresh", bucket=bucket) as metric:
+                bloom = refresh_review_bloom(get_client("s3", AWS_REGION), bucket, cursor)
+                metric.add_rows(bloom.count)
+            counts[bucket] = bloom.count
+        # 읽기만 한 트랜잭션을 끝냄
+        conn.rollback()
+    finally:
+        cursor.close()
+    return counts
+
+def rebuild_vector_indexes(conn):
+    """테이블마다 내려둔 인덱스와 재학습이 필요한 IVFFlat 인덱스를 다시 만들고 리포트를 반환합니다."""
+    reports = []
+    for table in VECTOR_TABLES:
+        with span("index_rebuild", table=table) as metric:
+            table_reports = maintain_vector_indexes(conn, table)
+            metric.add_rows(len(table_reports))
+        reports.extend(table_reports)
+    return reports
+
+def handler(event, context):
+    """
+    EventBridge 일정마다 호출되어 유지보수 작업을 실행
+    Input: {"tasks": ["review_bloom", "vector_index"]}  (없으면 모두 실행)
+    """
+    tasks = (event or {}).get("tasks") or DEFAULT_TASKS
+    print(f"Starting recommend DB maintenance: {', '.join(tasks)}")
+
+    result = {}
+    conn = get_db_connection()
+    try:
+        if "review_bloom" in tasks:
+            result["reviewBloomCounts"] = refresh_review_blooms(conn)
+        if "vector_index" in tasks:
+            result["rebuiltIndexes"] = rebuild_vector_indexes(conn)
+    finally:
+        conn.close()
+
+    print(f"Recommend DB maintenance completed: {json.dumps(result)}")
+
+    return {
+        "statusCode": 200,
+        "body": json.dumps({
+            "message": "Recommend DB maintenance completed successfully",
+            **result
+        })
+    }
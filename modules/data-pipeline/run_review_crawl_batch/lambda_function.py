@@ -1,19 +1,17 @@
 import json
-import boto3
 import os
 from typing import List, Dict, Any
 import logging
 import time
 from urllib.parse import unquote_plus
+from pipeline_common.s3_reader import read_object
+from pipeline_common.metrics import span
+from pipeline_common.aws_clients import get_client
 
 # 로깅 설정
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-# AWS 클라이언트 초기화
-s3_client = boto3.client("s3")
-batch_client = boto3.client("batch")
-
 # 환경변수
 JOB_QUEUE = os.environ.get("BATCH_JOB_QUEUE", "fargate-spot-review-crawler-job-queue")
 JOB_DEFINITION = os.environ.get("BATCH_JOB_DEFINITION", "batch-review-job-definition")
@@ -46,9 +44,12 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             logger.info(f"Processing file: s3://{bucket_name}/{object_key}")
 
             # S3에서 파일 읽기
-            response = s3_client.get_object(Bucket=bucket_name, Key=object_key)
-            file_content = response["Body"].read().decode("utf-8")
-            data = json.loads(file_content)
+            with span("s3_read", s3Key=object_key) as metric:
+                file_content = read_object(get_client("s3"), bucket_name, object_key).decode("utf-8")
+                metric.add_bytes(len(file_content))
+            with span("json_parse") as metric:
+                data = json.loads(file_content)
+                metric.add_rows(len(data) if isinstance(data, list) else 1)
 
             logger.info(f"Successfully loaded JSON from {object_key}")
 
@@ -59,14 +60,16 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
 
             # 각 식당에 대해 작업 실행
             job_responses = []
-            for restaurant_info in restaurant_data_list:
-                job_response = submit_batch_job(
-                    restaurant_info=restaurant_info, 
-                    source_bucket=bucket_name, 
-                    source_key=object_key
-                )
-                if job_response:
-                    job_responses.append(job_response)
+            with span("batch_submit") as metric:
+                for restaurant_info in restaurant_data_list:
+                    job_response = submit_batch_job(
+                        restaurant_info=restaurant_info, 
+                        source_bucket=bucket_name, 
+                        source_key=object_key
+                    )
+                    if job_response:
+                        job_responses.append(job_response)
+                metric.add_rows(len(job_responses))
 
             logger.info(f"Submitted {len(job_responses)} batch jobs for {object_key}")
 
@@ -79,7 +82,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 }
             ),
         }
-    except s3_client.exceptions.NoSuchKey as e:
+    except get_client("s3").exceptions.NoSuchKey as e:
         logger.error(f"No such key: {object_key}")
     except Exception as e:
         logger.error(f"Lambda execution error: {str(e)}")
@@ -141,7 +144,7 @@ def submit_batch_job(
     # 메타데이터를 JSON 문자열로 변환하여 환경변수로 전달
     metadata_json = json.dumps(restaurant_info, ensure_ascii=False)
 
-    response = batch_client.submit_job(
+    response = get_client("batch").submit_job(
         jobName=job_name,
         jobQueue=JOB_QUEUE,
         jobDefinition=JOB_DEFINITION,
@@ -168,10 +171,8 @@ def process_large_file(
     """
     restaurant_data = []
 
-    response = s3_client.get_object(Bucket=bucket, Key=key)
-
     # 스트리밍 파싱 대신 일반 파싱 사용 (ijson 없이)
-    file_content = response["Body"].read().decode("utf-8")
+    file_content = read_object(get_client("s3"), bucket, key).decode("utf-8")
     data = json.loads(file_content)
 
     # 데이터가 리스트인 경우
@@ -1,16 +1,20 @@
 """
 식당 메타데이터를 DB에 저장하는 Lambda 함수
 SQS에서 S3 key를 받아서 S3에서 데이터를 조회한 후 식당 DB에 저장
+작은 벡터 payload는 outbox 행에 함께 실어 save-vector가 S3를 다시 읽지 않게 함 (pipeline_common.outbox_payload)
 """
 import json
-import boto3
 import os
-import pymysql
 from urllib.parse import unquote_plus
-import uuid
+from pipeline_common.geo_cell import is_valid_coordinate
+from pipeline_common.restaurant_identity import restaurant_id_for
+from pipeline_common.s3_reader import read_object
+from pipeline_common.outbox_payload import encode_inline_payload
+from pipeline_common.metrics import span
+from pipeline_common.aws_clients import get_client
 
-# AWS 클라이언트 초기화
-s3_client = boto3.client("s3", region_name='ap-northeast-2')
+# AWS 클라이언트는 처음 사용할 때 생성 (pipeline_common.aws_clients)
+AWS_REGION = "ap-northeast-2"
 
 # 환경변수
 S3_BUCKET_NAME = os.environ.get("S3_BUCKET_NAME")
@@ -18,6 +22,8 @@ EMBEDDING_BUCKET_DIRECTORY = os.environ.get("EMBEDDING_BUCKET_DIRECTORY")
 
 def get_restaurant_db_connection():
     """restaurant 데이터베이스 연결을 생성합니다. (MySQL)"""
+    import pymysql
+
     return pymysql.connect(
         host=os.environ.get("RESTAURANT_DB_HOST"),
         user=os.environ.get("RESTAURANT_DB_USER"),
@@ -27,69 +33,83 @@ def get_restaurant_db_connection():
         cursorclass=pymysql.cursors.DictCursor,
     )
 
-def save_restaurant_to_db(restaurant_data, s3_key):
-    """식당 데이터를 DB에 저장하고 outbox 테이블에도 함께 저장합니다."""
+def find_existing_outbox(cursor, restaurant_ids, s3_keys):
+    """
+    이미 outbox에 기록된 restaurant id와 S3 key를 각각 한 번의 IN 조회로 찾습니다.
+    restaurant 행이 있는지로 판단하지 않습니다. Step Functions 경로(save_restaurant_to_DB)도
+    같은 결정적 id로 restaurant 행을 만들기 때문에, 그쪽에서 먼저 저장된 식당을 건너뛰면 벡터가 저장되지 않습니다.
+    결정적 id 도입 전(uuid4)에 저장된 식당은 같은 S3 key의 outbox 행으로 걸러냅니다.
+    """
+    existing_ids = set()
+    existing_s3_keys = set()
+
+    if restaurant_ids:
+        placeholders = ", ".join(["%s"] * len(restaurant_ids))
+        cursor.execute(
+            f"SELECT restaurant_id FROM outbox WHERE restaurant_id IN ({placeholders})",
+            list(restaurant_ids),
+        )
+        existing_ids = {row["restaurant_id"] for row in cursor.fetchall()}
+
+    if s3_keys:
+        placeholders = ", ".join(["%s"] * len(s3_keys))
+        cursor.execute(
+            f"SELECT payload FROM outbox WHERE payload IN ({placeholders})", list(s3_keys)
+        )
+        existing_s3_keys = {row["payload"] for row in cursor.fetchall()}
+
+    return existing_ids, existing_s3_keys
+
+
+def save_restaurants_to_db(restaurants):
+    """
+    식당 데이터를 DB에 저장하고 outbox 테이블에도 함께 저장합니다.
+    restaurants: [(restaurant_metadata, s3_key, inline_payload), ...]
+    이미 outbox에 기록된 식당은 건너뛰어 하위 벡터 파이프라인 중복 실행을 막습니다.
+    restaurant 행만 있는 식당(Step Functions 경로에서 저장)은 INSERT IGNORE로 두고 outbox 행은 기록합니다.
+    """
     connection = None
     cursor = None
     saved_count = 0
+    skipped_count = 0
+    inlined_count = 0
 
     try:
         connection = get_restaurant_db_connection()
         cursor = connection.cursor()
 
-        # 각 restaurant마다 새로운 UUID 생성
-        restaurant_id = str(uuid.uuid4())
-
-        place_id = restaurant_data.get("placeId")
-        name = restaurant_data.get("name")
-        address = restaurant_data.get("address")
-        latitude = restaurant_data.get("latitude") or 0.0
-        longitude = restaurant_data.get("longitude") or 0.0
-        thumbnail = restaurant_data.get("thumbnail") or ""
-
-        # Restaurant DB에 저장 (MySQL)
-        restaurant_insert_query = """
-            INSERT INTO restaurant (
-                id, name, address, latitude, longitude, thumbnail, owner_id
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s)
-        """
-
-        cursor.execute(
-            restaurant_insert_query,
-            (
-                restaurant_id,
-                name,
-                address,
-                latitude,
-                longitude,
-                thumbnail,
-                1
-            ),
+        restaurant_ids = {restaurant_id_for(data["placeId"]) for data, _, _ in restaurants}
+        s3_keys = {s3_key for _, s3_key, _ in restaurants}
+        existing_ids, existing_s3_keys = find_existing_outbox(
+            cursor, restaurant_ids, s3_keys
         )
 
-        # Outbox 테이블에 S3 key 저장 (같은 트랜잭션)
-        outbox_payload = s3_key
-        
-        outbox_insert_query = """
-            INSERT INTO outbox (
-                restaurant_id, payload, is_processed
-            ) VALUES (%s, %s, %s)
-        """
-        
-        cursor.execute(
-            outbox_insert_query,
-            (
-                restaurant_id,
-                outbox_payload,
-                0  # is_processed = false
-            ),
-        )
+        for restaurant_data, s3_key, inline_payload in restaurants:
+            place_id = restaurant_data.get("placeId")
+            # placeId 기반 결정적 UUID (같은 메시지를 재처리해도 같은 id)
+            restaurant_id = restaurant_id_for(place_id)
 
-        saved_count += 1
-        print(f"Successfully saved restaurant {place_id} to database and outbox")
+            if restaurant_id in existing_ids or s3_key in existing_s3_keys:
+                print(f"Restaurant {place_id} already in outbox, skipping")
+                skipped_count += 1
+                continue
+            existing_ids.add(restaurant_id)
+            existing_s3_keys.add(s3_key)
 
-        # 변경사항 커밋
-        connection.commit()
+            try:
+                save_restaurant_to_db(
+                    cursor, restaurant_id, restaurant_data, s3_key, inline_payload
+                )
+                # 변경사항 커밋
+                connection.commit()
+                saved_count += 1
+                if inline_payload is not None:
+                    inlined_count += 1
+                print(f"Successfully saved restaurant {place_id} to database and outbox")
+            except Exception as e:
+                print(f"Database error: {str(e)}")
+                connection.rollback()
+                continue
 
     except Exception as e:
         print(f"Database error: {str(e)}")
@@ -103,7 +123,63 @@ def save_restaurant_to_db(restaurant_data, s3_key):
         if connection:
             connection.close()
 
-    return saved_count
+    return saved_count, skipped_count, inlined_count
+
+
+def save_restaurant_to_db(cursor, restaurant_id, restaurant_data, s3_key, inline_payload=None):
+    """
+    식당 한 건을 restaurant 테이블과 outbox 테이블에 같은 트랜잭션으로 저장합니다.
+    inline_payload가 있으면 outbox.inline_payload에 함께 저장하고, 없으면 NULL (save-vector가 S3에서 읽음)
+    """
+    place_id = restaurant_data.get("placeId")
+    name = restaurant_data.get("name")
+    address = restaurant_data.get("address")
+    latitude = restaurant_data.get("latitude") or 0.0
+    longitude = restaurant_data.get("longitude") or 0.0
+    thumbnail = restaurant_data.get("thumbnail") or ""
+
+    # 좌표가 없거나 0.0/0.0인 식당은 저장하되 경고를 남김 (추천 DB에서는 geohash NULL로 제외됨)
+    if not is_valid_coordinate(latitude, longitude):
+        print(f"Invalid location for restaurant {place_id}: ({latitude}, {longitude})")
+
+    # Restaurant DB에 저장 (MySQL). 다른 경로에서 같은 id로 이미 저장했으면 그대로 둠
+    restaurant_insert_query = """
+        INSERT IGNORE INTO restaurant (
+            id, name, address, latitude, longitude, thumbnail, owner_id
+        ) VALUES (%s, %s, %s, %s, %s, %s, %s)
+    """
+
+    cursor.execute(
+        restaurant_insert_query,
+        (
+            restaurant_id,
+            name,
+            address,
+            latitude,
+            longitude,
+            thumbnail,
+            1
+        ),
+    )
+
+    # Outbox 테이블에 S3 key와 작은 벡터 payload 저장 (같은 트랜잭션)
+    outbox_payload = s3_key
+    
+    outbox_insert_query = """
+        INSERT INTO outbox (
+            restaurant_id, payload, inline_payload, is_processed
+        ) VALUES (%s, %s, %s, %s)
+    """
+    
+    cursor.execute(
+        outbox_insert_query,
+        (
+            restaurant_id,
+            outbox_payload,
+            inline_payload,
+            0  # is_processed = false
+        ),
+    )
 
 def get_restaurant_data_from_s3(s3_key):
     """S3에서 식당 데이터를 읽어옵니다."""
@@ -111,8 +187,10 @@ def get_restaurant_data_from_s3(s3_key):
         key = f"{EMBEDDING_BUCKET_DIRECTORY}/{s3_key}"
         print(f"Reading from S3: {S3_BUCKET_NAME}/{key}")
         
-        response = s3_client.get_object(Bucket=S3_BUCKET_NAME, Key=key)
-        data = json.loads(response["Body"].read().decode("utf-8"))
+        with span("s3_read", s3Key=key) as metric:
+            body = read_object(get_client("s3", AWS_REGION), S3_BUCKET_NAME, key)
+            metric.add_bytes(len(body))
+        data = json.loads(body.decode("utf-8"))
         
         print(f"Successfully read data from S3: {s3_key}")
         return data
@@ -128,7 +206,7 @@ def handler(event, context):
     """
     print("Starting restaurant metadata save process...")
     
-    saved_count = 0
+    restaurants = []
     
     # SQS 메시지 처리
     for record in event.get('Records', []):
@@ -159,10 +237,9 @@ def handler(event, context):
             
             # placeId가 있는 경우만 DB에 저장
             if restaurant_metadata["placeId"]:
-                count = save_restaurant_to_db(restaurant_metadata, s3_key)
-                saved_count += count
-                
-                print(f"Successfully processed placeId: {restaurant_metadata['placeId']}")
+                # 임계값 이하면 save-vector가 쓸 필드만 outbox에 실어 보냄 (넘으면 None -> S3 key로만 전달)
+                inline_payload = encode_inline_payload(embedding_data)
+                restaurants.append((restaurant_metadata, s3_key, inline_payload))
             else:
                 print(f"No placeId found in data for key: {s3_key}")
                 
@@ -171,13 +248,26 @@ def handler(event, context):
             # 개별 레코드 오류는 로그만 남기고 계속 진행
             continue
     
-    print(f"Processing completed. Total saved: {saved_count}")
+    saved_count = 0
+    skipped_count = 0
+    if restaurants:
+        try:
+            with span("db_write") as metric:
+                saved_count, skipped_count, inlined_count = save_restaurants_to_db(restaurants)
+                metric.add_rows(saved_count)
+                metric.set_metric("Skipped", skipped_count, "Count")
+                metric.set_metric("InlinedPayloads", inlined_count, "Count")
+        except Exception as e:
+            print(f"Error saving restaurants: {str(e)}")
+    
+    print(f"Processing completed. Total saved: {saved_count}, skipped: {skipped_count}")
     
     return {
         "statusCode": 200,
         "body": json.dumps({
             "message": "Restaurant metadata save completed successfully",
-            "savedCount": saved_count
+            "savedCount": saved_count,
+            "skippedCount": skipped_count
         })
     }
 
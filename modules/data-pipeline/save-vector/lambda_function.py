@@ -1,16 +1,30 @@
 """
 Vector DB에 벡터 값을 저장하는 Lambda 함수
 Outbox 처리 큐에서 S3 key를 받아서 S3에서 임베딩 데이터를 읽고 Vector DB에 저장
+메시지에 벡터 payload가 실려 있으면 S3를 읽지 않고 그대로 사용 (pipeline_common.outbox_payload)
 """
 import json
-import boto3
 import os
-import psycopg2
+import time
 from datetime import datetime
 import hashlib
+from pipeline_common.vector_index import prepare_bulk_load
+from pipeline_common.geo_cell import geo_cell
+from pipeline_common.recommend_writer import RecommendWriter
+from pipeline_common.matryoshka import prefilter_columns
+from pipeline_common.s3_reader import read_object
+from pipeline_common.outbox_payload import inline_vector_payload
+from pipeline_common.metrics import emit, span
+from pipeline_common.db_backpressure import (
+    BackpressureController,
+    is_lock_error,
+    queue_url_from_arn,
+)
+from pipeline_common.review_bloom import get_review_bloom, find_existing_hashes, record_bloom_metrics
+from pipeline_common.aws_clients import get_client
 
-# AWS 클라이언트 초기화
-s3_client = boto3.client("s3", region_name='ap-northeast-2')
+# AWS 클라이언트는 처음 사용할 때 생성 (pipeline_common.aws_clients)
+AWS_REGION = "ap-northeast-2"
 
 # 환경변수
 S3_BUCKET_NAME = os.environ.get("S3_BUCKET_NAME")
@@ -20,16 +34,24 @@ RECOMMEND_DB_PORT = os.environ.get("RECOMMEND_DB_PORT", "3306")
 RECOMMEND_DB_NAME = os.environ.get("RECOMMEND_DB_NAME")
 RECOMMEND_DB_USER = os.environ.get("RECOMMEND_DB_USER")
 RECOMMEND_DB_PASSWORD = os.environ.get("RECOMMEND_DB_PASSWORD")
+# 잠금을 이 시간 이상 기다리면 오류로 끝내고 메시지를 돌려줌 (인덱스 유지보수 중 무한 대기 방지)
+RECOMMEND_DB_LOCK_TIMEOUT_MS = int(os.environ.get("RECOMMEND_DB_LOCK_TIMEOUT_MS", "5000"))
+
+# 실행 환경이 살아 있는 동안 처리 한도를 이어서 조절 (pipeline_common.db_backpressure)
+_backpressure = BackpressureController()
 
 def get_db_connection():
     """PostgreSQL 데이터베이스 연결을 생성합니다."""
+    import psycopg2
+
     try:
         conn = psycopg2.connect(
             host=RECOMMEND_DB_HOST,
             port=int(RECOMMEND_DB_PORT),
             database=RECOMMEND_DB_NAME,
             user=RECOMMEND_DB_USER,
-            password=RECOMMEND_DB_PASSWORD
+            password=RECOMMEND_DB_PASSWORD,
+            options=f"-c lock_timeout={RECOMMEND_DB_LOCK_TIMEOUT_MS}"
         )
         return conn
     except Exception as e:
@@ -42,8 +64,10 @@ def get_embedding_data_from_s3(s3_key):
         key = f"{EMBEDDING_BUCKET_DIRECTORY}/{s3_key}"
         print(f"Reading from S3: {S3_BUCKET_NAME}/{key}")
         
-        response = s3_client.get_object(Bucket=S3_BUCKET_NAME, Key=key)
-        data = json.loads(response["Body"].read().decode("utf-8"))
+        with span("s3_read", s3Key=key) as metric:
+            body = read_object(get_client("s3", AWS_REGION), S3_BUCKET_NAME, key)
+            metric.add_bytes(len(body))
+        data = json.loads(body.decode("utf-8"))
         
         print(f"Successfully read data from S3: {s3_key}")
         return data
@@ -52,12 +76,15 @@ def get_embedding_data_from_s3(s3_key):
         print(f"Error reading from S3: {str(e)}")
         raise e
 
-def save_vector_and_reviews_to_db(embedding_data, restaurant_id):
-    """Vector DB에 벡터 데이터와 리뷰를 하나의 트랜잭션으로 저장합니다."""
-    conn = None
+def save_vector_and_reviews_to_db(writer, embedding_data, restaurant_id):
+    """
+    Vector DB에 벡터 데이터와 리뷰를 하나의 트랜잭션으로 저장합니다.
+    연결은 호출하는 쪽이 메시지 묶음 동안 유지하므로 writer의 prepared statement가 메시지 사이에서 재사용됩니다.
+    반환: (저장 여부, Bloom 필터 통계)
+    """
+    conn = writer.connection
+    cursor = conn.cursor()
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
         
         place_id = embedding_data.get('placeId')
         summary = embedding_data.get('summary', '')
@@ -73,108 +100,213 @@ def save_vector_and_reviews_to_db(embedding_data, restaurant_id):
         latitude = embedding_data.get('latitude', 0.0)
         longitude = embedding_data.get('longitude', 0.0)
         
-        insert_vector_query = """
-        INSERT INTO restaurant_vector 
-        (id, place_id, companion_vector, food_vector, purpose_vector, vibe_vector, 
-         latitude, longitude, created_at)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-        ON CONFLICT (place_id) DO NOTHING
-        """
-        
-        cursor.execute(insert_vector_query, (
-            restaurant_id,
-            place_id,
-            companion_vector,
-            food_vector,
-            purpose_vector,
-            vibe_vector,
-            latitude,
-            longitude,
-            datetime.now()
-        ))
-        
-        if reviews:
-            # 리뷰 데이터를 hash 기준으로 정렬하여 저장
-            review_data = []
-            for review in reviews:
-                content = review.get('content', '')
-                review_hash = hashlib.sha256(content.encode()).hexdigest()
-                review_data.append((review_hash, content, place_id))
-            
-            insert_review_query = """
-            INSERT INTO crawling_review 
-            (hash, content, restaurant_id)
-            VALUES (%s, %s, %s)
-            ON CONFLICT (hash) DO NOTHING
-            """
-            cursor.executemany(insert_review_query, review_data)
+        # 좌표가 없거나 0.0/0.0이면 geohash를 NULL로 저장해 지리 필터에서 제외
+        geohash = geo_cell(latitude, longitude)
+        if geohash is None:
+            print(f"Invalid location for placeId {place_id}: ({latitude}, {longitude})")
+        
+        # 리뷰 hash를 먼저 계산하고 Bloom 필터로 이미 저장된 리뷰를 걸러냄 (읽기 전용, 갱신은 예약 작업)
+        review_data = []
+        for review in reviews:
+            content = review.get('content', '')
+            review_hash = hashlib.sha256(content.encode()).hexdigest()
+            review_data.append((review_hash, content, place_id))
+        
+        bloom = None
+        bloom_stats = {}
+        if review_data:
+            try:
+                bloom = get_review_bloom(get_client("s3", AWS_REGION), S3_BUCKET_NAME)
+            except Exception as e:
+                print(f"Review bloom filter unavailable, checking all hashes in DB: {str(e)}")
+            existing_hashes, bloom_stats = find_existing_hashes(
+                cursor, bloom, [review_hash for review_hash, _, _ in review_data]
+            )
+            review_data = [row for row in review_data if row[0] not in existing_hashes]
+        
+        # 대량 적재면 벡터 인덱스를 트랜잭션 밖에서 내려둠 (재생성은 recommend-db-maintenance 예약 작업)
+        vector_load_state = prepare_bulk_load(conn, "restaurant_vector", 1)
+        review_load_state = prepare_bulk_load(conn, "crawling_review", len(review_data))
+        
+        vector_row = {
+            "id": restaurant_id,
+            "place_id": place_id,
+            "companion_vector": companion_vector,
+            "food_vector": food_vector,
+            "purpose_vector": purpose_vector,
+            "vibe_vector": vibe_vector,
+            "latitude": latitude,
+            "longitude": longitude,
+            "geohash": geohash,
+            "created_at": datetime.now(),
+        }
+        # 2단계 검색의 후보 스캔용 128차원 사본
+        vector_row.update(prefilter_columns(vector_row))
+        writer.insert_restaurant_vectors([vector_row])
+        
+        if review_data:
+            # 리뷰 데이터를 hash 기준으로 정렬된 순서로 묶음 단위 저장
+            writer.insert_reviews([
+                {"hash": review_hash, "content": content, "restaurant_id": review_place_id}
+                for review_hash, content, review_place_id in review_data
+            ])
+        
+        dropped_indexes = vector_load_state["dropped_indexes"] + review_load_state["dropped_indexes"]
+        if dropped_indexes:
+            print(f"Vector indexes queued for rebuild: {', '.join(dropped_indexes)}")
         
         conn.commit()
         cursor.close()
-        conn.close()
         
-        return True
+        return True, bloom_stats
         
     except Exception as e:
-        if conn:
-            conn.rollback()
-            conn.close()
+        conn.rollback()
+        cursor.close()
         raise e
 
+def return_records(records, delay_seconds):
+    """
+    처리하지 않은 레코드를 batchItemFailures 항목으로 만들고, 가시성 제한 시간을 delay_seconds로 바꿔
+    큐 기본값(15분)이 아니라 재시도 대기 시간이 지나면 다시 받도록 합니다.
+    """
+    for record in records:
+        receipt_handle = record.get('receiptHandle')
+        queue_arn = record.get('eventSourceARN')
+        if not receipt_handle or not queue_arn:
+            continue
+        try:
+            get_client("sqs", AWS_REGION).change_message_visibility(
+                QueueUrl=queue_url_from_arn(queue_arn),
+                ReceiptHandle=receipt_handle,
+                VisibilityTimeout=delay_seconds,
+            )
+        except Exception as e:
+            print(f"Failed to change visibility for message {record.get('messageId')}: {str(e)}")
+    return [{"itemIdentifier": record['messageId']} for record in records]
+
 def handler(event, context):
     """
     Outbox 처리 큐에서 S3 key를 받아서 S3에서 임베딩 데이터를 조회한 후 Vector DB에 저장
-    Input: SQS 메시지 {"s3Key": "xxx_embedding.json"}
+    Input: SQS 메시지 {"s3Key": "xxx_embedding.json", "vectorPayload": {...}}  (vectorPayload는 작은 payload일 때만)
+    DB 트랜잭션 지연과 잠금 오류에 따라 처리 한도를 조절하고, 한도를 넘는 메시지는 batchItemFailures로 돌려줍니다.
+    잠금 오류가 아닌 오류(잘못된 메시지, S3/DB 오류)는 그 메시지만 batchItemFailures로 돌려주고 나머지는 계속 처리합니다.
+    호출 전체를 실패시키면 이미 커밋한 메시지까지 다시 받고, 메시지 하나가 같은 묶음의 나머지를 계속 막습니다.
+    (같은 메시지가 maxReceiveCount번 실패하면 DLQ로 이동)
     """
     print("Starting vector save process...")
     saved_count = 0
+    inline_count = 0
+    s3_count = 0
+    duplicate_skipped = 0
+    records = event.get('Records', [])
+    limit = _backpressure.batch_limit(len(records)) if records else 0
+    deferred = records[limit:]
+    failed = []
         
-    # SQS 메시지 처리
-    for record in event.get('Records', []):
-        message_body = json.loads(record['body'])
-        s3_key = message_body.get('s3Key')
-        restaurant_id = message_body.get('restaurantId')
-        print(f"Processing message for S3 key: {s3_key} restaurant_id: {restaurant_id}")
-        
-        if not s3_key:
-            print("No S3 key found in message, skipping...")
-            continue
-        
-        # S3에서 임베딩 데이터 읽기
-        embedding_data = get_embedding_data_from_s3(s3_key)
-        
-        # 트랜잭션 진입 이전에 리뷰 데이터를 hash 기준으로 미리 정렬
-        reviews = embedding_data.get('reviews', [])
-        if reviews:
-            review_data = []
-            for review in reviews:
-                content = review.get('content', '')
-                review_hash = hashlib.sha256(content.encode()).hexdigest()
-                review_data.append((review_hash, content, review))
+    # 메시지 묶음 동안 연결 하나를 유지 (트랜잭션은 메시지마다 따로)
+    writer = None
+    try:
+        # SQS 메시지 처리
+        for index, record in enumerate(records[:limit]):
+            try:
+                message_body = json.loads(record['body'])
+                s3_key = message_body.get('s3Key')
+                restaurant_id = message_body.get('restaurantId')
+                print(f"Processing message for S3 key: {s3_key} restaurant_id: {restaurant_id}")
             
-            # hash 기준으로 정렬
-            review_data.sort(key=lambda x: x[0])
+                if not s3_key:
+                    print("No S3 key found in message, skipping...")
+                    continue
             
-            # 정렬된 순서로 원본 리뷰 배열 재구성
-            sorted_reviews = [review for _, _, review in review_data]
-            embedding_data['reviews'] = sorted_reviews
-        
-        # Vector DB와 리뷰를 하나의 트랜잭션으로 저장
-        if save_vector_and_reviews_to_db(embedding_data, restaurant_id):
-            saved_count += 1
-            print(f"Successfully saved vector and reviews for placeId: {embedding_data.get('placeId', 'unknown')}")
-        else:
-            print(f"Failed to save vector and reviews for placeId: {embedding_data.get('placeId', 'unknown')}")
+                # 메시지에 실린 payload가 있으면 사용하고, 없으면(큰 payload) S3에서 임베딩 데이터 읽기
+                embedding_data = inline_vector_payload(message_body)
+                if embedding_data is not None:
+                    inline_count += 1
+                else:
+                    embedding_data = get_embedding_data_from_s3(s3_key)
+                    s3_count += 1
+            except Exception as e:
+                print(f"Failed to read message {record.get('messageId')}, returning it: {str(e)}")
+                failed.append(record)
+                continue
+        
+            # 트랜잭션 진입 이전에 리뷰 데이터를 hash 기준으로 미리 정렬
+            reviews = embedding_data.get('reviews', [])
+            if reviews:
+                review_data = []
+                for review in reviews:
+                    content = review.get('content', '')
+                    review_hash = hashlib.sha256(content.encode()).hexdigest()
+                    review_data.append((review_hash, content, review))
             
-    
-    print(f"Processing completed. Total saved: {saved_count}")
+                # hash 기준으로 정렬
+                review_data.sort(key=lambda x: x[0])
+            
+                # 정렬된 순서로 원본 리뷰 배열 재구성
+                sorted_reviews = [review for _, _, review in review_data]
+                embedding_data['reviews'] = sorted_reviews
+        
+            # Vector DB와 리뷰를 하나의 트랜잭션으로 저장
+            started_at = time.perf_counter()
+            try:
+                if writer is None:
+                    writer = RecommendWriter(get_db_connection(), "psycopg2")
+                with span("db_write", placeId=embedding_data.get('placeId')) as metric:
+                    saved, bloom_stats = save_vector_and_reviews_to_db(writer, embedding_data, restaurant_id)
+                    metric.add_rows(1 + len(embedding_data.get('reviews', [])) if saved else 0)
+                    record_bloom_metrics(metric, bloom_stats)
+                duplicate_skipped += bloom_stats.get("skipped", 0)
+            except Exception as e:
+                if not is_lock_error(e):
+                    # 이 메시지만 돌려주고 다음 메시지는 새 연결로 처리 (연결이 끊겼을 수도 있음)
+                    print(f"Failed to save message {record.get('messageId')}, returning it: {str(e)}")
+                    failed.append(record)
+                    if writer is not None:
+                        try:
+                            writer.connection.close()
+                        except Exception:
+                            pass
+                        writer = None
+                    continue
+                # 잠금 대기로 실패한 메시지부터 나머지는 돌려줌 (트랜잭션은 이미 롤백됨)
+                print(f"Recommend DB lock wait, returning {len(records) - index} messages: {str(e)}")
+                _backpressure.record(time.perf_counter() - started_at, lock_error=True)
+                deferred = records[index:]
+                break
+            slowed_down = _backpressure.record(time.perf_counter() - started_at)
+            if saved:
+                saved_count += 1
+                print(f"Successfully saved vector and reviews for placeId: {embedding_data.get('placeId', 'unknown')}")
+            else:
+                print(f"Failed to save vector and reviews for placeId: {embedding_data.get('placeId', 'unknown')}")
+            if slowed_down and index + 1 >= _backpressure.limit:
+                # DB가 느려져 한도가 줄었으면 남은 메시지는 돌려줌
+                deferred = records[index + 1:]
+                print(f"Recommend DB slowing down, returning {len(deferred)} messages")
+                break
+    finally:
+        if writer is not None:
+            writer.connection.close()
+
+    batch_item_failures = return_records(deferred, _backpressure.retry_delay()) if deferred else []
+    # 실패한 메시지는 가시성 제한 시간을 바꾸지 않고 큐 기본값이 지난 뒤 다시 받음
+    batch_item_failures += [{"itemIdentifier": record['messageId']} for record in failed]
+    emit("backpressure", {**_backpressure.snapshot(), "DeferredRecords": len(deferred), "FailedRecords": len(failed)})
+    emit("payload_source", {"InlinePayloads": inline_count, "S3Payloads": s3_count})
+    print(f"Processing completed. Total saved: {saved_count}, returned: {len(deferred)}, failed: {len(failed)}")
 
     return {
         "statusCode": 200,
         "body": json.dumps({
             "message": "Vector save completed successfully",
-            "savedCount": saved_count
-        })
+            "savedCount": saved_count,
+            "deferredCount": len(deferred),
+            "failedCount": len(failed),
+            "duplicateSkipped": duplicate_skipped
+        }),
+        # 이벤트 소스 매핑의 ReportBatchItemFailures로 이 메시지만 다시 받음
+        "batchItemFailures": batch_item_failures
     }
 
 if __name__ == "__main__":
@@ -0,0 +1,304 @@
+"""
+핸들러 콜드 스타트 벤치마크
+핸들러마다 새 Python 프로세스를 띄워 핸들러 모듈 import 시간과 첫 호출이 응답을 돌려줄 때까지의 시간(TTFB)을 잽니다.
+TTFB = import + 첫 호출이며, 같은 프로세스에서 한 번 더 호출한 warm 호출 시간도 함께 남깁니다.
+
+준비 단계에서 같은 트리의 핸들러로 파이프라인을 한 번 돌려 단계 직전 상태(S3 객체, DB, OpenAI 배치, SQS 메시지)를 pickle로 떠 둡니다.
+측정 프로세스는 그 상태를 복원한 뒤 대상 핸들러 하나만 import해 호출하므로 다른 핸들러가 모듈을 미리 올려 두지 않습니다.
+
+boto3와 DB 드라이버는 가짜 모듈이라 실제 로딩/생성 시간은 --boto3-import-ms, --client-create-ms 등으로 흉내 냅니다.
+기본값은 대략적인 Lambda(x86, 512MB) 수준이므로 실측값이 있으면 그 값으로 바꿔 주세요.
+로컬 스택이 json, re, hashlib, random 등 일부 표준 라이브러리를 먼저 로드하므로 그만큼은 import 시간에서 빠집니다.
+
+실행 예시
+python cold_start_benchmark.py --runs 5
+python cold_start_benchmark.py --baseline-ref HEAD~1
+python cold_start_benchmark.py --compare results/cold-start-20250101-120000-abc1234.json
+
+--baseline-ref를 주면 해당 커밋의 modules/를 임시 디렉터리에 풀어 같은 조건으로 측정하고 전후를 나란히 출력합니다.
+"""
+import argparse
+import contextlib
+import copy
+import io
+import json
+import os
+import pickle
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+from datetime import datetime
+
+from pipeline_benchmark import (
+    BENCHMARK_DIR,
+    HANDLER_ENVIRONMENT,
+    HANDLER_PATHS,
+    MODULES_DIR,
+    STAGES,
+    PipelineRun,
+    git_commit,
+    load_handler,
+    percentile,
+    run_stage,
+)
+from local_stack import LocalStack, NetworkModel
+
+METRICS = ("import_ms", "first_invoke_ms", "ttfb_ms", "warm_invoke_ms")
+
+
+def use_layer(modules_dir):
+    """측정 대상 트리의 pipeline_common이 먼저 잡히도록 sys.path 맨 앞에 둡니다."""
+    sys.path.insert(0, os.path.join(modules_dir, "pipeline-common", "layer", "python"))
+
+
+def import_delays(config):
+    return {
+        "boto3": config["boto3_import_ms"],
+        "pymysql": config["pymysql_import_ms"],
+        "pg8000": config["pg8000_import_ms"],
+        "psycopg2": config["psycopg2_import_ms"],
+    }
+
+
+def available_stages(modules_dir, stages=STAGES):
+    """트리에 핸들러가 있는 단계만 남깁니다. (기준 커밋에는 나중에 추가된 핸들러가 없을 수 있음)"""
+    return [stage for stage in stages if os.path.isdir(os.path.join(modules_dir, HANDLER_PATHS[stage]))]
+
+
+def prepare_snapshots(config, modules_dir, snapshot_dir):
+    """파이프라인을 한 번 돌리면서 단계마다 실행 직전 상태와 첫 이벤트를 저장합니다."""
+    use_layer(modules_dir)
+    os.environ.update(HANDLER_ENVIRONMENT)
+    stack = LocalStack(seed=config["seed"]).install()
+    output = open(os.devnull, "w")
+    try:
+        stages = available_stages(modules_dir)
+        handlers = {stage: load_handler(stage, modules_dir) for stage in stages}
+        run = PipelineRun(stack, handlers, argparse.Namespace(**config))
+        run.seed_inputs()
+        for stage in stages:
+            run.before(stage)
+            events, _ = run.events_for(stage)
+            with open(os.path.join(snapshot_dir, f"{stage}.pickle"), "wb") as f:
+                pickle.dump({"state": stack.snapshot(), "event": events[0]}, f)
+            run_stage(run, stage, output)
+    finally:
+        stack.uninstall()
+        output.close()
+
+
+def measure_stage(config, modules_dir, stage, snapshot_path):
+    """새 프로세스에서 핸들러 하나를 import하고 두 번 호출해 시간을 잽니다."""
+    use_layer(modules_dir)
+    with open(snapshot_path, "rb") as f:
+        snapshot = pickle.load(f)
+    os.environ.update(HANDLER_ENVIRONMENT)
+    os.environ["AWS_LAMBDA_FUNCTION_NAME"] = stage
+    stack = LocalStack(
+        s3_network=NetworkModel(config["s3_latency_ms"], config["s3_bandwidth_mbps"]),
+        db_network=NetworkModel(config["db_latency_ms"]),
+        api_network=NetworkModel(config["api_latency_ms"]),
+        seed=config["seed"],
+        import_delays_ms=import_delays(config),
+        client_delay_ms=config["client_create_ms"],
+    ).install()
+    stack.restore(snapshot["state"])
+
+    # Lambda처럼 핸들러 로그는 버리고 측정값만 마지막 줄로 출력
+    devnull = open(os.devnull, "w")
+    modules_before = len(sys.modules)
+    with contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+        started_at = time.perf_counter()
+        module = load_handler(stage, modules_dir)
+        imported_at = time.perf_counter()
+        modules_imported = len(sys.modules) - modules_before
+        clients_at_import = stack.clients_created
+        result = module.handler(copy.deepcopy(snapshot["event"]), None)
+        responded_at = time.perf_counter()
+
+        stack.restore(snapshot["state"])
+        warm_started_at = time.perf_counter()
+        module.handler(copy.deepcopy(snapshot["event"]), None)
+        warm_finished_at = time.perf_counter()
+
+    status = result.get("statusCode", 200) if isinstance(result, dict) else 200
+    return {
+        "import_ms": round((imported_at - started_at) * 1000, 3),
+        "first_invoke_ms": round((responded_at - imported_at) * 1000, 3),
+        "ttfb_ms": round((responded_at - started_at) * 1000, 3),
+        "warm_invoke_ms": round((warm_finished_at - warm_started_at) * 1000, 3),
+        "modules_imported": modules_imported,
+        "clients_at_import": clients_at_import,
+        "status": status,
+    }
+
+
+def run_child(mode, config, modules_dir, *extra):
+    command = [
+        sys.executable, os.path.abspath(__file__), mode, *extra,
+        "--modules-dir", modules_dir, "--config", json.dumps(config),
+    ]
+    completed = subprocess.run(command, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"{mode} {' '.join(extra)} failed:\n{completed.stderr[-2000:]}")
+    return completed.stdout
+
+
+def benchmark_tree(config, modules_dir, stages, runs, label):
+    """트리 하나에 대해 스냅샷을 만들고 단계별로 runs번 콜드 스타트를 잽니다."""
+    with tempfile.TemporaryDirectory(prefix="cold-start-") as snapshot_dir:
+        run_child("--prepare", config, modules_dir, snapshot_dir)
+        summaries = []
+        for stage in available_stages(modules_dir, stages):
+            samples = []
+            for _ in range(runs):
+                output = run_child(
+                    "--measure", config, modules_dir, stage,
+                    "--snapshot", os.path.join(snapshot_dir, f"{stage}.pickle"),
+                )
+                samples.append(json.loads(output.strip().splitlines()[-1]))
+            summary = {"stage": stage}
+            for metric in METRICS:
+                summary[metric] = round(percentile([sample[metric] for sample in samples], 50), 3)
+            summary["modules_imported"] = samples[0]["modules_imported"]
+            summary["clients_at_import"] = samples[0]["clients_at_import"]
+            summary["errors"] = sum(1 for sample in samples if sample["status"] != 200)
+            summaries.append(summary)
+            print(f"[{label}] {stage} done", file=sys.stderr)
+    return summaries
+
+
+def export_tree(ref, destination):
+    """git ref의 modules/ 디렉터리를 destination 아래에 풀고 그 경로를 반환합니다."""
+    root = subprocess.check_output(
+        ["git", "rev-parse", "--show-toplevel"], cwd=MODULES_DIR
+    ).decode().strip()
+    relative = os.path.relpath(MODULES_DIR, root)
+    archive = subprocess.check_output(["git", "archive", ref, relative], cwd=root)
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(destination)
+    return os.path.join(destination, relative)
+
+
+def print_stages(stages):
+    print(f"{'stage':28} {'import ms':>10} {'1st call ms':>12} {'TTFB ms':>10} {'warm ms':>10} {'modules':>8}")
+    for stage in stages:
+        print(
+            f"{stage['stage']:28} {stage['import_ms']:>10.1f} {stage['first_invoke_ms']:>12.1f} "
+            f"{stage['ttfb_ms']:>10.1f} {stage['warm_invoke_ms']:>10.1f} {stage['modules_imported']:>8}"
+        )
+
+
+def compare(baseline_stages, current_stages, label, threshold):
+    """단계별 import 시간과 TTFB 전후를 출력하고 TTFB 회귀 단계 목록을 반환합니다."""
+    baseline = {stage["stage"]: stage for stage in baseline_stages}
+    regressions = []
+    print(f"\nCompared with {label}")
+    print(f"{'stage':28} {'import before':>14} {'import after':>13} {'TTFB before':>12} {'TTFB after':>11} {'change':>8}")
+    for stage in current_stages:
+        before = baseline.get(stage["stage"])
+        if not before or not before["ttfb_ms"]:
+            continue
+        change = stage["ttfb_ms"] / before["ttfb_ms"] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(stage["stage"])
+        print(
+            f"{stage['stage']:28} {before['import_ms']:>14.1f} {stage['import_ms']:>13.1f} "
+            f"{before['ttfb_ms']:>12.1f} {stage['ttfb_ms']:>11.1f} {change * 100:>+7.1f}%{flag}"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="핸들러 콜드 스타트 벤치마크")
+    parser.add_argument("--runs", type=int, default=5, help="단계별 콜드 스타트 측정 횟수 (중앙값 사용)")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, help="측정할 단계 (기본: 전체)")
+    parser.add_argument("--restaurants", type=int, default=20)
+    parser.add_argument("--reviews-per-restaurant", type=int, default=5)
+    parser.add_argument("--dimension", type=int, default=256, help="임베딩 차원")
+    parser.add_argument("--sqs-batch-size", type=int, default=10)
+    parser.add_argument("--boto3-import-ms", type=float, default=150.0)
+    parser.add_argument("--client-create-ms", type=float, default=40.0, help="boto3 client 하나 생성 시간")
+    parser.add_argument("--pymysql-import-ms", type=float, default=25.0)
+    parser.add_argument("--pg8000-import-ms", type=float, default=35.0)
+    parser.add_argument("--psycopg2-import-ms", type=float, default=20.0)
+    parser.add_argument("--s3-latency-ms", type=float, default=15.0)
+    parser.add_argument("--s3-bandwidth-mbps", type=float, default=400.0)
+    parser.add_argument("--db-latency-ms", type=float, default=1.0)
+    parser.add_argument("--api-latency-ms", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--baseline-ref", help="같은 조건으로 함께 측정할 이전 git ref (예: HEAD~1)")
+    parser.add_argument("--output-dir", default=os.path.join(BENCHMARK_DIR, "results"))
+    parser.add_argument("--compare", help="비교할 이전 콜드 스타트 결과 JSON 경로")
+    parser.add_argument("--regression-threshold", type=float, default=0.15,
+                        help="TTFB 증가율이 이 값을 넘으면 회귀로 판단")
+    # 내부용: 준비/측정 자식 프로세스
+    parser.add_argument("--prepare", metavar="SNAPSHOT_DIR", help=argparse.SUPPRESS)
+    parser.add_argument("--measure", metavar="STAGE", help=argparse.SUPPRESS)
+    parser.add_argument("--snapshot", help=argparse.SUPPRESS)
+    parser.add_argument("--modules-dir", default=MODULES_DIR, help=argparse.SUPPRESS)
+    parser.add_argument("--config", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.prepare:
+        prepare_snapshots(json.loads(args.config), args.modules_dir, args.prepare)
+        return
+    if args.measure:
+        result = measure_stage(json.loads(args.config), args.modules_dir, args.measure, args.snapshot)
+        print(json.dumps(result))
+        return
+
+    config = {
+        key: value for key, value in vars(args).items()
+        if key not in ("runs", "stages", "baseline_ref", "output_dir", "compare",
+                       "regression_threshold", "prepare", "measure", "snapshot",
+                       "modules_dir", "config")
+    }
+    stages = args.stages or STAGES
+    result = {
+        "createdAt": datetime.now().isoformat(timespec="seconds"),
+        "gitCommit": git_commit(),
+        "python": sys.version.split()[0],
+        "config": {**config, "runs": args.runs},
+        "stages": benchmark_tree(config, MODULES_DIR, stages, args.runs, "current"),
+    }
+    if args.baseline_ref:
+        with tempfile.TemporaryDirectory(prefix="cold-start-tree-") as tree_dir:
+            baseline_dir = export_tree(args.baseline_ref, tree_dir)
+            result["baseline"] = {
+                "ref": args.baseline_ref,
+                "stages": benchmark_tree(config, baseline_dir, stages, args.runs, args.baseline_ref),
+            }
+
+    print_stages(result["stages"])
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    filename = (
+        f"cold-start-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{result['gitCommit'] or 'nogit'}.json"
+    )
+    output_path = os.path.join(args.output_dir, filename)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\nSaved results to {output_path}")
+
+    regressions = []
+    if args.baseline_ref:
+        regressions += compare(
+            result["baseline"]["stages"], result["stages"], args.baseline_ref, args.regression_threshold
+        )
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        label = f"{baseline.get('gitCommit')} ({baseline.get('createdAt')})"
+        regressions += compare(baseline["stages"], result["stages"], label, args.regression_threshold)
+    if regressions:
+        print(f"Regressions over {args.regression_threshold:.0%}: {', '.join(sorted(set(regressions)))}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,781 @@
+"""
+파이프라인 핸들러 오프라인 실행용 로컬 스택
+AWS(S3/SQS/Batch), Restaurant DB(MySQL), Recommend DB(PostgreSQL), OpenAI API를 프로세스 안의 가짜 구현으로 대체합니다.
+
+- boto3, pymysql, pg8000, psycopg2 import를 sys.meta_path finder로 가로채 가짜 모듈을 돌려주므로
+  핸들러 모듈보다 먼저 install()을 호출해야 합니다. 핸들러가 함수 안에서 늦게 import해도 가짜 모듈이 잡힙니다.
+  import_delays_ms / client_delay_ms를 주면 실제 라이브러리 로딩과 client 생성 시간을 흉내 냅니다. (콜드 스타트 측정용)
+- OpenAI 호출은 urllib.request.urlopen을 바꿔치기해 업로드된 배치 입력으로 결과 파일을 생성합니다.
+  urllib.request가 아직 import되지 않았으면 import되는 시점에 바꿔치기해 핸들러의 import 비용을 가리지 않습니다.
+- 네트워크 비용은 요청당 지연(latency)과 대역폭으로 흉내 내어 청크/병렬화 효과가 수치에 드러나게 합니다.
+
+가짜 DB는 핸들러가 실제로 쓰는 쿼리 형태(INSERT ... VALUES, = ANY(%s), IN (...), COUNT(*) 등)만 해석합니다.
+"""
+import copy
+import hashlib
+import importlib.abc
+import importlib.machinery
+import importlib.util
+import io
+import json
+import random
+import re
+import sys
+import threading
+import time
+import types
+
+# 테이블별 중복 판단 키 (ON CONFLICT / INSERT IGNORE / UNIQUE 제약)
+UNIQUE_KEYS = {
+    "restaurant": "id",
+    "restaurant_vector": "place_id",
+    "crawling_review": "hash",
+}
+FACETS = ("companion", "food", "purpose", "vibe")
+
+
+def new_id():
+    """uuid4 hex와 같은 모양의 무작위 ID (uuid 모듈을 미리 로드하지 않기 위해 직접 생성)"""
+    return f"{random.getrandbits(128):032x}"
+
+
+class LocalClientError(Exception):
+    """botocore ClientError와 같은 response 구조를 갖는 예외"""
+
+    def __init__(self, code, message=""):
+        super().__init__(f"An error occurred ({code}): {message or code}")
+        self.response = {"Error": {"Code": code, "Message": message or code}}
+
+
+class NetworkModel:
+    """요청당 지연과 전송 대역폭을 sleep으로 흉내 냅니다."""
+
+    def __init__(self, latency_ms=0.0, bandwidth_mbps=0.0):
+        self.latency_s = latency_ms / 1000.0
+        self.bytes_per_s = bandwidth_mbps * 1024 * 1024 / 8 if bandwidth_mbps else 0.0
+
+    def wait(self, size=0):
+        delay = self.latency_s
+        if self.bytes_per_s and size:
+            delay += size / self.bytes_per_s
+        if delay > 0:
+            time.sleep(delay)
+
+
+class LocalS3:
+    def __init__(self, network):
+        self.network = network
+        self.objects = {}
+        self.request_count = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self._lock = threading.Lock()
+        self.exceptions = types.SimpleNamespace(
+            NoSuchKey=type("NoSuchKey", (LocalClientError,), {}),
+            ClientError=LocalClientError,
+        )
+
+    def _get(self, bucket, key):
+        entry = self.objects.get((bucket, key))
+        if entry is None:
+            raise self.exceptions.NoSuchKey("NoSuchKey", f"{bucket}/{key}")
+        return entry
+
+    def _count(self, bytes_out=0, bytes_in=0):
+        with self._lock:
+            self.request_count += 1
+            self.bytes_out += bytes_out
+            self.bytes_in += bytes_in
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        if isinstance(Body, str):
+            Body = Body.encode("utf-8")
+        elif not isinstance(Body, (bytes, bytearray)):
+            Body = Body.read()
+        etag = '"' + hashlib.md5(Body).hexdigest() + '"'
+        self.network.wait(len(Body))
+        self._count(bytes_in=len(Body))
+        self.objects[(Bucket, Key)] = {"body": bytes(Body), "etag": etag, "meta": kwargs}
+        return {"ETag": etag}
+
+    def head_object(self, Bucket, Key, **kwargs):
+        self.network.wait()
+        self._count()
+        entry = self.objects.get((Bucket, Key))
+        if entry is None:
+            raise LocalClientError("404", "Not Found")
+        return {
+            "ContentLength": len(entry["body"]),
+            "ETag": entry["etag"],
+            "ContentType": entry["meta"].get("ContentType"),
+            "ContentEncoding": entry["meta"].get("ContentEncoding"),
+        }
+
+    def get_object(self, Bucket, Key, Range=None, IfMatch=None, **kwargs):
+        entry = self._get(Bucket, Key)
+        if IfMatch and IfMatch != entry["etag"]:
+            raise LocalClientError("PreconditionFailed")
+        body = entry["body"]
+        response = {
+            "ETag": entry["etag"],
+            "ContentType": entry["meta"].get("ContentType"),
+            "ContentEncoding": entry["meta"].get("ContentEncoding"),
+        }
+        if Range:
+            start, end = (int(v) for v in re.match(r"bytes=(\d+)-(\d+)", Range).groups())
+            if start >= len(body):
+                raise LocalClientError("InvalidRange")
+            end = min(end, len(body) - 1)
+            response["ContentRange"] = f"bytes {start}-{end}/{len(body)}"
+            body = body[start : end + 1]
+        self.network.wait(len(body))
+        self._count(bytes_out=len(body))
+        response["ContentLength"] = len(body)
+        response["Body"] = io.BytesIO(body)
+        return response
+
+    def list_objects_v2(self, Bucket, Prefix="", **kwargs):
+        self.network.wait()
+        self._count()
+        contents = [
+            {"Key": key, "Size": len(entry["body"])}
+            for (bucket, key), entry in sorted(self.objects.items())
+            if bucket == Bucket and key.startswith(Prefix)
+        ]
+        return {"Contents": contents, "KeyCount": len(contents), "IsTruncated": False}
+
+
+class LocalSQS:
+    def __init__(self, network):
+        self.network = network
+        self.messages = []
+        self.request_count = 0
+
+    def send_message(self, QueueUrl, MessageBody, **kwargs):
+        self.network.wait(len(MessageBody))
+        self.request_count += 1
+        message_id = new_id()
+        self.messages.append({"QueueUrl": QueueUrl, "MessageId": message_id, "Body": MessageBody})
+        return {"MessageId": message_id}
+
+    def send_message_batch(self, QueueUrl, Entries, **kwargs):
+        self.network.wait(sum(len(entry["MessageBody"]) for entry in Entries))
+        self.request_count += 1
+        successful = []
+        for entry in Entries:
+            message_id = new_id()
+            self.messages.append(
+                {"QueueUrl": QueueUrl, "MessageId": message_id, "Body": entry["MessageBody"]}
+            )
+            successful.append({"Id": entry["Id"], "MessageId": message_id})
+        return {"Successful": successful, "Failed": []}
+
+    def change_message_visibility(self, **kwargs):
+        self.network.wait()
+        self.request_count += 1
+        return {}
+
+
+class LocalBatch:
+    def __init__(self, network):
+        self.network = network
+        self.jobs = []
+
+    def submit_job(self, jobName, **kwargs):
+        self.network.wait()
+        job_id = new_id()
+        self.jobs.append({"jobName": jobName, "jobId": job_id, **kwargs})
+        return {"jobName": jobName, "jobId": job_id}
+
+
+class LocalDatabase:
+    """테이블별 행 목록과 고유 키 인덱스만 유지하는 인메모리 DB"""
+
+    def __init__(self, name, network):
+        self.name = name
+        self.network = network
+        self.tables = {}
+        self.statement_count = 0
+        # 서버가 SQL을 파싱/플랜한 횟수 (prepared statement 재사용이면 늘지 않음)
+        self.parse_count = 0
+        self.commit_count = 0
+        self._lock = threading.Lock()
+
+    def table(self, name):
+        if name not in self.tables:
+            self.tables[name] = {"rows": [], "unique": {}, "next_id": 1}
+        return self.tables[name]
+
+    def insert(self, table_name, columns, values, ignore_conflict):
+        table = self.table(table_name)
+        unique_key = UNIQUE_KEYS.get(table_name)
+        row = dict(zip(columns, values))
+        if "id" not in row:
+            row["id"] = table["next_id"]
+        table["next_id"] += 1
+
+        if unique_key and row.get(unique_key) is not None:
+            if row[unique_key] in table["unique"]:
+                if ignore_conflict:
+                    return 0
+                raise LocalClientError("IntegrityError", f"duplicate {table_name}.{unique_key}")
+            table["unique"][row[unique_key]] = row
+        table["rows"].append(row)
+        return 1
+
+
+class LocalCursor:
+    INSERT_PATTERN = re.compile(
+        r"INSERT\s+(IGNORE\s+)?INTO\s+(\w+)\s*\(([^)]*)\)\s*VALUES", re.IGNORECASE
+    )
+    SELECT_ANY_PATTERN = re.compile(
+        r"SELECT\s+(.+?)\s+FROM\s+(\w+)\s+WHERE\s+(\w+)\s*=\s*ANY\(", re.IGNORECASE | re.DOTALL
+    )
+    SELECT_IN_PATTERN = re.compile(
+        r"SELECT\s+(.+?)\s+FROM\s+(\w+)\s+WHERE\s+(\w+)\s+IN\s*\(", re.IGNORECASE | re.DOTALL
+    )
+    COUNT_PATTERN = re.compile(r"SELECT\s+COUNT\(\*\)\s+FROM\s+\"?(\w+)\"?", re.IGNORECASE)
+    PREPARE_PATTERN = re.compile(r"PREPARE\s+(\w+)(?:\s*\([^)]*\))?\s+AS\s+(.+)", re.IGNORECASE | re.DOTALL)
+    EXECUTE_PATTERN = re.compile(r"EXECUTE\s+(\w+)", re.IGNORECASE)
+
+    def __init__(self, connection, dict_rows=False):
+        self.connection = connection
+        self.database = connection.database
+        self.dict_rows = dict_rows
+        self.rowcount = -1
+        self._results = []
+
+    def _set_rows(self, columns, rows):
+        if self.dict_rows:
+            self._results = [{column: row.get(column) for column in columns} for row in rows]
+        else:
+            self._results = [tuple(row.get(column) for column in columns) for row in rows]
+
+    def execute(self, query, params=None):
+        params = list(params or [])
+        size = len(query) + sum(len(str(value)) for value in params)
+        self.database.network.wait(size)
+        query = " ".join(query.split())
+        with self.database._lock:
+            self.database.statement_count += 1
+            self._count_parse(query)
+            self._execute(query, params)
+
+    def executemany(self, query, param_list):
+        for params in param_list:
+            self.execute(query, params)
+
+    def _count_parse(self, query):
+        """
+        서버 파싱 횟수를 흉내 냅니다.
+        두 드라이버 모두 cursor.execute()는 호출마다 문장을 파싱하고, PREPARE한 문장의 EXECUTE만 파싱 없이 실행합니다.
+        """
+        if self.EXECUTE_PATTERN.match(query):
+            return
+        self.database.parse_count += 1
+
+    def _execute(self, query, params):
+        self._results = []
+        self.rowcount = 0
+        upper = query.upper()
+
+        match = self.PREPARE_PATTERN.match(query)
+        if match:
+            self.connection.prepared[match.group(1).lower()] = match.group(2)
+            return
+        match = self.EXECUTE_PATTERN.match(query)
+        if match:
+            # $n 자리표시자를 %s로 바꾸고 값도 그 순서로 맞춤
+            prepared = self.connection.prepared[match.group(1).lower()]
+            order = [int(index) - 1 for index in re.findall(r"\$(\d+)", prepared)]
+            self._execute(re.sub(r"\$\d+", "%s", prepared), [params[index] for index in order])
+            return
+        if "PG_PREPARED_STATEMENTS" in upper:
+            name = str(params[0]).lower() if params else ""
+            self._results = [(1,)] if name in self.connection.prepared else []
+            return
+
+        match = self.INSERT_PATTERN.search(query)
+        if match:
+            table_name = match.group(2)
+            columns = [column.strip() for column in match.group(3).split(",")]
+            ignore_conflict = bool(match.group(1)) or "ON CONFLICT" in upper
+            for offset in range(0, len(params), len(columns)):
+                self.rowcount += self.database.insert(
+                    table_name, columns, params[offset : offset + len(columns)], ignore_conflict
+                )
+            return
+
+        if upper.startswith("UPDATE OUTBOX SET IS_PROCESSED = 1"):
+            ids = set(params)
+            for row in self.database.table("outbox")["rows"]:
+                if row["id"] in ids:
+                    row["is_processed"] = 1
+                    self.rowcount += 1
+            return
+
+        match = self.SELECT_ANY_PATTERN.search(query) or self.SELECT_IN_PATTERN.search(query)
+        if match:
+            columns = [column.strip() for column in match.group(1).split(",")]
+            table = self.database.table(match.group(2))
+            key_column = match.group(3)
+            keys = set(params[0]) if "ANY(" in upper else set(params)
+            if key_column == UNIQUE_KEYS.get(match.group(2)):
+                rows = [table["unique"][key] for key in keys if key in table["unique"]]
+            else:
+                rows = [row for row in table["rows"] if row.get(key_column) in keys]
+            self._set_rows(columns, rows)
+            return
+
+        match = self.COUNT_PATTERN.search(query)
+        if match:
+            self._results = [(len(self.database.table(match.group(1))["rows"]),)]
+            return
+
+        if "FROM OUTBOX" in upper and "IS_PROCESSED = 0" in upper:
+            rows = [row for row in self.database.table("outbox")["rows"] if not row.get("is_processed")]
+            columns = re.search(r"SELECT\s+(.*?)\s+FROM", query, re.S | re.I).group(1)
+            self._set_rows([column.strip() for column in columns.split(",")], rows)
+            return
+
+        if "SELECT HASH FROM CRAWLING_REVIEW" in upper:
+            self._results = [(row["hash"],) for row in self.database.table("crawling_review")["rows"]]
+            return
+        if "RELTUPLES" in upper:
+            table_name = str(params[0]) if params else ""
+            self._results = [(len(self.database.table(table_name)["rows"]),)]
+            return
+        if "PG_TRY_ADVISORY" in upper:
+            self._results = [(True,)]
+            return
+        if "SET_CONFIG" in upper:
+            self._results = [(params[0] if params else "",)]
+            return
+        if "PG_RELATION_SIZE" in upper:
+            self._results = [(0,)]
+            return
+        # pg_indexes 조회 등 나머지 쿼리는 빈 결과 (가짜 DB에는 벡터 인덱스가 없음)
+
+    def fetchone(self):
+        return self._results.pop(0) if self._results else None
+
+    def fetchmany(self, size=1):
+        rows, self._results = self._results[:size], self._results[size:]
+        return rows
+
+    def fetchall(self):
+        rows, self._results = self._results, []
+        return rows
+
+    def close(self):
+        pass
+
+
+class LocalConnection:
+    def __init__(self, database, dict_rows=False, driver=None):
+        self.database = database
+        self.dict_rows = dict_rows
+        self.driver = driver
+        self.autocommit = False
+        # 연결(세션) 단위 상태: PREPARE한 문장
+        self.prepared = {}
+        database.network.wait()
+
+    def cursor(self, *args, **kwargs):
+        return LocalCursor(self, self.dict_rows)
+
+    def commit(self):
+        self.database.network.wait()
+        self.database.commit_count += 1
+
+    def rollback(self):
+        self.database.network.wait()
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class LocalOpenAI:
+    """
+    OpenAI Files/Batches API 흉내
+    업로드된 배치 입력(JSONL)을 보고 채팅 요청에는 카테고리 JSON, 임베딩 요청에는 난수 벡터를 돌려줍니다.
+    리뷰 여러 개를 묶은 채팅 요청(user 메시지가 [{"id", "review"}] 배열)에는 {"results": [...]}로 답하고,
+    malformed_pack_rate 비율만큼은 읽을 수 없는 응답을 돌려줘 fallback 경로를 확인할 수 있습니다.
+    failed_request_rate 비율만큼의 배치 요청은 실제 Batch API처럼 결과 파일에서 빠지고 오류 파일(error_file_id)로 갑니다.
+    동기 /v1/chat/completions, /v1/embeddings 호출도 받으며 같은 비율로 500을 돌려줍니다.
+    배치는 polls_until_complete번 조회된 뒤 completed가 됩니다.
+    """
+
+    VIBES = ["조용하고 편안한", "활기찬", "로맨틱한", "고급스러운", ""]
+    FOODS = ["한식", "일식", "양식", "중식", "이탈리안", ""]
+    COMPANIONS = ["가족", "친구", "연인", "동료", "부모님", ""]
+    PURPOSES = ["생일", "기념일", "회식", "데이트", "가족모임", ""]
+
+    def __init__(self, network, seed=0, polls_until_complete=0):
+        self.network = network
+        self.random = random.Random(seed)
+        self.polls_until_complete = polls_until_complete
+        self.files = {}
+        self.batches = {}
+        self.request_count = 0
+        self.malformed_pack_rate = 0.0
+        self.failed_request_rate = 0.0
+
+    def urlopen(self, request, *args, **kwargs):
+        url = request.full_url if hasattr(request, "full_url") else str(request)
+        data = request.data if hasattr(request, "data") else None
+        self.request_count += 1
+        self.network.wait(len(data or b""))
+        path = url.split("api.openai.com", 1)[-1].split("?")[0]
+
+        if path == "/v1/files" and data:
+            return self._respond(self._upload(data))
+        if path == "/v1/batches" and data:
+            return self._respond(self._create_batch(json.loads(data)))
+        if path in ("/v1/chat/completions", "/v1/embeddings") and data:
+            import urllib.error
+
+            if self.failed_request_rate and self.random.random() < self.failed_request_rate:
+                raise urllib.error.HTTPError(url, 500, "Server Error", {}, io.BytesIO(b'{"error":"server error"}'))
+            return self._respond(self._response_body(path, json.loads(data)))
+        match = re.match(r"/v1/batches/([^/]+)$", path)
+        if match:
+            return self._respond(self._get_batch(match.group(1)))
+        match = re.match(r"/v1/files/([^/]+)/content$", path)
+        if match and match.group(1) in self.files:
+            content = self.files[match.group(1)]
+            self.network.wait(len(content))
+            return LocalResponse(content)
+        import urllib.error
+
+        raise urllib.error.HTTPError(url, 404, "Not Found", {}, io.BytesIO(b'{"error":"not found"}'))
+
+    def _respond(self, payload):
+        return LocalResponse(json.dumps(payload).encode("utf-8"))
+
+    def _upload(self, body):
+        # multipart 본문에서 파일 부분만 추출
+        marker = b"Content-Type: application/jsonl\r\n\r\n"
+        start = body.index(marker) + len(marker)
+        end = body.rindex(b"\r\n------")
+        file_id = f"file-{new_id()[:24]}"
+        self.files[file_id] = body[start:end]
+        return {"id": file_id, "object": "file", "bytes": end - start}
+
+    def _create_batch(self, request):
+        batch_id = f"batch_{new_id()[:24]}"
+        lines = [line for line in self.files[request["input_file_id"]].splitlines() if line.strip()]
+        self.batches[batch_id] = {
+            "id": batch_id,
+            "status": "validating",
+            "endpoint": request["endpoint"],
+            "input_file_id": request["input_file_id"],
+            "output_file_id": None,
+            "error_file_id": None,
+            "request_counts": {"total": len(lines), "completed": 0, "failed": 0},
+            "created_at": int(time.time()),
+            "in_progress_at": None,
+            "expires_at": int(time.time()) + 24 * 3600,
+            "polls": 0,
+        }
+        return self._public_batch(self.batches[batch_id])
+
+    def _get_batch(self, batch_id):
+        batch = self.batches[batch_id]
+        batch["polls"] += 1
+        if batch["output_file_id"] is None and batch["polls"] > self.polls_until_complete:
+            output_file_id = f"file-{new_id()[:24]}"
+            output, errors = self._build_output(batch)
+            self.files[output_file_id] = output
+            batch["output_file_id"] = output_file_id
+            if errors:
+                batch["error_file_id"] = f"file-{new_id()[:24]}"
+                self.files[batch["error_file_id"]] = errors
+            batch["status"] = "completed"
+            batch["request_counts"]["failed"] = errors.count(b"\n")
+            batch["request_counts"]["completed"] = batch["request_counts"]["total"] - batch["request_counts"]["failed"]
+        elif batch["output_file_id"] is None:
+            # 조회할 때마다 요청이 고르게 처리된 것처럼 진행률을 올림
+            batch["status"] = "in_progress"
+            batch["in_progress_at"] = batch["in_progress_at"] or batch["created_at"]
+            counts = batch["request_counts"]
+            counts["completed"] = counts["total"] * batch["polls"] // (self.polls_until_complete + 1)
+        return self._public_batch(batch)
+
+    @staticmethod
+    def _public_batch(batch):
+        return {key: value for key, value in batch.items() if key != "polls"}
+
+    def _categories(self):
+        return {
+            "purpose": self.random.choice(self.PURPOSES),
+            "vibe": self.random.choice(self.VIBES),
+            "companion": self.random.choice(self.COMPANIONS),
+            "food": self.random.choice(self.FOODS),
+        }
+
+    def _chat_content(self, user_content):
+        try:
+            packed = json.loads(user_content)
+        except ValueError:
+            packed = None
+        if not isinstance(packed, list):
+            return json.dumps(self._categories(), ensure_ascii=False)
+        if self.random.random() < self.malformed_pack_rate:
+            return '{"results": [{"id": '
+        results = [{"id": item["id"], **self._categories()} for item in packed]
+        return json.dumps({"results": results}, ensure_ascii=False)
+
+    def _response_body(self, endpoint, body):
+        if endpoint == "/v1/embeddings":
+            inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+            dimensions = body.get("dimensions", 1536)
+            return {
+                "object": "list",
+                "data": [
+                    {
+                        "object": "embedding",
+                        "index": index,
+                        "embedding": [round(self.random.uniform(-0.1, 0.1), 6) for _ in range(dimensions)],
+                    }
+                    for index in range(len(inputs))
+                ],
+            }
+        content = self._chat_content(body["messages"][-1]["content"])
+        prompt = "".join(message["content"] for message in body["messages"])
+        return {
+            "choices": [{"message": {"role": "assistant", "content": content}}],
+            # 토큰 수는 UTF-8 바이트 / 3으로 어림
+            "usage": {
+                "prompt_tokens": len(prompt.encode("utf-8")) // 3,
+                "completion_tokens": len(content.encode("utf-8")) // 3,
+            },
+        }
+
+    def _build_output(self, batch):
+        """(결과 파일, 오류 파일) 내용. 실패한 요청은 오류 파일에만 들어감"""
+        lines = []
+        errors = []
+        for line in self.files[batch["input_file_id"]].splitlines():
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            if self.failed_request_rate and self.random.random() < self.failed_request_rate:
+                errors.append(
+                    json.dumps(
+                        {
+                            "id": f"batch_req_{new_id()[:16]}",
+                            "custom_id": request["custom_id"],
+                            "response": {"status_code": 500, "body": {"error": {"message": "server error"}}},
+                            "error": None,
+                        }
+                    )
+                )
+                continue
+            lines.append(
+                json.dumps(
+                    {
+                        "id": f"batch_req_{new_id()[:16]}",
+                        "custom_id": request["custom_id"],
+                        "response": {"status_code": 200, "body": self._response_body(batch["endpoint"], request["body"])},
+                        "error": None,
+                    },
+                    ensure_ascii=False,
+                )
+            )
+        output = ("\n".join(lines) + "\n").encode("utf-8")
+        return output, ("\n".join(errors) + "\n").encode("utf-8") if errors else b""
+
+
+class LocalResponse(io.BytesIO):
+    status = 200
+
+    def getcode(self):
+        return self.status
+
+
+class _PatchingLoader(importlib.abc.Loader):
+    """원래 loader로 모듈을 실행한 뒤 patch(module)를 호출합니다."""
+
+    def __init__(self, loader, patch):
+        self.loader = loader
+        self.patch = patch
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        self.loader.exec_module(module)
+        self.patch(module)
+
+
+class LocalModuleFinder(importlib.abc.MetaPathFinder, importlib.abc.Loader):
+    """
+    가짜 모듈을 import 시점에 돌려주는 finder
+    import_delays_ms에 모듈별 지연을 주면 처음 import될 때 그만큼 sleep해 실제 라이브러리 로딩 시간을 흉내 냅니다.
+    patches에 등록한 실제 모듈(urllib.request 등)은 로드 직후 patch 함수를 호출합니다.
+    """
+
+    def __init__(self, modules, import_delays_ms=None, patches=None):
+        self.modules = modules
+        self.import_delays_ms = import_delays_ms or {}
+        self.patches = patches or {}
+
+    def find_spec(self, fullname, path=None, target=None):
+        if fullname in self.modules:
+            return importlib.util.spec_from_loader(fullname, self)
+        if fullname in self.patches:
+            spec = importlib.machinery.PathFinder.find_spec(fullname, path)
+            if spec is not None:
+                spec.loader = _PatchingLoader(spec.loader, self.patches[fullname])
+            return spec
+        return None
+
+    def create_module(self, spec):
+        delay_ms = self.import_delays_ms.get(spec.name, 0)
+        if delay_ms:
+            time.sleep(delay_ms / 1000.0)
+        return self.modules[spec.name]
+
+    def exec_module(self, module):
+        pass
+
+
+class LocalStack:
+    """로컬 스택 전체. install()로 가짜 모듈을 등록하고 uninstall()로 되돌립니다."""
+
+    def __init__(self, s3_network=None, db_network=None, api_network=None, seed=0,
+                 polls_until_complete=0, import_delays_ms=None, client_delay_ms=0.0):
+        self.s3 = LocalS3(s3_network or NetworkModel())
+        self.sqs = LocalSQS(api_network or NetworkModel())
+        self.batch = LocalBatch(api_network or NetworkModel())
+        self.restaurant_db = LocalDatabase("restaurant", db_network or NetworkModel())
+        self.recommend_db = LocalDatabase("recommend", db_network or NetworkModel())
+        self.openai = LocalOpenAI(api_network or NetworkModel(), seed, polls_until_complete)
+        self.import_delays_ms = import_delays_ms or {}
+        self.client_delay_ms = client_delay_ms
+        self.clients_created = 0
+        self._finder = None
+        self._saved_modules = {}
+        self._saved_urlopen = None
+
+    def reset(self):
+        """핸들러 모듈이 잡고 있는 client 객체는 그대로 두고 저장된 상태만 비웁니다."""
+        self.s3.objects.clear()
+        self.sqs.messages.clear()
+        self.batch.jobs.clear()
+        self.restaurant_db.tables.clear()
+        self.recommend_db.tables.clear()
+        self.openai.files.clear()
+        self.openai.batches.clear()
+
+    def snapshot(self):
+        """저장된 상태 전체의 복사본을 반환합니다. (pickle 가능)"""
+        return copy.deepcopy(
+            {
+                "s3": self.s3.objects,
+                "sqs": self.sqs.messages,
+                "batch": self.batch.jobs,
+                "restaurant_db": self.restaurant_db.tables,
+                "recommend_db": self.recommend_db.tables,
+                "openai_files": self.openai.files,
+                "openai_batches": self.openai.batches,
+            }
+        )
+
+    def restore(self, snapshot):
+        """snapshot()으로 떠 둔 상태로 되돌립니다. client 객체는 그대로 유지됩니다."""
+        self.reset()
+        snapshot = copy.deepcopy(snapshot)
+        self.s3.objects.update(snapshot["s3"])
+        self.sqs.messages.extend(snapshot["sqs"])
+        self.batch.jobs.extend(snapshot["batch"])
+        self.restaurant_db.tables.update(snapshot["restaurant_db"])
+        self.recommend_db.tables.update(snapshot["recommend_db"])
+        self.openai.files.update(snapshot["openai_files"])
+        self.openai.batches.update(snapshot["openai_batches"])
+
+    def client(self, service_name, *args, **kwargs):
+        clients = {"s3": self.s3, "sqs": self.sqs, "batch": self.batch}
+        if service_name not in clients:
+            raise ValueError(f"Local stack has no {service_name} client")
+        if self.client_delay_ms:
+            time.sleep(self.client_delay_ms / 1000.0)
+        self.clients_created += 1
+        return clients[service_name]
+
+    def fake_modules(self):
+        boto3 = types.ModuleType("boto3")
+        boto3.client = self.client
+
+        pymysql = types.ModuleType("pymysql")
+        pymysql.cursors = types.SimpleNamespace(DictCursor="DictCursor", Cursor="Cursor")
+        pymysql.connect = lambda *args, **kwargs: LocalConnection(
+            self.restaurant_db, dict_rows=kwargs.get("cursorclass") == "DictCursor", driver="pymysql"
+        )
+
+        pg8000 = types.ModuleType("pg8000")
+        pg8000.connect = lambda *args, **kwargs: LocalConnection(self.recommend_db, driver="pg8000")
+
+        psycopg2 = types.ModuleType("psycopg2")
+        psycopg2.connect = lambda *args, **kwargs: LocalConnection(self.recommend_db, driver="psycopg2")
+
+        return {"boto3": boto3, "pymysql": pymysql, "pg8000": pg8000, "psycopg2": psycopg2}
+
+    def _patch_urlopen(self, module):
+        self._saved_urlopen = module.urlopen
+        module.urlopen = self.openai.urlopen
+
+    def install(self):
+        modules = self.fake_modules()
+        for name in modules:
+            self._saved_modules[name] = sys.modules.pop(name, None)
+        patches = {}
+        if "urllib.request" in sys.modules:
+            self._patch_urlopen(sys.modules["urllib.request"])
+        else:
+            patches["urllib.request"] = self._patch_urlopen
+        self._finder = LocalModuleFinder(modules, self.import_delays_ms, patches)
+        sys.meta_path.insert(0, self._finder)
+        self._reset_cached_clients()
+        return self
+
+    def uninstall(self):
+        if self._finder in sys.meta_path:
+            sys.meta_path.remove(self._finder)
+        self._finder = None
+        for name, module in self._saved_modules.items():
+            if module is None:
+                sys.modules.pop(name, None)
+            else:
+                sys.modules[name] = module
+        self._saved_modules = {}
+        if self._saved_urlopen is not None:
+            sys.modules["urllib.request"].urlopen = self._saved_urlopen
+            self._saved_urlopen = None
+        self._reset_cached_clients()
+
+    @staticmethod
+    def _reset_cached_clients():
+        """핸들러가 캐시한 client가 다른 스택의 가짜 client를 잡고 있지 않도록 비웁니다."""
+        aws_clients = sys.modules.get("pipeline_common.aws_clients")
+        if aws_clients is not None:
+            aws_clients.reset_clients()
+
+    def counters(self):
+        return {
+            "s3Requests": self.s3.request_count,
+            "s3BytesOut": self.s3.bytes_out,
+            "s3BytesIn": self.s3.bytes_in,
+            "sqsRequests": self.sqs.request_count,
+            "openaiRequests": self.openai.request_count,
+            "restaurantDbStatements": self.restaurant_db.statement_count,
+            "recommendDbStatements": self.recommend_db.statement_count,
+            "recommendDbParses": self.recommend_db.parse_count,
+        }
@@ -0,0 +1,447 @@
+"""
+파이프라인 핸들러 오프라인 벤치마크
+합성 데이터와 로컬 스택(local_stack.py)으로 11개 Lambda 핸들러를 실제 파이프라인 순서대로 실행하고
+단계별 처리량, p50/p99 지연 시간, 최대 RSS를 측정해 결과를 JSON으로 저장합니다.
+
+Step Functions 흐름
+extract_place_ids -> save_restaurant_to_DB -> create-category-batch -> batch-status -> create-embedding-batch
+-> save-embedding -> save_review_to_DB
+데이터 파이프라인 흐름
+run_review_crawl_batch -> save-restaurant-metadata -> outbox-polling -> save-vector
+
+실행 예시
+python pipeline_benchmark.py --restaurants 200 --reviews-per-restaurant 20 --iterations 5
+python pipeline_benchmark.py --compare results/20250101-120000-abc1234.json
+
+--compare로 이전 결과를 넘기면 단계별 p50 변화를 출력하고, 임계값을 넘는 회귀가 있으면 종료 코드 1로 끝납니다.
+최대 RSS는 프로세스 전체 값이므로 앞 단계에서 잡힌 메모리가 포함됩니다. 단계 자체의 증가분은 rss_growth_mb를 봅니다.
+"""
+import argparse
+import contextlib
+import importlib.util
+import json
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+MODULES_DIR = os.path.abspath(os.path.join(BENCHMARK_DIR, "..", ".."))
+LAYER_DIR = os.path.join(MODULES_DIR, "pipeline-common", "layer", "python")
+sys.path.insert(0, LAYER_DIR)
+sys.path.insert(0, BENCHMARK_DIR)
+
+from local_stack import LocalStack, NetworkModel  # noqa: E402
+from synthetic_data import (  # noqa: E402
+    generate_embedding_file,
+    generate_restaurants,
+    generate_reviews,
+)
+
+BUCKET = "bench-pipeline"
+QUERY = "공덕역 식당"
+REVIEW_S3_KEY = "bench-reviews"
+OUTBOX_QUEUE_URL = "https://sqs.local/000000000000/outbox"
+SAVE_VECTOR_QUEUE_ARN = "arn:aws:sqs:ap-northeast-2:000000000000:save-vector"
+
+HANDLER_PATHS = {
+    "extract_place_ids": "step-function/extract_place_ids",
+    "save_restaurant_to_DB": "step-function/save_restaurant_to_DB",
+    "create-category-batch": "step-function/create-category-batch",
+    "batch-status": "step-function/batch-status",
+    "create-embedding-batch": "step-function/create-embedding-batch",
+    "save-embedding": "step-function/save-embedding",
+    "save_review_to_DB": "step-function/save_review_to_DB",
+    "run_review_crawl_batch": "data-pipeline/run_review_crawl_batch",
+    "save-restaurant-metadata": "data-pipeline/save-restaurant-metadata",
+    "outbox-polling": "data-pipeline/outbox-polling",
+    "save-vector": "data-pipeline/save-vector",
+}
+STAGES = list(HANDLER_PATHS)
+
+HANDLER_ENVIRONMENT = {
+    "S3_BUCKET_NAME": BUCKET,
+    "RESTAURANT_BUCKET_DIRECTORY": "restaurant",
+    "REVIEW_BUCKET_DIRECTORY": "review",
+    "CATEGORY_BUCKET_DIRECTORY": "category",
+    "EMBEDDING_BUCKET_DIRECTORY": "embedding",
+    "OPENAI_API_KEY": "local",
+    "EXTRACTION_REVIEWS_PER_REQUEST": "10",
+    "OUTBOX_QUEUE_URL": OUTBOX_QUEUE_URL,
+    "BATCH_JOB_QUEUE": "local-queue",
+    "BATCH_JOB_DEFINITION": "local-job",
+    "RESTAURANT_DB_HOST": "localhost",
+    "RESTAURANT_DB_USER": "bench",
+    "RESTAURANT_DB_PASSWORD": "bench",
+    "RESTAURANT_DB_NAME": "restaurant",
+    "RECOMMEND_DB_HOST": "localhost",
+    "RECOMMEND_DB_PORT": "5432",
+    "RECOMMEND_DB_USER": "bench",
+    "RECOMMEND_DB_PASSWORD": "bench",
+    "RECOMMEND_DB_NAME": "recommend",
+}
+
+
+class RssSampler:
+    """별도 스레드에서 /proc/self/statm을 주기적으로 읽어 구간 최대 RSS를 구합니다."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.page_size = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def current(self):
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * self.page_size
+        except OSError:
+            # /proc가 없는 환경은 프로세스 최대값으로 대체 (macOS는 bytes, Linux는 KB)
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak if sys.platform == "darwin" else peak * 1024
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.current())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.start = self.current()
+        self.peak = self.start
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.current())
+
+
+def load_handler(name, modules_dir=MODULES_DIR):
+    """핸들러 파일을 고유한 모듈 이름으로 로드합니다. (모든 핸들러 파일 이름이 lambda_function.py)"""
+    path = os.path.join(modules_dir, HANDLER_PATHS[name], "lambda_function.py")
+    spec = importlib.util.spec_from_file_location(f"bench_{name.replace('-', '_')}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    index = (len(ordered) - 1) * q / 100
+    lower = int(index)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (index - lower)
+
+
+class PipelineRun:
+    """한 번의 파이프라인 실행. 단계 간 데이터(배치 ID, SQS 메시지 등)를 이어 줍니다."""
+
+    def __init__(self, stack, handlers, args):
+        self.stack = stack
+        self.handlers = handlers
+        self.args = args
+        self.state = {}
+
+    def seed_inputs(self):
+        """크롤러와 데이터 파이프라인 배치 작업이 올려 두는 입력 파일을 로컬 S3에 만듭니다."""
+        args = self.args
+        restaurants = generate_restaurants(args.restaurants, args.seed)
+        reviews = generate_reviews(restaurants, args.reviews_per_restaurant, args.seed)
+        s3 = self.stack.s3
+
+        s3.put_object(
+            Bucket=BUCKET,
+            Key=f"restaurant/{QUERY}.json",
+            Body=json.dumps(restaurants, ensure_ascii=False).encode("utf-8"),
+        )
+        s3.put_object(
+            Bucket=BUCKET,
+            Key=f"review/{REVIEW_S3_KEY}.json",
+            Body=json.dumps(reviews, ensure_ascii=False).encode("utf-8"),
+        )
+
+        reviews_by_place = {}
+        for review in reviews:
+            reviews_by_place.setdefault(review["placeId"], []).append(review)
+        embedding_keys = []
+        for restaurant in restaurants:
+            key = f"{restaurant['placeId']}_embedding.json"
+            embedding = generate_embedding_file(
+                restaurant, reviews_by_place.get(restaurant["placeId"], []), args.dimension, args.seed
+            )
+            s3.put_object(
+                Bucket=BUCKET,
+                Key=f"embedding/{key}",
+                Body=json.dumps(embedding, ensure_ascii=False).encode("utf-8"),
+            )
+            embedding_keys.append(key)
+
+        self.state.update(
+            restaurant_count=len(restaurants),
+            review_count=len(reviews),
+            embedding_keys=embedding_keys,
+        )
+
+    def sqs_batches(self, bodies):
+        size = self.args.sqs_batch_size
+        for offset in range(0, len(bodies), size):
+            yield {
+                "Records": [
+                    {
+                        "messageId": str(offset + i),
+                        "receiptHandle": f"receipt-{offset + i}",
+                        "eventSourceARN": SAVE_VECTOR_QUEUE_ARN,
+                        "body": body,
+                    }
+                    for i, body in enumerate(bodies[offset : offset + size])
+                ]
+            }
+
+    # 단계별 (핸들러 이벤트 목록, 처리 레코드 수)
+
+    def events_for(self, stage):
+        state = self.state
+        if stage == "extract_place_ids":
+            return [{"SEARCH_QUERY": QUERY, "RESTAURANT_BUCKET_DIRECTORY": "restaurant",
+                     "S3_BUCKET_NAME": BUCKET}], state["restaurant_count"]
+        if stage == "save_restaurant_to_DB":
+            return [{"SEARCH_QUERY": QUERY, "S3_DIRECTORY": "restaurant",
+                     "S3_BUCKET_NAME": BUCKET}], state["restaurant_count"]
+        if stage == "create-category-batch":
+            return [{"S3_KEY": REVIEW_S3_KEY}], state["review_count"]
+        if stage == "batch-status":
+            # 지금까지 만든 배치를 한 번에 조회
+            batch_ids = list(self.stack.openai.batches)
+            return [{"batch_ids": batch_ids}], len(batch_ids)
+        if stage == "create-embedding-batch":
+            return [{"S3_KEY": REVIEW_S3_KEY,
+                     "body": {"extraction_batch_id": state["extraction_batch_id"],
+                              "selection": state.get("selection")}}], state["review_count"]
+        if stage == "save-embedding":
+            return [{"body": state["embedding_body"]}], state["review_count"]
+        if stage == "save_review_to_DB":
+            return [{"SEARCH_QUERY": REVIEW_S3_KEY, "S3_DIRECTORY": "embedding",
+                     "S3_BUCKET_NAME": BUCKET}], state["review_count"]
+        if stage == "run_review_crawl_batch":
+            return [{"Records": [{"s3": {"bucket": {"name": BUCKET},
+                                         "object": {"key": f"restaurant/{QUERY}.json"}}}]}], \
+                state["restaurant_count"]
+        if stage == "save-restaurant-metadata":
+            bodies = [json.dumps({"s3Key": key}) for key in state["embedding_keys"]]
+            return list(self.sqs_batches(bodies)), state["restaurant_count"]
+        if stage == "outbox-polling":
+            return [{}], state["restaurant_count"]
+        if stage == "save-vector":
+            bodies = [message["Body"] for message in self.stack.sqs.messages]
+            return list(self.sqs_batches(bodies)), len(bodies)
+        raise ValueError(f"Unknown stage: {stage}")
+
+    def before(self, stage):
+        """
+        데이터 파이프라인 흐름은 Step Functions 흐름과 별개의 적재 경로이므로
+        첫 단계 전에 DB와 리뷰 Bloom 필터를 비워 같은 식당을 새로 적재하게 합니다.
+        """
+        if stage == "run_review_crawl_batch":
+            self.stack.restaurant_db.tables.clear()
+            self.stack.recommend_db.tables.clear()
+            for bucket, key in list(self.stack.s3.objects):
+                if key.startswith("bloom/"):
+                    del self.stack.s3.objects[(bucket, key)]
+
+    def after(self, stage, results):
+        """다음 단계가 쓸 값을 꺼내고, 조용히 실패한 단계는 예외로 드러냅니다."""
+        if not results:
+            raise RuntimeError(f"{stage} had no input events")
+        last = results[-1]
+        if stage == "create-category-batch":
+            self.state["extraction_batch_id"] = last["body"]["extraction_batch_id"]
+            self.state["selection"] = last["body"].get("selection")
+        elif stage == "batch-status" and not last["body"]["ready"]:
+            raise RuntimeError(f"{stage} reported unfinished batches: {last['body']}")
+        elif stage == "create-embedding-batch":
+            if last["statusCode"] != 200:
+                raise RuntimeError(f"{stage} did not complete: {last}")
+            self.state["embedding_body"] = last["body"]
+        elif stage == "save-embedding" and last["statusCode"] != 200:
+            raise RuntimeError(f"{stage} did not complete: {last}")
+        elif stage in ("run_review_crawl_batch", "outbox-polling", "save-vector",
+                       "save-restaurant-metadata"):
+            failed = [result for result in results if result.get("statusCode", 200) != 200]
+            if failed:
+                raise RuntimeError(f"{stage} failed: {failed[0]}")
+
+
+def run_stage(run, stage, output=None):
+    """output을 주면 핸들러의 stdout/stderr를 그쪽으로 돌립니다."""
+    handler = run.handlers[stage].handler
+    run.before(stage)
+    # EMF 지표의 Function 차원이 단계 이름이 되도록 Lambda 환경 변수를 흉내 냄
+    os.environ["AWS_LAMBDA_FUNCTION_NAME"] = stage
+    events, record_count = run.events_for(stage)
+    counters_before = run.stack.counters()
+    latencies = []
+    results = []
+
+    with RssSampler() as sampler:
+        for event in events:
+            with contextlib.ExitStack() as redirect:
+                if output:
+                    redirect.enter_context(contextlib.redirect_stdout(output))
+                    redirect.enter_context(contextlib.redirect_stderr(output))
+                started_at = time.perf_counter()
+                results.append(handler(event, None))
+                latencies.append(time.perf_counter() - started_at)
+
+    run.after(stage, results)
+    counters_after = run.stack.counters()
+    return {
+        "latencies": latencies,
+        "records": record_count,
+        "peak_rss": sampler.peak,
+        "rss_growth": sampler.peak - sampler.start,
+        "counters": {key: counters_after[key] - counters_before[key] for key in counters_after},
+    }
+
+
+def summarize(stage, samples):
+    latencies = [latency for sample in samples for latency in sample["latencies"]]
+    total_seconds = sum(sum(sample["latencies"]) for sample in samples)
+    total_records = sum(sample["records"] for sample in samples)
+    counters = {}
+    for sample in samples:
+        for key, value in sample["counters"].items():
+            counters[key] = counters.get(key, 0) + value
+    return {
+        "stage": stage,
+        "invocations": len(latencies),
+        "records": total_records,
+        "throughput_per_s": round(total_records / total_seconds, 2) if total_seconds else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "total_s": round(total_seconds, 3),
+        "peak_rss_mb": round(max(sample["peak_rss"] for sample in samples) / 1024 / 1024, 1),
+        "rss_growth_mb": round(max(sample["rss_growth"] for sample in samples) / 1024 / 1024, 1),
+        "counters_per_iteration": {key: value // len(samples) for key, value in counters.items()},
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=MODULES_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, current, threshold):
+    """단계별 p50 변화율을 출력하고 임계값을 넘은 회귀 단계 목록을 반환합니다."""
+    baseline_stages = {stage["stage"]: stage for stage in baseline["stages"]}
+    regressions = []
+    print(f"\nCompared with {baseline.get('gitCommit')} ({baseline.get('createdAt')})")
+    print(f"{'stage':28} {'p50 before':>12} {'p50 after':>12} {'change':>8}")
+    for stage in current["stages"]:
+        before = baseline_stages.get(stage["stage"])
+        if not before or not before["p50_ms"]:
+            continue
+        change = stage["p50_ms"] / before["p50_ms"] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(stage["stage"])
+        print(
+            f"{stage['stage']:28} {before['p50_ms']:>12.1f} {stage['p50_ms']:>12.1f} "
+            f"{change * 100:>+7.1f}%{flag}"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="파이프라인 핸들러 오프라인 벤치마크")
+    parser.add_argument("--restaurants", type=int, default=100)
+    parser.add_argument("--reviews-per-restaurant", type=int, default=10)
+    parser.add_argument("--dimension", type=int, default=768, help="임베딩 차원")
+    parser.add_argument("--iterations", type=int, default=3, help="파이프라인 반복 실행 횟수")
+    parser.add_argument("--sqs-batch-size", type=int, default=10)
+    parser.add_argument("--stages", nargs="+", choices=STAGES, help="결과에 포함할 단계 (기본: 전체)")
+    parser.add_argument("--s3-latency-ms", type=float, default=15.0)
+    parser.add_argument("--s3-bandwidth-mbps", type=float, default=400.0, help="요청 하나당 대역폭")
+    parser.add_argument("--db-latency-ms", type=float, default=1.0, help="DB 왕복 지연")
+    parser.add_argument("--api-latency-ms", type=float, default=30.0, help="OpenAI/SQS/Batch 호출 지연")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output-dir", default=os.path.join(BENCHMARK_DIR, "results"))
+    parser.add_argument("--compare", help="비교할 이전 결과 JSON 경로")
+    parser.add_argument("--regression-threshold", type=float, default=0.15,
+                        help="p50 증가율이 이 값을 넘으면 회귀로 판단")
+    parser.add_argument("--verbose", action="store_true", help="핸들러 로그를 그대로 출력")
+    args = parser.parse_args()
+
+    os.environ.update(HANDLER_ENVIRONMENT)
+    stack = LocalStack(
+        s3_network=NetworkModel(args.s3_latency_ms, args.s3_bandwidth_mbps),
+        db_network=NetworkModel(args.db_latency_ms),
+        api_network=NetworkModel(args.api_latency_ms),
+        seed=args.seed,
+    ).install()
+
+    # 핸들러가 첫 호출 때 당시의 sys.stdout으로 로깅 핸들러를 만들므로 실행 내내 같은 출력 파일을 씀
+    output = None if args.verbose else open(os.devnull, "w")
+    try:
+        handlers = {stage: load_handler(stage) for stage in STAGES}
+        samples = {stage: [] for stage in STAGES}
+        for iteration in range(args.iterations):
+            stack.reset()
+            run = PipelineRun(stack, handlers, args)
+            run.seed_inputs()
+            for stage in STAGES:
+                samples[stage].append(run_stage(run, stage, output))
+            print(f"iteration {iteration + 1}/{args.iterations} done", file=sys.stderr)
+    finally:
+        stack.uninstall()
+        if output:
+            output.close()
+
+    selected = args.stages or STAGES
+    result = {
+        "createdAt": datetime.now().isoformat(timespec="seconds"),
+        "gitCommit": git_commit(),
+        "python": sys.version.split()[0],
+        "config": {key: value for key, value in vars(args).items()
+                   if key not in ("output_dir", "compare", "verbose")},
+        "stages": [summarize(stage, samples[stage]) for stage in selected],
+    }
+
+    print(f"{'stage':28} {'records/s':>10} {'p50 ms':>10} {'p99 ms':>10} {'peak RSS MB':>12}")
+    for stage in result["stages"]:
+        print(
+            f"{stage['stage']:28} {stage['throughput_per_s']:>10} {stage['p50_ms']:>10.1f} "
+            f"{stage['p99_ms']:>10.1f} {stage['peak_rss_mb']:>12.1f}"
+        )
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    filename = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{result['gitCommit'] or 'nogit'}.json"
+    output_path = os.path.join(args.output_dir, filename)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\nSaved results to {output_path}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, result, args.regression_threshold)
+        if regressions:
+            print(f"Regressions over {args.regression_threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
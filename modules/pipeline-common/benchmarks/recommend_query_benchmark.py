@@ -0,0 +1,294 @@
+"""
+근거리 추천 쿼리 벤치마크
+서울 범위의 합성 restaurant_vector 데이터를 만들어 세 가지 검색 경로의 지연 시간을 비교합니다.
+- exact: 순수 Python 전수 비교 (--exact-max 이하 규모에서만 실행)
+- numpy: 인메모리 NumPy 행렬
+- sql: --dsn 지정 시 임시 테이블에 적재 후 위경도 btree 인덱스 + pgvector 연산
+- numpy-prefilter-N / sql-prefilter-N: 앞 128차원 사본으로 후보 N개를 남긴 뒤 전체 차원으로 다시 정렬하는 2단계 검색
+  (--dimension이 128보다 클 때만 실행. --prefilter-candidates로 N 목록 지정)
+
+실제 text-embedding-3 벡터는 앞쪽 차원에 정보가 몰려 있어(Matryoshka 학습) 잘라도 순위가 유지됩니다.
+합성 벡터도 i번째 성분을 (i + 1) ** -spectrum_decay 배로 줄여 비슷한 분포를 흉내 냅니다. (0이면 모든 차원이 같은 분산)
+2단계 경로의 recall_vs_exact는 exact 실행 규모에서, recall_vs_numpy는 같은 규모의 768차원 numpy 결과 대비로 보고합니다.
+
+실행 예시
+python recommend_query_benchmark.py --sizes 10000 100000 1000000 --dimension 128
+python recommend_query_benchmark.py --sizes 10000 --dsn "host=localhost dbname=bench user=postgres"
+python recommend_query_benchmark.py --sizes 10000 100000 --dimension 768 --prefilter-candidates 50 100 200
+
+numpy가 필요하며, sql 경로는 psycopg2와 pgvector 확장이 설치된 PostgreSQL이 필요합니다.
+1M × 4 facet × 768차원은 float32로도 12GB이므로 큰 규모는 --dimension을 낮춰 실행합니다.
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "layer", "python"))
+
+import numpy as np  # noqa: E402
+
+from pipeline_common.recommend_query import (  # noqa: E402
+    FACETS,
+    PREFILTER_DIMENSION,
+    add_prefilter,
+    exact_scan,
+    numpy_search,
+    sql_search,
+    to_vector_literal,
+)
+
+# 서울 대략적인 범위
+SEOUL_LAT = (37.45, 37.65)
+SEOUL_LON = (126.85, 127.15)
+
+
+def spectrum(dimension, decay):
+    """차원별 크기 배율. 앞 차원일수록 분산이 큼"""
+    return (np.arange(1, dimension + 1, dtype=np.float32) ** -decay).astype(np.float32)
+
+
+def generate_restaurants(size, dimension, seed, decay=0.0):
+    """합성 식당 좌표와 facet 벡터(L2 정규화)를 생성합니다."""
+    rng = np.random.default_rng(seed)
+    latitude = rng.uniform(*SEOUL_LAT, size)
+    longitude = rng.uniform(*SEOUL_LON, size)
+    scale = spectrum(dimension, decay)
+    facets = {}
+    for facet in FACETS:
+        matrix = rng.standard_normal((size, dimension), dtype=np.float32)
+        matrix *= scale
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+        facets[facet] = matrix
+    return latitude, longitude, facets
+
+
+def to_numpy_index(latitude, longitude, facets):
+    """생성된 배열로 build_numpy_index와 같은 구조의 인덱스를 바로 만듭니다."""
+    restaurants = [
+        {"id": str(i), "placeId": f"place-{i}"} for i in range(len(latitude))
+    ]
+    return {
+        "restaurants": restaurants,
+        "latitude": latitude,
+        "longitude": longitude,
+        "facets": facets,
+    }
+
+
+def to_restaurant_rows(latitude, longitude, facets):
+    """exact 경로용 dict 목록으로 변환합니다."""
+    rows = []
+    for i in range(len(latitude)):
+        row = {
+            "id": str(i),
+            "placeId": f"place-{i}",
+            "latitude": float(latitude[i]),
+            "longitude": float(longitude[i]),
+        }
+        for facet in FACETS:
+            row[f"{facet}_vector"] = facets[facet][i].tolist()
+        rows.append(row)
+    return rows
+
+
+def load_sql_table(connection, latitude, longitude, facets, dimension, prefilter=None):
+    """
+    세션 임시 테이블 restaurant_vector에 합성 데이터를 COPY로 적재합니다.
+    prefilter(add_prefilter로 만든 facet 행렬)를 주면 {facet}_prefilter_vector 컬럼도 채웁니다.
+    """
+    cursor = connection.cursor()
+    cursor.execute("CREATE EXTENSION IF NOT EXISTS vector")
+    cursor.execute("DROP TABLE IF EXISTS pg_temp.restaurant_vector")
+    vector_columns = [f"{facet}_vector" for facet in FACETS]
+    facet_columns = ", ".join(f"{facet}_vector vector({dimension})" for facet in FACETS)
+    if prefilter is not None:
+        vector_columns += [f"{facet}_prefilter_vector" for facet in FACETS]
+        facet_columns += ", " + ", ".join(
+            f"{facet}_prefilter_vector vector({PREFILTER_DIMENSION})" for facet in FACETS
+        )
+    cursor.execute(
+        f"""
+        CREATE TEMP TABLE restaurant_vector (
+            id text, place_id text, latitude float8, longitude float8, {facet_columns}
+        )
+        """
+    )
+
+    buffer = io.StringIO()
+    matrices = [facets[facet] for facet in FACETS]
+    if prefilter is not None:
+        matrices += [prefilter[facet] for facet in FACETS]
+    for i in range(len(latitude)):
+        vectors = "\t".join(to_vector_literal(matrix[i].tolist()) for matrix in matrices)
+        buffer.write(f"{i}\tplace-{i}\t{latitude[i]}\t{longitude[i]}\t{vectors}\n")
+    buffer.seek(0)
+    columns = ", ".join(["id", "place_id", "latitude", "longitude"] + vector_columns)
+    cursor.copy_expert(f"COPY restaurant_vector ({columns}) FROM STDIN", buffer)
+    cursor.execute("CREATE INDEX ON restaurant_vector (latitude, longitude)")
+    cursor.execute("ANALYZE restaurant_vector")
+    connection.commit()
+    return cursor
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else None
+
+
+def run_queries(search, queries):
+    """쿼리마다 지연 시간(ms)과 결과 id 목록을 수집합니다."""
+    latencies = []
+    results = []
+    for query in queries:
+        started_at = time.perf_counter()
+        result = search(query)
+        latencies.append((time.perf_counter() - started_at) * 1000)
+        results.append([item["id"] for item in result])
+    return latencies, results
+
+
+def recall(results, baseline):
+    """baseline 대비 top-K 재현율"""
+    hits = 0
+    total = 0
+    for got, expected in zip(results, baseline):
+        hits += len(set(got) & set(expected))
+        total += len(expected)
+    return hits / total if total else None
+
+
+def summarize(name, size, latencies, results, baseline, reference=None):
+    summary = {
+        "engine": name,
+        "size": size,
+        "queries": len(latencies),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+    }
+    if baseline is not None:
+        summary["recall_vs_exact"] = round(recall(results, baseline), 4)
+    if reference is not None:
+        summary["recall_vs_numpy"] = round(recall(results, reference), 4)
+    print(json.dumps(summary))
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="근거리 추천 쿼리 벤치마크")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--dimension", type=int, default=128)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--radius", type=float, default=1500.0)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--exact-max", type=int, default=100000, help="exact 경로를 실행할 최대 규모")
+    parser.add_argument("--dsn", help="sql 경로용 PostgreSQL DSN (pgvector 필요)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--spectrum-decay", type=float, default=0.5,
+        help="i번째 차원 배율 (i + 1) ** -decay. 0이면 차원별 분산이 같아 잘라낸 벡터의 재현율이 최악에 가까움",
+    )
+    parser.add_argument(
+        "--prefilter-candidates", type=int, nargs="*", default=[50, 100, 200],
+        help="2단계 검색에서 128차원 점수로 남길 후보 수 목록 (빈 목록이면 2단계 경로 생략)",
+    )
+    parser.add_argument("--output", help="결과를 저장할 JSON 파일 경로")
+    args = parser.parse_args()
+
+    weights = {"companion": 0.1, "food": 0.3, "purpose": 0.2, "vibe": 0.4}
+    rng = np.random.default_rng(args.seed + 1)
+    scale = spectrum(args.dimension, args.spectrum_decay)
+    prefilter_candidates = args.prefilter_candidates if args.dimension > PREFILTER_DIMENSION else []
+    queries = []
+    for _ in range(args.queries):
+        vectors = {}
+        for facet in FACETS:
+            vector = rng.standard_normal(args.dimension).astype(np.float32) * scale
+            vectors[facet] = (vector / np.linalg.norm(vector)).tolist()
+        queries.append(
+            {
+                "query_vectors": vectors,
+                "latitude": float(rng.uniform(*SEOUL_LAT)),
+                "longitude": float(rng.uniform(*SEOUL_LON)),
+            }
+        )
+
+    connection = None
+    if args.dsn:
+        import psycopg2
+
+        connection = psycopg2.connect(args.dsn)
+
+    summaries = []
+    for size in args.sizes:
+        latitude, longitude, facets = generate_restaurants(
+            size, args.dimension, args.seed, args.spectrum_decay
+        )
+
+        def search_args(query):
+            return (
+                query["query_vectors"], weights, query["latitude"], query["longitude"],
+                args.radius, args.top_k,
+            )
+
+        baseline = None
+        if size <= args.exact_max:
+            rows = to_restaurant_rows(latitude, longitude, facets)
+            latencies, baseline = run_queries(
+                lambda q: exact_scan(rows, *search_args(q)), queries
+            )
+            summaries.append(summarize("exact", size, latencies, baseline, None))
+            del rows
+
+        index = to_numpy_index(latitude, longitude, facets)
+        latencies, numpy_results = run_queries(
+            lambda q: numpy_search(index, *search_args(q)), queries
+        )
+        summaries.append(summarize("numpy", size, latencies, numpy_results, baseline))
+
+        prefilter = None
+        if prefilter_candidates:
+            add_prefilter(index, PREFILTER_DIMENSION)
+            prefilter = index["prefilter"]
+        for candidates in prefilter_candidates:
+            latencies, results = run_queries(
+                lambda q: numpy_search(index, *search_args(q), prefilter_candidates=candidates),
+                queries,
+            )
+            summaries.append(
+                summarize(
+                    f"numpy-prefilter-{candidates}", size, latencies, results, baseline, numpy_results
+                )
+            )
+        # SQL 적재 전에 NumPy 인덱스 메모리를 놓음 (람다가 이름을 참조하므로 del 대신 None)
+        index = None
+
+        if connection is not None:
+            cursor = load_sql_table(
+                connection, latitude, longitude, facets, args.dimension, prefilter
+            )
+            latencies, results = run_queries(lambda q: sql_search(cursor, *search_args(q)), queries)
+            summaries.append(summarize("sql", size, latencies, results, baseline))
+            for candidates in prefilter_candidates:
+                latencies, results = run_queries(
+                    lambda q: sql_search(cursor, *search_args(q), prefilter_candidates=candidates),
+                    queries,
+                )
+                summaries.append(
+                    summarize(
+                        f"sql-prefilter-{candidates}", size, latencies, results, baseline, numpy_results
+                    )
+                )
+            cursor.close()
+
+    if connection is not None:
+        connection.close()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summaries, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
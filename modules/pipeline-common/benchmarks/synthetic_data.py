@@ -0,0 +1,91 @@
+"""
+벤치마크용 합성 데이터 생성
+서울 범위의 한국어 식당 목록, 크롤링 리뷰, 데이터 파이프라인 임베딩 파일을 만듭니다.
+카테고리/임베딩 배치 결과는 local_stack.LocalOpenAI가 업로드된 배치 입력으로 생성합니다.
+"""
+import hashlib
+import random
+
+SEOUL_LAT = (37.45, 37.65)
+SEOUL_LON = (126.85, 127.15)
+FACETS = ("companion", "food", "purpose", "vibe")
+
+NAME_PREFIXES = ["소문난", "원조", "옛날", "행복한", "맛있는", "할매", "새마을", "골목"]
+NAME_SUFFIXES = ["국밥", "칼국수", "삼겹살", "초밥", "파스타", "짬뽕", "냉면", "떡볶이", "카페"]
+CATEGORIES = ["한식", "일식", "양식", "중식", "분식", "카페,디저트"]
+DISTRICTS = ["마포구 공덕동", "강남구 역삼동", "종로구 관철동", "성동구 성수동", "용산구 한남동"]
+REVIEW_SENTENCES = [
+    "음식이 정말 맛있어요.",
+    "직원분들이 친절하고 분위기가 편안했습니다.",
+    "부모님 모시고 가족모임 하기 좋아요.",
+    "회식 장소로 추천합니다. 단체석이 넓어요.",
+    "데이트하기 좋은 조용한 곳이에요.",
+    "웨이팅이 조금 있었지만 기다릴 만했어요.",
+    "가격 대비 양이 많고 재료가 신선합니다.",
+    "친구들이랑 생일 파티 했는데 다들 만족했어요.",
+    "재방문 의사 있습니다!",
+    "주차가 불편한 점은 아쉬워요.",
+]
+
+
+def generate_restaurants(count, seed=0, invalid_ratio=0.02):
+    """크롤러가 restaurant/{query}.json으로 올리는 식당 목록을 생성합니다."""
+    rng = random.Random(seed)
+    restaurants = []
+    for i in range(count):
+        invalid = rng.random() < invalid_ratio
+        restaurants.append(
+            {
+                "placeId": str(1000000000 + i),
+                "name": f"{rng.choice(NAME_PREFIXES)} {rng.choice(NAME_SUFFIXES)} {i}호점",
+                "category": rng.choice(CATEGORIES),
+                "page": i // 20 + 1,
+                "origin_address": f"서울 {rng.choice(DISTRICTS)} {rng.randint(1, 300)}",
+                "address": f"서울특별시 {rng.choice(DISTRICTS)} {rng.randint(1, 300)}-{rng.randint(1, 30)}",
+                # 일부는 좌표 누락(0.0/0.0)으로 만들어 검증 경로도 함께 측정
+                "latitude": 0.0 if invalid else round(rng.uniform(*SEOUL_LAT), 7),
+                "longitude": 0.0 if invalid else round(rng.uniform(*SEOUL_LON), 7),
+                "thumbnail": f"https://example.com/thumbnails/{i}.jpg",
+            }
+        )
+    return restaurants
+
+
+def generate_review_content(rng, min_sentences=2, max_sentences=8):
+    sentences = rng.sample(REVIEW_SENTENCES, rng.randint(min_sentences, max_sentences))
+    return " ".join(sentences) + f" ({rng.randint(1, 10 ** 9)})"
+
+
+def generate_reviews(restaurants, reviews_per_restaurant, seed=0):
+    """크롤링 리뷰 목록을 생성합니다. id는 본문 sha256 (crawling_review.hash)"""
+    rng = random.Random(seed + 1)
+    reviews = []
+    for restaurant in restaurants:
+        for _ in range(reviews_per_restaurant):
+            content = generate_review_content(rng)
+            reviews.append(
+                {
+                    "id": hashlib.sha256(content.encode()).hexdigest(),
+                    "placeId": restaurant["placeId"],
+                    "content": content,
+                }
+            )
+    return reviews
+
+
+def random_unit_vector(rng, dimension):
+    vector = [rng.gauss(0.0, 1.0) for _ in range(dimension)]
+    norm = sum(value * value for value in vector) ** 0.5 or 1.0
+    return [round(value / norm, 6) for value in vector]
+
+
+def generate_embedding_file(restaurant, reviews, dimension, seed=0):
+    """데이터 파이프라인 배치 작업이 embedding/ 아래에 올리는 식당별 임베딩 파일을 생성합니다."""
+    rng = random.Random(f"{seed}:{restaurant['placeId']}")
+    return {
+        **{key: value for key, value in restaurant.items() if key != "thumbnail"},
+        "summary": f"{restaurant['name']}은 {restaurant['category']} 맛집입니다.",
+        "keywords": {facet: "" for facet in FACETS},
+        "embeddings": {facet: random_unit_vector(rng, dimension) for facet in FACETS},
+        "reviews": [{"content": review["content"]} for review in reviews],
+    }
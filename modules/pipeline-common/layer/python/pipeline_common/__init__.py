@@ -0,0 +1,4 @@
+"""
+데이터 파이프라인 Lambda 공용 모듈
+Lambda Layer(/opt/python)로 배포되어 각 함수에서 import 합니다.
+"""
@@ -0,0 +1,131 @@
+"""
+파이프라인 중간 산출물(리뷰, 카테고리) 직렬화 코덱
+새 산출물은 gzip 압축 JSON Lines(.jsonl.gz)로 쓰고, 읽을 때는 기존 JSON 배열(.json, .json.gz)도 함께 지원합니다.
+
+형식 판단 순서
+1. 키 확장자 (.jsonl.gz, .jsonl, .json.gz, .json)
+2. S3 객체의 ContentType / ContentEncoding
+3. 본문 앞부분 (gzip 매직 바이트, 첫 글자가 '['면 JSON 배열)
+
+JSON Lines는 한 줄에 레코드 하나라 스트림에서 레코드 단위로 읽을 수 있고 뒤에 이어 쓰기도 쉽습니다.
+확장자 없는 키는 read_artifact_with_fallback으로 읽습니다. 형식마다 HEAD로 확인하지 않고 바로 GET하며,
+객체가 없을 때(NoSuchKey)만 다음 형식으로 넘어갑니다.
+"""
+import gzip
+import io
+import json
+
+from pipeline_common.s3_reader import open_object
+
+JSONL_GZIP_EXTENSION = ".jsonl.gz"
+# 기존 키와 함께 조회할 때의 우선순위 (새 형식 우선)
+ARTIFACT_EXTENSIONS = (".jsonl.gz", ".jsonl", ".json.gz", ".json")
+JSONL_CONTENT_TYPES = ("application/x-ndjson", "application/jsonl", "application/x-jsonlines")
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def detect_format(key, content_type=None, content_encoding=None, head=b""):
+    """(gzip 여부, JSON Lines 여부)를 반환합니다."""
+    if key.endswith(".jsonl.gz"):
+        return True, True
+    if key.endswith(".jsonl"):
+        return False, True
+    if key.endswith(".json.gz"):
+        return True, False
+    if key.endswith(".json") and not content_encoding and head[:2] != GZIP_MAGIC:
+        return False, False
+
+    compressed = content_encoding == "gzip" or head[:2] == GZIP_MAGIC
+    lines = (content_type or "").split(";")[0].strip() in JSONL_CONTENT_TYPES
+    return compressed, lines
+
+
+def encode_jsonl(records):
+    """레코드를 한 줄에 하나씩 공백 없는 JSON으로 직렬화합니다."""
+    return "".join(
+        json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n" for record in records
+    ).encode("utf-8")
+
+
+def write_artifact(s3_client, bucket, key, records):
+    """
+    레코드 목록을 키 확장자에 맞는 형식으로 S3에 저장하고 압축 후 크기를 반환합니다.
+    .jsonl.gz / .jsonl이 아닌 키는 기존과 같은 JSON 배열로 저장합니다.
+    """
+    compressed, lines = detect_format(key)
+    if lines:
+        body = encode_jsonl(records)
+        content_type = "application/x-ndjson"
+    else:
+        body = json.dumps(records, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        content_type = "application/json"
+
+    params = {"Bucket": bucket, "Key": key, "ContentType": content_type}
+    if compressed:
+        raw_size = len(body)
+        body = gzip.compress(body)
+        params["ContentEncoding"] = "gzip"
+        print(f"Compressed artifact {key}: {raw_size:,} -> {len(body):,} bytes")
+
+    s3_client.put_object(Body=body, **params)
+    return len(body)
+
+
+def iter_artifact(s3_client, bucket, key, content_type=None, content_encoding=None):
+    """
+    산출물의 레코드를 하나씩 반환합니다.
+    JSON Lines는 스트림에서 한 줄씩 파싱하고, JSON 배열은 전체를 읽은 뒤 원소를 순서대로 반환합니다.
+    """
+    with open_object(s3_client, bucket, key) as raw:
+        yield from _iter_records(raw, key, content_type, content_encoding)
+
+
+def _iter_records(raw, key, content_type=None, content_encoding=None):
+    """열린 객체 스트림에서 레코드를 하나씩 파싱합니다."""
+    compressed, lines = detect_format(key, content_type, content_encoding, raw.peek(2))
+    stream = gzip.GzipFile(fileobj=raw) if compressed else raw
+
+    if not lines:
+        text = io.TextIOWrapper(stream, encoding="utf-8").read()
+        # ContentType 없이 올라간 JSON Lines 객체는 첫 글자로 구분
+        if text.lstrip()[:1] != "[":
+            for line in text.splitlines():
+                if line.strip():
+                    yield json.loads(line)
+            return
+        yield from json.loads(text)
+        return
+
+    for line in io.TextIOWrapper(stream, encoding="utf-8"):
+        if line.strip():
+            yield json.loads(line)
+
+
+def read_artifact(s3_client, bucket, key, content_type=None, content_encoding=None):
+    """산출물 전체를 레코드 목록으로 읽습니다."""
+    return list(iter_artifact(s3_client, bucket, key, content_type, content_encoding))
+
+
+def read_artifact_with_fallback(s3_client, bucket, base_key, known_key=None, extensions=ARTIFACT_EXTENSIONS):
+    """
+    확장자 없는 키의 산출물을 찾아 (key, 레코드 목록)을 반환합니다.
+    plan/체크포인트에 기록된 키(known_key)가 있으면 그 키부터, 없으면 새 형식 키부터 바로 GET하고
+    객체가 없을 때만 다음 형식을 읽습니다. (새 형식과 기존 형식 산출물이 섞여 있는 동안 읽는 쪽에서 사용)
+    """
+    keys = [f"{base_key}{extension}" for extension in extensions]
+    if known_key:
+        keys = [known_key] + [key for key in keys if key != known_key]
+    for key in keys:
+        try:
+            raw = open_object(s3_client, bucket, key)
+        except Exception as e:
+            error_code = getattr(e, "response", {}).get("Error", {}).get("Code")
+            if error_code in ("404", "NoSuchKey", "NotFound"):
+                continue
+            raise
+        with raw:
+            return key, list(_iter_records(raw, key))
+
+    raise FileNotFoundError(
+        f"No artifact found for s3://{bucket}/{base_key} ({', '.join(extensions)})"
+    )
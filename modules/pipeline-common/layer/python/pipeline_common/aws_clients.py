@@ -0,0 +1,36 @@
+"""
+boto3 client 지연 생성
+client는 처음 쓰는 시점에 만들어 실행 환경(Lambda 컨테이너)이 살아 있는 동안 재사용합니다.
+boto3 import도 이때 일어나므로 콜드 스타트의 init 단계에서 boto3 로딩 시간이 빠집니다.
+
+    from pipeline_common.aws_clients import get_client
+    body = read_object(get_client("s3"), bucket, key)
+"""
+import threading
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def get_client(service_name, region_name=None):
+    """(서비스, 리전)별 client를 한 번만 만들어 반환합니다. 기본 세션 생성은 스레드 안전하지 않아 잠금 안에서 만듭니다."""
+    cache_key = (service_name, region_name)
+    client = _clients.get(cache_key)
+    if client is not None:
+        return client
+
+    with _lock:
+        client = _clients.get(cache_key)
+        if client is None:
+            import boto3
+
+            options = {"region_name": region_name} if region_name else {}
+            client = boto3.client(service_name, **options)
+            _clients[cache_key] = client
+    return client
+
+
+def reset_clients():
+    """캐시된 client를 모두 버립니다. (벤치마크에서 가짜 boto3를 바꿔 끼울 때 사용)"""
+    with _lock:
+        _clients.clear()
@@ -0,0 +1,108 @@
+"""
+여러 식당의 OpenAI 배치 요청을 한 배치로 묶고, 결과를 식당별로 다시 나누기
+식당마다 작은 배치를 만들면 업로드/생성/상태 조회가 식당 수만큼 늘어나므로, 요청을 크기 제한까지 한 배치에 모읍니다.
+
+- custom_id = "{식당 키}|{리뷰 ID}|{카테고리}|{순번}" (각 부분은 URL 인코딩되어 '|'가 섞이지 않음)
+  결과 파일의 줄 순서는 보장되지 않으므로 식당/리뷰는 custom_id로만 되찾습니다.
+- 한 식당의 요청은 항상 같은 배치에 넣어 식당 하나의 결과가 배치 하나에서 모두 나오게 합니다.
+- 어느 배치에 어느 식당이 들어갔는지는 plan 파일(S3 JSON)로 남기고, 상태에는 plan key와 배치 ID만 싣습니다.
+
+    batches = pack_requests([(key, lines), ...])
+    plan_key = write_plan(s3_client, bucket, "extraction", [{"batch_id": ..., "keys": [...]}])
+    results_by_key = group_results_by_restaurant(results)
+"""
+import hashlib
+import json
+import os
+from datetime import datetime
+from urllib.parse import quote, unquote
+
+from pipeline_common.s3_reader import read_object
+
+# OpenAI 배치 한도 50,000 요청 / 200MB. 바이트는 Lambda 메모리 안에서 업로드 본문을 만들 수 있게 낮게 둠
+COALESCE_MAX_REQUESTS = int(os.environ.get("COALESCE_MAX_REQUESTS", "50000"))
+COALESCE_MAX_BYTES = int(os.environ.get("COALESCE_MAX_BYTES", str(50 * 1024 * 1024)))
+COALESCE_PLAN_DIRECTORY = os.environ.get("COALESCE_PLAN_DIRECTORY", "batch-plan")
+
+CUSTOM_ID_SEPARATOR = "|"
+
+
+def encode_custom_id(restaurant_key, review_id, category="", index=0):
+    """식당 키와 리뷰 ID(임베딩이면 카테고리까지)를 custom_id 하나에 담습니다. 순번은 배치 안 중복 방지용입니다."""
+    parts = (restaurant_key, review_id, category or "", index)
+    return CUSTOM_ID_SEPARATOR.join(quote(str(part), safe="") for part in parts)
+
+
+def parse_custom_id(custom_id, with_category=False):
+    """
+    custom_id를 (식당 키, 리뷰 ID, 카테고리)로 되돌립니다.
+    이전 형식("{리뷰 ID}_{uuid}", "{리뷰 ID}_{카테고리}_{uuid}")은 식당 키 None으로 읽습니다. (배포 중 남은 배치용)
+    """
+    if CUSTOM_ID_SEPARATOR in custom_id:
+        restaurant_key, review_id, category, _ = (
+            unquote(part) for part in custom_id.split(CUSTOM_ID_SEPARATOR)
+        )
+        return restaurant_key, review_id, category or None
+    if with_category:
+        review_id, category, _ = custom_id.rsplit("_", 2)
+        return None, review_id, category
+    return None, custom_id.split("_")[0], None
+
+
+def group_results_by_restaurant(results):
+    """배치 결과 줄을 식당 키별로 나눕니다. 이전 형식 custom_id는 None 키로 모입니다."""
+    grouped = {}
+    for result in results:
+        custom_id = result["custom_id"]
+        restaurant_key = None
+        if CUSTOM_ID_SEPARATOR in custom_id:
+            restaurant_key = unquote(custom_id.split(CUSTOM_ID_SEPARATOR, 1)[0])
+        grouped.setdefault(restaurant_key, []).append(result)
+    return grouped
+
+
+def pack_requests(requests_by_key, max_requests=None, max_bytes=None):
+    """
+    [(식당 키, [JSONL 한 줄(bytes), ...]), ...]을 크기 제한 안에서 순서대로 묶어
+    [{"keys": [...], "lines": [...], "bytes": n}, ...]를 반환합니다. 요청이 없는 식당은 건너뜁니다.
+    """
+    max_requests = max_requests or COALESCE_MAX_REQUESTS
+    max_bytes = max_bytes or COALESCE_MAX_BYTES
+    batches = []
+    current = {"keys": [], "lines": [], "bytes": 0}
+    for restaurant_key, lines in requests_by_key:
+        if not lines:
+            continue
+        size = sum(len(line) for line in lines)
+        if len(lines) > max_requests or size > max_bytes:
+            raise ValueError(
+                f"Requests for {restaurant_key} exceed one batch ({len(lines)} requests, {size:,} bytes)"
+            )
+        if current["lines"] and (
+            len(current["lines"]) + len(lines) > max_requests or current["bytes"] + size > max_bytes
+        ):
+            batches.append(current)
+            current = {"keys": [], "lines": [], "bytes": 0}
+        current["keys"].append(restaurant_key)
+        current["lines"].extend(lines)
+        current["bytes"] += size
+    if current["lines"]:
+        batches.append(current)
+    return batches
+
+
+def write_plan(s3_client, bucket, stage, batches, extra=None):
+    """
+    배치별 식당 키 목록을 plan 파일로 저장하고 key를 반환합니다. 같은 날 같은 내용이면 같은 key가 됩니다.
+    extra는 다음 단계가 다시 계산하지 않도록 함께 남길 값입니다. (예: 식당별 근접 중복 묶음 "selections")
+    """
+    body = json.dumps({"stage": stage, "batches": batches, **(extra or {})}, ensure_ascii=False).encode("utf-8")
+    digest = hashlib.sha1(body).hexdigest()[:12]
+    key = f"{COALESCE_PLAN_DIRECTORY}/{stage}-{datetime.now().strftime('%Y%m%d')}-{digest}.json"
+    s3_client.put_object(Bucket=bucket, Key=key, Body=body, ContentType="application/json")
+    return key
+
+
+def read_plan(s3_client, bucket, key):
+    """write_plan()으로 저장한 plan을 읽습니다."""
+    return json.loads(read_object(s3_client, bucket, key).decode("utf-8"))
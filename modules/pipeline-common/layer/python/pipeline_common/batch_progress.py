@@ -0,0 +1,77 @@
+"""
+OpenAI 배치 진행률과 다음 조회 시간 계산
+배치 객체의 request_counts(total/completed/failed)와 in_progress_at으로 처리 속도를 구해 남은 시간을 추정하고,
+고정 대기(1800초) 대신 진행 상황에 맞는 다음 조회 간격을 정합니다.
+
+- 처리 속도 = (completed + failed) / (지금 - in_progress_at), 남은 시간 = 남은 요청 수 / 처리 속도
+- 다음 조회는 남은 시간의 BATCH_POLL_ETA_FRACTION 뒤로 잡아 완료 시점에 점점 가깝게 다가가고,
+  BATCH_POLL_MIN_SECONDS ~ BATCH_POLL_MAX_SECONDS 사이로 자릅니다.
+- 아직 진행률이 없으면(validating, 첫 요청 처리 전) BATCH_POLL_DEFAULT_SECONDS, finalizing이면 최소 간격으로 조회합니다.
+
+    summary = summarize_batch(batch)
+    summary["nextPollSeconds"]  # Step Functions Wait 상태의 SecondsPath로 사용
+"""
+import os
+import time
+
+PENDING_STATUSES = ("validating", "in_progress", "finalizing")
+FAILED_STATUSES = ("failed", "expired", "cancelling", "cancelled")
+
+BATCH_POLL_MIN_SECONDS = int(os.environ.get("BATCH_POLL_MIN_SECONDS", "60"))
+BATCH_POLL_MAX_SECONDS = int(os.environ.get("BATCH_POLL_MAX_SECONDS", "1800"))
+BATCH_POLL_DEFAULT_SECONDS = int(os.environ.get("BATCH_POLL_DEFAULT_SECONDS", "300"))
+BATCH_POLL_ETA_FRACTION = float(os.environ.get("BATCH_POLL_ETA_FRACTION", "0.5"))
+
+
+def estimate_remaining_seconds(batch, now=None):
+    """지금까지의 처리 속도로 남은 시간(초)을 추정합니다. 진행률이 없으면 None."""
+    now = time.time() if now is None else now
+    counts = batch.get("request_counts") or {}
+    total = counts.get("total") or 0
+    done = (counts.get("completed") or 0) + (counts.get("failed") or 0)
+    started_at = batch.get("in_progress_at") or batch.get("created_at")
+    if not total or not done or not started_at or now <= started_at:
+        return None
+    rate = done / (now - started_at)
+    return max(0.0, (total - done) / rate)
+
+
+def next_poll_seconds(batch, now=None):
+    """다음 조회까지 기다릴 시간(초). 끝난 배치는 0입니다."""
+    now = time.time() if now is None else now
+    status = batch.get("status")
+    if status not in PENDING_STATUSES:
+        return 0
+    if status == "finalizing":
+        return BATCH_POLL_MIN_SECONDS
+
+    remaining = estimate_remaining_seconds(batch, now)
+    if remaining is None:
+        delay = BATCH_POLL_DEFAULT_SECONDS
+    else:
+        delay = remaining * BATCH_POLL_ETA_FRACTION
+    # 만료 시각이 더 가까우면 만료 직후에 한 번 더 확인
+    expires_at = batch.get("expires_at")
+    if expires_at:
+        delay = min(delay, expires_at - now)
+    return int(min(max(delay, BATCH_POLL_MIN_SECONDS), BATCH_POLL_MAX_SECONDS))
+
+
+def summarize_batch(batch, now=None):
+    """상태 응답에 실을 배치 요약(진행률, 예상 남은 시간, 다음 조회 간격)을 만듭니다."""
+    now = time.time() if now is None else now
+    counts = batch.get("request_counts") or {}
+    total = counts.get("total") or 0
+    completed = counts.get("completed") or 0
+    failed = counts.get("failed") or 0
+    remaining = estimate_remaining_seconds(batch, now) if batch.get("status") in PENDING_STATUSES else None
+    return {
+        "batchId": batch.get("id"),
+        "status": batch.get("status"),
+        "total": total,
+        "completed": completed,
+        "failed": failed,
+        "progress": round((completed + failed) / total, 4) if total else 0.0,
+        "etaSeconds": int(remaining) if remaining is not None else None,
+        "nextPollSeconds": next_poll_seconds(batch, now),
+    }
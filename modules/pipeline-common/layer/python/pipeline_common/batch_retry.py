@@ -0,0 +1,109 @@
+"""
+배치에서 실패했거나 결과 파일에 빠진 요청만 다시 보내기
+Batch API는 실패한 요청을 결과 파일(output_file)이 아닌 오류 파일로 보내거나 200이 아닌 응답으로 남깁니다.
+지금까지는 그런 리뷰가 빈 카테고리/빈 임베딩({})으로 저장되어 save_review_to_DB에서 0 벡터가 되었습니다.
+
+- 카테고리 추출(create-embedding-batch): 실패한 리뷰만 리뷰 하나짜리 요청으로 후속 배치를 만들어
+  BATCH_RETRY_MAX_ROUNDS번까지 다시 보냅니다. (채팅 요청은 배치 할인이 커서 동기 호출 대신 배치)
+- 임베딩(save-embedding): 실패한 키워드만 임베딩 API를 바로 호출합니다. 요청 하나에 입력을
+  EMBEDDING_INPUTS_PER_REQUEST개까지 담고, 429/5xx/네트워크 오류는 SYNC_RETRY_MAX_ATTEMPTS번까지 지수 백오프로 재시도합니다.
+  실패가 SYNC_RETRY_MAX_ITEMS개를 넘으면 장애 상황으로 보고 다시 보내지 않고 보고만 합니다.
+- 다시 보낸 결과는 배치 결과와 같은 형식({"custom_id", "response": {"status_code", "body"}})이라 기존 매핑 함수에 그대로 더합니다.
+- 끝내 실패한 요청은 write_failure_report로 S3에 custom_id와 오류를 남깁니다.
+
+    results, failures = embed_sync([(custom_id, "키워드"), ...], api_key, "text-embedding-3-small", 768)
+"""
+import json
+import os
+import time
+from datetime import datetime
+
+BATCH_RETRY_MAX_ROUNDS = int(os.environ.get("BATCH_RETRY_MAX_ROUNDS", "2"))
+SYNC_RETRY_MAX_ATTEMPTS = int(os.environ.get("SYNC_RETRY_MAX_ATTEMPTS", "3"))
+SYNC_RETRY_MAX_ITEMS = int(os.environ.get("SYNC_RETRY_MAX_ITEMS", "2000"))
+SYNC_RETRY_BACKOFF_SECONDS = float(os.environ.get("SYNC_RETRY_BACKOFF_SECONDS", "1.0"))
+EMBEDDING_INPUTS_PER_REQUEST = 256
+
+OPENAI_API_BASE = "https://api.openai.com"
+RETRYABLE_STATUS_CODES = (408, 409, 429, 500, 502, 503, 504)
+MISSING_RESULT = "missing from batch output"
+
+
+def result_error(result):
+    """배치 결과 한 줄의 오류 설명. 성공(200)이면 None"""
+    response = result.get("response") or {}
+    if response.get("status_code") == 200:
+        return None
+    error = result.get("error") or (response.get("body") or {}).get("error") or {}
+    message = error.get("message") if isinstance(error, dict) else str(error)
+    return f"status {response.get('status_code')}: {message or 'unknown error'}"
+
+
+def post_openai(path, payload, api_key, attempts=None):
+    """OpenAI API 동기 호출. 재시도할 수 있는 오류는 attempts번까지 지수 백오프로 다시 보냅니다."""
+    import urllib.error
+    import urllib.request
+
+    attempts = max(1, attempts or SYNC_RETRY_MAX_ATTEMPTS)
+    data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    for attempt in range(attempts):
+        request = urllib.request.Request(
+            f"{OPENAI_API_BASE}{path}",
+            data=data,
+            headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
+        )
+        try:
+            with urllib.request.urlopen(request) as response:
+                return json.loads(response.read().decode())
+        except urllib.error.HTTPError as e:
+            if e.code not in RETRYABLE_STATUS_CODES or attempt == attempts - 1:
+                raise Exception(f"{path} failed with status {e.code}: {e.read().decode(errors='replace')}")
+        except urllib.error.URLError as e:
+            if attempt == attempts - 1:
+                raise Exception(f"{path} failed: {e.reason}")
+        time.sleep(SYNC_RETRY_BACKOFF_SECONDS * 2**attempt)
+
+
+def embed_sync(items, api_key, model, dimensions):
+    """
+    [(custom_id, 입력 문자열), ...]을 임베딩 API로 바로 요청합니다.
+    반환: (배치 결과 형식의 성공 목록, [{"custom_id", "error"}, ...] 끝내 실패한 목록)
+    """
+    results = []
+    failures = []
+    for start in range(0, len(items), EMBEDDING_INPUTS_PER_REQUEST):
+        chunk = items[start : start + EMBEDDING_INPUTS_PER_REQUEST]
+        payload = {"model": model, "input": [text for _, text in chunk], "dimensions": dimensions}
+        try:
+            body = post_openai("/v1/embeddings", payload, api_key)
+        except Exception as e:
+            failures.extend({"custom_id": custom_id, "error": str(e)} for custom_id, _ in chunk)
+            continue
+        for data in body["data"]:
+            results.append(
+                {
+                    "custom_id": chunk[data["index"]][0],
+                    "response": {"status_code": 200, "body": {"data": [data]}},
+                }
+            )
+    return results, failures
+
+
+def write_failure_report(s3, bucket, key, stage, source, failures):
+    """끝내 실패한 요청 목록을 S3 JSON으로 남깁니다. 실패가 없으면 쓰지 않고 None을 반환합니다."""
+    if not failures:
+        return None
+    report = {
+        "stage": stage,
+        "source": source,
+        "failed_count": len(failures),
+        "created_at": datetime.now().isoformat(),
+        "failures": failures,
+    }
+    s3.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=json.dumps(report, ensure_ascii=False).encode("utf-8"),
+        ContentType="application/json",
+    )
+    return key
@@ -0,0 +1,109 @@
+"""
+DB 부하에 맞춘 SQS 소비 속도 조절 (적응형 backpressure)
+최근 트랜잭션(쓰기 + 커밋) 지연 시간과 잠금 오류를 슬라이딩 윈도우로 모아 한 번의 호출에서 처리할 레코드 수를 정합니다.
+
+- 잠금 오류(lock_timeout, deadlock 등)가 나면 처리 한도를 절반으로 줄이고, 느린 트랜잭션으로 윈도우 p90 지연이 목표를
+  넘으면 3/4로 줄입니다.
+- 지연이 목표 아래로 유지되면 한 번에 1씩 늘려 이벤트 소스 매핑의 batch_size까지 회복합니다. (AIMD)
+- 한도를 넘는 레코드와 잠금 오류가 난 레코드는 batchItemFailures로 돌려주고, 가시성 제한 시간을 재시도 대기 시간으로
+  바꿔 압박이 이어질수록(연속 감소 횟수) 더 늦게 다시 받습니다.
+- 상태는 모듈 전역 객체로 두어 같은 실행 환경(Lambda 컨테이너)의 다음 호출로 이어집니다.
+
+    controller = BackpressureController()
+    for record in records[: controller.batch_limit(len(records))]:
+        started_at = time.perf_counter()
+        ...
+        controller.record(time.perf_counter() - started_at, lock_error=False)
+"""
+import os
+from collections import deque
+
+BACKPRESSURE_WINDOW = int(os.environ.get("BACKPRESSURE_WINDOW", "20"))
+BACKPRESSURE_TARGET_LATENCY_MS = float(os.environ.get("BACKPRESSURE_TARGET_LATENCY_MS", "2000"))
+BACKPRESSURE_RETRY_DELAY_SECONDS = int(os.environ.get("BACKPRESSURE_RETRY_DELAY_SECONDS", "30"))
+# SQS 큐 visibility_timeout_seconds와 같게 둠 (돌려준 레코드를 기본값보다 늦게 받을 이유가 없음)
+BACKPRESSURE_MAX_RETRY_DELAY_SECONDS = int(os.environ.get("BACKPRESSURE_MAX_RETRY_DELAY_SECONDS", "900"))
+
+# 잠금 대기/충돌로 보는 PostgreSQL SQLSTATE
+LOCK_ERROR_CODES = {
+    "55P03",  # lock_not_available (lock_timeout)
+    "40P01",  # deadlock_detected
+    "40001",  # serialization_failure
+    "57014",  # query_canceled (statement_timeout)
+}
+
+
+def is_lock_error(error):
+    """psycopg2(pgcode)와 pg8000(args[0]["C"]) 예외에서 SQLSTATE를 꺼내 잠금 오류인지 확인합니다."""
+    code = getattr(error, "pgcode", None)
+    if code is None and error.args and isinstance(error.args[0], dict):
+        code = error.args[0].get("C")
+    return code in LOCK_ERROR_CODES
+
+
+def queue_url_from_arn(queue_arn):
+    """arn:aws:sqs:{region}:{account}:{name} 형식의 eventSourceARN을 큐 URL로 바꿉니다."""
+    _, _, _, region, account, name = queue_arn.split(":", 5)
+    return f"https://sqs.{region}.amazonaws.com/{account}/{name}"
+
+
+class BackpressureController:
+    """실행 환경 하나의 처리 한도. max_batch는 첫 이벤트의 레코드 수로 정해집니다."""
+
+    def __init__(self, window=None, target_latency_ms=None):
+        self.samples = deque(maxlen=window or BACKPRESSURE_WINDOW)
+        self.target_latency = (target_latency_ms or BACKPRESSURE_TARGET_LATENCY_MS) / 1000
+        self.limit = None
+        self.max_batch = None
+        self.pressure = 0
+
+    def batch_limit(self, record_count):
+        """이번 호출에서 처리할 레코드 수. 처음 보는 batch 크기면 그 크기까지 허용합니다."""
+        if self.max_batch is None or record_count > self.max_batch:
+            self.max_batch = record_count
+            if self.limit is None:
+                self.limit = record_count
+        return max(1, min(self.limit, record_count))
+
+    def latency_p90(self):
+        latencies = sorted(latency for latency, _ in self.samples)
+        if not latencies:
+            return 0.0
+        return latencies[min(len(latencies) - 1, int(len(latencies) * 0.9))]
+
+    def lock_error_count(self):
+        return sum(1 for _, lock_error in self.samples if lock_error)
+
+    def record(self, latency_seconds, lock_error=False):
+        """트랜잭션 하나의 결과를 반영하고, 한도를 줄였으면 True를 반환합니다. (남은 레코드를 돌려줄 신호)"""
+        self.samples.append((latency_seconds, lock_error))
+        if self.limit is None:
+            self.limit = self.max_batch or 1
+
+        if lock_error:
+            return self._decrease(0.5)
+        # 한 번 느렸던 표본이 윈도우에 남아 있는 동안 계속 줄이지 않도록 이번 트랜잭션도 느렸을 때만 줄임
+        if latency_seconds > self.target_latency and self.latency_p90() > self.target_latency:
+            return self._decrease(0.75)
+        self.pressure = 0
+        if self.max_batch and self.limit < self.max_batch:
+            self.limit += 1
+        return False
+
+    def _decrease(self, factor):
+        self.limit = max(1, int(self.limit * factor))
+        self.pressure += 1
+        return True
+
+    def retry_delay(self):
+        """돌려줄 레코드의 가시성 제한 시간(초). 압박이 이어질수록 두 배씩 늘립니다."""
+        delay = BACKPRESSURE_RETRY_DELAY_SECONDS * (2 ** max(0, self.pressure - 1))
+        return int(min(delay, BACKPRESSURE_MAX_RETRY_DELAY_SECONDS))
+
+    def snapshot(self):
+        """지표와 로그에 남길 현재 상태."""
+        return {
+            "BatchLimit": self.limit or 0,
+            "LatencyP90": round(self.latency_p90() * 1000, 3),
+            "LockErrors": self.lock_error_count(),
+        }
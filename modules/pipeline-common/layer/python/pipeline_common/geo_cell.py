@@ -0,0 +1,138 @@
+"""
+geohash 기반 계층형 지리 셀 키
+적재 시 식당 좌표를 geohash(기본 8자리)로 저장해 두면, 앞자리(prefix)가 상위 셀이 되므로
+"이 역 근처" 조회를 전체 거리 계산 대신 인덱스 prefix 스캔으로 처리할 수 있습니다.
+
+정밀도별 셀 크기(대략, 적도 기준 너비 x 높이)
+5: 4.9km x 4.9km, 6: 1.2km x 0.6km, 7: 153m x 153m, 8: 38m x 19m
+"""
+import math
+import os
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEO_CELL_PRECISION = int(os.environ.get("GEO_CELL_PRECISION", "8"))
+METERS_PER_DEGREE_LAT = 111320.0
+
+
+def is_valid_coordinate(latitude, longitude):
+    """좌표가 비어 있거나 범위를 벗어나거나 0.0/0.0(기본값)이면 False"""
+    if latitude is None or longitude is None:
+        return False
+    try:
+        latitude = float(latitude)
+        longitude = float(longitude)
+    except (TypeError, ValueError):
+        return False
+    if math.isnan(latitude) or math.isnan(longitude):
+        return False
+    if not (-90.0 <= latitude <= 90.0 and -180.0 <= longitude <= 180.0):
+        return False
+    return not (latitude == 0.0 and longitude == 0.0)
+
+
+def encode(latitude, longitude, precision=GEO_CELL_PRECISION):
+    """좌표를 geohash 문자열로 인코딩합니다."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+
+    while len(chars) < precision:
+        if even:
+            mid = (lon_range[0] + lon_range[1]) / 2
+            if longitude >= mid:
+                bits = (bits << 1) | 1
+                lon_range[0] = mid
+            else:
+                bits <<= 1
+                lon_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if latitude >= mid:
+                bits = (bits << 1) | 1
+                lat_range[0] = mid
+            else:
+                bits <<= 1
+                lat_range[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+
+    return "".join(chars)
+
+
+def decode_bbox(geohash):
+    """geohash 셀의 (min_lat, max_lat, min_lon, max_lon)을 반환합니다."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        value = BASE32.index(char)
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            target = lon_range if even else lat_range
+            mid = (target[0] + target[1]) / 2
+            if bit:
+                target[0] = mid
+            else:
+                target[1] = mid
+            even = not even
+    return lat_range[0], lat_range[1], lon_range[0], lon_range[1]
+
+
+def geo_cell(latitude, longitude, precision=GEO_CELL_PRECISION):
+    """
+    적재용 셀 키를 계산합니다.
+    유효하지 않은 좌표(0.0/0.0 포함)는 None을 반환하므로 지리 필터 대상에서 빠집니다.
+    """
+    if not is_valid_coordinate(latitude, longitude):
+        return None
+    return encode(float(latitude), float(longitude), precision)
+
+
+def cell_size_m(precision, latitude):
+    """해당 정밀도 셀의 (높이, 너비)를 미터로 반환합니다."""
+    lon_bits = (precision * 5 + 1) // 2
+    lat_bits = precision * 5 // 2
+    height = 180.0 / (2 ** lat_bits) * METERS_PER_DEGREE_LAT
+    width = 360.0 / (2 ** lon_bits) * METERS_PER_DEGREE_LAT * math.cos(math.radians(latitude))
+    return height, width
+
+
+def precision_for_radius(latitude, radius_m, max_precision=GEO_CELL_PRECISION):
+    """중심 셀 + 이웃 8칸이 반경을 덮을 수 있는 가장 세밀한 정밀도를 고릅니다."""
+    for precision in range(max_precision, 0, -1):
+        height, width = cell_size_m(precision, latitude)
+        if height >= radius_m and width >= radius_m:
+            return precision
+    return 1
+
+
+def covering_cells(latitude, longitude, radius_m, max_precision=GEO_CELL_PRECISION):
+    """반경 검색에 필요한 셀 prefix 목록(중심 + 이웃 8칸, 중복 제거)을 반환합니다."""
+    precision = precision_for_radius(latitude, radius_m, max_precision)
+    center = encode(latitude, longitude, precision)
+    min_lat, max_lat, min_lon, max_lon = decode_bbox(center)
+    lat_step = max_lat - min_lat
+    lon_step = max_lon - min_lon
+    center_lat = (min_lat + max_lat) / 2
+    center_lon = (min_lon + max_lon) / 2
+
+    cells = []
+    for d_lat in (-1, 0, 1):
+        for d_lon in (-1, 0, 1):
+            lat = center_lat + d_lat * lat_step
+            lon = center_lon + d_lon * lon_step
+            if not -90.0 <= lat <= 90.0:
+                continue
+            # 경도는 날짜변경선을 넘으면 반대편으로 감쌈
+            lon = (lon + 180.0) % 360.0 - 180.0
+            cell = encode(lat, lon, precision)
+            if cell not in cells:
+                cells.append(cell)
+    return cells
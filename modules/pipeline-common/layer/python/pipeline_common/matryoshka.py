@@ -0,0 +1,45 @@
+"""
+Matryoshka 방식 저차원 사전 필터 벡터
+text-embedding-3-small은 앞쪽 차원에 정보가 몰리도록 학습되어, 앞 N차원만 잘라 다시 L2 정규화해도 유사도 순위가 크게 유지됩니다.
+768차원 facet 벡터마다 앞 PREFILTER_DIMENSION차원 사본을 함께 저장해 두고,
+검색은 짧은 벡터로 후보를 좁힌 뒤 768차원 벡터로 다시 순위를 매깁니다. (recommend_query의 two-stage 경로)
+
+- 컬럼: {facet}_prefilter_vector vector(128) (sql/002_prefilter_vectors.sql). 차원을 바꾸면 컬럼 타입도 같이 바꿔야 함
+- 0 벡터(임베딩이 없는 facet)는 정규화하지 않고 0 벡터 그대로 둡니다.
+
+    row.update(prefilter_columns(row))  # {"vibe_vector": [...]} -> {"vibe_prefilter_vector": [...]}
+"""
+import math
+
+PREFILTER_DIMENSION = 128
+FACETS = ("companion", "food", "purpose", "vibe")
+
+
+def truncate_normalize(vector, dimension=PREFILTER_DIMENSION):
+    """앞 dimension차원을 잘라 다시 L2 정규화한 벡터. 비어 있으면 None"""
+    if not vector:
+        return None
+    head = [float(value) for value in vector[:dimension]]
+    norm = math.sqrt(sum(value * value for value in head))
+    if norm == 0:
+        return head
+    return [value / norm for value in head]
+
+
+def prefilter_embeddings(embeddings, dimension=PREFILTER_DIMENSION):
+    """{facet: 벡터} -> {facet: 잘라서 정규화한 벡터} (빈 벡터는 제외)"""
+    prefilter = {}
+    for facet, vector in (embeddings or {}).items():
+        truncated = truncate_normalize(vector, dimension)
+        if truncated is not None:
+            prefilter[facet] = truncated
+    return prefilter
+
+
+def prefilter_columns(row, dimension=PREFILTER_DIMENSION):
+    """{facet}_vector 값이 있는 행에서 {facet}_prefilter_vector 컬럼 값을 만듭니다."""
+    return {
+        f"{facet}_prefilter_vector": truncate_normalize(row[f"{facet}_vector"], dimension)
+        for facet in FACETS
+        if f"{facet}_vector" in row
+    }
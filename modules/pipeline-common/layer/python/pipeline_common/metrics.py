@@ -0,0 +1,130 @@
+"""
+단계별 성능 지표를 CloudWatch Embedded Metric Format(EMF)으로 출력
+with 블록(span) 하나가 EMF JSON 한 줄이 되어 stdout으로 나가며, CloudWatch Logs가 이를 지표로 추출합니다.
+
+    with metrics.span("s3_read") as span:
+        body = read_object(...)
+        span.add_bytes(len(body))
+
+지표: Duration(ms), Bytes, Rows, MemoryHighWaterMB(프로세스 최대 RSS), Error(0/1)
+차원: Function(Lambda 함수 이름), Stage(span 이름)
+오프라인에서는 stdout을 받아 parse_metrics()로 다시 읽어 검증할 수 있습니다.
+"""
+import json
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+
+METRICS_NAMESPACE = os.environ.get("METRICS_NAMESPACE", "WellmeetPipeline")
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "true").lower() != "false"
+
+UNITS = {
+    "Duration": "Milliseconds",
+    "ConnectDuration": "Milliseconds",
+    "CommitDuration": "Milliseconds",
+    "Bytes": "Bytes",
+    "Rows": "Count",
+    "MemoryHighWaterMB": "Megabytes",
+    "Error": "Count",
+}
+
+
+def memory_high_water_mb():
+    """프로세스 최대 RSS(MB). Linux는 KB, macOS는 bytes 단위로 반환됩니다."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return round(peak / 1024 / 1024, 1)
+    return round(peak / 1024, 1)
+
+
+def function_name():
+    return os.environ.get("AWS_LAMBDA_FUNCTION_NAME", "local")
+
+
+class Span:
+    def __init__(self, stage):
+        self.stage = stage
+        self.bytes = 0
+        self.rows = 0
+        self.values = {}
+        self.properties = {}
+
+    def add_bytes(self, count):
+        self.bytes += int(count or 0)
+
+    def add_rows(self, count):
+        self.rows += int(count or 0)
+
+    def set_metric(self, name, value, unit="None"):
+        """기본 지표 외에 단계 고유 지표를 추가합니다."""
+        self.values[name] = value
+        UNITS.setdefault(name, unit)
+
+    def set_property(self, name, value):
+        """지표가 아닌 검색용 속성(배치 ID, S3 key 등)을 같은 로그 줄에 남깁니다."""
+        self.properties[name] = value
+
+
+def emit(stage, values, properties=None):
+    """EMF JSON 한 줄을 stdout으로 출력하고, 출력한 dict를 반환합니다."""
+    record = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": METRICS_NAMESPACE,
+                    "Dimensions": [["Function", "Stage"]],
+                    "Metrics": [
+                        {"Name": name, "Unit": UNITS.get(name, "None")} for name in values
+                    ],
+                }
+            ],
+        },
+        "Function": function_name(),
+        "Stage": stage,
+    }
+    record.update(properties or {})
+    record.update(values)
+    if METRICS_ENABLED:
+        print(json.dumps(record, ensure_ascii=False, default=str), flush=True)
+    return record
+
+
+@contextmanager
+def span(stage, **properties):
+    """블록 실행 시간과 바이트/행 수를 재서 블록이 끝날 때 EMF 한 줄로 출력합니다. 예외는 그대로 올립니다."""
+    current = Span(stage)
+    current.properties.update(properties)
+    started_at = time.perf_counter()
+    error = 0
+    try:
+        yield current
+    except BaseException:
+        error = 1
+        raise
+    finally:
+        values = {
+            "Duration": round((time.perf_counter() - started_at) * 1000, 3),
+            "Bytes": current.bytes,
+            "Rows": current.rows,
+            "MemoryHighWaterMB": memory_high_water_mb(),
+            "Error": error,
+        }
+        values.update(current.values)
+        emit(stage, values, current.properties)
+
+
+def parse_metrics(text):
+    """stdout 텍스트에서 EMF 줄만 골라 dict 목록으로 반환합니다. (오프라인 검증용)"""
+    records = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line.startswith("{") or '"_aws"' not in line:
+            continue
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            continue
+    return records
@@ -0,0 +1,157 @@
+"""
+근접 중복 리뷰 묶기 (글자 n-gram MinHash + LSH)
+save-vector의 SHA-256 hash는 본문이 완전히 같을 때만 거르므로, 태그나 몇 글자만 다른 복사 리뷰는 모두 추출/임베딩됩니다.
+식당 하나의 리뷰 안에서 비슷한 리뷰를 묶어 묶음마다 대표 리뷰 하나만 LLM에 보내고,
+결과를 매핑할 때 대표 리뷰의 카테고리를 같은 묶음의 나머지 리뷰에 복사합니다.
+
+- 공백을 뺀 글자 NEAR_DUP_SHINGLE_SIZE-gram 집합의 MinHash 서명(NEAR_DUP_NUM_PERM개)을 만들고
+  NEAR_DUP_BANDS개 밴드로 나눠 같은 버킷에 들어간 리뷰만 후보로 비교합니다.
+- 후보 쌍은 서명 일치 비율(추정 Jaccard 유사도)이 NEAR_DUP_THRESHOLD 이상일 때 같은 묶음이 됩니다.
+- 대표는 묶음에서 가장 앞의 리뷰입니다. 묶음 계산(MinHash)은 요청을 만드는 쪽(create-category-batch)에서 한 번만 하고,
+  식당별 묶음(대표 id -> 나머지 위치)을 plan에 남깁니다. 매핑하는 쪽(create-embedding-batch)은
+  본문 정리만 다시 해서 저장한 묶음으로 대표 목록을 되살립니다. 저장한 묶음이 없으면(이전 plan) 다시 계산합니다.
+
+    representatives, members, report = dedupe_reviews([(위치, 리뷰), ...])
+    representatives, members, report = select_extraction_reviews(reviews)  # 정리(review_normalize) + 중복 제거
+    selection = extraction_selection(reviews, members)                      # plan에 저장
+    representatives, members = restore_extraction_reviews(reviews, selection)
+"""
+import os
+import random
+import re
+import zlib
+
+from pipeline_common.review_normalize import normalize_reviews
+from pipeline_common.review_packing import estimate_tokens
+
+NEAR_DUP_ENABLED = os.environ.get("NEAR_DUP_ENABLED", "true").lower() != "false"
+NEAR_DUP_SHINGLE_SIZE = int(os.environ.get("NEAR_DUP_SHINGLE_SIZE", "3"))
+NEAR_DUP_NUM_PERM = int(os.environ.get("NEAR_DUP_NUM_PERM", "64"))
+NEAR_DUP_BANDS = int(os.environ.get("NEAR_DUP_BANDS", "16"))
+NEAR_DUP_THRESHOLD = float(os.environ.get("NEAR_DUP_THRESHOLD", "0.7"))
+
+MASK_64 = (1 << 64) - 1
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+# multiply-shift 해시 계수 (a는 홀수). 큰 소수 나머지 연산보다 빨라 Lambda 안에서 순수 Python으로 충분
+_random = random.Random(20240601)
+PERMUTATIONS = [(_random.getrandbits(64) | 1, _random.getrandbits(64)) for _ in range(NEAR_DUP_NUM_PERM)]
+
+
+def shingles(text, size=None):
+    """공백을 뺀 소문자 본문의 글자 n-gram 집합"""
+    size = size or NEAR_DUP_SHINGLE_SIZE
+    text = WHITESPACE_PATTERN.sub("", (text or "").lower())
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i : i + size] for i in range(len(text) - size + 1)}
+
+
+def minhash(shingle_set):
+    """MinHash 서명 (빈 집합은 None)"""
+    if not shingle_set:
+        return None
+    hashes = [zlib.crc32(shingle.encode("utf-8")) for shingle in shingle_set]
+    return tuple(
+        min(((a * value + b) & MASK_64) >> 32 for value in hashes) for a, b in PERMUTATIONS
+    )
+
+
+def similarity(left, right):
+    """두 서명의 일치 비율 (Jaccard 유사도 추정값)"""
+    return sum(1 for x, y in zip(left, right) if x == y) / len(left)
+
+
+def cluster_near_duplicates(texts):
+    """
+    본문 목록을 근접 중복 묶음으로 나눠, 위치마다 대표 위치(묶음에서 가장 앞)를 담은 목록을 반환합니다.
+    빈 본문은 어느 묶음에도 넣지 않습니다.
+    """
+    signatures = [minhash(shingles(text)) for text in texts]
+    parent = list(range(len(texts)))
+
+    def find(index):
+        while parent[index] != index:
+            parent[index] = parent[parent[index]]
+            index = parent[index]
+        return index
+
+    rows = max(1, NEAR_DUP_NUM_PERM // NEAR_DUP_BANDS)
+    buckets = {}
+    for index, signature in enumerate(signatures):
+        if signature is None:
+            continue
+        for band in range(0, NEAR_DUP_NUM_PERM, rows):
+            buckets.setdefault((band, signature[band : band + rows]), []).append(index)
+
+    for members in buckets.values():
+        for position, left in enumerate(members):
+            for right in members[position + 1 :]:
+                root_left, root_right = find(left), find(right)
+                if root_left == root_right:
+                    continue
+                if similarity(signatures[left], signatures[right]) >= NEAR_DUP_THRESHOLD:
+                    # 앞쪽 위치가 대표가 되도록 작은 쪽을 루트로
+                    parent[max(root_left, root_right)] = min(root_left, root_right)
+
+    return [find(index) for index in range(len(texts))]
+
+
+def dedupe_reviews(kept):
+    """
+    [(원래 위치, 리뷰), ...]에서 근접 중복을 빼고 대표만 남깁니다.
+    반환: (대표 [(원래 위치, 리뷰), ...], {대표 리뷰 id(str): [같은 묶음 나머지의 원래 위치, ...]}, 보고 dict)
+    """
+    report = {"DuplicateReviews": 0, "DuplicateClusters": 0, "DuplicateTokens": 0}
+    if not NEAR_DUP_ENABLED or len(kept) < 2:
+        return list(kept), {}, report
+
+    representative_of = cluster_near_duplicates([review.get("content") for _, review in kept])
+    representatives = []
+    members = {}
+    for position, (index, review) in enumerate(kept):
+        representative = representative_of[position]
+        if representative == position:
+            representatives.append((index, review))
+            continue
+        members.setdefault(str(kept[representative][1]["id"]), []).append(index)
+        report["DuplicateReviews"] += 1
+        report["DuplicateTokens"] += estimate_tokens(review.get("content") or "")
+    report["DuplicateClusters"] = len(members)
+    return representatives, members, report
+
+
+def select_extraction_reviews(reviews):
+    """
+    추출 요청에 보낼 리뷰를 고릅니다. 본문 정리(review_normalize) 후 근접 중복을 뺍니다.
+    매핑하는 쪽은 extraction_selection()으로 저장한 묶음을 restore_extraction_reviews()로 되살려 같은 목록을 얻습니다.
+    반환: (대표 [(원래 위치, 정리된 리뷰), ...], {대표 리뷰 id: [나머지 원래 위치, ...]}, 정리 + 중복 보고)
+    """
+    normalized, report = normalize_reviews(reviews)
+    representatives, members, duplicate_report = dedupe_reviews(normalized)
+    report.update(duplicate_report)
+    return representatives, members, report
+
+
+def extraction_selection(reviews, members):
+    """select_extraction_reviews()의 묶음을 plan에 저장할 형태로 줄입니다. (대표 목록은 정리 결과에서 되살릴 수 있음)"""
+    return {"reviewCount": len(reviews), "members": members}
+
+
+def restore_extraction_reviews(reviews, selection):
+    """
+    저장한 묶음으로 select_extraction_reviews()와 같은 (대표, 묶음)을 MinHash 없이 되살립니다.
+    본문 정리만 다시 하고, 묶음 나머지 위치를 빼면 대표 목록이 됩니다.
+    저장한 묶음이 없거나 리뷰 파일이 바뀌어 맞지 않으면 None을 반환합니다.
+    """
+    if not selection or selection.get("reviewCount") != len(reviews):
+        return None
+    normalized, _ = normalize_reviews(reviews)
+    members = selection.get("members") or {}
+    member_indexes = {index for indexes in members.values() for index in indexes}
+    representatives = [(index, review) for index, review in normalized if index not in member_indexes]
+    representative_ids = {str(review["id"]) for _, review in representatives}
+    kept_indexes = {index for index, _ in normalized}
+    if not member_indexes <= kept_indexes or not set(members) <= representative_ids:
+        return None
+    return representatives, members
@@ -0,0 +1,68 @@
+"""
+outbox 메시지에 작은 벡터 payload 싣기 (claim-check 임계값)
+지금까지 outbox payload는 S3 key뿐이라, save-restaurant-metadata가 임베딩 JSON을 읽은 뒤
+outbox-polling이 key를 넘기면 save-vector가 같은 객체를 S3에서 다시 읽고 파싱했습니다.
+
+- save-restaurant-metadata는 이미 읽은 임베딩 JSON에서 save-vector가 쓰는 필드만 남긴 압축 payload를 만들어
+  OUTBOX_INLINE_MAX_BYTES 이하면 outbox.inline_payload(MEDIUMTEXT)에 같은 트랜잭션으로 저장합니다.
+- outbox-polling은 inline_payload가 있으면 메시지의 vectorPayload로 싣고, 메시지가 SQS 한도를 넘으면 key만 보냅니다.
+- save-vector는 vectorPayload가 있으면 S3를 읽지 않고, 없으면(큰 payload, 이전 행) 지금처럼 s3Key로 읽습니다.
+- outbox.payload는 계속 S3 key입니다. 중복 outbox 확인(payload IN (...))이 그대로 동작합니다.
+- 크기는 UTF-8 바이트로 잽니다. 메시지도 ensure_ascii=False로 만들어 한글이 \\uXXXX(6바이트)로 커지지 않게 합니다.
+
+    inline = encode_inline_payload(embedding_data)         # 임계값을 넘으면 None
+    body = build_outbox_message(s3_key, restaurant_id, inline)
+    embedding_data = inline_vector_payload(message_body)    # 없으면 None -> S3에서 읽기
+"""
+import json
+import os
+
+# SQS 메시지 한도 256 KiB. 메시지 틀(s3Key, restaurantId)과 속성 여유를 빼고 payload 임계값을 잡음
+SQS_MAX_MESSAGE_BYTES = 256 * 1024
+OUTBOX_INLINE_MAX_BYTES = int(os.environ.get("OUTBOX_INLINE_MAX_BYTES", str(240 * 1024)))
+
+# save-vector가 임베딩 JSON에서 읽는 필드
+VECTOR_PAYLOAD_FIELDS = ("placeId", "latitude", "longitude", "embeddings")
+
+
+def compact_vector_payload(embedding_data):
+    """임베딩 JSON에서 save-vector에 필요한 필드만 남깁니다. (리뷰는 본문만)"""
+    payload = {field: embedding_data.get(field) for field in VECTOR_PAYLOAD_FIELDS if field in embedding_data}
+    payload["reviews"] = [
+        {"content": review.get("content", "")} for review in embedding_data.get("reviews", [])
+    ]
+    return payload
+
+
+def encode_inline_payload(embedding_data):
+    """압축 payload JSON 문자열. OUTBOX_INLINE_MAX_BYTES를 넘거나 임계값이 0이면 None (S3 key로만 전달)"""
+    if OUTBOX_INLINE_MAX_BYTES <= 0:
+        return None
+    encoded = json.dumps(
+        compact_vector_payload(embedding_data), ensure_ascii=False, separators=(",", ":")
+    )
+    if len(encoded.encode("utf-8")) > OUTBOX_INLINE_MAX_BYTES:
+        return None
+    return encoded
+
+
+def build_outbox_message(s3_key, restaurant_id, inline_payload=None):
+    """
+    SQS 메시지 본문. inline_payload가 있으면 vectorPayload로 싣고,
+    합친 메시지가 SQS 한도를 넘으면(임계값을 올려 잡은 경우) key만 보냅니다.
+    """
+    message = {"s3Key": s3_key, "restaurantId": restaurant_id}
+    if inline_payload:
+        body = json.dumps(
+            {**message, "vectorPayload": json.loads(inline_payload)},
+            ensure_ascii=False,
+            separators=(",", ":"),
+        )
+        if len(body.encode("utf-8")) <= SQS_MAX_MESSAGE_BYTES:
+            return body
+    return json.dumps(message)
+
+
+def inline_vector_payload(message_body):
+    """메시지에 실린 벡터 payload. 없으면 None"""
+    return message_body.get("vectorPayload")
@@ -0,0 +1,101 @@
+"""
+placeId 목록 출력 (inline / manifest)
+inline은 기존처럼 {"placeIds": [...]}를 Step Functions 상태에 그대로 싣습니다.
+manifest는 placeId를 S3에 JSON Lines({"placeId": "..."} 한 줄씩)로 쓰고 key와 개수만 반환하므로
+검색 범위가 넓어도 상태 크기(256KB 제한)가 늘지 않습니다.
+분산 Map의 ItemReader(ReaderConfig.InputType = "JSONL")가 이 파일을 바로 항목 목록으로 읽습니다.
+
+여러 검색어를 한 번에 처리할 때는 merge_place_ids()로 처음 나온 순서를 유지하며 중복을 제거하고,
+검색어별로 앞선 검색어와 겹쳐 건너뛴 식당 수(= 아낀 크롤링/카테고리/임베딩 작업 수)를 보고합니다.
+"""
+import hashlib
+import json
+import os
+
+from pipeline_common.artifact_codec import write_artifact
+
+OUTPUT_MODES = ("inline", "manifest")
+DEFAULT_OUTPUT_MODE = os.environ.get("PLACE_ID_OUTPUT_MODE", "inline")
+PLACE_MANIFEST_DIRECTORY = os.environ.get("PLACE_MANIFEST_DIRECTORY", "manifest")
+
+
+def extract_place_ids(restaurants):
+    """식당 목록에서 placeId가 있는 항목만 {"placeId": ...} 객체로 추출합니다."""
+    place_ids = []
+    for restaurant in restaurants:
+        place_id = restaurant.get("placeId")
+        if place_id:
+            place_ids.append({"placeId": place_id})
+    return place_ids
+
+
+def merge_place_ids(query_results):
+    """
+    검색어별 placeId 목록을 합쳐 (중복 없는 작업 목록, 중복 보고서)를 반환합니다.
+    query_results는 [(query, [{"placeId": ...}, ...]), ...]이며 앞선 검색어와 파일 안 순서가 그대로 유지됩니다.
+    """
+    merged = []
+    first_query = {}
+    query_reports = []
+    for query, place_ids in query_results:
+        new_count = 0
+        overlap_with = {}
+        for item in place_ids:
+            place_id = item["placeId"]
+            owner = first_query.get(place_id)
+            if owner is None:
+                first_query[place_id] = query
+                merged.append({"placeId": place_id})
+                new_count += 1
+            else:
+                # 같은 파일 안의 중복은 자기 자신과 겹친 것으로 기록
+                overlap_with[owner] = overlap_with.get(owner, 0) + 1
+        duplicate_count = len(place_ids) - new_count
+        query_reports.append(
+            {
+                "query": query,
+                "placeCount": len(place_ids),
+                "newPlaceCount": new_count,
+                "duplicatePlaceCount": duplicate_count,
+                "overlapRatio": round(duplicate_count / len(place_ids), 4) if place_ids else 0.0,
+                "overlapWith": overlap_with,
+            }
+        )
+
+    total_count = sum(report["placeCount"] for report in query_reports)
+    avoided_count = total_count - len(merged)
+    return merged, {
+        "queries": query_reports,
+        "totalPlaceCount": total_count,
+        "uniquePlaceCount": len(merged),
+        "avoidedPlaceCount": avoided_count,
+        "avoidedRatio": round(avoided_count / total_count, 4) if total_count else 0.0,
+    }
+
+
+def manifest_name(queries):
+    """검색어 하나면 그대로, 여러 개면 검색어 목록 해시로 manifest 이름을 만듭니다. (key 길이 제한 회피)"""
+    if len(queries) == 1:
+        return queries[0]
+    digest = hashlib.sha1(json.dumps(queries, ensure_ascii=False).encode("utf-8")).hexdigest()
+    return f"queries-{digest[:12]}"
+
+
+def output_mode(event):
+    """이벤트의 OUTPUT_MODE(없으면 PLACE_ID_OUTPUT_MODE 환경변수)를 검증해 반환합니다."""
+    mode = event.get("OUTPUT_MODE") or DEFAULT_OUTPUT_MODE
+    if mode not in OUTPUT_MODES:
+        raise ValueError(f"Unknown OUTPUT_MODE: {mode} (expected one of {OUTPUT_MODES})")
+    return mode
+
+
+def manifest_key(query, directory=PLACE_MANIFEST_DIRECTORY):
+    """검색어별 manifest key. 같은 검색어는 같은 key를 덮어써 재실행해도 결과가 같습니다."""
+    return f"{directory}/{query}.jsonl"
+
+
+def write_place_manifest(s3_client, bucket, query, place_ids):
+    """placeId 목록을 JSONL manifest로 저장하고 상태에 실을 위치와 개수를 반환합니다."""
+    key = manifest_key(query)
+    write_artifact(s3_client, bucket, key, place_ids)
+    return {"manifestBucket": bucket, "manifestKey": key, "placeCount": len(place_ids)}
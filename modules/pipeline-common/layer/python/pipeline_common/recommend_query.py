@@ -0,0 +1,455 @@
+"""
+restaurant_vector 기반 근거리 추천 쿼리
+위치/반경으로 바운딩 박스 사전 필터링 후, 4개 facet(companion/food/purpose/vibe)의
+가중 코사인 유사도로 점수를 매겨 top-K를 반환합니다.
+
+세 가지 경로를 제공합니다.
+- exact_scan: 순수 Python 전수 비교 (기준값)
+- numpy_search: 메모리에 적재한 NumPy 행렬 비교
+- sql_search: recommend DB에서 위경도 조건 + pgvector 거리 연산
+
+numpy_search와 sql_search는 prefilter_candidates를 주면 2단계로 검색합니다.
+앞 128차원을 잘라 다시 정규화한 사본(pipeline_common.matryoshka)으로 후보를 prefilter_candidates개까지 좁힌 뒤
+768차원 벡터로 다시 점수를 매겨 top-K를 고릅니다. 바운딩 박스 안 후보가 그보다 적으면 768차원으로 바로 비교합니다.
+
+CLI 예시
+python recommend_query.py --query-file query.json --latitude 37.498 --longitude 127.027 \\
+    --radius 1000 --weights vibe=0.4,food=0.3,purpose=0.2,companion=0.1 --top-k 10 \\
+    --prefilter-candidates 200
+"""
+import argparse
+import heapq
+import json
+import math
+import os
+
+from pipeline_common.geo_cell import covering_cells
+from pipeline_common.matryoshka import PREFILTER_DIMENSION, truncate_normalize
+
+FACETS = ("companion", "food", "purpose", "vibe")
+EARTH_RADIUS_M = 6371000.0
+METERS_PER_DEGREE_LAT = 111320.0
+
+
+def bounding_box(latitude, longitude, radius_m):
+    """중심 좌표와 반경(m)을 감싸는 위경도 바운딩 박스를 계산합니다."""
+    delta_lat = radius_m / METERS_PER_DEGREE_LAT
+    cos_lat = max(math.cos(math.radians(latitude)), 1e-6)
+    delta_lon = radius_m / (METERS_PER_DEGREE_LAT * cos_lat)
+    return (
+        latitude - delta_lat,
+        latitude + delta_lat,
+        longitude - delta_lon,
+        longitude + delta_lon,
+    )
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """두 좌표 사이의 거리(m)"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    d_phi = math.radians(lat2 - lat1)
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def normalize_weights(weights):
+    """facet 가중치를 합이 1이 되도록 정규화하고, 0 이하인 facet은 제외합니다."""
+    weights = {facet: float(weight) for facet, weight in weights.items() if facet in FACETS}
+    weights = {facet: weight for facet, weight in weights.items() if weight > 0}
+    total = sum(weights.values())
+    if total <= 0:
+        raise ValueError("At least one facet weight must be positive")
+    return {facet: weight / total for facet, weight in weights.items()}
+
+
+def parse_weights(text):
+    """'vibe=0.4,food=0.3' 형식의 문자열을 가중치 dict로 변환합니다."""
+    weights = {}
+    for item in text.split(","):
+        if not item.strip():
+            continue
+        facet, value = item.split("=", 1)
+        weights[facet.strip()] = float(value)
+    return weights
+
+
+def cosine_similarity(a, b):
+    """두 벡터의 코사인 유사도 (어느 한쪽이 비어 있거나 0 벡터면 0)"""
+    if not a or not b:
+        return 0.0
+    dot = 0.0
+    norm_a = 0.0
+    norm_b = 0.0
+    for x, y in zip(a, b):
+        dot += x * y
+        norm_a += x * x
+        norm_b += y * y
+    if norm_a == 0 or norm_b == 0:
+        return 0.0
+    return dot / math.sqrt(norm_a * norm_b)
+
+
+def exact_scan(restaurants, query_vectors, weights, latitude, longitude, radius_m, top_k=10):
+    """
+    순수 Python 전수 비교
+    restaurants: [{"id", "placeId", "latitude", "longitude", "<facet>_vector": [...]}, ...]
+    """
+    weights = normalize_weights(weights)
+    min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, radius_m)
+
+    scored = []
+    for restaurant in restaurants:
+        lat = restaurant.get("latitude")
+        lon = restaurant.get("longitude")
+        if lat is None or lon is None:
+            continue
+        if not (min_lat <= lat <= max_lat and min_lon <= lon <= max_lon):
+            continue
+        distance_m = haversine_m(latitude, longitude, lat, lon)
+        if distance_m > radius_m:
+            continue
+
+        score = 0.0
+        for facet, weight in weights.items():
+            score += weight * cosine_similarity(
+                query_vectors.get(facet), restaurant.get(f"{facet}_vector")
+            )
+        scored.append((score, distance_m, restaurant))
+
+    top = heapq.nlargest(top_k, scored, key=lambda item: item[0])
+    return [to_result(restaurant, score, distance_m) for score, distance_m, restaurant in top]
+
+
+def to_result(restaurant, score, distance_m):
+    """검색 결과 한 건을 응답 형식으로 변환합니다."""
+    return {
+        "id": restaurant.get("id"),
+        "placeId": restaurant.get("placeId") or restaurant.get("place_id"),
+        "score": round(float(score), 6),
+        "distanceM": round(float(distance_m), 1),
+    }
+
+
+def build_numpy_index(restaurants, prefilter_dimension=None):
+    """
+    NumPy 경로용 인메모리 인덱스를 만듭니다.
+    facet 행렬은 float32로 미리 L2 정규화해 두어 검색 시 내적만 계산합니다.
+    prefilter_dimension을 주면 앞 N차원을 잘라 다시 정규화한 행렬도 만들어 2단계 검색에 씁니다.
+    """
+    try:
+        import numpy as np
+    except ImportError as e:
+        raise ImportError("numpy is required for the in-memory search path") from e
+
+    restaurants = [
+        r for r in restaurants if r.get("latitude") is not None and r.get("longitude") is not None
+    ]
+    index = {
+        "restaurants": restaurants,
+        "latitude": np.array([r["latitude"] for r in restaurants], dtype=np.float64),
+        "longitude": np.array([r["longitude"] for r in restaurants], dtype=np.float64),
+        "facets": {},
+    }
+
+    for facet in FACETS:
+        vectors = [r.get(f"{facet}_vector") for r in restaurants]
+        dimension = next((len(v) for v in vectors if v), 0)
+        if not dimension:
+            continue
+        matrix = np.zeros((len(restaurants), dimension), dtype=np.float32)
+        for row, vector in enumerate(vectors):
+            if vector:
+                matrix[row] = vector
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        index["facets"][facet] = matrix / norms
+
+    if prefilter_dimension:
+        add_prefilter(index, prefilter_dimension)
+    return index
+
+
+def add_prefilter(index, dimension=PREFILTER_DIMENSION):
+    """인덱스의 facet 행렬에서 앞 dimension차원을 잘라 다시 L2 정규화한 행렬을 추가합니다."""
+    import numpy as np
+
+    index["prefilter_dimension"] = dimension
+    index["prefilter"] = {}
+    for facet, matrix in index["facets"].items():
+        head = np.ascontiguousarray(matrix[:, :dimension])
+        norms = np.linalg.norm(head, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        index["prefilter"][facet] = head / norms
+    return index
+
+
+def numpy_scores(matrices, rows, query_vectors, weights, dimension=None):
+    """rows 행들의 가중 코사인 점수. dimension을 주면 질의 벡터도 앞 dimension차원으로 잘라 정규화합니다."""
+    import numpy as np
+
+    scores = np.zeros(rows.size, dtype=np.float32)
+    for facet, weight in weights.items():
+        matrix = matrices.get(facet)
+        query = query_vectors.get(facet)
+        if matrix is None or not query:
+            continue
+        query = np.asarray(query[:dimension] if dimension else query, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            continue
+        scores += weight * (matrix[rows] @ (query / norm))
+    return scores
+
+
+def numpy_search(
+    index, query_vectors, weights, latitude, longitude, radius_m, top_k=10, prefilter_candidates=None
+):
+    """
+    build_numpy_index로 만든 인덱스에서 바운딩 박스 필터 후 가중 코사인 top-K를 구합니다.
+    prefilter_candidates를 주면 사전 필터 행렬로 후보를 그 수만큼 남긴 뒤 전체 차원으로 다시 정렬합니다.
+    """
+    import numpy as np
+
+    weights = normalize_weights(weights)
+    min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, radius_m)
+
+    lat = index["latitude"]
+    lon = index["longitude"]
+    candidates = np.nonzero(
+        (lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) & (lon <= max_lon)
+    )[0]
+    if candidates.size == 0:
+        return []
+
+    # 바운딩 박스 모서리를 걸러내기 위한 haversine 거리
+    phi1 = math.radians(latitude)
+    phi2 = np.radians(lat[candidates])
+    d_phi = phi2 - phi1
+    d_lambda = np.radians(lon[candidates] - longitude)
+    a = np.sin(d_phi / 2) ** 2 + math.cos(phi1) * np.cos(phi2) * np.sin(d_lambda / 2) ** 2
+    distances = 2 * EARTH_RADIUS_M * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+    within = distances <= radius_m
+    candidates = candidates[within]
+    distances = distances[within]
+    if candidates.size == 0:
+        return []
+
+    if prefilter_candidates and "prefilter" in index and candidates.size > prefilter_candidates:
+        prefilter_scores = numpy_scores(
+            index["prefilter"], candidates, query_vectors, weights, index["prefilter_dimension"]
+        )
+        keep = np.argpartition(-prefilter_scores, prefilter_candidates - 1)[:prefilter_candidates]
+        candidates = candidates[keep]
+        distances = distances[keep]
+
+    scores = numpy_scores(index["facets"], candidates, query_vectors, weights)
+
+    k = min(top_k, candidates.size)
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+    return [
+        to_result(index["restaurants"][candidates[i]], scores[i], distances[i]) for i in top
+    ]
+
+
+def to_vector_literal(vector):
+    """벡터를 pgvector 문자열 형식으로 변환합니다."""
+    return "[" + ",".join(map(str, vector)) + "]"
+
+
+def score_sql(query_vectors, weights, column_suffix="_vector", dimension=None):
+    """
+    가중 코사인 점수 SQL 식과 파라미터. 질의 벡터가 있는 facet만 포함합니다.
+    dimension을 주면 질의 벡터를 앞 dimension차원으로 잘라 정규화해 사전 필터 컬럼과 비교합니다.
+    """
+    terms = []
+    params = []
+    for facet, weight in weights.items():
+        query = query_vectors.get(facet)
+        if not query:
+            continue
+        if dimension:
+            query = truncate_normalize(query, dimension)
+        terms.append(f"%s * COALESCE(1 - ({facet}{column_suffix} <=> %s::vector), 0)")
+        params.extend([weight, to_vector_literal(query)])
+    return " + ".join(terms), params
+
+
+def sql_search(
+    cursor, query_vectors, weights, latitude, longitude, radius_m, top_k=10, use_geo_cells=False,
+    prefilter_candidates=None,
+):
+    """
+    recommend DB에서 직접 검색합니다.
+    위경도 BETWEEN 조건으로 인덱스 범위 스캔 후 반경 밖 후보를 제거하고,
+    pgvector 코사인 거리(<=>)로 가중 점수를 계산합니다.
+    use_geo_cells면 적재 시 저장한 geohash prefix 스캔으로 후보를 먼저 좁힙니다.
+    prefilter_candidates를 주면 {facet}_prefilter_vector(sql/002_prefilter_vectors.sql) 점수로 후보를
+    그 수만큼 남긴 뒤, 남은 행만 768차원 벡터로 다시 점수를 매깁니다.
+    """
+    weights = normalize_weights(weights)
+    min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, radius_m)
+
+    score_terms, score_params = score_sql(query_vectors, weights)
+    if not score_terms:
+        return []
+
+    distance_sql = """
+        2 * %s * asin(least(1, sqrt(
+            power(sin(radians(latitude - %s) / 2), 2)
+            + cos(radians(%s)) * cos(radians(latitude))
+            * power(sin(radians(longitude - %s) / 2), 2)
+        )))
+    """
+    distance_params = [EARTH_RADIUS_M, latitude, latitude, longitude]
+
+    cell_sql = ""
+    cell_params = []
+    if use_geo_cells:
+        cells = covering_cells(latitude, longitude, radius_m)
+        cell_sql = "AND (" + " OR ".join(["geohash LIKE %s"] * len(cells)) + ")"
+        cell_params = [f"{cell}%" for cell in cells]
+
+    if prefilter_candidates:
+        # 안쪽에서 128차원 점수로 후보를 자르고, 바깥에서 남은 행의 768차원 점수를 계산
+        prefilter_terms, prefilter_params = score_sql(
+            query_vectors, weights, "_prefilter_vector", PREFILTER_DIMENSION
+        )
+        vector_columns = ", ".join(f"{facet}_vector" for facet in FACETS)
+        query_sql = f"""
+            SELECT id, place_id, score, distance_m FROM (
+                SELECT id, place_id,
+                       {score_terms} AS score,
+                       distance_m
+                FROM (
+                    SELECT id, place_id, {vector_columns},
+                           {prefilter_terms} AS prefilter_score,
+                           {distance_sql} AS distance_m
+                    FROM restaurant_vector
+                    WHERE latitude BETWEEN %s AND %s
+                      AND longitude BETWEEN %s AND %s
+                      {cell_sql}
+                ) candidates
+                WHERE distance_m <= %s
+                ORDER BY prefilter_score DESC
+                LIMIT %s
+            ) shortlisted
+            ORDER BY score DESC
+            LIMIT %s
+        """
+        params = (
+            score_params
+            + prefilter_params
+            + distance_params
+            + [min_lat, max_lat, min_lon, max_lon]
+            + cell_params
+            + [radius_m, prefilter_candidates, top_k]
+        )
+    else:
+        query_sql = f"""
+            SELECT id, place_id, score, distance_m FROM (
+                SELECT id, place_id,
+                       {score_terms} AS score,
+                       {distance_sql} AS distance_m
+                FROM restaurant_vector
+                WHERE latitude BETWEEN %s AND %s
+                  AND longitude BETWEEN %s AND %s
+                  {cell_sql}
+            ) candidates
+            WHERE distance_m <= %s
+            ORDER BY score DESC
+            LIMIT %s
+        """
+        params = (
+            score_params
+            + distance_params
+            + [min_lat, max_lat, min_lon, max_lon]
+            + cell_params
+            + [radius_m, top_k]
+        )
+    cursor.execute(query_sql, params)
+
+    return [
+        to_result({"id": row[0], "place_id": row[1]}, row[2], row[3])
+        for row in cursor.fetchall()
+    ]
+
+
+def get_recommend_db_connection():
+    """recommend 데이터베이스 연결을 생성합니다. (PostgreSQL with pg8000)"""
+    import pg8000
+
+    return pg8000.connect(
+        host=os.environ.get("RECOMMEND_DB_HOST"),
+        user=os.environ.get("RECOMMEND_DB_USER"),
+        password=os.environ.get("RECOMMEND_DB_PASSWORD"),
+        database=os.environ.get("RECOMMEND_DB_NAME"),
+        port=int(os.environ.get("RECOMMEND_DB_PORT", "5432")),
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="근거리 가중 facet 추천 쿼리")
+    parser.add_argument("--query-file", required=True, help='{"vibe": [...], "food": [...]} 형식 JSON')
+    parser.add_argument("--latitude", type=float, required=True)
+    parser.add_argument("--longitude", type=float, required=True)
+    parser.add_argument("--radius", type=float, default=1000.0, help="반경 (m)")
+    parser.add_argument("--weights", default="companion=1,food=1,purpose=1,vibe=1")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument(
+        "--restaurants-file",
+        help="지정하면 DB 대신 이 JSON 파일(restaurant_vector 행 목록)을 메모리에서 검색",
+    )
+    parser.add_argument("--engine", choices=["exact", "numpy"], default="numpy")
+    parser.add_argument(
+        "--use-geo-cells", action="store_true", help="DB 검색 시 geohash prefix로 후보를 좁힘"
+    )
+    parser.add_argument(
+        "--prefilter-candidates", type=int, default=0,
+        help="0보다 크면 128차원 사전 필터로 후보를 이 수만큼 남긴 뒤 768차원으로 다시 정렬",
+    )
+    args = parser.parse_args(argv)
+
+    with open(args.query_file, encoding="utf-8") as f:
+        query_vectors = json.load(f)
+    weights = parse_weights(args.weights)
+
+    if args.restaurants_file:
+        with open(args.restaurants_file, encoding="utf-8") as f:
+            restaurants = json.load(f)
+        if args.engine == "exact":
+            results = exact_scan(
+                restaurants, query_vectors, weights,
+                args.latitude, args.longitude, args.radius, args.top_k,
+            )
+        else:
+            index = build_numpy_index(
+                restaurants, PREFILTER_DIMENSION if args.prefilter_candidates else None
+            )
+            results = numpy_search(
+                index, query_vectors, weights,
+                args.latitude, args.longitude, args.radius, args.top_k,
+                prefilter_candidates=args.prefilter_candidates or None,
+            )
+    else:
+        connection = get_recommend_db_connection()
+        try:
+            cursor = connection.cursor()
+            results = sql_search(
+                cursor, query_vectors, weights,
+                args.latitude, args.longitude, args.radius, args.top_k,
+                use_geo_cells=args.use_geo_cells,
+                prefilter_candidates=args.prefilter_candidates or None,
+            )
+            cursor.close()
+        finally:
+            connection.close()
+
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    return results
+
+
+if __name__ == "__main__":
+    main()
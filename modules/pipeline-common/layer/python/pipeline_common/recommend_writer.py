@@ -0,0 +1,150 @@
+"""
+recommend DB(PostgreSQL) 적재 writer
+restaurant_vector, crawling_review INSERT를 한 곳에 모아 psycopg2와 pg8000 연결에서 같은 방식으로 씁니다.
+
+- 행을 batch_size개씩 multi-row INSERT 하나로 보냅니다. 같은 (테이블, 컬럼, 묶음 크기) 문장은 연결당 한 번만
+  서버에서 준비하고 이후에는 실행만 하므로 파싱/플랜 비용이 행 수에 비례해 늘지 않습니다.
+  - 두 드라이버 모두 PREPARE로 이름 붙은 문장을 만들고 EXECUTE로 호출합니다. psycopg2는 값을 클라이언트에서
+    치환하고, pg8000의 cursor.execute()는 호출마다 이름 없는 문장을 다시 파싱하므로 드라이버에 맡기지 않습니다.
+  - 이미 있는 이름으로 PREPARE하면 트랜잭션이 깨지므로 pg_prepared_statements로 확인한 뒤에 만듭니다.
+- 중복은 ON CONFLICT (place_id / hash) DO NOTHING으로 통일하고, 실제 삽입된 행 수를 반환합니다.
+- 벡터는 '[0.1,0.2,...]' 텍스트로 보내 ::vector로 캐스팅합니다. (list 변환 방식이 드라이버마다 달라서)
+
+    writer = RecommendWriter(connection, "pg8000")
+    inserted = writer.insert_reviews([{"hash": ..., "content": ..., "restaurant_id": ..., "vibe_vector": [...]}])
+"""
+import hashlib
+import os
+
+RESTAURANT_VECTOR_BATCH_SIZE = int(os.environ.get("RECOMMEND_VECTOR_BATCH_SIZE", "500"))
+# 리뷰 행은 벡터 4개(약 30KB 텍스트)와 128차원 사본 4개를 담으므로 더 작게 묶음
+CRAWLING_REVIEW_BATCH_SIZE = int(os.environ.get("RECOMMEND_REVIEW_BATCH_SIZE", "100"))
+
+DRIVERS = ("psycopg2", "pg8000")
+VECTOR_COLUMNS = (
+    "companion_vector", "food_vector", "purpose_vector", "vibe_vector",
+    # 앞 128차원을 잘라 다시 정규화한 사본 (pipeline_common.matryoshka, sql/002_prefilter_vectors.sql)
+    "companion_prefilter_vector", "food_prefilter_vector", "purpose_prefilter_vector", "vibe_prefilter_vector",
+)
+
+# 테이블별 (쓸 수 있는 컬럼과 SQL에서의 순서, 충돌 키)
+TABLES = {
+    "restaurant_vector": (
+        (
+            "id", "restaurant_id", "place_id",
+            "companion_vector", "food_vector", "purpose_vector", "vibe_vector",
+            "companion_prefilter_vector", "food_prefilter_vector", "purpose_prefilter_vector", "vibe_prefilter_vector",
+            "latitude", "longitude", "geohash", "created_at",
+        ),
+        "place_id",
+    ),
+    "crawling_review": (
+        (
+            "hash", "content", "restaurant_id",
+            "companion_vector", "food_vector", "purpose_vector", "vibe_vector",
+            "companion_prefilter_vector", "food_prefilter_vector", "purpose_prefilter_vector", "vibe_prefilter_vector",
+        ),
+        "hash",
+    ),
+}
+
+
+def vector_literal(vector):
+    """pgvector 입력 형식 '[v1,v2,...]' 문자열. None이나 이미 문자열인 값은 그대로 둡니다."""
+    if vector is None or isinstance(vector, str):
+        return vector
+    return "[" + ",".join(map(str, vector)) + "]"
+
+
+def insert_statement(table, columns, row_count, placeholder):
+    """
+    row_count행짜리 multi-row INSERT 문을 만듭니다.
+    placeholder(n)은 1부터 시작하는 n번째 자리표시자 문자열을 반환합니다. ("%s" 또는 "$n")
+    """
+    _, conflict_key = TABLES[table]
+    rows = []
+    for row in range(row_count):
+        slots = []
+        for offset, column in enumerate(columns):
+            slot = placeholder(row * len(columns) + offset + 1)
+            slots.append(f"{slot}::vector" if column in VECTOR_COLUMNS else slot)
+        rows.append("(" + ", ".join(slots) + ")")
+    return (
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES {', '.join(rows)} "
+        f"ON CONFLICT ({conflict_key}) DO NOTHING"
+    )
+
+
+class RecommendWriter:
+    """
+    연결 하나에 묶인 writer. 커밋/롤백은 호출하는 쪽 트랜잭션에 맡깁니다.
+    batch_sizes로 테이블별 묶음 크기를 바꿀 수 있습니다. 예: {"restaurant_vector": 1000}
+    """
+
+    def __init__(self, connection, driver, batch_sizes=None):
+        if driver not in DRIVERS:
+            raise ValueError(f"Unsupported driver: {driver} (expected one of {DRIVERS})")
+        self.connection = connection
+        self.driver = driver
+        self.batch_sizes = {
+            "restaurant_vector": RESTAURANT_VECTOR_BATCH_SIZE,
+            "crawling_review": CRAWLING_REVIEW_BATCH_SIZE,
+        }
+        self.batch_sizes.update(batch_sizes or {})
+        self.prepared = set()
+        self.statement_count = 0
+
+    def insert_restaurant_vectors(self, rows):
+        return self.insert("restaurant_vector", rows)
+
+    def insert_reviews(self, rows):
+        return self.insert("crawling_review", rows)
+
+    def insert(self, table, rows):
+        """dict 행 목록을 저장하고 실제 삽입된 행 수를 반환합니다. 모든 행은 같은 키를 가져야 합니다."""
+        if not rows:
+            return 0
+        allowed, _ = TABLES[table]
+        unknown = set(rows[0]) - set(allowed)
+        if unknown:
+            raise ValueError(f"Unknown {table} columns: {sorted(unknown)}")
+        columns = [column for column in allowed if column in rows[0]]
+
+        batch_size = max(1, int(self.batch_sizes[table]))
+        inserted_count = 0
+        cursor = self.connection.cursor()
+        try:
+            for start in range(0, len(rows), batch_size):
+                chunk = rows[start : start + batch_size]
+                params = []
+                for row in chunk:
+                    if len(row) != len(columns):
+                        raise ValueError(f"All {table} rows must have the same columns: {columns}")
+                    params.extend(
+                        vector_literal(row[column]) if column in VECTOR_COLUMNS else row[column]
+                        for column in columns
+                    )
+                inserted_count += self._execute(cursor, table, columns, len(chunk), params)
+        finally:
+            cursor.close()
+        return inserted_count
+
+    def _execute(self, cursor, table, columns, row_count, params):
+        # psycopg2, pg8000 모두 format(%s) 플레이스홀더이므로 EXECUTE 문은 같음
+        name = self._prepare(cursor, table, columns, row_count)
+        cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+        self.statement_count += 1
+        return max(cursor.rowcount, 0)
+
+    def _prepare(self, cursor, table, columns, row_count):
+        """(테이블, 컬럼, 묶음 크기)별 이름 붙은 문장을 연결에 한 번만 PREPARE하고 이름을 반환합니다."""
+        sql = insert_statement(table, columns, row_count, lambda n: f"${n}")
+        name = f"{table}_insert_{row_count}_{hashlib.sha1(sql.encode()).hexdigest()[:10]}"
+        if name in self.prepared:
+            return name
+        # 같은 연결을 다른 writer가 먼저 썼을 수 있음 (이미 있는 이름으로 PREPARE하면 트랜잭션이 깨짐)
+        cursor.execute("SELECT 1 FROM pg_prepared_statements WHERE name = %s", (name,))
+        if cursor.fetchone() is None:
+            cursor.execute(f"PREPARE {name} AS {sql}")
+        self.prepared.add(name)
+        return name
@@ -0,0 +1,14 @@
+"""
+placeId 기반 결정적 식당 ID
+같은 검색 파일이나 SQS 메시지를 다시 처리해도 같은 restaurant id가 나오므로
+중복 restaurant/outbox 행이 생기지 않고, 이미 있는 식당은 한 번의 IN 조회로 걸러낼 수 있습니다.
+"""
+import uuid
+
+# 값이 바뀌면 기존 ID와 달라지므로 절대 변경하지 않습니다.
+RESTAURANT_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "https://wellmeet/restaurant")
+
+
+def restaurant_id_for(place_id):
+    """placeId로부터 이름 기반 UUID(v5)를 만듭니다."""
+    return str(uuid.uuid5(RESTAURANT_ID_NAMESPACE, str(place_id)))
@@ -0,0 +1,220 @@
+"""
+crawling_review.hash Bloom 필터
+재크롤링 시 이미 저장된 리뷰를 벡터/본문과 함께 DB로 보내지 않도록 클라이언트에서 먼저 걸러냅니다.
+
+Bloom 필터는 "확실히 없음"만 보장하므로,
+- 필터에 없는 hash는 새 리뷰로 보고 바로 INSERT 대상으로 보내고
+- 필터에 "있을 수도 있는" hash만 hash 컬럼 하나로 한 번에 조회해 실제 중복을 확인합니다.
+오탐(false positive)이어도 리뷰가 누락되지 않으며, 무거운 행 대신 짧은 hash만 오갑니다.
+
+필터는 S3 객체 하나로 저장되며, 쓰는 곳은 예약 작업(recommend-db-maintenance) 한 곳뿐입니다.
+- 요청 경로(save-vector, save_review_to_DB)는 get_review_bloom으로 읽기만 합니다. 실행 환경마다
+  REVIEW_BLOOM_CACHE_SECONDS 동안 메모리에 두어 메시지/Map 항목마다 필터 전체를 내려받지 않습니다.
+  필터가 없거나 포화 상태면 None을 반환하고, 모든 hash를 DB에서 확인합니다. (요청 경로에서 재구축하지 않음)
+- refresh_review_bloom이 DB의 hash로 필터를 다시 만들어 업로드합니다. 쓰는 곳이 하나라 동시 업로드로 덮어쓰는 일이 없습니다.
+- 마지막 재구축 뒤에 저장된 hash는 필터에 없어 새 리뷰로 INSERT되지만 ON CONFLICT로 무시되므로 정합성에는 영향이 없습니다.
+"""
+import hashlib
+import json
+import math
+import os
+import struct
+import time
+
+REVIEW_BLOOM_S3_KEY = os.environ.get("REVIEW_BLOOM_S3_KEY", "bloom/crawling_review_hash.bloom")
+REVIEW_BLOOM_CAPACITY = int(os.environ.get("REVIEW_BLOOM_CAPACITY", "1000000"))
+REVIEW_BLOOM_ERROR_RATE = float(os.environ.get("REVIEW_BLOOM_ERROR_RATE", "0.01"))
+# 필터 비트 배열 최대 크기. 넘으면 크기를 고정하고 오탐률이 올라가는 것을 감수합니다.
+REVIEW_BLOOM_MAX_BYTES = int(os.environ.get("REVIEW_BLOOM_MAX_BYTES", str(8 * 1024 * 1024)))
+# 실행 환경에서 읽어 둔 필터를 다시 내려받기 전까지 쓰는 시간
+REVIEW_BLOOM_CACHE_SECONDS = float(os.environ.get("REVIEW_BLOOM_CACHE_SECONDS", "300"))
+
+MAGIC = b"WMBF"
+FORMAT_VERSION = 1
+REBUILD_FETCH_SIZE = 10000
+
+# {(bucket, key): (필터 또는 None, 읽은 시각)}
+_bloom_cache = {}
+
+
+class BloomFilter:
+    """double hashing(blake2b 128bit) 기반 Bloom 필터"""
+
+    def __init__(self, capacity, error_rate, num_bits=None, num_hashes=None, bits=None, count=0,
+                 version=0):
+        self.capacity = int(capacity)
+        self.error_rate = float(error_rate)
+        if num_bits is None:
+            num_bits = optimal_num_bits(self.capacity, self.error_rate)
+            num_bits = min(num_bits, REVIEW_BLOOM_MAX_BYTES * 8)
+        if num_hashes is None:
+            num_hashes = max(1, round(num_bits / max(self.capacity, 1) * math.log(2)))
+        self.num_bits = int(num_bits)
+        self.num_hashes = int(num_hashes)
+        self.bits = bytearray(bits) if bits is not None else bytearray((self.num_bits + 7) // 8)
+        self.count = int(count)
+        self.version = int(version)
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode("utf-8"), digest_size=16).digest()
+        h1, h2 = struct.unpack("<QQ", digest)
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(value))
+
+    def estimated_error_rate(self):
+        """현재 원소 수 기준 예상 오탐률"""
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+    def is_saturated(self):
+        return self.count > self.capacity
+
+    def to_bytes(self):
+        header = json.dumps(
+            {
+                "capacity": self.capacity,
+                "error_rate": self.error_rate,
+                "num_bits": self.num_bits,
+                "num_hashes": self.num_hashes,
+                "count": self.count,
+                "version": self.version,
+            }
+        ).encode("utf-8")
+        return MAGIC + struct.pack("<BI", FORMAT_VERSION, len(header)) + header + bytes(self.bits)
+
+    @classmethod
+    def from_bytes(cls, data):
+        if data[:4] != MAGIC:
+            raise ValueError("Not a review bloom filter object")
+        format_version, header_length = struct.unpack("<BI", data[4:9])
+        if format_version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported bloom filter format version: {format_version}")
+        header = json.loads(data[9 : 9 + header_length].decode("utf-8"))
+        return cls(bits=data[9 + header_length :], **header)
+
+
+def optimal_num_bits(capacity, error_rate):
+    """목표 오탐률을 만족하는 비트 수: -n ln(p) / (ln 2)^2"""
+    return max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+
+
+def load_review_bloom(s3_client, bucket, key=REVIEW_BLOOM_S3_KEY):
+    """S3에서 필터를 읽습니다. 없거나 읽을 수 없으면 None을 반환합니다."""
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=key)
+        return BloomFilter.from_bytes(response["Body"].read())
+    except s3_client.exceptions.NoSuchKey:
+        return None
+    except Exception as e:
+        print(f"Failed to load review bloom filter: {str(e)}")
+        return None
+
+
+def save_review_bloom(s3_client, bucket, bloom, key=REVIEW_BLOOM_S3_KEY):
+    """필터 버전을 올려 S3에 업로드합니다."""
+    bloom.version += 1
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=bloom.to_bytes(),
+        ContentType="application/octet-stream",
+        Metadata={"bloom-version": str(bloom.version), "bloom-count": str(bloom.count)},
+    )
+    print(
+        f"Saved review bloom filter v{bloom.version}: {bloom.count:,} hashes, "
+        f"{len(bloom.bits):,} bytes, est. FPR {bloom.estimated_error_rate():.4f}"
+    )
+
+
+def rebuild_review_bloom(cursor, capacity=None, error_rate=REVIEW_BLOOM_ERROR_RATE):
+    """crawling_review의 모든 hash로 필터를 새로 만듭니다."""
+    cursor.execute("SELECT COUNT(*) FROM crawling_review")
+    row_count = int(cursor.fetchone()[0])
+    if capacity is None:
+        # 재구축 직후 바로 포화되지 않도록 현재 행 수의 2배 이상으로 잡음
+        capacity = max(REVIEW_BLOOM_CAPACITY, row_count * 2)
+
+    bloom = BloomFilter(capacity, error_rate)
+    cursor.execute("SELECT hash FROM crawling_review WHERE hash IS NOT NULL")
+    while True:
+        rows = cursor.fetchmany(REBUILD_FETCH_SIZE)
+        if not rows:
+            break
+        for row in rows:
+            bloom.add(row[0])
+
+    print(f"Rebuilt review bloom filter from DB: {bloom.count:,} hashes, capacity {capacity:,}")
+    return bloom
+
+
+def get_review_bloom(s3_client, bucket, key=REVIEW_BLOOM_S3_KEY):
+    """
+    요청 경로용 읽기 전용 필터. REVIEW_BLOOM_CACHE_SECONDS 안에 읽은 적이 있으면 S3를 다시 읽지 않습니다.
+    없거나 포화 상태면 None (호출하는 쪽은 모든 hash를 DB에서 확인)
+    """
+    cached = _bloom_cache.get((bucket, key))
+    if cached is not None and time.monotonic() - cached[1] < REVIEW_BLOOM_CACHE_SECONDS:
+        return cached[0]
+
+    bloom = load_review_bloom(s3_client, bucket, key)
+    if bloom is not None and bloom.is_saturated():
+        print("Review bloom filter is saturated, checking all hashes in DB until it is rebuilt")
+        bloom = None
+    _bloom_cache[(bucket, key)] = (bloom, time.monotonic())
+    return bloom
+
+
+def refresh_review_bloom(s3_client, bucket, cursor, key=REVIEW_BLOOM_S3_KEY):
+    """DB의 hash로 필터를 다시 만들어 업로드합니다. 예약 작업에서만 호출합니다."""
+    previous = load_review_bloom(s3_client, bucket, key)
+    bloom = rebuild_review_bloom(cursor)
+    bloom.version = previous.version if previous is not None else 0
+    save_review_bloom(s3_client, bucket, bloom, key)
+    return bloom
+
+
+def find_existing_hashes(cursor, bloom, hashes):
+    """
+    이미 저장된 hash 집합과 필터 통계를 반환합니다.
+    필터에 있을 수도 있는 hash만 DB에서 hash 컬럼으로 확인합니다.
+    bloom이 None이면 모든 hash를 DB에서 확인합니다.
+    """
+    hashes = list(dict.fromkeys(h for h in hashes if h))
+    if bloom is None:
+        candidates = hashes
+    else:
+        candidates = [h for h in hashes if h in bloom]
+
+    existing = set()
+    if candidates:
+        cursor.execute(
+            "SELECT hash FROM crawling_review WHERE hash = ANY(%s)", (candidates,)
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+
+    stats = {
+        "checked": len(hashes),
+        "bloomMaybe": len(candidates),
+        "skipped": len(existing),
+        "falsePositive": len(candidates) - len(existing) if bloom is not None else 0,
+    }
+    print(
+        f"Review bloom filter: checked {stats['checked']}, maybe present {stats['bloomMaybe']}, "
+        f"skipped {stats['skipped']} duplicates, false positives {stats['falsePositive']}"
+    )
+    return existing, stats
+
+
+def record_bloom_metrics(metric, stats):
+    """find_existing_hashes 통계를 span 지표로 기록합니다. (save-vector, save_review_to_DB 공통)"""
+    metric.set_metric("BloomChecked", stats.get("checked", 0), "Count")
+    metric.set_metric("BloomMaybe", stats.get("bloomMaybe", 0), "Count")
+    metric.set_metric("DuplicateSkipped", stats.get("skipped", 0), "Count")
+    metric.set_metric("BloomFalsePositive", stats.get("falsePositive", 0), "Count")
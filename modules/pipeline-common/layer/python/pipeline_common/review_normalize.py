@@ -0,0 +1,96 @@
+"""
+카테고리 추출 전 리뷰 정리 단계
+크롤링한 리뷰를 그대로 보내면 빈 리뷰, 이모지뿐인 리뷰, 같은 문장 반복, 아주 긴 리뷰도 모두 토큰 비용을 냅니다.
+추출 요청을 만들기 전에 본문을 정리하고, 정보가 거의 없는 리뷰는 요청에서 뺍니다.
+
+- 이모지 묶음 제거, 같은 글자 반복("ㅋㅋㅋㅋㅋ", "!!!!!")은 REVIEW_MAX_CHAR_REPEAT개까지만 남김
+- 리뷰 안에서 같은 문장이 반복되면 한 번만 남기고 공백을 하나로 합침
+- REVIEW_MAX_TOKENS(토큰 어림값)를 넘는 리뷰는 앞부분만 남김
+- 글자/숫자(ㅋ, ㅎ 같은 낱자 제외)가 REVIEW_MIN_INFO_CHARS개 미만이면 요청하지 않음
+  (빠진 리뷰는 결과가 없으므로 매핑 단계에서 빈 카테고리가 되어 이후 조인에서 빠지지 않습니다)
+
+정리 결과는 설정과 본문만으로 정해지므로, 결과를 매핑하는 쪽(create-embedding-batch)도 같은 함수로 요청 목록을 다시 만듭니다.
+두 함수에 같은 REVIEW_* 환경 변수를 주어야 묶음 요청의 위치가 맞습니다.
+
+    kept, report = normalize_reviews(reviews)  # [(원래 위치, 본문을 정리한 리뷰), ...]
+"""
+import os
+import re
+import unicodedata
+
+from pipeline_common.review_packing import estimate_tokens
+
+REVIEW_NORMALIZE_ENABLED = os.environ.get("REVIEW_NORMALIZE_ENABLED", "true").lower() != "false"
+REVIEW_MAX_TOKENS = int(os.environ.get("REVIEW_MAX_TOKENS", "400"))
+REVIEW_MIN_INFO_CHARS = int(os.environ.get("REVIEW_MIN_INFO_CHARS", "3"))
+REVIEW_MAX_CHAR_REPEAT = int(os.environ.get("REVIEW_MAX_CHAR_REPEAT", "2"))
+
+EMOJI_PATTERN = re.compile(
+    "[\U0001F000-\U0001FAFF\u2600-\u27BF\u2B00-\u2BFF\uFE0F\u200D\u20E3]+"
+)
+REPEAT_PATTERN = re.compile(r"(.)\1{%d,}" % max(1, REVIEW_MAX_CHAR_REPEAT))
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?~])\s+|\n+")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+# 한글 낱자(ㅋ, ㅎ, ㅠ 등)는 정보량 계산에서 제외
+JAMO_RANGE = (0x3131, 0x318E)
+
+
+def normalize_text(text):
+    """이모지/반복 글자/반복 문장/공백을 정리한 본문"""
+    text = unicodedata.normalize("NFC", text or "")
+    text = EMOJI_PATTERN.sub(" ", text)
+    text = REPEAT_PATTERN.sub(lambda match: match.group(1) * REVIEW_MAX_CHAR_REPEAT, text)
+    sentences = (WHITESPACE_PATTERN.sub(" ", sentence).strip() for sentence in SENTENCE_PATTERN.split(text))
+    return " ".join(dict.fromkeys(sentence for sentence in sentences if sentence))
+
+
+def information_chars(text):
+    """낱자를 뺀 글자/숫자 수"""
+    return sum(1 for char in text if char.isalnum() and not JAMO_RANGE[0] <= ord(char) <= JAMO_RANGE[1])
+
+
+def truncate_to_tokens(text, max_tokens):
+    """토큰 어림값(UTF-8 바이트 / 3)이 max_tokens를 넘지 않도록 뒤를 자릅니다."""
+    limit = max_tokens * 3
+    encoded = text.encode("utf-8")
+    if len(encoded) <= limit:
+        return text
+    # 멀티바이트 글자 중간에서 잘린 바이트는 버림
+    return encoded[:limit].decode("utf-8", errors="ignore").rstrip()
+
+
+def normalize_reviews(reviews):
+    """
+    추출 요청에 보낼 리뷰 목록과 정리 보고를 반환합니다.
+    반환: ([(원래 위치, content를 정리한 리뷰 사본), ...], 보고 dict). 원본 리뷰는 바꾸지 않습니다.
+    """
+    kept = []
+    dropped = 0
+    truncated = 0
+    input_tokens = 0
+    output_tokens = 0
+    for index, review in enumerate(reviews):
+        content = review.get("content") or ""
+        input_tokens += estimate_tokens(content)
+        if not REVIEW_NORMALIZE_ENABLED:
+            output_tokens += estimate_tokens(content)
+            kept.append((index, review))
+            continue
+        text = normalize_text(content)
+        if information_chars(text) < REVIEW_MIN_INFO_CHARS:
+            dropped += 1
+            continue
+        shortened = truncate_to_tokens(text, REVIEW_MAX_TOKENS)
+        if shortened != text:
+            truncated += 1
+        output_tokens += estimate_tokens(shortened)
+        kept.append((index, {**review, "content": shortened}))
+
+    return kept, {
+        "Reviews": len(reviews),
+        "DroppedReviews": dropped,
+        "TruncatedReviews": truncated,
+        "InputTokens": input_tokens,
+        "OutputTokens": output_tokens,
+        "SavedTokens": input_tokens - output_tokens,
+    }
@@ -0,0 +1,172 @@
+"""
+카테고리 추출 요청 묶기 (리뷰 여러 개를 채팅 요청 하나에)
+리뷰마다 요청을 보내면 긴 한국어 시스템 프롬프트가 리뷰 수만큼 반복되어 짧은 리뷰보다 프롬프트 토큰이 더 듭니다.
+EXTRACTION_REVIEWS_PER_REQUEST가 2 이상이면 리뷰 N개를 id와 함께 한 요청에 넣고
+{"results": [{"id", "purpose", "vibe", "companion", "food"}, ...]}로 답하게 합니다.
+
+- 묶음 요청의 custom_id는 리뷰 ID 자리에 PACK_MARKER, 카테고리 자리에 리뷰 수, 순번 자리에 시작 위치를 담습니다.
+  결과를 매핑할 때 같은 리뷰 파일의 [시작, 시작 + 리뷰 수) 구간이 기대하는 id 목록이 됩니다.
+- parse_packed_content()는 배열을 검증하고, 파싱할 수 없거나 빠진 id는 리뷰 하나씩 다시 요청(fallback)하도록 돌려줍니다.
+- 토큰 수는 UTF-8 바이트 / 3으로 어림합니다. (한국어는 대략 글자당 토큰 하나) 실제 사용량은 결과의 usage를 씁니다.
+"""
+import json
+import os
+from urllib.parse import unquote
+
+from pipeline_common.batch_coalesce import CUSTOM_ID_SEPARATOR, encode_custom_id
+
+EXTRACTION_REVIEWS_PER_REQUEST = int(os.environ.get("EXTRACTION_REVIEWS_PER_REQUEST", "1"))
+EXTRACTION_MODEL = "gpt-4o-mini"
+CATEGORY_FIELDS = ("purpose", "vibe", "companion", "food")
+PACK_MARKER = "*pack"
+
+EXTRACTION_SYSTEM_PROMPT = """당신은 한국어 리뷰를 분석하는 전문가입니다.
+사용자의 리뷰를 분석하여 정확히 4가지 정보만 추출해주세요.
+추출할 정보:
+1. purpose (목적): 모임의 목적 - 생일, 기념일, 회식, 데이트, 가족모임 등
+2. vibe (분위기): 원하는 분위기 - 조용한, 활기찬, 로맨틱한, 편안한, 고급스러운 등
+3. companion (동행자): 함께 가는 사람 - 가족, 친구, 연인, 동료, 부모님 등
+4. food (음식): 선호하는 음식 종류 - 한식, 일식, 양식, 중식, 이탈리안 등
+응답 규칙:
+- 모든 값은 반드시 한글 String으로 작성
+- 여러 특성이 있으면 "~고"로 연결 (예: "조용하고 편안한")
+- 언급되지 않은 정보는 ""으로 표시
+- JSON 형식으로만 응답"""
+
+PACKED_EXTRACTION_SYSTEM_PROMPT = EXTRACTION_SYSTEM_PROMPT + """
+여러 리뷰 처리 규칙:
+- 리뷰는 [{"id": "...", "review": "..."}] JSON 배열로 주어집니다
+- 리뷰마다 {"id": 입력 id 그대로, "purpose": "", "vibe": "", "companion": "", "food": ""}를 만들어
+  {"results": [...]} 형태로 응답
+- 입력의 모든 id를 입력 순서대로 한 번씩 포함"""
+
+
+def estimate_tokens(text):
+    """토큰 수 어림값 (UTF-8 바이트 / 3)"""
+    return len(text.encode("utf-8")) // 3 + 1
+
+
+SYSTEM_PROMPT_TOKENS = estimate_tokens(EXTRACTION_SYSTEM_PROMPT)
+
+
+def _request_line(custom_id, system_prompt, user_content):
+    request = {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": {
+            "model": EXTRACTION_MODEL,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_content},
+            ],
+            "response_format": {"type": "json_object"},
+        },
+    }
+    return (json.dumps(request, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def single_request_line(restaurant_key, index, review):
+    """리뷰 하나짜리 추출 요청 한 줄 (기존 방식, fallback에도 사용)"""
+    return _request_line(
+        encode_custom_id(restaurant_key, review["id"], index=index),
+        EXTRACTION_SYSTEM_PROMPT,
+        review["content"],
+    )
+
+
+def packed_request_line(restaurant_key, start, reviews):
+    """reviews(파일의 start번째부터)를 요청 하나로 묶은 추출 요청 한 줄"""
+    user_content = json.dumps(
+        [{"id": str(review["id"]), "review": review["content"]} for review in reviews],
+        ensure_ascii=False,
+    )
+    return _request_line(
+        encode_custom_id(restaurant_key, PACK_MARKER, str(len(reviews)), start),
+        PACKED_EXTRACTION_SYSTEM_PROMPT,
+        user_content,
+    )
+
+
+def extraction_request_lines(reviews, restaurant_key, reviews_per_request=None):
+    """리뷰 목록의 추출 요청 줄(JSONL bytes) 목록. reviews_per_request가 1이면 리뷰마다 한 요청입니다."""
+    size = max(1, reviews_per_request or EXTRACTION_REVIEWS_PER_REQUEST)
+    if size == 1:
+        return [single_request_line(restaurant_key, index, review) for index, review in enumerate(reviews)]
+    lines = []
+    for start in range(0, len(reviews), size):
+        chunk = reviews[start : start + size]
+        if len(chunk) == 1:
+            lines.append(single_request_line(restaurant_key, start, chunk[0]))
+        else:
+            lines.append(packed_request_line(restaurant_key, start, chunk))
+    return lines
+
+
+def parse_pack_custom_id(custom_id):
+    """묶음 요청이면 (시작 위치, 리뷰 수)를, 아니면 None을 반환합니다."""
+    if CUSTOM_ID_SEPARATOR not in custom_id:
+        return None
+    _, review_id, count, start = (unquote(part) for part in custom_id.split(CUSTOM_ID_SEPARATOR))
+    if review_id != PACK_MARKER:
+        return None
+    return int(start), int(count)
+
+
+def parse_packed_content(content, expected_ids):
+    """
+    묶음 응답 본문을 검증해 {리뷰 id(str): 카테고리 dict}를 반환합니다.
+    배열 자체를 읽을 수 없으면 ValueError를 내고, 항목 단위로 잘못된 id는 결과에서 빠집니다. (호출하는 쪽이 fallback)
+    """
+    parsed = json.loads(content)
+    if isinstance(parsed, dict):
+        parsed = parsed.get("results")
+    if not isinstance(parsed, list):
+        raise ValueError("Packed response is not a JSON array")
+
+    expected = {str(review_id) for review_id in expected_ids}
+    categories_by_id = {}
+    for item in parsed:
+        if not isinstance(item, dict):
+            continue
+        review_id = str(item.get("id"))
+        if review_id not in expected or review_id in categories_by_id:
+            continue
+        values = {field: item.get(field) or "" for field in CATEGORY_FIELDS}
+        if not all(isinstance(value, str) for value in values.values()):
+            continue
+        categories_by_id[review_id] = values
+    return categories_by_id
+
+
+def estimate_saved_prompt_tokens(review_count, request_count):
+    """리뷰마다 요청했을 때보다 덜 보내는 시스템 프롬프트 토큰 어림값"""
+    return max(0, review_count - request_count) * SYSTEM_PROMPT_TOKENS
+
+
+def packing_report(extraction_results):
+    """배치 결과 하나의 요청/리뷰 수, 실제 토큰 사용량, 묶음으로 아낀 요청과 프롬프트 토큰 어림값"""
+    request_count = len(extraction_results)
+    packed_count = 0
+    review_count = 0
+    prompt_tokens = 0
+    completion_tokens = 0
+    for result in extraction_results:
+        pack = parse_pack_custom_id(result["custom_id"])
+        if pack:
+            packed_count += 1
+            review_count += pack[1]
+        else:
+            review_count += 1
+        usage = ((result.get("response") or {}).get("body") or {}).get("usage") or {}
+        prompt_tokens += usage.get("prompt_tokens") or 0
+        completion_tokens += usage.get("completion_tokens") or 0
+    return {
+        "Requests": request_count,
+        "PackedRequests": packed_count,
+        "Reviews": review_count,
+        "SavedRequests": review_count - request_count,
+        "PromptTokens": prompt_tokens,
+        "CompletionTokens": completion_tokens,
+        "EstimatedSavedPromptTokens": estimate_saved_prompt_tokens(review_count, request_count),
+    }
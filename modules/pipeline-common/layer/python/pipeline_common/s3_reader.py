@@ -0,0 +1,157 @@
+"""
+병렬 Range GET 기반 S3 리더
+큰 객체를 바이트 구간으로 나눠 스레드 풀에서 동시에 받은 뒤 순서대로 이어 붙입니다.
+임계값 이하 객체는 첫 GET 한 번으로 끝나므로 작은 파일에는 추가 비용이 없습니다.
+
+- read_object: 객체 전체를 bytes로 반환
+- open_object: 앞쪽 구간부터 순서대로 내주는 읽기 전용 파일 객체 반환
+  (gzip.GzipFile(fileobj=...), io.TextIOWrapper 등에 그대로 넘길 수 있음)
+
+첫 GET에서 받은 ETag를 이후 구간 요청의 IfMatch로 넘겨, 다운로드 도중 객체가 바뀌면
+섞인 데이터 대신 오류가 나도록 합니다. boto3 client는 스레드 간 공유해도 안전합니다.
+"""
+import io
+import os
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# 이 크기 이하 객체는 GET 한 번으로 읽음
+S3_PARALLEL_THRESHOLD = int(os.environ.get("S3_PARALLEL_THRESHOLD", str(16 * 1024 * 1024)))
+S3_PART_SIZE = int(os.environ.get("S3_PART_SIZE", str(8 * 1024 * 1024)))
+S3_MAX_WORKERS = int(os.environ.get("S3_MAX_WORKERS", "8"))
+
+CONTENT_RANGE_PATTERN = re.compile(r"bytes (\d+)-(\d+)/(\d+)")
+
+
+def get_range(s3_client, bucket, key, start, end, etag=None):
+    """
+    [start, end] 구간을 읽어 (데이터, 객체 전체 크기, ETag)를 반환합니다.
+    빈 객체는 Range 요청이 InvalidRange로 실패하므로 일반 GET으로 다시 읽습니다.
+    """
+    params = {"Bucket": bucket, "Key": key, "Range": f"bytes={start}-{end}"}
+    if etag:
+        params["IfMatch"] = etag
+    try:
+        response = s3_client.get_object(**params)
+    except Exception as e:
+        error_code = getattr(e, "response", {}).get("Error", {}).get("Code")
+        if error_code != "InvalidRange" or start != 0:
+            raise
+        response = s3_client.get_object(Bucket=bucket, Key=key)
+
+    data = response["Body"].read()
+    content_range = CONTENT_RANGE_PATTERN.match(response.get("ContentRange") or "")
+    total_size = int(content_range.group(3)) if content_range else len(data)
+    return data, total_size, response.get("ETag")
+
+
+def split_ranges(start, total_size, part_size=S3_PART_SIZE):
+    """start부터 객체 끝까지를 part_size 단위 (start, end) 구간으로 나눕니다."""
+    return [
+        (offset, min(offset + part_size, total_size) - 1)
+        for offset in range(start, total_size, part_size)
+    ]
+
+
+def read_object(
+    s3_client,
+    bucket,
+    key,
+    threshold=S3_PARALLEL_THRESHOLD,
+    part_size=S3_PART_SIZE,
+    max_workers=S3_MAX_WORKERS,
+):
+    """객체 전체를 bytes로 읽습니다. 임계값을 넘는 나머지 구간은 병렬로 받습니다."""
+    head, total_size, etag = get_range(s3_client, bucket, key, 0, threshold - 1)
+    if total_size <= len(head):
+        return head
+
+    ranges = split_ranges(len(head), total_size, part_size)
+    buffer = bytearray(total_size)
+    buffer[: len(head)] = head
+
+    def fetch(byte_range):
+        data, _, _ = get_range(s3_client, bucket, key, byte_range[0], byte_range[1], etag)
+        buffer[byte_range[0] : byte_range[0] + len(data)] = data
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(ranges))) as executor:
+        # list()로 소비해야 구간 요청 예외가 호출자에게 전달됨
+        list(executor.map(fetch, ranges))
+
+    print(
+        f"Read s3://{bucket}/{key}: {total_size:,} bytes in {len(ranges) + 1} ranged GETs"
+    )
+    return bytes(buffer)
+
+
+class S3RangeStream(io.RawIOBase):
+    """
+    구간을 미리 max_workers개까지 요청해 두고 앞에서부터 순서대로 내주는 읽기 전용 스트림
+    메모리에는 선반입된 구간(최대 max_workers x part_size)만 유지합니다.
+    """
+
+    def __init__(self, s3_client, bucket, key, threshold, part_size, max_workers):
+        super().__init__()
+        self._s3_client = s3_client
+        self._bucket = bucket
+        self._key = key
+        self._current, self.size, self._etag = get_range(
+            s3_client, bucket, key, 0, threshold - 1
+        )
+        self._position = 0
+        self._pending_ranges = deque(split_ranges(len(self._current), self.size, part_size))
+        self._futures = deque()
+        self._executor = None
+        if self._pending_ranges:
+            self._executor = ThreadPoolExecutor(
+                max_workers=min(max_workers, len(self._pending_ranges))
+            )
+            self._max_in_flight = max_workers
+            self._fill()
+
+    def _fill(self):
+        while self._pending_ranges and len(self._futures) < self._max_in_flight:
+            start, end = self._pending_ranges.popleft()
+            self._futures.append(
+                self._executor.submit(
+                    get_range, self._s3_client, self._bucket, self._key, start, end, self._etag
+                )
+            )
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        while self._position >= len(self._current):
+            if not self._futures:
+                return 0
+            self._current = self._futures.popleft().result()[0]
+            self._position = 0
+            self._fill()
+
+        size = min(len(target), len(self._current) - self._position)
+        target[:size] = self._current[self._position : self._position + size]
+        self._position += size
+        return size
+
+    def close(self):
+        if self._executor is not None:
+            for future in self._futures:
+                future.cancel()
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        super().close()
+
+
+def open_object(
+    s3_client,
+    bucket,
+    key,
+    threshold=S3_PARALLEL_THRESHOLD,
+    part_size=S3_PART_SIZE,
+    max_workers=S3_MAX_WORKERS,
+):
+    """객체를 순차 읽기용 파일 객체(BufferedReader)로 엽니다. 사용 후 close() 하거나 with로 감쌉니다."""
+    stream = S3RangeStream(s3_client, bucket, key, threshold, part_size, max_workers)
+    return io.BufferedReader(stream, buffer_size=min(part_size, 1024 * 1024))
@@ -0,0 +1,93 @@
+"""
+단계별 체크포인트 (S3)
+create-embedding-batch는 한 번의 호출에서 추출 결과 다운로드 -> 카테고리 매핑/저장 -> 임베딩 배치 생성을 모두 합니다.
+중간에 실패하면 Step Functions 재시도가 처음부터 다시 실행해 결과를 다시 받고, 유료 임베딩 배치를 한 번 더 만들 수 있습니다.
+입력 배치 ID(묶음 처리면 plan 이름)마다 끝난 단계와 그 결과를 S3 JSON 하나에 남겨, 재시도하면 끝난 단계를 건너뜁니다.
+save-embedding은 최종 파일을 저장한 식당을 남겨 재시도하면 저장을 마친 식당을 건너뜁니다.
+
+- 기록: {STAGE_CHECKPOINT_DIRECTORY}/{scope}/{source_id}/stages.json  ({"stages": {단계 이름: 값}})
+- 단계를 끝낼 때마다 기록 전체를 다시 씁니다. 객체가 하나라 단계 기록끼리 어긋나지 않습니다.
+- 큰 결과(추출 결과 줄 목록)는 artifact_key(이름)에 따로 저장하고 기록에는 key만 남깁니다.
+- 식당별 진행처럼 항목이 자주 끝나는 단계는 record()로 모아 min_interval초에 한 번만 쓰고, 끝에 flush()합니다.
+
+    checkpoint = StageCheckpoint(s3, bucket, "create-embedding-batch", extraction_batch_id)
+    if checkpoint.done("embedding_batch_created"):
+        return checkpoint.get("embedding_batch_created")
+    checkpoint.complete("categories_saved", {"category_s3_key": key})
+"""
+import json
+import os
+import threading
+import time
+from urllib.parse import quote
+
+STAGE_CHECKPOINT_DIRECTORY = os.environ.get("STAGE_CHECKPOINT_DIRECTORY", "checkpoint")
+STAGE_CHECKPOINT_ENABLED = os.environ.get("STAGE_CHECKPOINT_ENABLED", "true").lower() != "false"
+
+
+class StageCheckpoint:
+    """
+    입력 하나(source_id)의 단계 기록. 생성할 때 S3에서 한 번 읽고, complete()마다 S3에 씁니다.
+    STAGE_CHECKPOINT_ENABLED가 false면 읽지도 쓰지도 않아 모든 단계를 처음부터 실행합니다.
+    """
+
+    def __init__(self, s3_client, bucket, scope, source_id):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.prefix = f"{STAGE_CHECKPOINT_DIRECTORY}/{scope}/{quote(str(source_id), safe='')}"
+        self.key = f"{self.prefix}/stages.json"
+        self.lock = threading.Lock()
+        self.stages = self._load() if STAGE_CHECKPOINT_ENABLED else {}
+        self.written_at = 0.0
+        self.dirty = False
+
+    def _load(self):
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=self.key)
+        except self.s3_client.exceptions.NoSuchKey:
+            return {}
+        return json.loads(response["Body"].read().decode("utf-8")).get("stages", {})
+
+    def done(self, stage):
+        return stage in self.stages
+
+    def get(self, stage, default=None):
+        return self.stages.get(stage, default)
+
+    def artifact_key(self, name):
+        """이 입력의 단계 결과를 따로 저장할 key"""
+        return f"{self.prefix}/{name}"
+
+    def complete(self, stage, value=True):
+        """단계를 끝난 것으로 기록합니다. 여러 스레드에서 불러도 기록이 섞이지 않습니다."""
+        with self.lock:
+            self.stages[stage] = value
+            self._write()
+
+    def record(self, stage, item, value, min_interval=0.0):
+        """
+        dict 단계(stage)에 끝난 항목 하나를 더합니다.
+        마지막으로 쓴 지 min_interval초가 지나지 않았으면 메모리에만 두고 다음 기록이나 flush() 때 함께 씁니다.
+        """
+        with self.lock:
+            self.stages.setdefault(stage, {})[item] = value
+            if time.monotonic() - self.written_at < min_interval:
+                self.dirty = True
+                return
+            self._write()
+
+    def flush(self):
+        """record()로 모아 둔 항목이 있으면 씁니다."""
+        with self.lock:
+            if self.dirty:
+                self._write()
+
+    def _write(self):
+        self.dirty = False
+        self.written_at = time.monotonic()
+        if not STAGE_CHECKPOINT_ENABLED:
+            return
+        body = json.dumps({"stages": self.stages}, ensure_ascii=False).encode("utf-8")
+        self.s3_client.put_object(
+            Bucket=self.bucket, Key=self.key, Body=body, ContentType="application/json"
+        )
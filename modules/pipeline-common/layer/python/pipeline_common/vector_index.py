@@ -0,0 +1,404 @@
+"""
+pgvector ANN 인덱스(HNSW/IVFFlat) 수명주기 관리
+대량 적재 전에는 벡터 인덱스를 내려두었다가 튜닝된 빌드 파라미터로 다시 생성하고,
+행 수가 학습 시점보다 크게 늘어난 IVFFlat 인덱스는 lists를 다시 학습시킵니다.
+psycopg2, pg8000 모두 format(%s) 플레이스홀더를 사용하므로 같은 코드로 동작합니다.
+
+- 인덱스를 내리는 것은 BULK_LOAD_MIN_ROWS 이상의 명시적 대량 적재에서만 합니다.
+  그보다 작은 적재(save-vector의 메시지 한 건 등)는 카탈로그/행 수 조회도 하지 않습니다.
+- 인덱스 삭제와 생성은 모두 적재 트랜잭션 밖(autocommit)에서 CONCURRENTLY로 합니다.
+  적재 쪽(prepare_bulk_load)은 정의를 vector_index_rebuild 대기열에 남기고 DROP INDEX CONCURRENTLY만 하며,
+  다시 만드는 것과 IVFFlat 재학습은 예약 작업(recommend-db-maintenance)이 maintain_vector_indexes로 합니다.
+  추천 API 조회와 동시 적재가 ACCESS EXCLUSIVE 잠금을 기다리지 않고, 적재가 실패해도 인덱스는 되살아납니다.
+"""
+import json
+import math
+import os
+import re
+import time
+
+# 적재 행 수가 이 값 이상이고 기존 행 수 대비 비율을 넘을 때만 인덱스를 내림
+BULK_LOAD_MIN_ROWS = int(os.environ.get("VECTOR_INDEX_BULK_LOAD_MIN_ROWS", "10000"))
+BULK_LOAD_RATIO = float(os.environ.get("VECTOR_INDEX_BULK_LOAD_RATIO", "0.2"))
+# 학습 시점 대비 행 수가 이 배수 이상 늘어나면 IVFFlat 재학습 (0이면 비활성화)
+IVFFLAT_RETRAIN_GROWTH = float(os.environ.get("VECTOR_INDEX_IVFFLAT_RETRAIN_GROWTH", "2.0"))
+HNSW_M = int(os.environ.get("VECTOR_INDEX_HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.environ.get("VECTOR_INDEX_HNSW_EF_CONSTRUCTION", "64"))
+MAINTENANCE_WORK_MEM = os.environ.get("VECTOR_INDEX_MAINTENANCE_WORK_MEM", "256MB")
+PARALLEL_MAINTENANCE_WORKERS = os.environ.get("VECTOR_INDEX_PARALLEL_WORKERS", "2")
+
+
+def quote_identifier(name):
+    """SQL 식별자를 큰따옴표로 감쌉니다."""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def get_vector_indexes(cursor, table):
+    """테이블에 걸린 HNSW/IVFFlat 인덱스 목록을 조회합니다."""
+    cursor.execute(
+        """
+        SELECT i.schemaname, i.indexname, i.indexdef, am.amname,
+               obj_description(c.oid, 'pg_class')
+        FROM pg_indexes i
+        JOIN pg_namespace n ON n.nspname = i.schemaname
+        JOIN pg_class c ON c.relname = i.indexname AND c.relnamespace = n.oid
+        JOIN pg_am am ON am.oid = c.relam
+        WHERE i.tablename = %s AND am.amname IN ('hnsw', 'ivfflat')
+        ORDER BY i.indexname
+        """,
+        (table,),
+    )
+    indexes = []
+    for schema, name, definition, method, comment in cursor.fetchall():
+        indexes.append(
+            {
+                "schema": schema,
+                "name": name,
+                "qualified_name": quoted_index_name(schema, name),
+                "definition": definition,
+                "method": method,
+                "trained_rows": get_trained_rows(comment),
+            }
+        )
+    return indexes
+
+
+def get_trained_rows(comment):
+    """인덱스 코멘트에 기록된 빌드 시점 행 수를 읽습니다."""
+    if not comment:
+        return None
+    try:
+        return int(json.loads(comment).get("rows"))
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+def estimate_row_count(cursor, table):
+    """pg_class 통계로 행 수를 추정합니다. 통계가 없으면 COUNT(*)를 사용합니다."""
+    cursor.execute(
+        "SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)", (table,)
+    )
+    result = cursor.fetchone()
+    if result and result[0] is not None and result[0] >= 0:
+        return int(result[0])
+
+    cursor.execute(f"SELECT COUNT(*) FROM {quote_identifier(table)}")
+    return int(cursor.fetchone()[0])
+
+
+def should_drop_for_bulk_load(existing_rows, incoming_rows):
+    """적재량이 충분히 커서 인덱스를 내렸다가 다시 만드는 편이 나은지 판단합니다."""
+    if incoming_rows < BULK_LOAD_MIN_ROWS:
+        return False
+    return incoming_rows >= existing_rows * BULK_LOAD_RATIO
+
+
+def ivfflat_lists_for(rows):
+    """pgvector 권장값: 100만 행까지는 rows / 1000, 그 이상은 sqrt(rows)"""
+    if rows <= 1_000_000:
+        return max(1, rows // 1000)
+    return int(math.sqrt(rows))
+
+
+def tune_index_definition(definition, method, rows):
+    """기존 CREATE INDEX 문의 WITH 절을 튜닝된 빌드 파라미터로 바꿉니다."""
+    definition = re.sub(r"\s+WITH\s*\([^)]*\)", "", definition)
+    if method == "hnsw":
+        options = f"m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION}"
+    else:
+        options = f"lists = {ivfflat_lists_for(rows)}"
+
+    # 부분 인덱스(WHERE 절)는 WITH 절 뒤에 와야 함
+    where_match = re.search(r"\s+WHERE\s+", definition)
+    if where_match:
+        head = definition[: where_match.start()]
+        tail = definition[where_match.start():]
+        return f"{head} WITH ({options}){tail}"
+    return f"{definition} WITH ({options})"
+
+
+def quoted_index_name(schema, name):
+    """스키마를 붙인 인덱스 식별자"""
+    return f"{quote_identifier(schema)}.{quote_identifier(name)}"
+
+
+def try_advisory_lock(cursor, table):
+    """
+    같은 테이블의 인덱스를 동시에 내리거나 다시 만들지 않도록 세션 advisory lock을 잡습니다.
+    autocommit 연결에서 쓰므로 트랜잭션 lock이 아니라 세션 lock이며, release_advisory_lock으로 풀어야 합니다.
+    """
+    cursor.execute("SELECT pg_try_advisory_lock(hashtext(%s))", (f"vector_index:{table}",))
+    return bool(cursor.fetchone()[0])
+
+
+def release_advisory_lock(cursor, table):
+    """try_advisory_lock으로 잡은 세션 lock을 풉니다."""
+    cursor.execute("SELECT pg_advisory_unlock(hashtext(%s))", (f"vector_index:{table}",))
+
+
+def queue_index_rebuild(cursor, table, index):
+    """
+    삭제할 인덱스의 정의를 재생성 대기열(vector_index_rebuild, sql/004_vector_index_rebuild.sql)에 남깁니다.
+    삭제보다 먼저 기록하므로 중간에 끊겨도 유지보수 작업이 인덱스를 되살립니다.
+    """
+    cursor.execute(
+        """
+        INSERT INTO vector_index_rebuild (schema_name, index_name, table_name, definition, method)
+        VALUES (%s, %s, %s, %s, %s)
+        ON CONFLICT (schema_name, index_name) DO NOTHING
+        """,
+        (index["schema"], index["name"], table, index["definition"], index["method"]),
+    )
+
+
+def drop_index_concurrently(cursor, index):
+    """
+    인덱스를 DROP INDEX CONCURRENTLY로 삭제합니다. autocommit 연결에서만 호출해야 하며,
+    테이블에 ACCESS EXCLUSIVE 잠금을 잡지 않으므로 추천 API 조회가 기다리지 않습니다.
+    """
+    cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index['qualified_name']}")
+    print(f"Dropped vector index {index['name']} ({index['method']}) before bulk load, queued for rebuild")
+
+
+def set_build_parameters(cursor, is_local=True):
+    """
+    인덱스 빌드 메모리/병렬 작업자 수를 설정합니다.
+    트랜잭션 밖(autocommit)에서는 is_local=False로 세션 값으로 설정해야 다음 문장까지 유지됩니다.
+    """
+    # SET LOCAL 대신 set_config를 사용해야 pg8000에서도 파라미터 바인딩이 가능
+    cursor.execute(
+        "SELECT set_config('maintenance_work_mem', %s, %s)", (MAINTENANCE_WORK_MEM, is_local)
+    )
+    cursor.execute(
+        "SELECT set_config('max_parallel_maintenance_workers', %s, %s)",
+        (PARALLEL_MAINTENANCE_WORKERS, is_local),
+    )
+
+
+def build_index(cursor, index, rows, definition=None, qualified_name=None):
+    """
+    튜닝된 파라미터로 인덱스를 생성하고 빌드 시간과 크기를 반환합니다.
+    definition/qualified_name을 주면 그 문장으로 그 이름의 인덱스를 만듭니다. (재학습용 CONCURRENTLY 빌드)
+    """
+    definition = definition or tune_index_definition(index["definition"], index["method"], rows)
+    qualified_name = qualified_name or index["qualified_name"]
+
+    started_at = time.perf_counter()
+    cursor.execute(definition)
+    build_seconds = time.perf_counter() - started_at
+
+    # 재학습 판단을 위해 빌드 시점 행 수를 인덱스 코멘트에 기록
+    comment = json.dumps({"rows": int(rows)})
+    cursor.execute(f"COMMENT ON INDEX {qualified_name} IS '{comment}'")
+
+    cursor.execute("SELECT pg_relation_size(%s::regclass)", (qualified_name,))
+    size_bytes = int(cursor.fetchone()[0])
+
+    report = {
+        "index": index["name"],
+        "method": index["method"],
+        "rows": int(rows),
+        "build_seconds": round(build_seconds, 3),
+        "size_bytes": size_bytes,
+    }
+    print(
+        f"Built vector index {index['name']} ({index['method']}) "
+        f"in {build_seconds:.2f}s, size {size_bytes:,} bytes, rows {rows:,}"
+    )
+    return report
+
+
+def needs_ivfflat_retrain(index, rows):
+    """IVFFlat 인덱스의 행 수가 학습 시점보다 임계 배수 이상 늘었는지 확인합니다."""
+    if index["method"] != "ivfflat" or IVFFLAT_RETRAIN_GROWTH <= 0:
+        return False
+    trained_rows = index["trained_rows"]
+    if not trained_rows:
+        # 코멘트가 없는 인덱스는 lists 값으로 학습 시점 행 수를 역산
+        lists_match = re.search(r"lists\s*=\s*'?(\d+)", index["definition"])
+        if not lists_match:
+            return False
+        trained_rows = int(lists_match.group(1)) * 1000
+    return rows >= trained_rows * IVFFLAT_RETRAIN_GROWTH
+
+
+def retrain_index_name(index):
+    """재학습 중 새로 만드는 인덱스 이름 (식별자 최대 63바이트)"""
+    return f"{index['name'][:55]}_retrain"
+
+
+def concurrent_index_definition(definition, name):
+    """CREATE INDEX 문을 새 이름의 CREATE INDEX CONCURRENTLY 문으로 바꿉니다."""
+    return re.sub(
+        r"^CREATE\s+(UNIQUE\s+)?INDEX\s+\S+\s+ON\s+",
+        lambda match: f"CREATE {match.group(1) or ''}INDEX CONCURRENTLY {quote_identifier(name)} ON ",
+        definition,
+        count=1,
+        flags=re.IGNORECASE,
+    )
+
+
+def rebuild_index_concurrently(cursor, index, rows):
+    """
+    새 이름으로 인덱스를 CONCURRENTLY 빌드한 뒤 기존 인덱스를 CONCURRENTLY 삭제하고 이름을 바꿉니다.
+    autocommit 연결에서만 호출해야 합니다. 테이블은 SHARE UPDATE EXCLUSIVE만 잡혀 조회/적재가 계속됩니다.
+    """
+    new_name = retrain_index_name(index)
+    new_qualified_name = quoted_index_name(index["schema"], new_name)
+    # 이전 실행이 중간에 끊겨 남은 INVALID 인덱스 정리
+    cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {new_qualified_name}")
+
+    definition = concurrent_index_definition(
+        tune_index_definition(index["definition"], index["method"], rows), new_name
+    )
+    try:
+        report = build_index(cursor, index, rows, definition, new_qualified_name)
+    except Exception:
+        cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {new_qualified_name}")
+        raise
+
+    cursor.execute(f"DROP INDEX CONCURRENTLY {index['qualified_name']}")
+    cursor.execute(f"ALTER INDEX {new_qualified_name} RENAME TO {quote_identifier(index['name'])}")
+    return report
+
+
+def get_queued_rebuilds(cursor, table):
+    """재생성 대기열에 남은 인덱스 목록"""
+    cursor.execute(
+        """
+        SELECT schema_name, index_name, definition, method
+        FROM vector_index_rebuild
+        WHERE table_name = %s
+        ORDER BY index_name
+        """,
+        (table,),
+    )
+    return [
+        {
+            "schema": schema,
+            "name": name,
+            "qualified_name": quoted_index_name(schema, name),
+            "definition": definition,
+            "method": method,
+            "trained_rows": None,
+        }
+        for schema, name, definition, method in cursor.fetchall()
+    ]
+
+
+def index_is_valid(cursor, index):
+    """인덱스가 있고 사용할 수 있으면 True, 없으면 None, CONCURRENTLY 빌드가 끊겨 INVALID로 남았으면 False"""
+    cursor.execute(
+        "SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", (index["qualified_name"],)
+    )
+    result = cursor.fetchone()
+    return None if result is None else bool(result[0])
+
+
+def rebuild_queued_index(cursor, index, rows):
+    """
+    대량 적재 때문에 내려둔 인덱스를 같은 이름으로 CREATE INDEX CONCURRENTLY 빌드하고 대기열에서 지웁니다.
+    이미 유효한 인덱스가 있으면(삭제 전에 끊긴 경우) 대기열에서만 지웁니다.
+    """
+    valid = index_is_valid(cursor, index)
+    report = None
+    if not valid:
+        if valid is False:
+            # 이전 빌드가 Lambda 시간 제한 등으로 끊겨 남은 INVALID 인덱스 정리
+            cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index['qualified_name']}")
+        definition = concurrent_index_definition(
+            tune_index_definition(index["definition"], index["method"], rows), index["name"]
+        )
+        report = build_index(cursor, index, rows, definition)
+    cursor.execute(
+        "DELETE FROM vector_index_rebuild WHERE schema_name = %s AND index_name = %s",
+        (index["schema"], index["name"]),
+    )
+    return report
+
+
+def maintain_vector_indexes(connection, table):
+    """
+    예약 작업(recommend-db-maintenance)에서 호출합니다.
+    대량 적재가 내려둔 인덱스를 다시 만들고, 행 수가 임계치를 넘은 IVFFlat 인덱스는 lists를 재학습합니다.
+    연결을 잠시 autocommit으로 바꿔 트랜잭션 밖에서 CONCURRENTLY 빌드하고,
+    적재 쪽 인덱스 삭제와 겹치지 않도록 세션 advisory lock을 잡습니다.
+    """
+    autocommit = connection.autocommit
+    connection.autocommit = True
+    cursor = connection.cursor()
+    try:
+        queued_indexes = get_queued_rebuilds(cursor, table)
+        rows = estimate_row_count(cursor, table)
+        stale_indexes = [
+            index for index in get_vector_indexes(cursor, table)
+            if needs_ivfflat_retrain(index, rows)
+        ]
+        if not queued_indexes and not stale_indexes:
+            return []
+        if not try_advisory_lock(cursor, table):
+            print(f"Another job is changing vector indexes on {table}, skipping")
+            return []
+
+        try:
+            set_build_parameters(cursor, is_local=False)
+            reports = []
+            for index in queued_indexes:
+                print(f"Rebuilding vector index {index['name']} ({index['method']}) dropped for bulk load")
+                report = rebuild_queued_index(cursor, index, rows)
+                if report:
+                    reports.append(report)
+            for index in stale_indexes:
+                print(
+                    f"Retraining IVFFlat index {index['name']}: "
+                    f"trained on {index['trained_rows']} rows, now {rows} rows"
+                )
+                reports.append(rebuild_index_concurrently(cursor, index, rows))
+            return reports
+        finally:
+            release_advisory_lock(cursor, table)
+    finally:
+        cursor.close()
+        connection.autocommit = autocommit
+
+
+def prepare_bulk_load(connection, table, incoming_rows):
+    """
+    대량 적재 직전, 적재 트랜잭션에서 쓰기를 하기 전에 호출합니다.
+    적재량이 크면 벡터 인덱스 정의를 재생성 대기열에 남기고 트랜잭션 밖에서 DROP INDEX CONCURRENTLY로 내립니다.
+    이때 읽기만 한 현재 트랜잭션은 롤백으로 끝냅니다. 인덱스 재생성은 적재 경로가 아니라
+    예약 작업(maintain_vector_indexes)이 CREATE INDEX CONCURRENTLY로 하므로, 적재가 실패하거나
+    Lambda 시간이 다 되어도 추천 API 조회가 잠금을 기다리지 않습니다.
+    BULK_LOAD_MIN_ROWS보다 작은 적재는 인덱스를 내릴 일이 없으므로 조회 없이 바로 반환합니다.
+    """
+    load_state = {
+        "table": table,
+        "existing_rows": None,
+        "incoming_rows": incoming_rows,
+        "dropped_indexes": [],
+    }
+    if incoming_rows < BULK_LOAD_MIN_ROWS:
+        return load_state
+
+    connection.rollback()
+    autocommit = connection.autocommit
+    connection.autocommit = True
+    cursor = connection.cursor()
+    try:
+        load_state["existing_rows"] = estimate_row_count(cursor, table)
+        if not should_drop_for_bulk_load(load_state["existing_rows"], incoming_rows):
+            return load_state
+        if not try_advisory_lock(cursor, table):
+            print(f"Another job is changing vector indexes on {table}, loading with indexes")
+            return load_state
+        try:
+            for index in get_vector_indexes(cursor, table):
+                queue_index_rebuild(cursor, table, index)
+                drop_index_concurrently(cursor, index)
+                load_state["dropped_indexes"].append(index["name"])
+        finally:
+            release_advisory_lock(cursor, table)
+    finally:
+        cursor.close()
+        connection.autocommit = autocommit
+    return load_state
@@ -0,0 +1,15 @@
+# 파이프라인 Lambda 공용 모듈(pipeline_common) Layer
+data "archive_file" "pipeline_common_zip" {
+  type        = "zip"
+  source_dir  = "${path.module}/layer"
+  output_path = "${path.module}/${var.layer_name}.zip"
+  excludes    = ["python/pipeline_common/__pycache__"]
+}
+
+resource "aws_lambda_layer_version" "this" {
+  filename            = data.archive_file.pipeline_common_zip.output_path
+  layer_name          = var.layer_name
+  description         = "Shared helpers for data pipeline Lambdas"
+  compatible_runtimes = ["python3.9"]
+  source_code_hash    = data.archive_file.pipeline_common_zip.output_base64sha256
+}
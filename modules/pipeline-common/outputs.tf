@@ -0,0 +1,4 @@
+# Outputs
+output "layer_arn" {
+  value = aws_lambda_layer_version.this.arn
+}
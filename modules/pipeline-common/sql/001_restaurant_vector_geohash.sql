@@ -0,0 +1,10 @@
+-- restaurant_vector 지리 셀 키 컬럼
+-- geohash 앞자리가 상위 셀이므로 text_pattern_ops 인덱스로 LIKE 'prefix%' 스캔이 가능
+-- 좌표가 없거나 0.0/0.0인 식당은 geohash가 NULL로 저장되어 지리 필터에서 제외됨
+ALTER TABLE restaurant_vector ADD COLUMN IF NOT EXISTS geohash varchar(12);
+
+CREATE INDEX IF NOT EXISTS idx_restaurant_vector_geohash
+    ON restaurant_vector (geohash text_pattern_ops);
+
+CREATE INDEX IF NOT EXISTS idx_restaurant_vector_lat_lon
+    ON restaurant_vector (latitude, longitude);
@@ -0,0 +1,28 @@
+-- facet별 128차원 사전 필터 벡터 (pipeline_common.matryoshka)
+-- 768차원 벡터의 앞 128차원을 잘라 다시 L2 정규화한 사본. 검색은 이 컬럼으로 후보를 좁힌 뒤 768차원 컬럼으로 다시 정렬함
+-- 차원은 matryoshka.PREFILTER_DIMENSION과 같아야 함
+ALTER TABLE restaurant_vector ADD COLUMN IF NOT EXISTS companion_prefilter_vector vector(128);
+ALTER TABLE restaurant_vector ADD COLUMN IF NOT EXISTS food_prefilter_vector vector(128);
+ALTER TABLE restaurant_vector ADD COLUMN IF NOT EXISTS purpose_prefilter_vector vector(128);
+ALTER TABLE restaurant_vector ADD COLUMN IF NOT EXISTS vibe_prefilter_vector vector(128);
+
+ALTER TABLE crawling_review ADD COLUMN IF NOT EXISTS companion_prefilter_vector vector(128);
+ALTER TABLE crawling_review ADD COLUMN IF NOT EXISTS food_prefilter_vector vector(128);
+ALTER TABLE crawling_review ADD COLUMN IF NOT EXISTS purpose_prefilter_vector vector(128);
+ALTER TABLE crawling_review ADD COLUMN IF NOT EXISTS vibe_prefilter_vector vector(128);
+
+-- 기존 행 채우기 (subvector/l2_normalize는 pgvector 0.7 이상)
+-- 0 벡터는 l2_normalize 결과도 0 벡터라 writer와 같은 값이 됨
+UPDATE restaurant_vector SET
+    companion_prefilter_vector = l2_normalize(subvector(companion_vector, 1, 128))::vector(128),
+    food_prefilter_vector = l2_normalize(subvector(food_vector, 1, 128))::vector(128),
+    purpose_prefilter_vector = l2_normalize(subvector(purpose_vector, 1, 128))::vector(128),
+    vibe_prefilter_vector = l2_normalize(subvector(vibe_vector, 1, 128))::vector(128)
+WHERE vibe_prefilter_vector IS NULL AND vibe_vector IS NOT NULL;
+
+UPDATE crawling_review SET
+    companion_prefilter_vector = l2_normalize(subvector(companion_vector, 1, 128))::vector(128),
+    food_prefilter_vector = l2_normalize(subvector(food_vector, 1, 128))::vector(128),
+    purpose_prefilter_vector = l2_normalize(subvector(purpose_vector, 1, 128))::vector(128),
+    vibe_prefilter_vector = l2_normalize(subvector(vibe_vector, 1, 128))::vector(128)
+WHERE vibe_prefilter_vector IS NULL AND vibe_vector IS NOT NULL;
@@ -0,0 +1,6 @@
+-- Restaurant DB(MySQL) outbox 작은 벡터 payload 컬럼 (pipeline_common.outbox_payload)
+-- save-restaurant-metadata가 OUTBOX_INLINE_MAX_BYTES 이하의 압축 payload를 저장하고, 넘으면 NULL
+-- payload 컬럼은 계속 S3 key이고, NULL인 행(큰 payload, 이전 행)은 save-vector가 S3에서 읽음
+-- TEXT(64KB)로는 임계값(240KB)을 담지 못하므로 MEDIUMTEXT
+-- save-restaurant-metadata/outbox-polling 배포 전에 적용
+ALTER TABLE outbox ADD COLUMN inline_payload MEDIUMTEXT CHARACTER SET utf8mb4 NULL;
@@ -0,0 +1,12 @@
+-- 대량 적재 때문에 내려둔 벡터 인덱스의 재생성 대기열 (pipeline_common.vector_index)
+-- 적재 쪽이 DROP INDEX CONCURRENTLY 전에 정의를 남기고, recommend-db-maintenance가
+-- CREATE INDEX CONCURRENTLY로 다시 만든 뒤 행을 지움
+CREATE TABLE IF NOT EXISTS vector_index_rebuild (
+    schema_name TEXT NOT NULL,
+    index_name TEXT NOT NULL,
+    table_name TEXT NOT NULL,
+    definition TEXT NOT NULL,
+    method TEXT NOT NULL,
+    queued_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (schema_name, index_name)
+);
@@ -0,0 +1,5 @@
+"""pipeline_common 레이어를 설치 없이 import하도록 경로를 추가합니다."""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "layer", "python"))
@@ -0,0 +1,67 @@
+import gzip
+import io
+import json
+import re
+
+import pytest
+
+from pipeline_common.artifact_codec import read_artifact, read_artifact_with_fallback, write_artifact
+
+
+class MissingKey(Exception):
+    def __init__(self):
+        super().__init__("NoSuchKey")
+        self.response = {"Error": {"Code": "NoSuchKey"}}
+
+
+class FakeS3:
+    """artifact_codec이 쓰는 put_object / get_object(Range)만 흉내 내는 메모리 S3"""
+
+    def __init__(self):
+        self.objects = {}
+        self.get_calls = []
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[(Bucket, Key)] = bytes(Body)
+
+    def get_object(self, Bucket, Key, Range=None, IfMatch=None):
+        self.get_calls.append(Key)
+        if (Bucket, Key) not in self.objects:
+            raise MissingKey()
+        data = self.objects[(Bucket, Key)]
+        start, end = map(int, re.match(r"bytes=(\d+)-(\d+)", Range).groups()) if Range else (0, len(data) - 1)
+        part = data[start : end + 1]
+        return {
+            "Body": io.BytesIO(part),
+            "ContentRange": f"bytes {start}-{start + len(part) - 1}/{len(data)}",
+            "ETag": "etag",
+        }
+
+
+RECORDS = [{"id": "r1", "content": "맛있어요"}, {"id": "r2", "categories": {"food": "고기"}}]
+
+
+@pytest.mark.parametrize("extension", [".jsonl.gz", ".jsonl", ".json.gz", ".json"])
+def test_write_read_round_trip(extension):
+    s3 = FakeS3()
+    write_artifact(s3, "bucket", f"review/place{extension}", RECORDS)
+    assert read_artifact(s3, "bucket", f"review/place{extension}") == RECORDS
+
+
+def test_fallback_reads_legacy_gzip_json_without_head():
+    s3 = FakeS3()
+    s3.put_object("bucket", "review/place.json", gzip.compress(json.dumps(RECORDS).encode("utf-8")))
+    assert read_artifact_with_fallback(s3, "bucket", "review/place") == ("review/place.json", RECORDS)
+    assert s3.get_calls == ["review/place.jsonl.gz", "review/place.jsonl", "review/place.json.gz", "review/place.json"]
+
+
+def test_fallback_uses_known_key_first():
+    s3 = FakeS3()
+    write_artifact(s3, "bucket", "review/place.json", RECORDS)
+    assert read_artifact_with_fallback(s3, "bucket", "review/place", "review/place.json")[1] == RECORDS
+    assert s3.get_calls == ["review/place.json"]
+
+
+def test_fallback_raises_when_missing():
+    with pytest.raises(FileNotFoundError):
+        read_artifact_with_fallback(FakeS3(), "bucket", "review/none")
@@ -0,0 +1,31 @@
+from pipeline_common.batch_coalesce import (
+    encode_custom_id,
+    group_results_by_restaurant,
+    pack_requests,
+    parse_custom_id,
+)
+
+
+def test_custom_id_round_trip():
+    custom_id = encode_custom_id("place|1", "review 2", "food", 3)
+    assert parse_custom_id(custom_id) == ("place|1", "review 2", "food")
+    assert parse_custom_id(encode_custom_id("place", "r1")) == ("place", "r1", None)
+
+
+def test_parse_legacy_custom_id():
+    assert parse_custom_id("r1_0a1b") == (None, "r1", None)
+    assert parse_custom_id("r1_food_0a1b", with_category=True) == (None, "r1", "food")
+
+
+def test_group_results_by_restaurant():
+    results = [{"custom_id": encode_custom_id(key, "r", index=i)} for i, key in enumerate(["a", "b", "a"])]
+    results.append({"custom_id": "r1_0a1b"})
+    grouped = group_results_by_restaurant(results)
+    assert [len(grouped[key]) for key in ("a", "b", None)] == [2, 1, 1]
+
+
+def test_pack_requests_respects_limits():
+    requests = [("a", [b"x" * 10] * 2), ("b", []), ("c", [b"y" * 10] * 2), ("d", [b"z" * 10])]
+    batches = pack_requests(requests, max_requests=4, max_bytes=1000)
+    assert [batch["keys"] for batch in batches] == [["a", "c"], ["d"]]
+    assert batches[0]["bytes"] == 40
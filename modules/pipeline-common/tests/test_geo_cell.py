@@ -0,0 +1,17 @@
+from pipeline_common.geo_cell import decode_bbox, encode, geo_cell
+
+
+def test_encode_known_geohash():
+    assert encode(37.5665, 126.978, 6) == "wydm9q"
+
+
+def test_encode_decode_round_trip():
+    for latitude, longitude in [(37.5665, 126.978), (-33.8688, 151.2093), (0.1, -0.1)]:
+        min_lat, max_lat, min_lon, max_lon = decode_bbox(encode(latitude, longitude, 7))
+        assert min_lat <= latitude <= max_lat
+        assert min_lon <= longitude <= max_lon
+
+
+def test_geo_cell_skips_invalid_coordinates():
+    assert geo_cell(0.0, 0.0) is None
+    assert geo_cell(37.5665, 126.978) == encode(37.5665, 126.978)
@@ -0,0 +1,26 @@
+from pipeline_common.near_duplicates import (
+    extraction_selection,
+    restore_extraction_reviews,
+    select_extraction_reviews,
+)
+
+CONTENT = "가족과 조용한 저녁 먹기 좋은 곳이에요 고기가 부드럽고 직원분들도 친절해서 재방문 의사 있어요"
+
+
+def test_selection_round_trip():
+    reviews = [
+        {"id": "r0", "content": CONTENT},
+        {"id": "r1", "content": CONTENT + "!"},
+        {"id": "r2", "content": "회식하기 넓고 활기찬 분위기에 주차도 편하고 메뉴 구성이 다양해서 단체로 오기 좋아요"},
+    ]
+    representatives, members, _ = select_extraction_reviews(reviews)
+    assert members == {"r0": [1]}
+
+    restored = restore_extraction_reviews(reviews, extraction_selection(reviews, members))
+    assert restored == (representatives, members)
+
+
+def test_restore_rejects_mismatched_selection():
+    reviews = [{"id": "r0", "content": CONTENT}]
+    assert restore_extraction_reviews(reviews, {"reviewCount": 2, "members": {}}) is None
+    assert restore_extraction_reviews(reviews, None) is None
@@ -0,0 +1,22 @@
+import pytest
+
+from pipeline_common.review_bloom import BloomFilter
+
+
+def test_bloom_filter_bytes_round_trip():
+    bloom = BloomFilter(1000, 0.01, version=7)
+    hashes = [f"hash-{i}" for i in range(200)]
+    for value in hashes:
+        bloom.add(value)
+
+    restored = BloomFilter.from_bytes(bloom.to_bytes())
+    assert (restored.num_bits, restored.num_hashes, restored.count, restored.version) == (
+        bloom.num_bits, bloom.num_hashes, bloom.count, 7
+    )
+    assert restored.bits == bloom.bits
+    assert all(value in restored for value in hashes)
+
+
+def test_bloom_filter_rejects_other_objects():
+    with pytest.raises(ValueError):
+        BloomFilter.from_bytes(b"not a bloom filter")
@@ -0,0 +1,28 @@
+import json
+
+from pipeline_common.batch_coalesce import parse_custom_id
+from pipeline_common.review_packing import extraction_request_lines, parse_pack_custom_id, parse_packed_content
+
+
+def test_packed_custom_id_round_trip():
+    reviews = [{"id": f"r{i}", "content": f"review {i}"} for i in range(5)]
+    lines = [json.loads(line) for line in extraction_request_lines(reviews, "place", reviews_per_request=2)]
+    assert [parse_pack_custom_id(line["custom_id"]) for line in lines] == [(0, 2), (2, 2), None]
+    # 마지막 한 개는 기존 단일 요청 형식
+    assert parse_custom_id(lines[-1]["custom_id"]) == ("place", "r4", None)
+
+
+def test_parse_packed_content_keeps_expected_ids_only():
+    content = json.dumps(
+        {
+            "results": [
+                {"id": "r1", "companion": "가족", "food": "고기", "purpose": "", "vibe": "조용함"},
+                {"id": "other", "companion": "친구"},
+                {"id": "r1", "companion": "중복"},
+            ]
+        },
+        ensure_ascii=False,
+    )
+    parsed = parse_packed_content(content, ["r1", "r2"])
+    assert list(parsed) == ["r1"]
+    assert parsed["r1"]["companion"] == "가족"
@@ -0,0 +1,5 @@
+# Variables
+variable "layer_name" {
+  description = "Name of the pipeline common Lambda layer"
+  type        = string
+}
@@ -0,0 +1,169 @@
+"""
+OpenAI 배치 상태 멀티플렉서
+배치 ID 여러 개(수백 개까지)를 한 번의 호출에서 asyncio로 동시에 조회하고,
+request_counts 진행률로 배치별 예상 남은 시간과 다음 조회 간격을 계산합니다. (pipeline_common.batch_progress)
+무거운 create-embedding-batch / save-embedding을 부르기 전에 이 함수로 준비 여부만 확인하고,
+준비되지 않았으면 nextPollSeconds만큼 기다립니다.
+다시 조회해도 결과가 바뀌지 않는 4xx(잘못된 키, 권한, 요청 오류)는 실패로 처리하고,
+배치를 만든 시각(started_at)부터 BATCH_MAX_WAIT_SECONDS가 지나도 끝나지 않으면 timedOut으로 실패를 돌려줘
+Step Functions 조회 루프가 무한히 돌지 않게 합니다.
+"""
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pipeline_common.batch_progress import (
+    BATCH_POLL_MIN_SECONDS,
+    FAILED_STATUSES,
+    PENDING_STATUSES,
+    summarize_batch,
+)
+from pipeline_common.metrics import span
+
+# 환경 변수
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# 동시에 열어 둘 조회 요청 수
+BATCH_STATUS_CONCURRENCY = int(os.getenv("BATCH_STATUS_CONCURRENCY", "32"))
+BATCH_STATUS_TIMEOUT_SECONDS = float(os.getenv("BATCH_STATUS_TIMEOUT_SECONDS", "10"))
+# 배치를 만든 뒤 기다릴 최대 시간 (OpenAI 배치 완료 기한 24시간 + 여유)
+BATCH_MAX_WAIT_SECONDS = int(os.getenv("BATCH_MAX_WAIT_SECONDS", str(26 * 3600)))
+# 잠시 뒤 다시 조회하면 성공할 수 있는 4xx (타임아웃, 충돌, 요청 한도)
+RETRYABLE_HTTP_CODES = (408, 409, 425, 429)
+
+# 로거 설정 (stdout 핸들러는 첫 호출 때 연결)
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+_logging_configured = False
+
+
+def configure_logging():
+    """stdout 로그 핸들러를 실행 환경당 한 번만 연결합니다."""
+    global _logging_configured
+    if _logging_configured:
+        return
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setLevel(logging.INFO)
+    stream_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+    logger.addHandler(stream_handler)
+    _logging_configured = True
+
+
+def retrieve_batch(batch_id):
+    """GET /v1/batches/{id} 한 번 (스레드에서 실행)"""
+    import urllib.request
+
+    req = urllib.request.Request(
+        f"https://api.openai.com/v1/batches/{batch_id}",
+        headers={"Authorization": f"Bearer {OPENAI_API_KEY}"},
+    )
+    with urllib.request.urlopen(req, timeout=BATCH_STATUS_TIMEOUT_SECONDS) as response:
+        return json.loads(response.read().decode())
+
+
+async def check_batch(loop, executor, batch_id):
+    """배치 하나를 조회해 요약합니다. 조회 실패는 이 배치만 표시하고 다른 배치 결과는 그대로 돌려줍니다."""
+    import urllib.error
+
+    try:
+        batch = await loop.run_in_executor(executor, retrieve_batch, batch_id)
+    except urllib.error.HTTPError as e:
+        if e.code == 404:
+            # 없는 배치는 다시 조회해도 소용없으므로 실패로 처리
+            return {"batchId": batch_id, "status": "not_found", "error": str(e), "nextPollSeconds": 0}
+        if 400 <= e.code < 500 and e.code not in RETRYABLE_HTTP_CODES:
+            # 400/401/403 등은 키나 요청을 고치기 전에는 계속 실패하므로 대기하지 않고 실패로 처리
+            logger.error(f"배치 상태 조회 실패, 재시도하지 않음 ({batch_id}): {str(e)}")
+            return {"batchId": batch_id, "status": "lookup_failed", "error": str(e), "nextPollSeconds": 0}
+        logger.warning(f"배치 상태 조회 실패 ({batch_id}): {str(e)}")
+        return {"batchId": batch_id, "status": "unknown", "error": str(e), "nextPollSeconds": BATCH_POLL_MIN_SECONDS}
+    except Exception as e:
+        logger.warning(f"배치 상태 조회 실패 ({batch_id}): {str(e)}")
+        return {"batchId": batch_id, "status": "unknown", "error": str(e), "nextPollSeconds": BATCH_POLL_MIN_SECONDS}
+    return summarize_batch(batch)
+
+
+def elapsed_seconds(started_at):
+    """대기 시작 시각(ISO 8601, Step Functions의 $$.State.EnteredTime)부터 지난 초. 없으면 None"""
+    if not started_at:
+        return None
+    started = datetime.fromisoformat(started_at.replace("Z", "+00:00"))
+    if started.tzinfo is None:
+        started = started.replace(tzinfo=timezone.utc)
+    return time.time() - started.timestamp()
+
+
+async def check_batches(batch_ids):
+    """모든 배치를 동시에 조회하고 입력 순서대로 요약을 반환합니다."""
+    loop = asyncio.get_running_loop()
+    # urllib는 블로킹이므로 동시 요청 수만큼 스레드를 두고 이벤트 루프에서 모아 기다림
+    with ThreadPoolExecutor(max_workers=max(1, min(BATCH_STATUS_CONCURRENCY, len(batch_ids)))) as executor:
+        return await asyncio.gather(*(check_batch(loop, executor, batch_id) for batch_id in batch_ids))
+
+
+def handler(event, context):
+    """
+    Input: {"batch_ids": ["batch_abc", "batch_def", ...], "started_at": "2024-01-01T00:00:00Z"}
+           또는 {"batch_id": "batch_abc"} (started_at은 선택, batch_id가 null이면 기다릴 배치가 없음)
+    Output: {"statusCode": 200, "body": {"batches": [...], "ready": bool, "failed": bool, "timedOut": bool,
+             "nextPollSeconds": 120, ...}}
+    ready는 모든 배치가 completed일 때(빈 목록 포함), failed는 하나라도 실패/만료/취소/조회 불가이거나
+    started_at부터 BATCH_MAX_WAIT_SECONDS가 지났는데 진행 중인 배치가 남았을 때 true입니다.
+    nextPollSeconds는 아직 진행 중인 배치들의 다음 조회 간격 중 가장 짧은 값입니다.
+    """
+    configure_logging()
+    batch_ids = event["batch_ids"] if "batch_ids" in event else [event.get("batch_id")]
+    if isinstance(batch_ids, str):
+        batch_ids = [batch_ids]
+    batch_ids = [batch_id for batch_id in dict.fromkeys(batch_ids) if batch_id]
+    # 빈 batch_ids 목록이나 null batch_id는 기다릴 배치가 없는 것으로 보고 바로 ready
+    # (묶음 단계 또는 식당 하나의 추출 요청이 하나도 없을 때)
+    if "batch_ids" not in event and "batch_id" not in event:
+        raise ValueError("batch_id is missing")
+
+    logger.info(f"배치 {len(batch_ids)}개 상태 조회 시작")
+    with span("openai_batch_status") as metric:
+        batches = asyncio.run(check_batches(batch_ids))
+        metric.add_rows(len(batches))
+
+        pending = [batch for batch in batches if batch["status"] in PENDING_STATUSES + ("unknown",)]
+        failed = [
+            batch for batch in batches if batch["status"] in FAILED_STATUSES + ("not_found", "lookup_failed")
+        ]
+        completed_count = sum(1 for batch in batches if batch["status"] == "completed")
+        metric.set_metric("PendingBatches", len(pending), "Count")
+        metric.set_metric("FailedBatches", len(failed), "Count")
+
+    next_poll = min(batch["nextPollSeconds"] for batch in pending) if pending else 0
+    elapsed = elapsed_seconds(event.get("started_at"))
+    timed_out = bool(pending) and elapsed is not None and elapsed >= BATCH_MAX_WAIT_SECONDS
+    if timed_out:
+        logger.error(
+            f"배치 대기 시간 초과: 시작 후 {int(elapsed)}초 (최대 {BATCH_MAX_WAIT_SECONDS}초), "
+            f"진행 중 {len(pending)}개"
+        )
+    logger.info(
+        f"완료 {completed_count}개, 진행 중 {len(pending)}개, 실패 {len(failed)}개, "
+        f"다음 조회까지 {next_poll}초"
+    )
+    return {
+        "statusCode": 200,
+        "body": {
+            "batches": batches,
+            "ready": not pending and not failed,
+            "failed": bool(failed) or timed_out,
+            "timedOut": timed_out,
+            "completedCount": completed_count,
+            "pendingCount": len(pending),
+            "failedCount": len(failed),
+            "nextPollSeconds": next_poll,
+            "nextPollAt": datetime.fromtimestamp(time.time() + next_poll, timezone.utc).isoformat(),
+        },
+    }
+
+
+if __name__ == "__main__":
+    handler({"batch_ids": ["batch_xxx"]}, None)
@@ -1,33 +1,51 @@
 from datetime import datetime
 import json
 import os
-import boto3
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple
 import logging
 import sys
-import urllib.request
-import urllib.parse
-import uuid
+from pipeline_common.artifact_codec import read_artifact, read_artifact_with_fallback
+from pipeline_common.metrics import span
+from pipeline_common.aws_clients import get_client
+from pipeline_common.batch_coalesce import pack_requests, write_plan
+from pipeline_common.near_duplicates import extraction_selection, select_extraction_reviews
+from pipeline_common.review_packing import (
+    EXTRACTION_REVIEWS_PER_REQUEST,
+    estimate_saved_prompt_tokens,
+    extraction_request_lines,
+)
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 
 # 환경 변수
 REVIEW_BUCKET_DIRECTORY = os.getenv("REVIEW_BUCKET_DIRECTORY")
 S3_BUCKET_NAME = os.getenv("S3_BUCKET_NAME")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")  # API 키 환경변수 추가
+# 여러 식당을 한 배치로 묶을 때 리뷰 파일을 동시에 읽을 스레드 수
+COALESCE_READ_WORKERS = int(os.getenv("COALESCE_READ_WORKERS", "16"))
 
-# S3 클라이언트 초기화
-s3_client = boto3.client("s3")
-
-# 로거 설정
+# 로거 설정 (stdout 핸들러는 첫 호출 때 연결)
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
-handler = logging.StreamHandler(sys.stdout)
-handler.setLevel(logging.INFO)
-formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
-handler.setFormatter(formatter)
-logger.addHandler(handler)
+_logging_configured = False
+
+
+def configure_logging():
+    """stdout 로그 핸들러를 실행 환경당 한 번만 연결합니다."""
+    global _logging_configured
+    if _logging_configured:
+        return
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setLevel(logging.INFO)
+    stream_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+    logger.addHandler(stream_handler)
+    _logging_configured = True
 
 
 def handler(event, context):
+    configure_logging()
+    if "S3_KEYS" in event or "manifestKey" in event:
+        return handle_coalesced(event)
     S3_KEY = event["S3_KEY"]
     logger.info(f"S3_KEY: {S3_KEY}")
     """Lambda 1: 카테고리 추출 배치 생성만 수행"""
@@ -35,18 +53,47 @@ def handler(event, context):
         logger.info("=== 카테고리 추출 배치 생성 시작 ===")
         # 1. S3에서 리뷰 데이터 가져오기
         logger.info("S3에서 리뷰 데이터 로딩 중...")
-        reviews = get_reviews_from_s3(REVIEW_BUCKET_DIRECTORY, S3_KEY)
+        with span("s3_read") as metric:
+            review_key, reviews = get_reviews_from_s3(REVIEW_BUCKET_DIRECTORY, S3_KEY)
+            metric.add_rows(len(reviews))
         logger.info(f"S3에서 {len(reviews)}개의 리뷰를 성공적으로 로드했습니다")
-        # 2. 카테고리 추출을 위한 배치 작업 생성
+        # 2. 본문 정리 후 정보가 없는 리뷰와 근접 중복은 요청에서 뺌 (매핑 단계에서 빈 카테고리 또는 대표 결과 복사)
+        extraction_reviews, selection, preparation = prepare_extraction(reviews)
+        if not extraction_reviews:
+            # 리뷰가 모두 빠졌으면 빈 배치를 만들지 않음 (묶음 경로의 batch_id가 None인 식당과 같음)
+            # 다음 단계는 batch_id가 None이면 바로 빈 카테고리로 저장
+            logger.info("추출할 리뷰가 없어 배치를 만들지 않습니다")
+            return {
+                "statusCode": 200,
+                "body": {
+                    "extraction_batch_id": None,
+                    "review_key": review_key,
+                    "review_count": len(reviews),
+                    "preparation": preparation,
+                    "packing": packing_summary(0, 0),
+                    "selection": selection,
+                },
+            }
+        # 3. 카테고리 추출을 위한 배치 작업 생성
         logger.info("카테고리 추출 배치 작업 생성 중...")
-        extraction_batch_id = create_extraction_batch(reviews)
+        with span("create_batch") as metric:
+            extraction_batch_id, request_count = create_extraction_batch(extraction_reviews, S3_KEY)
+            metric.add_rows(len(extraction_reviews))
+            metric.set_property("batchId", extraction_batch_id)
+            packing = packing_summary(len(extraction_reviews), request_count, metric)
         logger.info(f"추출 배치 작업이 생성되었습니다. 배치 ID: {extraction_batch_id}")
         # Step Function으로 전달할 데이터
         return {
             "statusCode": 200,
             "body": {
                 "extraction_batch_id": extraction_batch_id,
+                # 다음 단계가 리뷰 파일 형식을 다시 찾지 않도록 실제로 읽은 키를 전달
+                "review_key": review_key,
                 "review_count": len(reviews),
+                "preparation": preparation,
+                "packing": packing,
+                # 매핑 단계가 근접 중복 묶음을 다시 계산하지 않도록 전달
+                "selection": selection,
             },
         }
     except Exception as e:
@@ -55,59 +102,183 @@ def handler(event, context):
         raise Exception(f"Failed to create category batch: {str(e)}")
 
 
-def get_reviews_from_s3(BUCKET_DIRECTORY: str, S3_KEY: str) -> List[Dict[str, Any]]:
-    """S3에서 리뷰 데이터를 가져오는 함수"""
+def handle_coalesced(event):
+    """
+    여러 식당의 리뷰를 크기 제한까지 한 추출 배치로 묶습니다. (pipeline_common.batch_coalesce)
+    Input: {"S3_KEYS": ["123", "456", ...]} 또는 place manifest {"manifestBucket": "...", "manifestKey": "..."}
+    Output body: {"plan_key": "...", "extraction_batch_ids": [...], "restaurant_count": n, "review_count": n}
+    """
+    try:
+        logger.info("=== 묶음 카테고리 추출 배치 생성 시작 ===")
+        restaurant_keys = get_restaurant_keys(event)
+        logger.info(f"식당 {len(restaurant_keys)}곳의 리뷰를 묶습니다")
+
+        # 1. 식당별 리뷰를 동시에 읽기 (없는 파일은 건너뜀)
+        with span("s3_read") as metric:
+            with ThreadPoolExecutor(max_workers=max(1, min(COALESCE_READ_WORKERS, len(restaurant_keys)))) as executor:
+                read_results = list(zip(restaurant_keys, executor.map(read_reviews_or_none, restaurant_keys)))
+            skipped_keys = [key for key, (_, reviews) in read_results if reviews is None]
+            reviews_by_key = [(key, reviews) for key, (_, reviews) in read_results if reviews]
+            review_keys = {key: review_key for key, (review_key, reviews) in read_results if reviews}
+            review_count = sum(len(reviews) for _, reviews in reviews_by_key)
+            metric.add_rows(review_count)
+        if skipped_keys:
+            logger.info(f"리뷰 파일이 없는 식당 {len(skipped_keys)}곳은 건너뜁니다")
+
+        # 2. 본문 정리/근접 중복 제거 후 요청을 크기 제한 안에서 배치로 나누어 생성
+        extraction_by_key, selections, preparation = prepare_extraction_by_key(reviews_by_key)
+        packed = pack_requests(
+            [(key, extraction_request_lines(reviews, key)) for key, reviews in extraction_by_key]
+        )
+        review_count_by_key = {key: len(reviews) for key, reviews in extraction_by_key}
+        batches = []
+        request_count = 0
+        for index, batch in enumerate(packed):
+            with span("create_batch") as metric:
+                batch_id = submit_batch(b"".join(batch["lines"]))
+                metric.add_rows(len(batch["lines"]))
+                metric.set_property("batchId", batch_id)
+                packing_summary(
+                    sum(review_count_by_key[key] for key in batch["keys"]), len(batch["lines"]), metric
+                )
+            request_count += len(batch["lines"])
+            logger.info(
+                f"[{index + 1}/{len(packed)}] 배치 {batch_id}: 식당 {len(batch['keys'])}곳, "
+                f"요청 {len(batch['lines'])}개"
+            )
+            batches.append({"batch_id": batch_id, "keys": batch["keys"]})
+        # 리뷰가 모두 빠진 식당도 다음 단계에서 빈 카테고리로 저장되도록 plan에 남김
+        packed_keys = {key for batch in batches for key in batch["keys"]}
+        leftover_keys = [key for key, _ in reviews_by_key if key not in packed_keys]
+        if leftover_keys:
+            batches.append({"batch_id": None, "keys": leftover_keys})
+
+        # 식당별 근접 중복 묶음도 plan에 남겨 create-embedding-batch가 MinHash를 다시 계산하지 않게 함
+        # 실제로 읽은 리뷰 파일 키도 남겨 다음 단계가 형식을 다시 찾지 않게 함
+        plan_key = write_plan(
+            get_client("s3"),
+            S3_BUCKET_NAME,
+            "extraction",
+            batches,
+            {"selections": selections, "review_keys": review_keys},
+        )
+        logger.info(f"배치 plan 저장: {plan_key}")
+        return {
+            "statusCode": 200,
+            "body": {
+                "plan_key": plan_key,
+                "extraction_batch_ids": [batch["batch_id"] for batch in batches if batch["batch_id"]],
+                "restaurant_count": len(reviews_by_key),
+                "skipped_count": len(skipped_keys),
+                "review_count": review_count,
+                "preparation": preparation,
+                "packing": packing_summary(sum(review_count_by_key.values()), request_count),
+            },
+        }
+    except Exception as e:
+        logger.error("묶음 배치 생성 중 오류가 발생했습니다")
+        logger.error(f"오류 내용: {str(e)}")
+        raise Exception(f"Failed to create coalesced category batch: {str(e)}")
+
+
+def get_restaurant_keys(event) -> List[str]:
+    """이벤트의 S3_KEYS 또는 place manifest의 placeId 목록 (중복 제거, 순서 유지)"""
+    if "S3_KEYS" in event:
+        keys = event["S3_KEYS"]
+    else:
+        items = read_artifact(get_client("s3"), event["manifestBucket"], event["manifestKey"])
+        keys = [item["placeId"] for item in items]
+    return [key for key in dict.fromkeys(keys) if key]
+
+
+def read_reviews_or_none(S3_KEY: str):
+    """식당 하나의 (리뷰 파일 키, 리뷰)를 읽고, 크롤링 결과가 없으면 (None, None)을 반환합니다."""
+    try:
+        return get_reviews_from_s3(REVIEW_BUCKET_DIRECTORY, S3_KEY)
+    except Exception as e:
+        logger.warning(f"리뷰를 읽지 못했습니다 ({S3_KEY}): {str(e)}")
+        return None, None
+
+
+def get_reviews_from_s3(BUCKET_DIRECTORY: str, S3_KEY: str) -> Tuple[str, List[Dict[str, Any]]]:
+    """S3에서 리뷰 데이터를 가져오는 함수 (실제로 읽은 키와 리뷰 목록을 반환)"""
     try:
-        key = f"{BUCKET_DIRECTORY}/{S3_KEY}.json"
+        # .jsonl.gz를 먼저 GET하고, 없으면 기존 .json 배열을 읽음
+        key, reviews = read_artifact_with_fallback(
+            get_client("s3"), S3_BUCKET_NAME, f"{BUCKET_DIRECTORY}/{S3_KEY}"
+        )
         logger.info(f"key: {key}")
-        response = s3_client.get_object(Bucket=S3_BUCKET_NAME, Key=key)
-        content = response["Body"].read().decode("utf-8")
-        reviews = json.loads(content)
-        return reviews
+        return key, reviews
     except Exception as e:
         raise Exception(f"Failed to get reviews from S3: {str(e)}")
 
 
-def create_extraction_batch(reviews: List[Dict[str, Any]]) -> str:
-    """카테고리 추출을 위한 배치 작업 생성"""
-    batch_input_file_path = "/tmp/extraction_batch_input.jsonl"
+def prepare_extraction(
+    reviews: List[Dict[str, Any]]
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any], Dict[str, int]]:
+    """추출 요청에 보낼 리뷰 목록(본문 정리 + 근접 중복 제거), 근접 중복 묶음과 보고를 반환합니다."""
+    extraction_by_key, selections, report = prepare_extraction_by_key([(None, reviews)])
+    return extraction_by_key[0][1], selections[None], report
 
-    # JSONL 파일 생성
-    with open(batch_input_file_path, "w", encoding="utf-8") as f:
-        for review in reviews:
-            request = {
-                "custom_id": f"{review['id']}_{uuid.uuid4()}",
-                "method": "POST",
-                "url": "/v1/chat/completions",
-                "body": {
-                    "model": "gpt-4o-mini",
-                    "messages": [
-                        {
-                            "role": "system",
-                            "content": """당신은 한국어 리뷰를 분석하는 전문가입니다.
-사용자의 리뷰를 분석하여 정확히 4가지 정보만 추출해주세요.
-추출할 정보:
-1. purpose (목적): 모임의 목적 - 생일, 기념일, 회식, 데이트, 가족모임 등
-2. vibe (분위기): 원하는 분위기 - 조용한, 활기찬, 로맨틱한, 편안한, 고급스러운 등
-3. companion (동행자): 함께 가는 사람 - 가족, 친구, 연인, 동료, 부모님 등
-4. food (음식): 선호하는 음식 종류 - 한식, 일식, 양식, 중식, 이탈리안 등
-응답 규칙:
-- 모든 값은 반드시 한글 String으로 작성
-- 여러 특성이 있으면 "~고"로 연결 (예: "조용하고 편안한")
-- 언급되지 않은 정보는 ""으로 표시
-- JSON 형식으로만 응답""",
-                        },
-                        {"role": "user", "content": review["content"]},
-                    ],
-                    "response_format": {"type": "json_object"},
-                },
-            }
-            f.write(json.dumps(request, ensure_ascii=False) + "\n")
 
-    # 파일 업로드 - urllib 사용
-    with open(batch_input_file_path, "rb") as f:
-        file_content = f.read()
+def prepare_extraction_by_key(
+    reviews_by_key,
+) -> Tuple[List[Tuple[str, List[Dict[str, Any]]]], Dict[str, Dict[str, Any]], Dict[str, int]]:
+    """
+    식당별로 리뷰 본문을 정리하고 근접 중복 묶음의 대표만 남깁니다. (pipeline_common.near_duplicates)
+    식당별 묶음(extraction_selection)은 매핑 단계에서 다시 쓰도록 함께 반환합니다.
+    빠진 리뷰, 중복 리뷰 수와 줄어든 토큰을 합친 보고를 EMF 지표로 남깁니다.
+    """
+    with span("prepare_reviews") as metric:
+        extraction_by_key = []
+        selections = {}
+        report = Counter()
+        for key, reviews in reviews_by_key:
+            representatives, members, restaurant_report = select_extraction_reviews(reviews)
+            extraction_by_key.append((key, [review for _, review in representatives]))
+            selections[key] = extraction_selection(reviews, members)
+            report.update(restaurant_report)
+        metric.add_rows(sum(len(reviews) for _, reviews in extraction_by_key))
+        for name in ("DroppedReviews", "TruncatedReviews", "SavedTokens", "DuplicateReviews", "DuplicateTokens"):
+            metric.set_metric(name, report[name], "Count")
+    logger.info(
+        f"리뷰 정리: {report['Reviews']}개 중 {report['DroppedReviews']}개 제외, {report['TruncatedReviews']}개 자름, "
+        f"근접 중복 {report['DuplicateReviews']}개({report['DuplicateClusters']}묶음) 제외, "
+        f"토큰 약 {report['InputTokens']:,} -> {report['OutputTokens'] - report['DuplicateTokens']:,}"
+    )
+    return extraction_by_key, selections, dict(report)
+
+
+def create_extraction_batch(reviews: List[Dict[str, Any]], restaurant_key: str) -> Tuple[str, int]:
+    """
+    카테고리 추출을 위한 배치 작업 생성 (배치 ID, 요청 수)
+    EXTRACTION_REVIEWS_PER_REQUEST가 2 이상이면 리뷰 여러 개를 한 요청에 묶습니다. (pipeline_common.review_packing)
+    """
+    lines = extraction_request_lines(reviews, restaurant_key)
+    return submit_batch(b"".join(lines)), len(lines)
+
+
+def packing_summary(review_count: int, request_count: int, metric=None) -> Dict[str, int]:
+    """리뷰를 묶어 줄어든 요청 수와 시스템 프롬프트 토큰 어림값 (metric이 있으면 EMF 지표로도 기록)"""
+    summary = {
+        "reviewsPerRequest": EXTRACTION_REVIEWS_PER_REQUEST,
+        "requestCount": request_count,
+        "savedRequests": review_count - request_count,
+        "estimatedSavedPromptTokens": estimate_saved_prompt_tokens(review_count, request_count),
+    }
+    if metric is not None:
+        metric.set_metric("Requests", request_count, "Count")
+        metric.set_metric("SavedRequests", summary["savedRequests"], "Count")
+        metric.set_metric("EstimatedSavedPromptTokens", summary["estimatedSavedPromptTokens"], "Count")
+    return summary
 
+
+def submit_batch(file_content: bytes) -> str:
+    """JSONL 요청 파일을 업로드하고 채팅 배치 작업을 만들어 배치 ID를 반환합니다."""
+    import urllib.request
+    import urllib.error
+
+    # 파일 업로드 - urllib 사용
     # multipart/form-data 경계 문자열
     boundary = "----WebKitFormBoundary7MA4YWxkTrZu0gW"
 
@@ -139,9 +310,11 @@ def create_extraction_batch(reviews: List[Dict[str, Any]]) -> str:
     )
 
     try:
-        with urllib.request.urlopen(req) as response:
-            result = json.loads(response.read().decode())
-            file_id = result["id"]
+        with span("openai_file_upload") as metric:
+            metric.add_bytes(len(body_data))
+            with urllib.request.urlopen(req) as response:
+                result = json.loads(response.read().decode())
+                file_id = result["id"]
     except urllib.error.HTTPError as e:
         raise Exception(f"File upload failed: {e.read().decode()}")
 
@@ -164,7 +337,7 @@ def create_extraction_batch(reviews: List[Dict[str, Any]]) -> str:
     )
 
     try:
-        with urllib.request.urlopen(batch_req) as response:
+        with span("openai_batch_create"), urllib.request.urlopen(batch_req) as response:
             result = json.loads(response.read().decode())
             return result["id"]
     except urllib.error.HTTPError as e:
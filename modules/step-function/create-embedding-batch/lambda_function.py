@@ -1,34 +1,72 @@
 import json
 import os
-import uuid
-import boto3
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
 import logging
 import sys
-import urllib.request
-import urllib.error
+from pipeline_common.artifact_codec import (
+    JSONL_GZIP_EXTENSION,
+    read_artifact,
+    read_artifact_with_fallback,
+    write_artifact,
+)
+from pipeline_common.metrics import emit, span
+from pipeline_common.batch_progress import PENDING_STATUSES, next_poll_seconds
+from pipeline_common.batch_retry import (
+    BATCH_RETRY_MAX_ROUNDS,
+    MISSING_RESULT,
+    result_error,
+    write_failure_report,
+)
+from pipeline_common.batch_coalesce import (
+    encode_custom_id,
+    group_results_by_restaurant,
+    pack_requests,
+    parse_custom_id,
+    read_plan,
+    write_plan,
+)
+from pipeline_common.near_duplicates import restore_extraction_reviews, select_extraction_reviews
+from pipeline_common.stage_checkpoint import StageCheckpoint
+from pipeline_common.review_packing import (
+    packing_report,
+    parse_pack_custom_id,
+    parse_packed_content,
+    single_request_line,
+)
+from concurrent.futures import ThreadPoolExecutor
+from pipeline_common.aws_clients import get_client
 
 # 환경 변수
 S3_BUCKET_NAME = os.getenv("S3_BUCKET_NAME")
 REVIEW_BUCKET_DIRECTORY = os.getenv("REVIEW_BUCKET_DIRECTORY")
 CATEGORY_BUCKET_DIRECTORY = os.getenv("CATEGORY_BUCKET_DIRECTORY")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# 묶음 배치 결과를 식당별로 저장할 때 동시에 처리할 스레드 수
+COALESCE_READ_WORKERS = int(os.getenv("COALESCE_READ_WORKERS", "16"))
 
-# S3 클라이언트 초기화
-s3_client = boto3.client("s3")
-
-# 로거 설정
+# 로거 설정 (stdout 핸들러는 첫 호출 때 연결)
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
-handler = logging.StreamHandler(sys.stdout)
-handler.setLevel(logging.INFO)
-formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
-handler.setFormatter(formatter)
-logger.addHandler(handler)
+_logging_configured = False
+
+
+def configure_logging():
+    """stdout 로그 핸들러를 실행 환경당 한 번만 연결합니다."""
+    global _logging_configured
+    if _logging_configured:
+        return
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setLevel(logging.INFO)
+    stream_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+    logger.addHandler(stream_handler)
+    _logging_configured = True
 
 
 def handler(event, context):
+    configure_logging()
+    if "plan_key" in event.get("body", {}):
+        return handle_coalesced(event)
     logger.info(event)
     print(event["body"])
     S3_KEY = event["S3_KEY"]
@@ -39,83 +77,411 @@ def handler(event, context):
 
         # Step Function에서 전달받은 데이터
         extraction_batch_id = event["body"]["extraction_batch_id"]
-        reviews = get_reviews_from_s3(REVIEW_BUCKET_DIRECTORY, S3_KEY)
+        # 재시도면 끝난 단계를 건너뛰고, 임베딩 배치까지 만들었으면 그 배치 ID를 그대로 반환
+        # 추출 배치가 없던 식당은 식당 키로 체크포인트를 구분
+        checkpoint_id = extraction_batch_id or f"no-requests-{S3_KEY}"
+        checkpoint = StageCheckpoint(get_client("s3"), S3_BUCKET_NAME, "create-embedding-batch", checkpoint_id)
+        if checkpoint.done("embedding_batch_created"):
+            logger.info(f"이미 임베딩 배치를 만들었습니다: {checkpoint.get('embedding_batch_created')}")
+            return {"statusCode": 200, "body": checkpoint.get("embedding_batch_created")}
+        if checkpoint.done("categories_saved"):
+            # 카테고리 파일까지 저장한 뒤 실패했으면 저장된 파일로 임베딩 배치만 만듦
+            category_s3_key = checkpoint.get("categories_saved")["category_s3_key"]
+            reviews_with_categories = get_reviews_from_s3(CATEGORY_BUCKET_DIRECTORY, S3_KEY, category_s3_key)
+            logger.info(f"저장된 카테고리 데이터를 사용합니다: {category_s3_key}")
+        else:
+            with span("s3_read") as metric:
+                reviews = get_reviews_from_s3(REVIEW_BUCKET_DIRECTORY, S3_KEY, event["body"].get("review_key"))
+                metric.add_rows(len(reviews))
+
+            logger.info(f"배치 ID: {extraction_batch_id}")
+            logger.info(f"리뷰 개수: {len(reviews)}")
+
+            if extraction_batch_id is None:
+                # 추출 요청이 없던 식당 (리뷰가 모두 정리 단계에서 빠짐): 배치 조회 없이 빈 카테고리로 저장
+                extraction_results = []
+            else:
+                # 1. 배치 상태 확인
+                logger.info("배치 상태 확인 중...")
+
+                batch = retrieve_batch(extraction_batch_id)
+
+                if batch["status"] in PENDING_STATUSES:
+                    # 완료되지 않았으면 즉시 에러 반환
+                    logger.info(
+                        f"배치가 아직 완료되지 않았습니다. 현재 상태: {batch['status']}"
+                    )
+                    return {
+                        "statusCode": 202,
+                        "body": {
+                            "error": "Batch not completed",
+                            "batch_id": extraction_batch_id,
+                            "status": batch["status"],
+                            # 진행률로 계산한 대기 시간 (Wait 상태의 SecondsPath)
+                            "next_poll_seconds": next_poll_seconds(batch),
+                        },
+                    }
+                elif batch["status"] != "completed":
+                    raise Exception(f"Batch failed: {batch}")
+                logger.info("카테고리 추출 배치가 완료되었습니다!")
+
+                # 2. 배치 결과 가져오기 (재시도면 체크포인트에 저장한 결과)
+                logger.info("배치 결과 가져오기...")
+                extraction_results = fetch_extraction_results(checkpoint, [batch])
+                logger.info(f"추출 결과 {len(extraction_results)}개를 받았습니다")
+
+            # 3. 추출된 카테고리를 리뷰에 매핑
+            logger.info("카테고리를 리뷰에 매핑 중...")
+            with span("map_results") as metric:
+                selection = event["body"].get("selection")
+                reviews_with_categories, fallback = map_categories_to_reviews(reviews, extraction_results, selection)
+                metric.add_rows(len(reviews_with_categories))
+                metric.set_metric("FallbackReviews", len(fallback), "Count")
+            if fallback:
+                # 결과가 없거나 실패한 리뷰는 하나씩 다시 추출한 결과를 더해 다시 매핑
+                fallback_results, not_ready = run_fallback(extraction_batch_id, {S3_KEY: fallback})
+                if not_ready:
+                    return not_ready
+                reviews_with_categories, _ = map_categories_to_reviews(
+                    reviews, extraction_results + fallback_results, selection
+                )
+            logger.info("카테고리 매핑이 완료되었습니다")
+
+            # 4. 카테고리가 추가된 리뷰를 S3에 저장
+            logger.info("카테고리 데이터를 S3에 저장 중...")
+            category_s3_key = save_categories_to_s3(
+                CATEGORY_BUCKET_DIRECTORY, reviews_with_categories, S3_KEY
+            )
+            checkpoint.complete("categories_saved", {"category_s3_key": category_s3_key})
+            logger.info(f"카테고리 데이터가 S3에 저장되었습니다: {category_s3_key}")
 
-        logger.info(f"배치 ID: {extraction_batch_id}")
-        logger.info(f"리뷰 개수: {len(reviews)}")
+        # 5. 임베딩 배치 생성
+        logger.info("임베딩 배치 작업 생성 중...")
+        with span("create_batch") as metric:
+            embedding_batch_id = create_embedding_batch(reviews_with_categories, S3_KEY)
+            metric.add_rows(len(reviews_with_categories))
+            metric.set_property("batchId", embedding_batch_id)
+        if embedding_batch_id is None:
+            # 다음 단계는 embedding_batch_id가 None이면 배치 조회 없이 빈 임베딩으로 저장
+            logger.info("임베딩할 키워드가 없어 배치를 만들지 않습니다")
+        else:
+            logger.info(f"임베딩 배치 작업이 생성되었습니다. 배치 ID: {embedding_batch_id}")
+        body = {
+            "s3_key": S3_KEY,
+            "embedding_batch_id": embedding_batch_id,
+            "processed_count": len(reviews_with_categories),
+        }
+        checkpoint.complete("embedding_batch_created", body)
 
-        # 1. 배치 상태 확인
-        logger.info("배치 상태 확인 중...")
+        # Step Function으로 전달할 데이터
+        return {"statusCode": 200, "body": body}
 
-        # urllib로 배치 상태 확인
-        req = urllib.request.Request(
-            f"https://api.openai.com/v1/batches/{extraction_batch_id}",
-            headers={"Authorization": f"Bearer {OPENAI_API_KEY}"},
-        )
+    except Exception as e:
+        logger.error("처리 중 오류가 발생했습니다")
+        logger.error(f"오류 내용: {str(e)}")
+        raise Exception(f"Failed to create embedding batch: {str(e)}")
 
-        try:
-            with urllib.request.urlopen(req) as response:
-                batch = json.loads(response.read().decode())
-        except urllib.error.HTTPError as e:
-            raise Exception(f"Batch retrieve failed: {e.read().decode()}")
-
-        if batch["status"] == "in_progress" or batch["status"] == "validating":
-            # 완료되지 않았으면 즉시 에러 반환
-            logger.info(
-                f"배치가 아직 완료되지 않았습니다. 현재 상태: {batch['status']}"
-            )
-            return {
-                "statusCode": 202,
-                "body": {
-                    "error": "Batch not completed",
-                    "batch_id": extraction_batch_id,
-                    "status": batch["status"],
-                },
-            }
-        elif batch["status"] != "completed":
-            raise Exception(f"Batch failed: {batch}")
-        logger.info("카테고리 추출 배치가 완료되었습니다!")
-
-        # 2. 배치 결과 가져오기
-        logger.info("배치 결과 가져오기...")
-        extraction_results = get_batch_results(batch["output_file_id"])
-        logger.info(f"추출 결과 {len(extraction_results)}개를 받았습니다")
-
-        # 3. 추출된 카테고리를 리뷰에 매핑
-        logger.info("카테고리를 리뷰에 매핑 중...")
-        reviews_with_categories = map_categories_to_reviews(reviews, extraction_results)
-        logger.info("카테고리 매핑이 완료되었습니다")
-
-        # 4. 카테고리가 추가된 리뷰를 S3에 저장
-        logger.info("카테고리 데이터를 S3에 저장 중...")
-        category_s3_key = save_categories_to_s3(
-            CATEGORY_BUCKET_DIRECTORY, reviews_with_categories, S3_KEY
+
+def handle_coalesced(event):
+    """
+    묶음 추출 배치 결과를 식당별로 나눠 카테고리를 저장하고, 임베딩 요청도 다시 묶어 배치로 만듭니다.
+    Input: {"body": {"plan_key": "batch-plan/extraction-....json", "extraction_batch_ids": [...]}}
+    Output body: {"plan_key": "batch-plan/embedding-....json", "embedding_batch_ids": [...], "processed_count": n}
+    끝난 단계는 plan 이름 기준 체크포인트에 남겨 재시도하면 건너뜁니다.
+    """
+    try:
+        logger.info("=== 묶음 카테고리 배치 확인 및 처리 시작 ===")
+        plan_name = os.path.splitext(os.path.basename(event["body"]["plan_key"]))[0]
+        checkpoint = StageCheckpoint(get_client("s3"), S3_BUCKET_NAME, "create-embedding-batch", plan_name)
+        if checkpoint.done("embedding_batches_created"):
+            logger.info(f"이미 임베딩 배치를 모두 만들었습니다: {checkpoint.get('embedding_batches_created')}")
+            return {"statusCode": 200, "body": checkpoint.get("embedding_batches_created")}
+        plan = read_plan(get_client("s3"), S3_BUCKET_NAME, event["body"]["plan_key"])
+        restaurant_keys = [key for entry in plan["batches"] for key in entry["keys"]]
+        workers = max(1, min(COALESCE_READ_WORKERS, len(restaurant_keys)))
+
+        if checkpoint.done("categories_saved"):
+            # 카테고리 파일까지 저장한 뒤 실패했으면 저장된 파일로 임베딩 배치만 만듦
+            def load(restaurant_key):
+                return restaurant_key, get_reviews_from_s3(CATEGORY_BUCKET_DIRECTORY, restaurant_key)
+
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                reviews_by_key = list(executor.map(load, restaurant_keys))
+            logger.info(f"저장된 식당 {len(reviews_by_key)}곳의 카테고리 데이터를 사용합니다")
+        else:
+            # 1. 모든 배치가 끝났는지 확인 (하나라도 진행 중이면 가장 이른 다음 조회 시간으로 202)
+            # batch_id가 None인 항목은 추출 요청이 없던 식당 (리뷰가 모두 정리 단계에서 빠짐)
+            batches = [
+                retrieve_batch(entry["batch_id"]) for entry in plan["batches"] if entry["batch_id"]
+            ]
+            not_ready = pending_response(batches)
+            if not_ready:
+                return not_ready
+
+            # 2. 결과를 식당별로 나눔 (재시도면 체크포인트에 저장한 결과)
+            results_by_key = group_results_by_restaurant(fetch_extraction_results(checkpoint, batches))
+            logger.info(f"식당 {len(restaurant_keys)}곳의 추출 결과를 나눴습니다")
+
+            # 3. 식당별로 카테고리를 매핑하고, 결과가 없거나 실패한 리뷰는 하나씩 다시 추출
+            # create-category-batch가 plan에 남긴 근접 중복 묶음 (이전 plan이면 없음 -> 다시 계산)
+            selections = plan.get("selections", {})
+            # create-category-batch가 실제로 읽은 리뷰 파일 키 (이전 plan이면 없음 -> 새 형식부터 GET)
+            review_keys = plan.get("review_keys", {})
+
+            def map_results(restaurant_key):
+                reviews = get_reviews_from_s3(REVIEW_BUCKET_DIRECTORY, restaurant_key, review_keys.get(restaurant_key))
+                reviews, fallback = map_categories_to_reviews(
+                    reviews, results_by_key.get(restaurant_key, []), selections.get(restaurant_key)
+                )
+                return restaurant_key, reviews, fallback
+
+            with span("map_results") as metric:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    mapped = list(executor.map(map_results, restaurant_keys))
+                fallback_by_key = {key: fallback for key, _, fallback in mapped if fallback}
+                metric.add_rows(sum(len(reviews) for _, reviews, _ in mapped))
+                metric.set_metric("FallbackReviews", sum(len(fallback) for fallback in fallback_by_key.values()), "Count")
+            if fallback_by_key:
+                fallback_results, not_ready = run_fallback(plan_name, fallback_by_key)
+                if not_ready:
+                    return not_ready
+                fallback_results_by_key = group_results_by_restaurant(fallback_results)
+                for key, reviews, fallback in mapped:
+                    if fallback:
+                        map_categories_to_reviews(
+                            reviews,
+                            results_by_key.get(key, []) + fallback_results_by_key.get(key, []),
+                            selections.get(key),
+                        )
+            reviews_by_key = [(key, reviews) for key, reviews, _ in mapped]
+
+            def save(item):
+                restaurant_key, reviews = item
+                return save_categories_to_s3(CATEGORY_BUCKET_DIRECTORY, reviews, restaurant_key)
+
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(save, reviews_by_key))
+            checkpoint.complete("categories_saved", {"restaurant_count": len(reviews_by_key)})
+        processed_count = sum(len(reviews) for _, reviews in reviews_by_key)
+
+        # 4. 임베딩 요청을 다시 묶어 배치 생성
+        # 재시도면 체크포인트에 남은 배치는 건너뜀 (같은 카테고리 파일이라 묶음 순서가 같음)
+        packed = pack_requests(
+            [(key, embedding_request_lines(reviews, key)) for key, reviews in reviews_by_key]
         )
-        logger.info(f"카테고리 데이터가 S3에 저장되었습니다: {category_s3_key}")
+        embedding_batches = list(checkpoint.get("embedding_batches", []))
+        for batch in packed[len(embedding_batches) :]:
+            with span("create_batch") as metric:
+                batch_id = submit_batch(b"".join(batch["lines"]))
+                metric.add_rows(len(batch["lines"]))
+                metric.set_property("batchId", batch_id)
+            logger.info(f"임베딩 배치 {batch_id}: 식당 {len(batch['keys'])}곳, 요청 {len(batch['lines'])}개")
+            embedding_batches.append({"batch_id": batch_id, "keys": batch["keys"]})
+            checkpoint.complete("embedding_batches", list(embedding_batches))
+        # 임베딩할 키워드가 하나도 없는 식당도 다음 단계에서 빈 임베딩으로 저장되도록 plan에 남김
+        packed_keys = {key for batch in embedding_batches for key in batch["keys"]}
+        leftover_keys = [key for key, _ in reviews_by_key if key not in packed_keys]
+        if leftover_keys:
+            embedding_batches.append({"batch_id": None, "keys": leftover_keys})
+
+        plan_key = write_plan(get_client("s3"), S3_BUCKET_NAME, "embedding", embedding_batches)
+        body = {
+            "plan_key": plan_key,
+            "embedding_batch_ids": [batch["batch_id"] for batch in embedding_batches if batch["batch_id"]],
+            "processed_count": processed_count,
+            "restaurant_count": len(reviews_by_key),
+        }
+        checkpoint.complete("embedding_batches_created", body)
+        return {"statusCode": 200, "body": body}
+    except Exception as e:
+        logger.error("처리 중 오류가 발생했습니다")
+        logger.error(f"오류 내용: {str(e)}")
+        raise Exception(f"Failed to create coalesced embedding batch: {str(e)}")
 
-        # 5. 임베딩 배치 생성
-        logger.info("임베딩 배치 작업 생성 중...")
-        embedding_batch_id = create_embedding_batch(reviews_with_categories)
-        logger.info(f"임베딩 배치 작업이 생성되었습니다. 배치 ID: {embedding_batch_id}")
 
-        # Step Function으로 전달할 데이터
+def retrieve_batch(batch_id: str) -> Dict[str, Any]:
+    """배치 상태 조회"""
+    import urllib.request
+    import urllib.error
+
+    # urllib로 배치 상태 확인
+    req = urllib.request.Request(
+        f"https://api.openai.com/v1/batches/{batch_id}",
+        headers={"Authorization": f"Bearer {OPENAI_API_KEY}"},
+    )
+
+    try:
+        with span("openai_batch_status") as metric, urllib.request.urlopen(req) as response:
+            batch = json.loads(response.read().decode())
+            metric.set_property("batchStatus", batch["status"])
+            return batch
+    except urllib.error.HTTPError as e:
+        raise Exception(f"Batch retrieve failed: {e.read().decode()}")
+
+
+def pending_response(batches: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """진행 중인 배치가 있으면 가장 이른 다음 조회 시간을 담은 202 응답을, 실패한 배치가 있으면 예외를 냅니다."""
+    pending = [batch for batch in batches if batch["status"] in PENDING_STATUSES]
+    if pending:
+        logger.info(f"배치 {len(pending)}/{len(batches)}개가 아직 완료되지 않았습니다")
         return {
-            "statusCode": 200,
+            "statusCode": 202,
             "body": {
-                "s3_key": S3_KEY,
-                "embedding_batch_id": embedding_batch_id,
-                "processed_count": len(reviews_with_categories),
+                "error": "Batch not completed",
+                "batch_id": pending[0]["id"],
+                "status": pending[0]["status"],
+                "pending_count": len(pending),
+                "next_poll_seconds": min(next_poll_seconds(batch) for batch in pending),
             },
         }
+    failed = [batch for batch in batches if batch["status"] != "completed"]
+    if failed:
+        raise Exception(f"Batch failed: {failed[0]}")
+    return None
+
+
+def fetch_extraction_results(checkpoint: StageCheckpoint, batches: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    완료된 추출 배치들의 결과 줄을 모아 반환합니다.
+    처음 받을 때 체크포인트 산출물(.jsonl.gz)로 저장해 두고, 재시도에서는 OpenAI 대신 그 파일을 읽습니다.
+    """
+    s3 = get_client("s3")
+    if checkpoint.done("results_fetched"):
+        return read_artifact(s3, S3_BUCKET_NAME, checkpoint.get("results_fetched")["results_key"])
+
+    results = []
+    for batch in batches:
+        batch_results = get_batch_results(batch["output_file_id"])
+        report_packing(batch["id"], batch_results)
+        results.extend(batch_results)
+    results_key = checkpoint.artifact_key(f"extraction_results{JSONL_GZIP_EXTENSION}")
+    write_artifact(s3, S3_BUCKET_NAME, results_key, results)
+    checkpoint.complete("results_fetched", {"results_key": results_key, "result_count": len(results)})
+    return results
+
+
+def report_packing(batch_id: str, extraction_results: List[Dict[str, Any]]) -> Dict[str, int]:
+    """추출 배치 하나의 요청/토큰 사용량과 리뷰를 묶어 아낀 요청/프롬프트 토큰을 EMF 한 줄로 남깁니다."""
+    report = packing_report(extraction_results)
+    emit("extraction_packing", report, {"batchId": batch_id})
+    if report["PackedRequests"]:
+        logger.info(
+            f"배치 {batch_id}: 리뷰 {report['Reviews']}개를 요청 {report['Requests']}개로 보냄 "
+            f"(요청 {report['SavedRequests']}개, 프롬프트 토큰 약 {report['EstimatedSavedPromptTokens']:,}개 절약)"
+        )
+    return report
+
+
+def run_fallback(source_name: str, fallback_by_key: Dict[str, Any]):
+    """
+    결과가 없거나 실패한 리뷰(묶음 응답 오류 포함)를 리뷰 하나씩 요청하는 후속 추출 배치로 다시 보냅니다.
+    fallback_by_key: {식당 키: [(리뷰 위치, 본문을 정리한 리뷰), ...]}
+    후속 배치 ID는 S3 기록(source_name 기준)에 회차별로 남겨 202로 다시 호출되었을 때 같은 배치를 이어서 확인합니다.
+    회차가 끝나도 실패한 리뷰는 BATCH_RETRY_MAX_ROUNDS회차까지 다시 보내고, 그래도 실패하면 빈 카테고리로 진행하며
+    실패 보고({CATEGORY_BUCKET_DIRECTORY}/failures/{source_name}.json)를 남깁니다.
+    반환: (후속 배치의 성공 결과 목록, 진행 중이면 202 응답 아니면 None)
+    """
+    s3 = get_client("s3")
+    record_key = f"{CATEGORY_BUCKET_DIRECTORY}/fallback/{source_name}.json"
+    try:
+        _, records = read_artifact_with_fallback(s3, S3_BUCKET_NAME, record_key, extensions=("",))
+        record = records[0]
+    except FileNotFoundError:
+        record = {}
+    # 회차 구분 전 기록({"batch_id", "review_count"})은 1회차로 읽음
+    rounds = record.get("rounds", [record] if "batch_id" in record else [])
+
+    results = []
+    recovered = set()
+    errors = {}
+    checked = 0
+    while True:
+        for fallback_round in rounds[checked:]:
+            batch = retrieve_batch(fallback_round["batch_id"])
+            if batch["status"] in PENDING_STATUSES:
+                return [], pending_response([batch])
+            if batch["status"] != "completed":
+                logger.warning(f"후속 추출 배치 {fallback_round['batch_id']}가 실패했습니다: {batch['status']}")
+                continue
+            for result in get_batch_results(batch["output_file_id"]):
+                key, review_id, _ = parse_custom_id(result["custom_id"])
+                _, error = read_extraction_result(result)
+                if error:
+                    errors[(key, review_id)] = error
+                else:
+                    recovered.add((key, review_id))
+                    results.append(result)
+        checked = len(rounds)
+
+        remaining = {}
+        for key, fallback in fallback_by_key.items():
+            left = [(index, review) for index, review in fallback if (key, str(review["id"])) not in recovered]
+            if left:
+                remaining[key] = left
+        if not remaining or len(rounds) >= BATCH_RETRY_MAX_ROUNDS:
+            break
+
+        lines = [
+            single_request_line(key, index, review)
+            for key, fallback in remaining.items()
+            for index, review in fallback
+        ]
+        with span("create_batch") as metric:
+            batch_id = submit_batch(b"".join(lines), "/v1/chat/completions")
+            metric.add_rows(len(lines))
+            metric.set_property("batchId", batch_id)
+        rounds.append({"batch_id": batch_id, "review_count": len(lines)})
+        write_artifact(s3, S3_BUCKET_NAME, record_key, [{"rounds": rounds}])
+        logger.info(f"결과가 없거나 실패한 리뷰 {len(lines)}개를 하나씩 다시 추출합니다 ({len(rounds)}회차). 배치 ID: {batch_id}")
+
+    failures = [
+        {
+            "custom_id": encode_custom_id(key, review["id"], index=index),
+            "error": errors.get((key, str(review["id"])), MISSING_RESULT),
+        }
+        for key, fallback in remaining.items()
+        for index, review in fallback
+    ]
+    emit(
+        "batch_retry",
+        {
+            "FailedItems": sum(len(fallback) for fallback in fallback_by_key.values()),
+            "RetryRounds": len(rounds),
+            "RecoveredItems": len(recovered),
+            "UnrecoveredItems": len(failures),
+        },
+        {"stage": "category_extraction", "source": source_name},
+    )
+    if failures:
+        report_key = write_failure_report(
+            s3, S3_BUCKET_NAME, f"{CATEGORY_BUCKET_DIRECTORY}/failures/{source_name}.json",
+            "category_extraction", source_name, failures,
+        )
+        logger.warning(
+            f"리뷰 {len(failures)}개는 {len(rounds)}회 다시 보내도 실패해 빈 카테고리로 저장합니다: "
+            f"s3://{S3_BUCKET_NAME}/{report_key}"
+        )
+    return results, None
 
-    except Exception as e:
-        logger.error("처리 중 오류가 발생했습니다")
-        logger.error(f"오류 내용: {str(e)}")
-        raise Exception(f"Failed to create embedding batch: {str(e)}")
+
+def read_extraction_result(result: Dict[str, Any]):
+    """리뷰 하나짜리 추출 결과를 (카테고리 dict, 오류 설명)으로 읽습니다. 둘 중 하나는 None입니다."""
+    error = result_error(result)
+    if error:
+        return None, error
+    try:
+        content = json.loads(result["response"]["body"]["choices"][0]["message"]["content"])
+    except (ValueError, KeyError, IndexError, TypeError) as e:
+        return None, f"unreadable content: {str(e)}"
+    if not isinstance(content, dict):
+        return None, "unreadable content: not an object"
+    return content, None
 
 
 def get_batch_results(output_file_id: str) -> List[Dict[str, Any]]:
     """배치 결과 파일 가져오기"""
+    import urllib.request
+
     try:
         # urllib로 파일 내용 가져오기
         req = urllib.request.Request(
@@ -123,14 +489,17 @@ def get_batch_results(output_file_id: str) -> List[Dict[str, Any]]:
             headers={"Authorization": f"Bearer {OPENAI_API_KEY}"},
         )
 
-        with urllib.request.urlopen(req) as response:
-            file_content = response.read().decode()
+        with span("openai_results_download") as metric:
+            with urllib.request.urlopen(req) as response:
+                file_content = response.read().decode()
+            metric.add_bytes(len(file_content))
 
-        # JSONL 파싱
-        results = []
-        for line in file_content.split("\n"):
-            if line.strip():
-                results.append(json.loads(line))
+            # JSONL 파싱
+            results = []
+            for line in file_content.split("\n"):
+                if line.strip():
+                    results.append(json.loads(line))
+            metric.add_rows(len(results))
 
         return results
     except Exception as e:
@@ -138,22 +507,56 @@ def get_batch_results(output_file_id: str) -> List[Dict[str, Any]]:
 
 
 def map_categories_to_reviews(
-    reviews: List[Dict[str, Any]], extraction_results: List[Dict[str, Any]]
-) -> List[Dict[str, Any]]:
-    """추출된 카테고리를 리뷰에 매핑"""
+    reviews: List[Dict[str, Any]],
+    extraction_results: List[Dict[str, Any]],
+    selection: Dict[str, Any] = None,
+) -> Tuple[List[Dict[str, Any]], List[Tuple[int, Dict[str, Any]]]]:
+    """
+    추출된 카테고리를 리뷰에 매핑
+    리뷰 여러 개를 묶은 요청은 응답 배열을 검증합니다. 요청했지만 결과가 없거나(배치 오류 파일로 빠짐)
+    200이 아니거나 응답을 읽지 못한 리뷰는 빈 카테고리로 두고 리뷰 하나씩 다시 추출할 목록으로 돌려줍니다.
+    반환: (리뷰 목록, [(리뷰 위치, 본문을 정리한 리뷰), ...])
+    정리 단계에서 요청하지 않은 리뷰는 빈 카테고리가 되고, 근접 중복 리뷰는 묶음 대표의 카테고리를 복사합니다.
+    selection은 create-category-batch가 남긴 근접 중복 묶음이며, 없거나 리뷰와 맞지 않으면 다시 계산합니다.
+    """
+    # 묶음 요청의 위치는 create-category-batch가 보낸 리뷰 목록(정리 + 근접 중복 제거) 기준
+    restored = restore_extraction_reviews(reviews, selection)
+    if restored:
+        extraction_reviews, duplicates = restored
+    else:
+        extraction_reviews, duplicates, _ = select_extraction_reviews(reviews)
     # 결과를 ID로 인덱싱
     results_by_id = {}
     for result in extraction_results:
-        review_id = result["custom_id"].split("_")[0]
-        if result["response"]["status_code"] == 200:
-            content = json.loads(
-                result["response"]["body"]["choices"][0]["message"]["content"]
-            )
+        response = result.get("response") or {}
+        pack = parse_pack_custom_id(result["custom_id"])
+        if pack:
+            start, count = pack
+            packed = extraction_reviews[start : start + count]
+            if response.get("status_code") != 200:
+                continue
+            try:
+                content = response["body"]["choices"][0]["message"]["content"]
+                results_by_id.update(parse_packed_content(content, [review["id"] for _, review in packed]))
+            except (ValueError, KeyError, IndexError, TypeError) as e:
+                logger.warning(f"묶음 응답을 읽지 못했습니다 ({result['custom_id']}): {str(e)}")
+            continue
+        _, review_id, _ = parse_custom_id(result["custom_id"])
+        content, error = read_extraction_result(result)
+        if error:
+            logger.warning(f"추출 결과를 읽지 못했습니다 ({result['custom_id']}): {error}")
+        else:
             results_by_id[review_id] = content
 
+    # 근접 중복 리뷰는 대표 리뷰의 결과를 그대로 사용
+    for representative_id, member_indexes in duplicates.items():
+        if representative_id in results_by_id:
+            for index in member_indexes:
+                results_by_id.setdefault(str(reviews[index]["id"]), dict(results_by_id[representative_id]))
+
     # 리뷰에 카테고리 추가
     for review in reviews:
-        review_id = review["id"]
+        review_id = str(review["id"])
         if review_id in results_by_id:
             review["categories"] = results_by_id[review_id]
         else:
@@ -164,17 +567,18 @@ def map_categories_to_reviews(
                 "food": "",
             }
 
-    return reviews
+    fallback = [(index, review) for index, review in extraction_reviews if str(review["id"]) not in results_by_id]
+    return reviews, fallback
 
 
-def get_reviews_from_s3(BUCKET_DIRECTORY: str, S3_KEY: str) -> List[Dict[str, Any]]:
-    """S3에서 리뷰 데이터를 가져오는 함수"""
+def get_reviews_from_s3(BUCKET_DIRECTORY: str, S3_KEY: str, known_key: Optional[str] = None) -> List[Dict[str, Any]]:
+    """S3에서 리뷰 데이터를 가져오는 함수 (known_key는 이전 단계가 실제로 읽거나 저장한 키)"""
     try:
-        key = f"{BUCKET_DIRECTORY}/{S3_KEY}.json"
+        # 기록된 키가 있으면 그 키를, 없으면 .jsonl.gz를 먼저 GET하고 없을 때만 기존 .json 배열을 읽음
+        key, reviews = read_artifact_with_fallback(
+            get_client("s3"), S3_BUCKET_NAME, f"{BUCKET_DIRECTORY}/{S3_KEY}", known_key
+        )
         logger.info(f"key: {key}")
-        response = s3_client.get_object(Bucket=S3_BUCKET_NAME, Key=key)
-        content = response["Body"].read().decode("utf-8")
-        reviews = json.loads(content)
         return reviews
     except Exception as e:
         raise Exception(f"Failed to get reviews from S3: {str(e)}")
@@ -188,55 +592,61 @@ def save_categories_to_s3(
         # 타임스탬프 생성
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
 
-        # S3 키 생성
-        category_key = f"{BUCKET_DIRECTORY}/{S3_KEY}.json"
+        # S3 키 생성 (gzip JSON Lines)
+        category_key = f"{BUCKET_DIRECTORY}/{S3_KEY}{JSONL_GZIP_EXTENSION}"
 
-        # JSON으로 변환
-        content = json.dumps(reviews, ensure_ascii=False, indent=2)
+        # 리뷰 한 건을 한 줄로 압축 저장
+        with span("s3_write", s3Key=category_key) as metric:
+            size = write_artifact(get_client("s3"), S3_BUCKET_NAME, category_key, reviews)
+            metric.add_bytes(size)
+            metric.add_rows(len(reviews))
 
-        # S3에 업로드
-        s3_client.put_object(
-            Bucket=S3_BUCKET_NAME,
-            Key=category_key,
-            Body=content.encode("utf-8"),
-            ContentType="application/json",
+        logger.info(
+            f"카테고리 데이터 저장 완료: s3://{S3_BUCKET_NAME}/{category_key} ({size:,} bytes)"
         )
 
-        logger.info(f"카테고리 데이터 저장 완료: s3://{S3_BUCKET_NAME}/{category_key}")
-
         return category_key
 
     except Exception as e:
         raise Exception(f"Failed to save categories to S3: {str(e)}")
 
 
-def create_embedding_batch(reviews: List[Dict[str, Any]]) -> str:
-    """임베딩을 위한 배치 작업 생성"""
-    batch_input_file_path = "/tmp/embedding_batch_input.jsonl"
-
-    # JSONL 파일 생성
-    with open(batch_input_file_path, "w", encoding="utf-8") as f:
-        for review in reviews:
-            categories = review.get("categories", {})
-            # 각 카테고리별로 임베딩 요청 생성
-            for category, keyword in categories.items():
-                if keyword:  # 빈 문자열이 아닌 경우만
-                    request = {
-                        "custom_id": f"{review['id']}_{category}_{uuid.uuid4()}",
-                        "method": "POST",
-                        "url": "/v1/embeddings",
-                        "body": {
-                            "model": "text-embedding-3-small",
-                            "input": keyword,
-                            "dimensions": 768,
-                        },
-                    }
-                    f.write(json.dumps(request, ensure_ascii=False) + "\n")
+def embedding_request_lines(reviews: List[Dict[str, Any]], restaurant_key: str) -> List[bytes]:
+    """리뷰의 카테고리 키워드마다 임베딩 요청 한 줄(JSONL)을 만듭니다. 빈 키워드는 건너뜁니다."""
+    lines = []
+    for index, review in enumerate(reviews):
+        categories = review.get("categories", {})
+        # 각 카테고리별로 임베딩 요청 생성
+        for category, keyword in categories.items():
+            if keyword:  # 빈 문자열이 아닌 경우만
+                request = {
+                    "custom_id": encode_custom_id(restaurant_key, review["id"], category, index),
+                    "method": "POST",
+                    "url": "/v1/embeddings",
+                    "body": {
+                        "model": "text-embedding-3-small",
+                        "input": keyword,
+                        "dimensions": 768,
+                    },
+                }
+                lines.append((json.dumps(request, ensure_ascii=False) + "\n").encode("utf-8"))
+    return lines
+
+
+def create_embedding_batch(reviews: List[Dict[str, Any]], restaurant_key: str) -> Optional[str]:
+    """임베딩을 위한 배치 작업 생성 (임베딩할 키워드가 없으면 빈 배치를 만들지 않고 None)"""
+    lines = embedding_request_lines(reviews, restaurant_key)
+    if not lines:
+        return None
+    return submit_batch(b"".join(lines))
+
+
+def submit_batch(file_content: bytes, endpoint: str = "/v1/embeddings") -> str:
+    """JSONL 요청 파일을 업로드하고 배치 작업(기본은 임베딩)을 만들어 배치 ID를 반환합니다."""
+    import urllib.request
+    import urllib.error
 
     # 파일 업로드 - urllib 사용
-    with open(batch_input_file_path, "rb") as f:
-        file_content = f.read()
-
     # multipart/form-data 경계 문자열
     boundary = "----WebKitFormBoundary7MA4YWxkTrZu0gW"
 
@@ -268,9 +678,11 @@ def create_embedding_batch(reviews: List[Dict[str, Any]]) -> str:
     )
 
     try:
-        with urllib.request.urlopen(req) as response:
-            result = json.loads(response.read().decode())
-            file_id = result["id"]
+        with span("openai_file_upload") as metric:
+            metric.add_bytes(len(body_data))
+            with urllib.request.urlopen(req) as response:
+                result = json.loads(response.read().decode())
+                file_id = result["id"]
     except urllib.error.HTTPError as e:
         raise Exception(f"File upload failed: {e.read().decode()}")
 
@@ -278,7 +690,7 @@ def create_embedding_batch(reviews: List[Dict[str, Any]]) -> str:
     batch_data = json.dumps(
         {
             "input_file_id": file_id,
-            "endpoint": "/v1/embeddings",
+            "endpoint": endpoint,
             "completion_window": "24h",
         }
     ).encode("utf-8")
@@ -293,7 +705,7 @@ def create_embedding_batch(reviews: List[Dict[str, Any]]) -> str:
     )
 
     try:
-        with urllib.request.urlopen(batch_req) as response:
+        with span("openai_batch_create"), urllib.request.urlopen(batch_req) as response:
             result = json.loads(response.read().decode())
             return result["id"]
     except urllib.error.HTTPError as e:
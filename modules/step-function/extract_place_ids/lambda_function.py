@@ -1,39 +1,108 @@
 import json
-import boto3
 import os
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import unquote_plus
+from pipeline_common.s3_reader import read_object
+from pipeline_common.metrics import emit, span
+from pipeline_common.aws_clients import get_client
+from pipeline_common.place_manifest import (
+    extract_place_ids,
+    manifest_key,
+    manifest_name,
+    merge_place_ids,
+    output_mode,
+    write_place_manifest,
+)
 
-s3_client = boto3.client("s3")
+# 여러 검색어 파일을 동시에 읽을 최대 스레드 수
+EXTRACT_MAX_WORKERS = int(os.environ.get("EXTRACT_MAX_WORKERS", "8"))
+
+
+def read_place_ids(s3_bucket_name, restaurant_bucket_directory, query):
+    """검색어 하나의 식당 파일을 읽어 placeId 객체 목록을 반환합니다."""
+    # 파일 키 생성 (query 기반) - URL encoding 적용
+    file_key = f"{restaurant_bucket_directory}/{unquote_plus(query)}.json"
+
+    with span("s3_read", s3Key=file_key) as metric:
+        body = read_object(get_client("s3"), s3_bucket_name, file_key)
+        metric.add_bytes(len(body))
+    with span("json_parse") as metric:
+        restaurants_data = json.loads(body.decode("utf-8"))
+        metric.add_rows(len(restaurants_data))
+
+    if not isinstance(restaurants_data, list):
+        return []
+    return extract_place_ids(restaurants_data)
 
 
 def handler(event, context):
     """
     S3에서 식당 데이터를 읽어와서 place_id 리스트를 추출
-    Input: {"query": "강남역 맛집"}
-    Output: {"placeIds": [{"placeId": "123"}, {"placeId": "124"}, ...]}
+    Input: {"SEARCH_QUERY": "강남역 맛집", "OUTPUT_MODE": "inline" | "manifest"}
+           또는 {"SEARCH_QUERIES": ["강남역 식당", "역삼역 식당"], ...}
+    Output (inline): {"placeIds": [{"placeId": "123"}, {"placeId": "124"}, ...]}
+    Output (manifest): {"manifestBucket": "...", "manifestKey": "manifest/강남역 맛집.jsonl", "placeCount": 2}
+    SEARCH_QUERIES면 파일을 동시에 읽고 앞선 검색어 순서대로 중복을 제거하며, overlapReport를 함께 반환합니다.
+    상태 머신은 이 함수를 호출하지 않습니다. (SaveRestaurantsToDB가 같은 병합으로 manifest를 씀)
+    DB 저장 없이 검색어 파일에서 placeId 목록만 뽑을 때 쓰는 단독 진입점입니다.
     """
-    query = event.get("SEARCH_QUERY", "공덕역 식당")
+    multi_query = "SEARCH_QUERIES" in event
+    if multi_query:
+        queries = event["SEARCH_QUERIES"]
+        if isinstance(queries, str):
+            queries = [queries]
+        # 같은 검색어가 두 번 들어와도 한 번만 읽음
+        queries = list(dict.fromkeys(queries))
+        if not queries:
+            raise ValueError("SEARCH_QUERIES is empty")
+    else:
+        queries = [event.get("SEARCH_QUERY", "공덕역 식당")]
+    mode = output_mode(event)
     restaurant_bucket_directory = event.get("RESTAURANT_BUCKET_DIRECTORY")
     s3_bucket_name = event.get("S3_BUCKET_NAME")
 
-    # 파일 키 생성 (query 기반) - URL encoding 적용
-    file_key = f"{restaurant_bucket_directory}/{unquote_plus(query)}.json"
-
     try:
-        # S3에서 파일 읽기
-        response = s3_client.get_object(Bucket=s3_bucket_name, Key=file_key)
-        restaurants_data = json.loads(response["Body"].read().decode("utf-8"))
+        # S3에서 검색어별 파일 읽기 (결과는 검색어 순서 유지)
+        with ThreadPoolExecutor(max_workers=max(1, min(EXTRACT_MAX_WORKERS, len(queries)))) as executor:
+            results = list(
+                executor.map(
+                    lambda query: (
+                        query,
+                        read_place_ids(s3_bucket_name, restaurant_bucket_directory, query),
+                    ),
+                    queries,
+                )
+            )
 
         # place_id를 객체로 추출
-        place_ids = []
-        if isinstance(restaurants_data, list):
-            for restaurant in restaurants_data:
-                place_id = restaurant.get("placeId")
-                if place_id:
-                    place_ids.append({"placeId": place_id})  # 객체로 변경
-
-        print(place_ids)
-        return {"placeIds": place_ids, "query": query}
+        place_ids, overlap_report = merge_place_ids(results)
+        print(f"Extracted {len(place_ids)} place IDs")
+
+        output = {"query": queries[0]}
+        if multi_query:
+            output = {"queries": queries, "overlapReport": overlap_report}
+            emit(
+                "place_dedup",
+                {
+                    "Rows": overlap_report["uniquePlaceCount"],
+                    "DuplicatePlaces": overlap_report["avoidedPlaceCount"],
+                },
+            )
+            print(
+                f"Skipped {overlap_report['avoidedPlaceCount']}/{overlap_report['totalPlaceCount']} "
+                f"duplicate places across {len(queries)} queries: "
+                f"{json.dumps(overlap_report['queries'], ensure_ascii=False)}"
+            )
+
+        if mode == "inline":
+            return {"placeIds": place_ids, **output}
+
+        # 목록은 S3 manifest로 내보내고 상태에는 위치와 개수만 반환
+        name = manifest_name(queries)
+        with span("s3_write", s3Key=manifest_key(name)) as metric:
+            manifest = write_place_manifest(get_client("s3"), s3_bucket_name, name, place_ids)
+            metric.add_rows(manifest["placeCount"])
+        return {**manifest, **output}
 
     except Exception as e:
         print(f"Error: {str(e)}")
@@ -91,6 +91,7 @@ resource "aws_iam_role_policy" "step_functions_policy" {
           aws_lambda_function.create_category_batch.arn,
           aws_lambda_function.create_embedding_batch.arn,
           aws_lambda_function.save_embedding.arn,
+          aws_lambda_function.batch_status.arn,
           aws_lambda_function.save_restaurant_to_db.arn,
           aws_lambda_function.save_review_to_db.arn
         ]
@@ -104,6 +105,25 @@ resource "aws_iam_role_policy" "step_functions_policy" {
           "events:DescribeRule"
         ]
         Resource = "*"
+      },
+      # 분산 Map: manifest 읽기, 결과 쓰기, 자식 실행 관리
+      {
+        Effect = "Allow"
+        Action = ["s3:GetObject", "s3:PutObject", "s3:ListBucket", "s3:ListMultipartUploadParts", "s3:AbortMultipartUpload"]
+        Resource = [
+          "${module.s3_data_pipeline.bucket_arn}/*",
+          "${module.s3_data_pipeline.bucket_arn}"
+        ]
+      },
+      {
+        Effect   = "Allow"
+        Action   = ["states:StartExecution"]
+        Resource = [aws_sfn_state_machine.crawling_pipeline.arn]
+      },
+      {
+        Effect   = "Allow"
+        Action   = ["states:DescribeExecution", "states:StopExecution"]
+        Resource = ["${replace(aws_sfn_state_machine.crawling_pipeline.arn, ":stateMachine:", ":execution:")}/*"]
       }
     ]
   })
@@ -160,6 +180,12 @@ data "archive_file" "save_embedding_zip" {
   output_path = "${path.module}/save-embedding.zip"
 }
 
+data "archive_file" "batch_status_zip" {
+  type        = "zip"
+  source_dir  = "${path.module}/batch-status"
+  output_path = "${path.module}/batch-status.zip"
+}
+
 data "archive_file" "save_restaurant_to_db_zip" {
   type        = "zip"
   source_dir  = "${path.module}/save_restaurant_to_db"
@@ -186,6 +212,7 @@ resource "aws_lambda_function" "extract_place_ids" {
       S3_BUCKET_NAME = module.s3_data_pipeline.bucket_name
     }
   }
+  layers = [module.pipeline_common.layer_arn]
 }
 # DB 저장 Lambda
 resource "aws_lambda_function" "save_restaurant_to_db" {
@@ -215,7 +242,7 @@ resource "aws_lambda_function" "save_restaurant_to_db" {
     subnet_ids         = var.private_subnets_for_lambda
     security_group_ids = [aws_security_group.save_restaurant_to_db_lambda_sg.id]
   }
-  layers = [aws_lambda_layer_version.db_layer.arn]
+  layers = [aws_lambda_layer_version.db_layer.arn, module.pipeline_common.layer_arn]
 }
 
 resource "aws_lambda_function" "save_review_to_db" {
@@ -241,7 +268,7 @@ resource "aws_lambda_function" "save_review_to_db" {
     subnet_ids         = var.private_subnets_for_lambda
     security_group_ids = [aws_security_group.save_restaurant_to_db_lambda_sg.id]
   }
-  layers = [aws_lambda_layer_version.db_layer.arn]
+  layers = [aws_lambda_layer_version.db_layer.arn, module.pipeline_common.layer_arn]
 }
 
 
@@ -251,17 +278,21 @@ resource "aws_lambda_function" "create_category_batch" {
   role             = aws_iam_role.lambda_function_role.arn
   handler          = "lambda_function.handler"
   runtime          = "python3.9"
-  timeout          = 300
+  timeout          = 900 # 여러 식당을 한 배치로 묶어 처리
+  memory_size      = 1024
   source_code_hash = data.archive_file.create_category_batch_zip.output_base64sha256
   architectures    = ["arm64"]
 
   environment {
     variables = {
-      REVIEW_BUCKET_DIRECTORY = var.review_bucket_directory
-      S3_BUCKET_NAME          = module.s3_data_pipeline.bucket_name
-      OPENAI_API_KEY          = var.openai_api_key
+      REVIEW_BUCKET_DIRECTORY        = var.review_bucket_directory
+      S3_BUCKET_NAME                 = module.s3_data_pipeline.bucket_name
+      OPENAI_API_KEY                 = var.openai_api_key
+      # 추출 요청 하나에 묶을 리뷰 수 (1이면 리뷰마다 요청)
+      EXTRACTION_REVIEWS_PER_REQUEST = "10"
     }
   }
+  layers = [module.pipeline_common.layer_arn]
 }
 
 resource "aws_lambda_function" "create_embedding_batch" {
@@ -270,7 +301,8 @@ resource "aws_lambda_function" "create_embedding_batch" {
   role             = aws_iam_role.lambda_function_role.arn
   handler          = "lambda_function.handler"
   runtime          = "python3.9"
-  timeout          = 300
+  timeout          = 900 # 여러 식당을 한 배치로 묶어 처리
+  memory_size      = 1024
   source_code_hash = data.archive_file.create_embedding_batch_zip.output_base64sha256
 
   environment {
@@ -281,6 +313,7 @@ resource "aws_lambda_function" "create_embedding_batch" {
       OPENAI_API_KEY            = var.openai_api_key
     }
   }
+  layers = [module.pipeline_common.layer_arn]
 }
 
 resource "aws_lambda_function" "save_embedding" {
@@ -289,7 +322,8 @@ resource "aws_lambda_function" "save_embedding" {
   role             = aws_iam_role.lambda_function_role.arn
   handler          = "lambda_function.handler"
   runtime          = "python3.9"
-  timeout          = 300
+  timeout          = 900 # 여러 식당을 한 배치로 묶어 처리
+  memory_size      = 1024
   source_code_hash = data.archive_file.save_embedding_zip.output_base64sha256
 
   environment {
@@ -300,6 +334,28 @@ resource "aws_lambda_function" "save_embedding" {
       OPENAI_API_KEY             = var.openai_api_key
     }
   }
+  layers = [module.pipeline_common.layer_arn]
+}
+
+# OpenAI 배치 여러 개의 상태를 한 번에 조회하고 다음 조회 시간을 계산하는 Lambda
+resource "aws_lambda_function" "batch_status" {
+  filename         = data.archive_file.batch_status_zip.output_path
+  function_name    = "batch-status-function"
+  role             = aws_iam_role.lambda_function_role.arn
+  handler          = "lambda_function.handler"
+  runtime          = "python3.9"
+  timeout          = 60
+  source_code_hash = data.archive_file.batch_status_zip.output_base64sha256
+  architectures    = ["arm64"]
+
+  environment {
+    variables = {
+      OPENAI_API_KEY           = var.openai_api_key
+      BATCH_STATUS_CONCURRENCY = "32"
+      BATCH_MAX_WAIT_SECONDS   = "93600"
+    }
+  }
+  layers = [module.pipeline_common.layer_arn]
 }
 
 resource "aws_batch_job_queue" "restaurant_crawler" {
@@ -348,6 +404,12 @@ resource "aws_lambda_layer_version" "db_layer" {
   depends_on = [terraform_data.db_layer_builder]
 }
 
+# 파이프라인 공용 모듈 Lambda Layer
+module "pipeline_common" {
+  source     = "../pipeline-common"
+  layer_name = "step-function-common-layer"
+}
+
 resource "aws_iam_role" "access_rds_role" {
   name = "access-rds-role"
   assume_role_policy = jsonencode({
@@ -393,6 +455,7 @@ resource "aws_iam_role_policy" "lambda_all_permissions" {
         Effect = "Allow"
         Action = [
           "s3:GetObject",
+          "s3:PutObject",
           "s3:ListBucket"
         ]
         Resource = [
@@ -462,35 +525,85 @@ resource "aws_sfn_state_machine" "crawling_pipeline" {
 
   definition = jsonencode({
     Comment = "Restaurant and Review Crawling Pipeline with Category and Embedding"
-    StartAt = "CrawlRestaurants"
+    StartAt = "ResolveSearchQueries"
 
     States = {
-      CrawlRestaurants = {
-        Type     = "Task"
-        Resource = "arn:aws:states:::batch:submitJob.sync"
+      # 입력은 {"queries": ["강남역 식당", "역삼역 식당"]} 또는 기존처럼 {"query": "강남역 식당"}
+      ResolveSearchQueries = {
+        Type = "Choice"
+        Choices = [
+          {
+            Variable  = "$.queries"
+            IsPresent = true
+            Next      = "UseSearchQueries"
+          }
+        ]
+        Default = "UseSingleSearchQuery"
+      }
+
+      UseSearchQueries = {
+        Type = "Pass"
         Parameters = {
-          JobDefinition = module.batch.restaurant_job_definition_arn
-          JobName       = "restaurant-crawling"
-          JobQueue      = aws_batch_job_queue.restaurant_crawler.name
-          ContainerOverrides = {
-            Environment = [
-              {
-                Name      = "SEARCH_QUERY"
-                "Value.$" = "$.query"
-              },
-              {
-                Name  = "RESTAURANT_BUCKET_DIRECTORY"
-                Value = var.restaurant_bucket_directory
-              },
-              {
-                Name  = "S3_BUCKET_NAME"
-                Value = var.S3_bucket_name
+          "list.$" = "$.queries"
+        }
+        ResultPath = "$.searchQueries"
+        Next       = "CrawlRestaurants"
+      }
+
+      UseSingleSearchQuery = {
+        Type = "Pass"
+        Parameters = {
+          "list.$" = "States.Array($.query)"
+        }
+        ResultPath = "$.searchQueries"
+        Next       = "CrawlRestaurants"
+      }
+
+      # 검색어마다 식당 목록 크롤링 (겹치는 식당은 SaveRestaurantsToDB가 합치며 한 번만 처리)
+      CrawlRestaurants = {
+        Type           = "Map"
+        MaxConcurrency = 10
+        ItemsPath      = "$.searchQueries.list"
+        ItemSelector = {
+          "query.$" = "$$.Map.Item.Value"
+        }
+        ResultPath = "$.batchResult"
+
+        ItemProcessor = {
+          StartAt = "CrawlQueryRestaurants"
+
+          States = {
+            CrawlQueryRestaurants = {
+              Type     = "Task"
+              Resource = "arn:aws:states:::batch:submitJob.sync"
+              Parameters = {
+                JobDefinition = module.batch.restaurant_job_definition_arn
+                JobName       = "restaurant-crawling"
+                JobQueue      = aws_batch_job_queue.restaurant_crawler.name
+                ContainerOverrides = {
+                  Environment = [
+                    {
+                      Name      = "SEARCH_QUERY"
+                      "Value.$" = "$.query"
+                    },
+                    {
+                      Name  = "RESTAURANT_BUCKET_DIRECTORY"
+                      Value = var.restaurant_bucket_directory
+                    },
+                    {
+                      Name  = "S3_BUCKET_NAME"
+                      Value = var.S3_bucket_name
+                    }
+                  ]
+                }
               }
-            ]
+              # 작업 결과는 크기가 커서 상태에 남기지 않음
+              ResultPath = null
+              End        = true
+            }
           }
         }
-        ResultPath = "$.batchResult"
-        Next       = "SaveRestaurantsToDB"
+        Next = "SaveRestaurantsToDB"
       }
 
       SaveRestaurantsToDB = {
@@ -499,37 +612,51 @@ resource "aws_sfn_state_machine" "crawling_pipeline" {
         Parameters = {
           FunctionName = aws_lambda_function.save_restaurant_to_db.arn
           Payload = {
-            "SEARCH_QUERY.$" = "$.query"
-            "S3_DIRECTORY"   = var.restaurant_bucket_directory
-            "S3_BUCKET_NAME" = var.S3_bucket_name
+            # 검색어 사이 중복 placeId를 합쳐 manifest에 한 번만 씀
+            "SEARCH_QUERIES.$" = "$.searchQueries.list"
+            "S3_DIRECTORY"     = var.restaurant_bucket_directory
+            "S3_BUCKET_NAME"   = var.S3_bucket_name
+            # placeId 목록은 S3 manifest로 내보내고 상태에는 key와 개수만 남김
+            "OUTPUT_MODE" = "manifest"
           }
         }
-        ResultPath = "$.saveRestaurantResult"
-        Next       = "ExtractPlaceIds"
-      }
-
-      ExtractPlaceIds = {
-        Type     = "Task"
-        Resource = aws_lambda_function.extract_place_ids.arn
-        Parameters = {
-          "SEARCH_QUERY.$"              = "$.query"
-          "S3_BUCKET_NAME"              = var.S3_bucket_name
-          "RESTAURANT_BUCKET_DIRECTORY" = var.restaurant_bucket_directory
+        ResultSelector = {
+          "manifestBucket.$" = "$.Payload.manifestBucket"
+          "manifestKey.$"    = "$.Payload.manifestKey"
+          "placeCount.$"     = "$.Payload.placeCount"
         }
-        ResultPath = "$.extractedResult"
-        Next       = "ProcessEachRestaurant"
+        ResultPath = "$.saveRestaurantResult"
+        Next       = "CrawlEachRestaurant"
       }
 
-      # 각 식당별로 전체 프로세스 실행
-      ProcessEachRestaurant = {
+      # 각 식당의 리뷰 크롤링 (manifest의 한 줄 {"placeId": ...}이 항목 하나)
+      CrawlEachRestaurant = {
         Type           = "Map"
-        ItemsPath      = "$.extractedResult.placeIds"
         MaxConcurrency = 100
-        ResultPath     = "$.allRestaurantsResult"
+        ItemReader = {
+          Resource = "arn:aws:states:::s3:getObject"
+          ReaderConfig = {
+            InputType = "JSONL"
+          }
+          Parameters = {
+            "Bucket.$" = "$.saveRestaurantResult.manifestBucket"
+            "Key.$"    = "$.saveRestaurantResult.manifestKey"
+          }
+        }
+        # 항목별 결과는 상태 대신 S3에 기록
+        ResultWriter = {
+          Resource = "arn:aws:states:::s3:putObject"
+          Parameters = {
+            Bucket = var.S3_bucket_name
+            Prefix = "manifest/map-results"
+          }
+        }
+        ResultPath = "$.crawlResult"
 
         ItemProcessor = {
           ProcessorConfig = {
-            Mode = "INLINE"
+            Mode          = "DISTRIBUTED"
+            ExecutionType = "STANDARD"
           }
 
           StartAt = "CrawlSingleRestaurantReviews"
@@ -561,11 +688,291 @@ resource "aws_sfn_state_machine" "crawling_pipeline" {
                 }
               }
               ResultPath = "$.reviewCrawlResult"
-              Next       = "CreateCategoryBatchForRestaurant"
+              End        = true
             }
+          }
+        }
+        Next = "CreateCategoryBatches"
+      }
+
+      # 모든 식당의 리뷰를 크기 제한까지 묶어 카테고리 추출 배치 생성 (식당 키는 custom_id에 담김)
+      CreateCategoryBatches = {
+        Type     = "Task"
+        Resource = "arn:aws:states:::lambda:invoke"
+        Parameters = {
+          FunctionName = aws_lambda_function.create_category_batch.arn
+          Payload = {
+            "manifestBucket.$" = "$.saveRestaurantResult.manifestBucket"
+            "manifestKey.$"    = "$.saveRestaurantResult.manifestKey"
+          }
+        }
+        ResultSelector = {
+          "statusCode.$"    = "$.Payload.statusCode"
+          "body.$"          = "$.Payload.body"
+          "pollStartedAt.$" = "$$.State.EnteredTime"
+        }
+        ResultPath = "$.categoryResult"
+        Next       = "PollCategoryBatches"
+        Catch = [
+          {
+            ErrorEquals = ["States.ALL"]
+            ResultPath  = "$.coalescedError"
+            Next        = "ProcessEachRestaurantFallback"
+          }
+        ]
+      }
+
+      # 카테고리 배치 상태만 가볍게 확인 (리뷰를 읽는 임베딩 생성 Lambda는 완료 후에 호출)
+      # 배치를 만든 단계에 들어간 시각(pollStartedAt)부터 BATCH_MAX_WAIT_SECONDS가 지나면
+      # batch-status가 failed를 돌려줘 조회 루프를 끝냄
+      # 묶음 단계가 실패하면(배치 실패/만료/시간 초과, Lambda 오류) 식당별 처리로 다시 시도해 실패를 식당 하나로 가둠
+      PollCategoryBatches = {
+        Type     = "Task"
+        Resource = "arn:aws:states:::lambda:invoke"
+        Parameters = {
+          FunctionName = aws_lambda_function.batch_status.arn
+          Payload = {
+            "batch_ids.$"  = "$.categoryResult.body.extraction_batch_ids"
+            "started_at.$" = "$.categoryResult.pollStartedAt"
+          }
+        }
+        ResultSelector = {
+          "ready.$"           = "$.Payload.body.ready"
+          "failed.$"          = "$.Payload.body.failed"
+          "timedOut.$"        = "$.Payload.body.timedOut"
+          "nextPollSeconds.$" = "$.Payload.body.nextPollSeconds"
+        }
+        ResultPath = "$.categoryBatchStatus"
+        Next       = "EvaluateCategoryBatchStatus"
+        Catch = [
+          {
+            ErrorEquals = ["States.ALL"]
+            ResultPath  = "$.coalescedError"
+            Next        = "ProcessEachRestaurantFallback"
+          }
+        ]
+      }
 
+      EvaluateCategoryBatchStatus = {
+        Type = "Choice"
+        Choices = [
+          {
+            Variable      = "$.categoryBatchStatus.ready"
+            BooleanEquals = true
+            Next          = "MarkEmbeddingStart"
+          },
+          {
+            Variable      = "$.categoryBatchStatus.failed"
+            BooleanEquals = true
+            Next          = "ProcessEachRestaurantFallback"
+          }
+        ]
+        Default = "WaitForCategoryBatches"
+      }
+
+      # 진행률로 계산한 시간만큼 대기
+      WaitForCategoryBatches = {
+        Type        = "Wait"
+        SecondsPath = "$.categoryBatchStatus.nextPollSeconds"
+        Next        = "PollCategoryBatches"
+      }
+
+      # 임베딩 단계 대기 시작 시각 (WaitForEmbedding -> CreateEmbeddingBatches 반복에서도 처음 값을 유지)
+      MarkEmbeddingStart = {
+        Type = "Pass"
+        Parameters = {
+          "startedAt.$" = "$$.State.EnteredTime"
+        }
+        ResultPath = "$.embeddingPoll"
+        Next       = "CreateEmbeddingBatches"
+      }
+
+      # 추출 결과를 식당별로 나눠 카테고리 저장 후 임베딩 요청을 다시 묶어 배치 생성
+      CreateEmbeddingBatches = {
+        Type     = "Task"
+        Resource = "arn:aws:states:::lambda:invoke"
+        Parameters = {
+          FunctionName = aws_lambda_function.create_embedding_batch.arn
+          Payload = {
+            "body.$" = "$.categoryResult.body"
+          }
+        }
+        ResultSelector = {
+          "statusCode.$" = "$.Payload.statusCode"
+          "body.$"       = "$.Payload.body"
+        }
+        ResultPath = "$.embeddingRequestResult"
+        Next       = "EvaluateEmbeddingResult"
+        Catch = [
+          {
+            ErrorEquals = ["States.ALL"]
+            ResultPath  = "$.coalescedError"
+            Next        = "ProcessEachRestaurantFallback"
+          }
+        ]
+      }
+
+      # 임베딩 결과 평가
+      EvaluateEmbeddingResult = {
+        Type = "Choice"
+        Choices = [
+          {
+            Variable      = "$.embeddingRequestResult.statusCode"
+            NumericEquals = 202
+            Next          = "WaitForEmbedding"
+          },
+          {
+            Variable      = "$.embeddingRequestResult.statusCode"
+            NumericEquals = 200
+            Next          = "PollEmbeddingBatches"
+          }
+        ]
+        Default = "ProcessEachRestaurantFallback"
+      }
+
+      # 임베딩 대기
+      WaitForEmbedding = {
+        Type        = "Wait"
+        SecondsPath = "$.embeddingRequestResult.body.next_poll_seconds"
+        Next        = "CreateEmbeddingBatches"
+      }
+
+      # 임베딩 배치 상태만 가볍게 확인
+      PollEmbeddingBatches = {
+        Type     = "Task"
+        Resource = "arn:aws:states:::lambda:invoke"
+        Parameters = {
+          FunctionName = aws_lambda_function.batch_status.arn
+          Payload = {
+            "batch_ids.$"  = "$.embeddingRequestResult.body.embedding_batch_ids"
+            "started_at.$" = "$.embeddingPoll.startedAt"
+          }
+        }
+        ResultSelector = {
+          "ready.$"           = "$.Payload.body.ready"
+          "failed.$"          = "$.Payload.body.failed"
+          "timedOut.$"        = "$.Payload.body.timedOut"
+          "nextPollSeconds.$" = "$.Payload.body.nextPollSeconds"
+        }
+        ResultPath = "$.embeddingBatchStatus"
+        Next       = "EvaluateEmbeddingBatchStatus"
+        Catch = [
+          {
+            ErrorEquals = ["States.ALL"]
+            ResultPath  = "$.coalescedError"
+            Next        = "ProcessEachRestaurantFallback"
+          }
+        ]
+      }
+
+      EvaluateEmbeddingBatchStatus = {
+        Type = "Choice"
+        Choices = [
+          {
+            Variable      = "$.embeddingBatchStatus.ready"
+            BooleanEquals = true
+            Next          = "SaveEmbeddings"
+          },
+          {
+            Variable      = "$.embeddingBatchStatus.failed"
+            BooleanEquals = true
+            Next          = "ProcessEachRestaurantFallback"
+          }
+        ]
+        Default = "WaitForEmbeddingBatches"
+      }
+
+      WaitForEmbeddingBatches = {
+        Type        = "Wait"
+        SecondsPath = "$.embeddingBatchStatus.nextPollSeconds"
+        Next        = "PollEmbeddingBatches"
+      }
+
+      # 임베딩 결과를 식당별로 나눠 식당마다 최종 파일 저장
+      SaveEmbeddings = {
+        Type     = "Task"
+        Resource = "arn:aws:states:::lambda:invoke"
+        Parameters = {
+          FunctionName = aws_lambda_function.save_embedding.arn
+          Payload = {
+            "body.$" = "$.embeddingRequestResult.body"
+          }
+        }
+        ResultSelector = {
+          "statusCode.$" = "$.Payload.statusCode"
+          "body.$"       = "$.Payload.body"
+        }
+        ResultPath = "$.saveEmbeddingResult"
+        Next       = "EvaluateSaveResult"
+        Catch = [
+          {
+            ErrorEquals = ["States.ALL"]
+            ResultPath  = "$.coalescedError"
+            Next        = "ProcessEachRestaurantFallback"
+          }
+        ]
+      }
+
+      # 저장 결과 평가
+      EvaluateSaveResult = {
+        Type = "Choice"
+        Choices = [
+          {
+            Variable      = "$.saveEmbeddingResult.statusCode"
+            NumericEquals = 202
+            Next          = "WaitForSave"
+          },
+          {
+            Variable      = "$.saveEmbeddingResult.statusCode"
+            NumericEquals = 200
+            Next          = "SaveEachRestaurantReviews"
+          }
+        ]
+        Default = "ProcessEachRestaurantFallback"
+      }
+
+      # 저장 대기
+      WaitForSave = {
+        Type        = "Wait"
+        SecondsPath = "$.saveEmbeddingResult.body.next_poll_seconds"
+        Next        = "SaveEmbeddings"
+      }
+
+      # 묶음 단계 실패 시 식당마다 따로 배치를 만들어 처리 (한 식당의 실패는 그 식당만 실패로 남김)
+      ProcessEachRestaurantFallback = {
+        Type           = "Map"
+        MaxConcurrency = 100
+        ItemReader = {
+          Resource = "arn:aws:states:::s3:getObject"
+          ReaderConfig = {
+            InputType = "JSONL"
+          }
+          Parameters = {
+            "Bucket.$" = "$.saveRestaurantResult.manifestBucket"
+            "Key.$"    = "$.saveRestaurantResult.manifestKey"
+          }
+        }
+        # 항목별 결과(실패한 식당 포함)는 상태 대신 S3에 기록
+        ResultWriter = {
+          Resource = "arn:aws:states:::s3:putObject"
+          Parameters = {
+            Bucket = var.S3_bucket_name
+            Prefix = "manifest/fallback-results"
+          }
+        }
+        ResultPath = "$.fallbackResult"
+
+        ItemProcessor = {
+          ProcessorConfig = {
+            Mode          = "DISTRIBUTED"
+            ExecutionType = "STANDARD"
+          }
+
+          StartAt = "CreateRestaurantCategoryBatch"
+
+          States = {
             # 해당 식당의 카테고리 추출
-            CreateCategoryBatchForRestaurant = {
+            CreateRestaurantCategoryBatch = {
               Type     = "Task"
               Resource = "arn:aws:states:::lambda:invoke"
               Parameters = {
@@ -575,22 +982,88 @@ resource "aws_sfn_state_machine" "crawling_pipeline" {
                 }
               }
               ResultSelector = {
-                "statusCode.$" = "$.Payload.statusCode"
-                "body.$"       = "$.Payload.body"
+                "statusCode.$"    = "$.Payload.statusCode"
+                "body.$"          = "$.Payload.body"
+                "pollStartedAt.$" = "$$.State.EnteredTime"
               }
               ResultPath = "$.categoryResult"
-              Next       = "CheckCategoryAndCreateEmbedding"
+              Next       = "PollRestaurantCategoryBatch"
+              Catch = [
+                {
+                  ErrorEquals = ["States.ALL"]
+                  ResultPath  = "$.error"
+                  Next        = "RestaurantProcessFailed"
+                }
+              ]
+            }
+
+            PollRestaurantCategoryBatch = {
+              Type     = "Task"
+              Resource = "arn:aws:states:::lambda:invoke"
+              Parameters = {
+                FunctionName = aws_lambda_function.batch_status.arn
+                Payload = {
+                  "batch_id.$"   = "$.categoryResult.body.extraction_batch_id"
+                  "started_at.$" = "$.categoryResult.pollStartedAt"
+                }
+              }
+              ResultSelector = {
+                "ready.$"           = "$.Payload.body.ready"
+                "failed.$"          = "$.Payload.body.failed"
+                "nextPollSeconds.$" = "$.Payload.body.nextPollSeconds"
+              }
+              ResultPath = "$.categoryBatchStatus"
+              Next       = "EvaluateRestaurantCategoryBatchStatus"
+              Catch = [
+                {
+                  ErrorEquals = ["States.ALL"]
+                  ResultPath  = "$.error"
+                  Next        = "RestaurantProcessFailed"
+                }
+              ]
+            }
+
+            EvaluateRestaurantCategoryBatchStatus = {
+              Type = "Choice"
+              Choices = [
+                {
+                  Variable      = "$.categoryBatchStatus.ready"
+                  BooleanEquals = true
+                  Next          = "MarkRestaurantEmbeddingStart"
+                },
+                {
+                  Variable      = "$.categoryBatchStatus.failed"
+                  BooleanEquals = true
+                  Next          = "RestaurantProcessFailed"
+                }
+              ]
+              Default = "WaitForRestaurantCategoryBatch"
+            }
+
+            WaitForRestaurantCategoryBatch = {
+              Type        = "Wait"
+              SecondsPath = "$.categoryBatchStatus.nextPollSeconds"
+              Next        = "PollRestaurantCategoryBatch"
+            }
+
+            MarkRestaurantEmbeddingStart = {
+              Type = "Pass"
+              Parameters = {
+                "startedAt.$" = "$$.State.EnteredTime"
+              }
+              ResultPath = "$.embeddingPoll"
+              Next       = "CreateRestaurantEmbeddingBatch"
             }
 
             # 카테고리 확인 및 임베딩 생성
-            CheckCategoryAndCreateEmbedding = {
+            CreateRestaurantEmbeddingBatch = {
               Type     = "Task"
               Resource = "arn:aws:states:::lambda:invoke"
               Parameters = {
                 FunctionName = aws_lambda_function.create_embedding_batch.arn
                 Payload = {
-                  "S3_KEY.$" = "$.placeId",
-                  "body.$"   = "$.categoryResult.body",
+                  "S3_KEY.$" = "$.placeId"
+                  "body.$"   = "$.categoryResult.body"
                 }
               }
               ResultSelector = {
@@ -598,49 +1071,96 @@ resource "aws_sfn_state_machine" "crawling_pipeline" {
                 "body.$"       = "$.Payload.body"
               }
               ResultPath = "$.embeddingRequestResult"
-              Next       = "EvaluateEmbeddingResult"
+              Next       = "EvaluateRestaurantEmbeddingResult"
+              Catch = [
+                {
+                  ErrorEquals = ["States.ALL"]
+                  ResultPath  = "$.error"
+                  Next        = "RestaurantProcessFailed"
+                }
+              ]
             }
 
-            # 임베딩 결과 평가
-            EvaluateEmbeddingResult = {
+            EvaluateRestaurantEmbeddingResult = {
               Type = "Choice"
               Choices = [
                 {
                   Variable      = "$.embeddingRequestResult.statusCode"
                   NumericEquals = 202
-                  Next          = "WaitForEmbedding"
+                  Next          = "WaitForRestaurantEmbedding"
                 },
                 {
                   Variable      = "$.embeddingRequestResult.statusCode"
                   NumericEquals = 200
-                  Next          = "CheckEmbeddingAndSave"
+                  Next          = "PollRestaurantEmbeddingBatch"
+                }
+              ]
+              Default = "RestaurantProcessFailed"
+            }
+
+            WaitForRestaurantEmbedding = {
+              Type        = "Wait"
+              SecondsPath = "$.embeddingRequestResult.body.next_poll_seconds"
+              Next        = "CreateRestaurantEmbeddingBatch"
+            }
+
+            PollRestaurantEmbeddingBatch = {
+              Type     = "Task"
+              Resource = "arn:aws:states:::lambda:invoke"
+              Parameters = {
+                FunctionName = aws_lambda_function.batch_status.arn
+                Payload = {
+                  "batch_id.$"   = "$.embeddingRequestResult.body.embedding_batch_id"
+                  "started_at.$" = "$.embeddingPoll.startedAt"
+                }
+              }
+              ResultSelector = {
+                "ready.$"           = "$.Payload.body.ready"
+                "failed.$"          = "$.Payload.body.failed"
+                "nextPollSeconds.$" = "$.Payload.body.nextPollSeconds"
+              }
+              ResultPath = "$.embeddingBatchStatus"
+              Next       = "EvaluateRestaurantEmbeddingBatchStatus"
+              Catch = [
+                {
+                  ErrorEquals = ["States.ALL"]
+                  ResultPath  = "$.error"
+                  Next        = "RestaurantProcessFailed"
                 }
               ]
-              Default = "HandleEmbeddingError"
             }
 
-            # 임베딩 대기
-            WaitForEmbedding = {
-              Type    = "Wait"
-              Seconds = 1800
-              Next    = "CheckCategoryAndCreateEmbedding"
+            EvaluateRestaurantEmbeddingBatchStatus = {
+              Type = "Choice"
+              Choices = [
+                {
+                  Variable      = "$.embeddingBatchStatus.ready"
+                  BooleanEquals = true
+                  Next          = "SaveRestaurantEmbedding"
+                },
+                {
+                  Variable      = "$.embeddingBatchStatus.failed"
+                  BooleanEquals = true
+                  Next          = "RestaurantProcessFailed"
+                }
+              ]
+              Default = "WaitForRestaurantEmbeddingBatch"
             }
 
-            # 임베딩 에러 처리
-            HandleEmbeddingError = {
-              Type   = "Pass"
-              Result = "Embedding failed"
-              Next   = "RestaurantProcessComplete"
+            WaitForRestaurantEmbeddingBatch = {
+              Type        = "Wait"
+              SecondsPath = "$.embeddingBatchStatus.nextPollSeconds"
+              Next        = "PollRestaurantEmbeddingBatch"
             }
 
             # 임베딩 확인 및 저장
-            CheckEmbeddingAndSave = {
+            SaveRestaurantEmbedding = {
               Type     = "Task"
               Resource = "arn:aws:states:::lambda:invoke"
               Parameters = {
                 FunctionName = aws_lambda_function.save_embedding.arn
                 Payload = {
-                  "S3_KEY.$" = "$.placeId",
+                  "S3_KEY.$" = "$.placeId"
                   "body.$"   = "$.embeddingRequestResult.body"
                 }
               }
@@ -649,41 +1169,122 @@ resource "aws_sfn_state_machine" "crawling_pipeline" {
                 "body.$"       = "$.Payload.body"
               }
               ResultPath = "$.saveEmbeddingResult"
-              Next       = "EvaluateSaveResult"
+              Next       = "EvaluateRestaurantSaveResult"
+              Catch = [
+                {
+                  ErrorEquals = ["States.ALL"]
+                  ResultPath  = "$.error"
+                  Next        = "RestaurantProcessFailed"
+                }
+              ]
             }
-            # 저장 결과 평가
-            EvaluateSaveResult = {
+
+            EvaluateRestaurantSaveResult = {
               Type = "Choice"
               Choices = [
                 {
                   Variable      = "$.saveEmbeddingResult.statusCode"
                   NumericEquals = 202
-                  Next          = "WaitForSave"
+                  Next          = "WaitForRestaurantSave"
                 },
                 {
                   Variable      = "$.saveEmbeddingResult.statusCode"
                   NumericEquals = 200
-                  Next          = "SaveReviewsToDB"
+                  Next          = "SaveRestaurantReviewsToDB"
                 }
               ]
-              Default = "HandleSaveError"
+              Default = "RestaurantProcessFailed"
             }
 
-            # 저장 대기
-            WaitForSave = {
-              Type    = "Wait"
-              Seconds = 1800
-              Next    = "CheckEmbeddingAndSave"
+            WaitForRestaurantSave = {
+              Type        = "Wait"
+              SecondsPath = "$.saveEmbeddingResult.body.next_poll_seconds"
+              Next        = "SaveRestaurantEmbedding"
             }
 
-            # 저장 에러 처리
-            HandleSaveError = {
-              Type   = "Pass"
-              Result = "Save failed"
-              Next   = "RestaurantProcessComplete"
+            SaveRestaurantReviewsToDB = {
+              Type     = "Task"
+              Resource = "arn:aws:states:::lambda:invoke"
+              Parameters = {
+                FunctionName = aws_lambda_function.save_review_to_db.arn
+                Payload = {
+                  "SEARCH_QUERY.$" = "$.placeId"
+                  "S3_DIRECTORY"   = var.embedding_vector_bucket_directory
+                  "S3_BUCKET_NAME" = var.S3_bucket_name
+                }
+              }
+              ResultPath = "$.saveReviewResult"
+              End        = true
+              Catch = [
+                {
+                  ErrorEquals = ["States.ALL"]
+                  ResultPath  = "$.error"
+                  Next        = "RestaurantProcessFailed"
+                }
+              ]
+            }
+
+            # 이 식당만 실패로 기록하고 다른 식당은 계속 처리
+            RestaurantProcessFailed = {
+              Type = "Pass"
+              Parameters = {
+                "placeId.$" = "$.placeId"
+                "status"    = "failed"
+              }
+              End = true
             }
+          }
+        }
+        Next = "AllRestaurantsComplete"
+        # 식당별 실패는 위에서 처리하므로 여기로 오는 것은 Map 자체의 실패 (manifest 읽기 등)
+        Catch = [
+          {
+            ErrorEquals = ["States.ALL"]
+            ResultPath  = "$.fallbackError"
+            Next        = "BatchProcessingFailed"
+          }
+        ]
+      }
 
-            # 리뷰 데이터 DB 저장
+      BatchProcessingFailed = {
+        Type  = "Fail"
+        Error = "BatchProcessingFailed"
+        Cause = "Coalesced batches failed and the per-restaurant fallback could not run"
+      }
+
+      # 각 식당의 리뷰 데이터 DB 저장
+      SaveEachRestaurantReviews = {
+        Type           = "Map"
+        MaxConcurrency = 100
+        ItemReader = {
+          Resource = "arn:aws:states:::s3:getObject"
+          ReaderConfig = {
+            InputType = "JSONL"
+          }
+          Parameters = {
+            "Bucket.$" = "$.saveRestaurantResult.manifestBucket"
+            "Key.$"    = "$.saveRestaurantResult.manifestKey"
+          }
+        }
+        # 항목별 결과는 상태 대신 S3에 기록
+        ResultWriter = {
+          Resource = "arn:aws:states:::s3:putObject"
+          Parameters = {
+            Bucket = var.S3_bucket_name
+            Prefix = "manifest/map-results"
+          }
+        }
+        ResultPath = "$.saveReviewsResult"
+
+        ItemProcessor = {
+          ProcessorConfig = {
+            Mode          = "DISTRIBUTED"
+            ExecutionType = "STANDARD"
+          }
+
+          StartAt = "SaveReviewsToDB"
+
+          States = {
             SaveReviewsToDB = {
               Type     = "Task"
               Resource = "arn:aws:states:::lambda:invoke"
@@ -696,14 +1297,7 @@ resource "aws_sfn_state_machine" "crawling_pipeline" {
                 }
               }
               ResultPath = "$.saveReviewResult"
-              Next       = "RestaurantProcessComplete"
-            }
-
-            # 단일 식당 처리 완료
-            RestaurantProcessComplete = {
-              Type   = "Pass"
-              Result = "Restaurant processing completed"
-              End    = true
+              End        = true
             }
           }
         }
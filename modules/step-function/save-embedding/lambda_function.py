@@ -1,36 +1,67 @@
 import json
 import os
-import boto3
-import gzip
 from typing import List, Dict, Any
 from datetime import datetime
 import logging
 import sys
-import urllib.request
-import urllib.error
+from pipeline_common.artifact_codec import read_artifact_with_fallback
+from pipeline_common.metrics import emit, span
+from pipeline_common.batch_progress import PENDING_STATUSES, next_poll_seconds
+from pipeline_common.batch_coalesce import (
+    encode_custom_id,
+    group_results_by_restaurant,
+    parse_custom_id,
+    read_plan,
+)
+from pipeline_common.batch_retry import (
+    MISSING_RESULT,
+    SYNC_RETRY_MAX_ITEMS,
+    embed_sync,
+    result_error,
+    write_failure_report,
+)
+from pipeline_common.matryoshka import prefilter_embeddings
+from pipeline_common.stage_checkpoint import StageCheckpoint
+from concurrent.futures import ThreadPoolExecutor
+from pipeline_common.aws_clients import get_client
 
 # 환경 변수
 S3_BUCKET_NAME = os.getenv("S3_BUCKET_NAME")
 CATEGORY_BUCKET_DIRECTORY = os.getenv("CATEGORY_BUCKET_DIRECTORY")
 EMBEDDING_BUCKET_DIRECTORY = os.getenv("EMBEDDING_BUCKET_DIRECTORY")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# 묶음 배치 결과를 식당별로 저장할 때 동시에 처리할 스레드 수
+COALESCE_READ_WORKERS = int(os.getenv("COALESCE_READ_WORKERS", "16"))
+# 식당별 저장 진행을 체크포인트에 쓰는 최소 간격 (초)
+SAVE_CHECKPOINT_INTERVAL_SECONDS = float(os.getenv("SAVE_CHECKPOINT_INTERVAL_SECONDS", "5"))
+# 실패한 키워드를 다시 요청할 때 쓰는 설정 (create-embedding-batch의 요청과 같아야 함)
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_DIMENSIONS = 768
 # S3_KEY = os.getenv("S3_KEY")
 
-# S3 클라이언트 초기화
-s3_client = boto3.client("s3")
-
-# 로거 설정
+# 로거 설정 (stdout 핸들러는 첫 호출 때 연결)
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
-handler = logging.StreamHandler(sys.stdout)
-handler.setLevel(logging.INFO)
-formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
-handler.setFormatter(formatter)
-logger.addHandler(handler)
+_logging_configured = False
+
+
+def configure_logging():
+    """stdout 로그 핸들러를 실행 환경당 한 번만 연결합니다."""
+    global _logging_configured
+    if _logging_configured:
+        return
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setLevel(logging.INFO)
+    stream_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+    logger.addHandler(stream_handler)
+    _logging_configured = True
 
 
 def handler(event, context):
     """Lambda 3: 임베딩 배치 완료 확인 및 최종 처리"""
+    configure_logging()
+    if "plan_key" in event.get("body", {}):
+        return handle_coalesced(event)
     try:
         logger.info("=== 임베딩 배치 완료 확인 시작 ===")
         print(event["body"])
@@ -42,52 +73,65 @@ def handler(event, context):
         logger.info(f"임베딩 배치 ID: {embedding_batch_id}")
         logger.info(f"S3 키: {s3_key}")
 
-        # 1. 배치 상태 확인
-        logger.info("[단계 1/5] 배치 상태 확인 중...")
-
-        # urllib로 배치 상태 확인
-        req = urllib.request.Request(
-            f"https://api.openai.com/v1/batches/{embedding_batch_id}",
-            headers={"Authorization": f"Bearer {OPENAI_API_KEY}"},
-        )
-
-        try:
-            with urllib.request.urlopen(req) as response:
-                batch = json.loads(response.read().decode())
-        except urllib.error.HTTPError as e:
-            raise Exception(f"Batch retrieve failed: {e.read().decode()}")
-
-        if batch["status"] == "in_progress" or batch["status"] == "validating":
-            logger.info(
-                f"배치가 아직 완료되지 않았습니다. 현재 상태: {batch['status']}"
-            )
-            return {
-                "statusCode": 202,
-                "body": {
-                    "error": "Batch not completed",
-                    "batch_id": embedding_batch_id,
-                    "status": batch["status"],
-                },
-            }
-        elif batch["status"] != "completed":
-            raise Exception(f"Batch failed: {batch}")
-        logger.info("배치가 성공적으로 완료되었습니다!")
-
-        # 2. 임베딩 결과 가져오기
-        logger.info("[단계 2/5] 임베딩 결과 가져오기...")
-        embedding_results = get_batch_results(batch["output_file_id"])
-        logger.info(f"임베딩 결과 {len(embedding_results)}개를 받았습니다")
+        # 재시도면 최종 파일까지 저장했는지 확인
+        # 임베딩 배치가 없던 식당(임베딩할 키워드가 없음)은 식당 키로 체크포인트를 구분
+        checkpoint_id = embedding_batch_id or f"no-requests-{s3_key}"
+        checkpoint = StageCheckpoint(get_client("s3"), S3_BUCKET_NAME, "save-embedding", checkpoint_id)
+        if checkpoint.done("completed"):
+            logger.info(f"이미 최종 파일을 저장했습니다: {checkpoint.get('completed')}")
+            return {"statusCode": 200, "body": checkpoint.get("completed")}
+
+        if embedding_batch_id is None:
+            # 배치 조회 없이 빈 임베딩으로 저장
+            logger.info("임베딩 배치가 없어 빈 임베딩으로 저장합니다")
+            embedding_results = []
+        else:
+            # 1. 배치 상태 확인
+            logger.info("[단계 1/5] 배치 상태 확인 중...")
+
+            batch = retrieve_batch(embedding_batch_id)
+
+            if batch["status"] in PENDING_STATUSES:
+                logger.info(
+                    f"배치가 아직 완료되지 않았습니다. 현재 상태: {batch['status']}"
+                )
+                return {
+                    "statusCode": 202,
+                    "body": {
+                        "error": "Batch not completed",
+                        "batch_id": embedding_batch_id,
+                        "status": batch["status"],
+                        # 진행률로 계산한 대기 시간 (Wait 상태의 SecondsPath)
+                        "next_poll_seconds": next_poll_seconds(batch),
+                    },
+                }
+            elif batch["status"] != "completed":
+                raise Exception(f"Batch failed: {batch}")
+            logger.info("배치가 성공적으로 완료되었습니다!")
+
+            # 2. 임베딩 결과 가져오기
+            logger.info("[단계 2/5] 임베딩 결과 가져오기...")
+            embedding_results = get_batch_results(batch["output_file_id"])
+            logger.info(f"임베딩 결과 {len(embedding_results)}개를 받았습니다")
 
         # 3. 카테고리 데이터 가져오기
         logger.info("[단계 3/5] S3에서 카테고리 데이터 로딩 중...")
-        reviews_with_categories = get_categories_from_s3(s3_key)
+        with span("s3_read") as metric:
+            reviews_with_categories = get_categories_from_s3(s3_key)
+            metric.add_rows(len(reviews_with_categories))
         logger.info(f"{len(reviews_with_categories)}개의 리뷰를 로드했습니다")
 
-        # 4. 임베딩 결과를 리뷰에 매핑
+        # 4. 결과가 없거나 실패한 키워드만 다시 요청한 뒤 임베딩 결과를 리뷰에 매핑
+        failed = find_failed_embeddings(reviews_with_categories, embedding_results, s3_key)
+        if failed:
+            retried_by_key = retry_failed_embeddings({s3_key: failed}, embedding_batch_id)
+            embedding_results = embedding_results + retried_by_key.get(s3_key, [])
         logger.info("[단계 4/5] 임베딩을 리뷰에 매핑 중...")
-        final_reviews = map_embeddings_to_reviews(
-            reviews_with_categories, embedding_results
-        )
+        with span("map_results") as metric:
+            final_reviews = map_embeddings_to_reviews(
+                reviews_with_categories, embedding_results
+            )
+            metric.add_rows(len(final_reviews))
         logger.info("임베딩 매핑이 성공적으로 완료되었습니다")
 
         # 5. 최종 결과를 S3에 저장
@@ -98,14 +142,13 @@ def handler(event, context):
         logger.info("=== 모든 처리가 완료되었습니다 ===")
         logger.info(f"총 처리된 리뷰 수: {len(final_reviews)}개")
 
-        return {
-            "statusCode": 200,
-            "body": {
-                "message": "All processing completed successfully",
-                "processed_count": len(final_reviews),
-                "final_s3_key": final_s3_key,
-            },
+        body = {
+            "message": "All processing completed successfully",
+            "processed_count": len(final_reviews),
+            "final_s3_key": final_s3_key,
         }
+        checkpoint.complete("completed", body)
+        return {"statusCode": 200, "body": body}
 
     except Exception as e:
         logger.error("처리 중 오류가 발생했습니다")
@@ -113,8 +156,130 @@ def handler(event, context):
         raise Exception(f"Failed to save embedding: {str(e)}")
 
 
+def handle_coalesced(event):
+    """
+    묶음 임베딩 배치 결과를 식당별로 나눠 식당마다 최종 파일을 저장합니다.
+    Input: {"body": {"plan_key": "batch-plan/embedding-....json", "embedding_batch_ids": [...]}}
+    최종 파일을 저장한 식당은 plan 이름 기준 체크포인트에 남겨 재시도하면 건너뜁니다.
+    """
+    try:
+        logger.info("=== 묶음 임베딩 배치 완료 확인 시작 ===")
+        plan_name = os.path.splitext(os.path.basename(event["body"]["plan_key"]))[0]
+        checkpoint = StageCheckpoint(get_client("s3"), S3_BUCKET_NAME, "save-embedding", plan_name)
+        if checkpoint.done("completed"):
+            logger.info(f"이미 최종 파일을 모두 저장했습니다: {checkpoint.get('completed')}")
+            return {"statusCode": 200, "body": checkpoint.get("completed")}
+        plan = read_plan(get_client("s3"), S3_BUCKET_NAME, event["body"]["plan_key"])
+
+        # 1. 모든 배치가 끝났는지 확인 (임베딩할 키워드가 없던 식당 묶음은 batch_id가 없음)
+        # 재시도면 최종 파일을 저장한 식당만 있는 배치는 결과를 다시 받지 않음
+        saved = dict(checkpoint.get("restaurants_saved", {}))
+        entries = [entry for entry in plan["batches"] if any(key not in saved for key in entry["keys"])]
+        batches = [retrieve_batch(entry["batch_id"]) for entry in entries if entry["batch_id"]]
+        not_ready = pending_response(batches)
+        if not_ready:
+            return not_ready
+
+        # 2. 결과를 식당별로 나눔
+        results_by_key = {}
+        for batch in batches:
+            results_by_key.update(group_results_by_restaurant(get_batch_results(batch["output_file_id"])))
+        restaurant_keys = [key for entry in entries for key in entry["keys"] if key not in saved]
+        if saved:
+            logger.info(f"이미 저장한 식당 {len(saved)}곳을 건너뜁니다")
+        workers = max(1, min(COALESCE_READ_WORKERS, len(restaurant_keys)))
+
+        # 3. 식당별 카테고리를 읽고, 결과가 없거나 실패한 키워드는 모아서 한 번에 다시 요청
+        def load(restaurant_key):
+            reviews = get_categories_from_s3(restaurant_key)
+            failed = find_failed_embeddings(reviews, results_by_key.get(restaurant_key, []), restaurant_key)
+            return restaurant_key, reviews, failed
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            loaded = list(executor.map(load, restaurant_keys))
+        failed_by_key = {key: failed for key, _, failed in loaded if failed}
+        if failed_by_key:
+            for key, retried in retry_failed_embeddings(failed_by_key, plan_name).items():
+                results_by_key[key] = results_by_key.get(key, []) + retried
+
+        # 4. 식당별로 임베딩을 매핑해 최종 파일 저장
+        def map_and_save(item):
+            restaurant_key, reviews, _ = item
+            reviews = map_embeddings_to_reviews(reviews, results_by_key.get(restaurant_key, []))
+            save_final_results_to_s3(reviews, restaurant_key)
+            checkpoint.record("restaurants_saved", restaurant_key, len(reviews), SAVE_CHECKPOINT_INTERVAL_SECONDS)
+            return len(reviews)
+
+        with span("map_results") as metric:
+            try:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    processed_count = sum(executor.map(map_and_save, loaded))
+            finally:
+                # 일부 식당에서 실패해도 저장을 마친 식당은 체크포인트에 남김
+                checkpoint.flush()
+            metric.add_rows(processed_count)
+        processed_count += sum(saved.values())
+        restaurant_count = len(restaurant_keys) + len(saved)
+
+        logger.info(f"=== 식당 {restaurant_count}곳, 리뷰 {processed_count}개 처리 완료 ===")
+        body = {
+            "message": "All processing completed successfully",
+            "processed_count": processed_count,
+            "restaurant_count": restaurant_count,
+        }
+        checkpoint.complete("completed", body)
+        return {"statusCode": 200, "body": body}
+    except Exception as e:
+        logger.error("처리 중 오류가 발생했습니다")
+        logger.error(f"오류 내용: {str(e)}")
+        raise Exception(f"Failed to save coalesced embedding: {str(e)}")
+
+
+def retrieve_batch(batch_id: str) -> Dict[str, Any]:
+    """배치 상태 조회"""
+    import urllib.request
+    import urllib.error
+
+    # urllib로 배치 상태 확인
+    req = urllib.request.Request(
+        f"https://api.openai.com/v1/batches/{batch_id}",
+        headers={"Authorization": f"Bearer {OPENAI_API_KEY}"},
+    )
+
+    try:
+        with span("openai_batch_status") as metric, urllib.request.urlopen(req) as response:
+            batch = json.loads(response.read().decode())
+            metric.set_property("batchStatus", batch["status"])
+            return batch
+    except urllib.error.HTTPError as e:
+        raise Exception(f"Batch retrieve failed: {e.read().decode()}")
+
+
+def pending_response(batches: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """진행 중인 배치가 있으면 가장 이른 다음 조회 시간을 담은 202 응답을, 실패한 배치가 있으면 예외를 냅니다."""
+    pending = [batch for batch in batches if batch["status"] in PENDING_STATUSES]
+    if pending:
+        logger.info(f"배치 {len(pending)}/{len(batches)}개가 아직 완료되지 않았습니다")
+        return {
+            "statusCode": 202,
+            "body": {
+                "error": "Batch not completed",
+                "batch_id": pending[0]["id"],
+                "status": pending[0]["status"],
+                "pending_count": len(pending),
+                "next_poll_seconds": min(next_poll_seconds(batch) for batch in pending),
+            },
+        }
+    failed = [batch for batch in batches if batch["status"] != "completed"]
+    if failed:
+        raise Exception(f"Batch failed: {failed[0]}")
+    return None
+
+
 def get_batch_results(output_file_id: str) -> List[Dict[str, Any]]:
     """배치 결과 파일 가져오기"""
+    import urllib.request
+
     try:
         # urllib로 파일 내용 가져오기
         req = urllib.request.Request(
@@ -122,14 +287,17 @@ def get_batch_results(output_file_id: str) -> List[Dict[str, Any]]:
             headers={"Authorization": f"Bearer {OPENAI_API_KEY}"},
         )
 
-        with urllib.request.urlopen(req) as response:
-            file_content = response.read().decode()
+        with span("openai_results_download") as metric:
+            with urllib.request.urlopen(req) as response:
+                file_content = response.read().decode()
+            metric.add_bytes(len(file_content))
 
-        # JSONL 파싱
-        results = []
-        for line in file_content.split("\n"):
-            if line.strip():
-                results.append(json.loads(line))
+            # JSONL 파싱
+            results = []
+            for line in file_content.split("\n"):
+                if line.strip():
+                    results.append(json.loads(line))
+            metric.add_rows(len(results))
 
         return results
     except Exception as e:
@@ -137,20 +305,92 @@ def get_batch_results(output_file_id: str) -> List[Dict[str, Any]]:
 
 
 def get_categories_from_s3(category_s3_key: str) -> List[Dict[str, Any]]:
-    s3_key = f"{CATEGORY_BUCKET_DIRECTORY}/{category_s3_key}.json"
-    """S3에서 카테고리 데이터를 가져오는 함수"""
+    """S3에서 카테고리 데이터를 가져오는 함수 (.jsonl.gz 우선, 기존 .json도 지원)"""
     try:
-        response = s3_client.get_object(
-            Bucket=S3_BUCKET_NAME,
-            Key=s3_key,
+        # create-embedding-batch는 .jsonl.gz로 저장하므로 보통 첫 GET에서 읽음
+        _, reviews = read_artifact_with_fallback(
+            get_client("s3"), S3_BUCKET_NAME, f"{CATEGORY_BUCKET_DIRECTORY}/{category_s3_key}"
         )
-        content = response["Body"].read().decode("utf-8")
-        reviews = json.loads(content)
         return reviews
     except Exception as e:
         raise Exception(f"Failed to get categories from S3: {str(e)}")
 
 
+def find_failed_embeddings(
+    reviews: List[Dict[str, Any]], embedding_results: List[Dict[str, Any]], restaurant_key: str
+) -> List[Dict[str, Any]]:
+    """
+    create-embedding-batch가 요청했을 키워드(빈 값이 아닌 카테고리) 중 200 결과가 없는 것을 찾습니다.
+    반환: [{"custom_id", "input", "error"}, ...] (결과 파일에 아예 없으면 error는 MISSING_RESULT)
+    """
+    succeeded = set()
+    errors = {}
+    for result in embedding_results:
+        _, review_id, category = parse_custom_id(result["custom_id"], with_category=True)
+        error = result_error(result)
+        if error:
+            errors[(review_id, category)] = error
+        else:
+            succeeded.add((review_id, category))
+
+    failed = []
+    for index, review in enumerate(reviews):
+        review_id = str(review["id"])
+        for category, keyword in (review.get("categories") or {}).items():
+            if keyword and (review_id, category) not in succeeded:
+                failed.append(
+                    {
+                        "custom_id": encode_custom_id(restaurant_key, review_id, category, index),
+                        "input": keyword,
+                        "error": errors.get((review_id, category), MISSING_RESULT),
+                    }
+                )
+    return failed
+
+
+def retry_failed_embeddings(
+    failed_by_key: Dict[str, List[Dict[str, Any]]], source_name: str
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    실패한 키워드를 임베딩 API로 바로 다시 요청해 식당 키별 결과(배치 결과 형식)를 반환합니다.
+    SYNC_RETRY_MAX_ITEMS개를 넘으면 다시 요청하지 않습니다. 끝내 실패한 키워드는 빈 임베딩으로 두고
+    실패 보고({EMBEDDING_BUCKET_DIRECTORY}/failures/{source_name}.json)를 남깁니다.
+    """
+    items = [item for failed in failed_by_key.values() for item in failed]
+    if len(items) > SYNC_RETRY_MAX_ITEMS:
+        logger.warning(f"실패한 임베딩 {len(items)}개가 재시도 한도({SYNC_RETRY_MAX_ITEMS})를 넘어 다시 요청하지 않습니다")
+        results = []
+        failures = [{"custom_id": item["custom_id"], "error": item["error"]} for item in items]
+    else:
+        logger.info(f"결과가 없거나 실패한 임베딩 {len(items)}개를 다시 요청합니다")
+        with span("openai_embedding_retry") as metric:
+            results, failures = embed_sync(
+                [(item["custom_id"], item["input"]) for item in items],
+                OPENAI_API_KEY, EMBEDDING_MODEL, EMBEDDING_DIMENSIONS,
+            )
+            metric.add_rows(len(items))
+
+    emit(
+        "batch_retry",
+        {
+            "FailedItems": len(items),
+            "RecoveredItems": len(results),
+            "UnrecoveredItems": len(failures),
+        },
+        {"stage": "embedding", "source": source_name},
+    )
+    if failures:
+        report_key = write_failure_report(
+            get_client("s3"), S3_BUCKET_NAME, f"{EMBEDDING_BUCKET_DIRECTORY}/failures/{source_name}.json",
+            "embedding", source_name, failures,
+        )
+        logger.warning(
+            f"임베딩 {len(failures)}개는 다시 요청해도 실패해 빈 임베딩으로 저장합니다: "
+            f"s3://{S3_BUCKET_NAME}/{report_key}"
+        )
+    return group_results_by_restaurant(results)
+
+
 def map_embeddings_to_reviews(
     reviews: List[Dict[str, Any]], embedding_results: List[Dict[str, Any]]
 ) -> List[Dict[str, Any]]:
@@ -159,8 +399,7 @@ def map_embeddings_to_reviews(
     embeddings_by_id = {}
     for result in embedding_results:
         if result["response"]["status_code"] == 200:
-            custom_id = result["custom_id"]
-            review_id, category, _ = custom_id.rsplit("_", 2)
+            _, review_id, category = parse_custom_id(result["custom_id"], with_category=True)
 
             if review_id not in embeddings_by_id:
                 embeddings_by_id[review_id] = {}
@@ -168,19 +407,22 @@ def map_embeddings_to_reviews(
             embedding_data = result["response"]["body"]["data"][0]["embedding"]
             embeddings_by_id[review_id][category] = embedding_data
 
-    # 리뷰에 임베딩 추가
+    # 리뷰에 임베딩과 2단계 검색용 128차원 사본 추가
     for review in reviews:
         review_id = review["id"]
         if review_id in embeddings_by_id:
             review["embeddings"] = embeddings_by_id[review_id]
         else:
             review["embeddings"] = {}
+        review["prefilterEmbeddings"] = prefilter_embeddings(review["embeddings"])
 
     return reviews
 
 
 def save_final_results_to_s3(reviews: List[Dict[str, Any]], s3_key: str) -> str:
     """처리된 최종 결과를 S3에 저장"""
+    import gzip
+
     try:
         result_key = f"{EMBEDDING_BUCKET_DIRECTORY}/{s3_key}.json.gz"
 
@@ -199,13 +441,16 @@ def save_final_results_to_s3(reviews: List[Dict[str, Any]], s3_key: str) -> str:
 
         # 3. S3에 업로드
         logger.info("S3에 업로드 중...")
-        s3_client.put_object(
-            Bucket=S3_BUCKET_NAME,
-            Key=result_key,
-            Body=compressed_content,
-            ContentType="application/json",
-            ContentEncoding="gzip",
-        )
+        with span("s3_write", s3Key=result_key) as metric:
+            get_client("s3").put_object(
+                Bucket=S3_BUCKET_NAME,
+                Key=result_key,
+                Body=compressed_content,
+                ContentType="application/json",
+                ContentEncoding="gzip",
+            )
+            metric.add_bytes(len(compressed_content))
+            metric.add_rows(len(reviews))
 
         logger.info(f"✓ 최종 파일 업로드 완료: s3://{S3_BUCKET_NAME}/{result_key}")
         logger.info("=== 파일 저장 프로세스 완료 ===")
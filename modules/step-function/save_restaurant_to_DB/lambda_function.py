@@ -1,16 +1,36 @@
 import json
-import boto3
 import os
-import pymysql
-import pg8000
 from urllib.parse import unquote_plus
-import uuid
-
-s3_client = boto3.client("s3")
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pipeline_common.geo_cell import geo_cell
+from pipeline_common.restaurant_identity import restaurant_id_for
+from pipeline_common.metrics import emit, span
+from pipeline_common.s3_reader import read_object
+from pipeline_common.recommend_writer import RecommendWriter
+from pipeline_common.place_manifest import (
+    extract_place_ids,
+    manifest_key,
+    manifest_name,
+    merge_place_ids,
+    output_mode,
+    write_place_manifest,
+)
+from pipeline_common.aws_clients import get_client
+
+
+# multi-row INSERT 한 번에 담을 행 수
+DB_WRITE_CHUNK_SIZE = int(os.environ.get("DB_WRITE_CHUNK_SIZE", "500"))
+# 여러 검색어 파일을 동시에 읽을 최대 스레드 수
+READ_MAX_WORKERS = int(os.environ.get("READ_MAX_WORKERS", "8"))
+# 커밋 순서. 이미 저장된 식당을 거르는 기준(restaurant_vector)이 있는 recommend를 마지막에 커밋
+COMMIT_ORDER = ("restaurant", "recommend")
 
 
 def get_restaurant_db_connection():
     """restaurant 데이터베이스 연결을 생성합니다. (MySQL)"""
+    import pymysql
+
     return pymysql.connect(
         host=os.environ.get("RESTAURANT_DB_HOST"),
         user=os.environ.get("RESTAURANT_DB_USER"),
@@ -23,6 +43,8 @@ def get_restaurant_db_connection():
 
 def get_recommend_db_connection():
     """recommend 데이터베이스 연결을 생성합니다. (PostgreSQL with pg8000)"""
+    import pg8000
+
     return pg8000.connect(
         host=os.environ.get("RECOMMEND_DB_HOST"),
         user=os.environ.get("RECOMMEND_DB_USER"),
@@ -32,142 +54,367 @@ def get_recommend_db_connection():
     )
 
 
-def save_restaurants_to_db(restaurants_data):
-    """식당 데이터를 두 개의 DB에 저장합니다."""
-    restaurant_connection = None
-    recommend_connection = None
-    restaurant_cursor = None
-    recommend_cursor = None
-    saved_count = 0
+def chunked(rows, size):
+    """rows를 size 단위로 나눕니다."""
+    for start in range(0, len(rows), size):
+        yield rows[start : start + size]
 
+
+def find_existing_place_ids(connection, place_ids):
+    """restaurant_vector에 이미 저장된 placeId를 한 번의 조회로 찾습니다."""
+    if not place_ids:
+        return set()
+    cursor = connection.cursor()
     try:
-        restaurant_connection = get_restaurant_db_connection()
-        recommend_connection = get_recommend_db_connection()
-        restaurant_cursor = restaurant_connection.cursor()
-        recommend_cursor = recommend_connection.cursor()
-
-        # 각 식당 데이터를 DB에 저장
-        for restaurant in restaurants_data:
-            # 각 restaurant마다 새로운 UUID 생성
-            restaurant_id = str(uuid.uuid4())
-
-            place_id = restaurant.get("placeId")
-            name = restaurant.get("name")
-            address = restaurant.get("address")
-            latitude = restaurant.get("latitude") or 0.0
-            longitude = restaurant.get("longitude") or 0.0
-            thumbnail = restaurant.get("thumbnail") or ""
+        cursor.execute(
+            "SELECT place_id FROM restaurant_vector WHERE place_id = ANY(%s)",
+            (list(place_ids),),
+        )
+        return {row[0] for row in cursor.fetchall()}
+    finally:
+        cursor.close()
 
-            try:
-                # Restaurant DB에 저장 (MySQL)
-                restaurant_insert_query = """
-                    INSERT IGNORE INTO restaurant (
-                        id, name, address, latitude, longitude, thumbnail
-                    ) VALUES (%s, %s, %s, %s, %s, %s)
-                """
-
-                restaurant_cursor.execute(
-                    restaurant_insert_query,
-                    (
-                        restaurant_id,
-                        name,
-                        address,
-                        latitude,
-                        longitude,
-                        thumbnail,
-                    ),
-                )
 
-                # Recommend DB에 저장 (PostgreSQL with pg8000)
-                # pg8000은 %s 대신 숫자 플레이스홀더 사용
-                recommend_insert_query = """
-                    INSERT INTO restaurant_vector (
-                        restaurant_id, place_id, latitude, longitude
-                    ) VALUES (%s, %s, %s, %s)
-                    ON CONFLICT (place_id) DO NOTHING
-                """
-
-                recommend_cursor.execute(
-                    recommend_insert_query,
-                    (
-                        restaurant_id,
-                        place_id,
-                        latitude,
-                        longitude,
-                    ),
-                )
+def find_reviewed_place_ids(connection, place_ids):
+    """
+    이미 저장된 placeId 중 리뷰까지 저장된(crawling_review가 있는) placeId를 한 번의 조회로 찾습니다.
+    식당만 저장되고 리뷰 처리 전에 실행이 실패한 placeId는 빠지므로 재실행 때 다시 처리됩니다.
+    """
+    if not place_ids:
+        return set()
+    cursor = connection.cursor()
+    try:
+        cursor.execute(
+            """
+            SELECT place_id FROM restaurant_vector WHERE place_id = ANY(%s)
+            AND EXISTS (
+                SELECT 1 FROM crawling_review WHERE crawling_review.restaurant_id = restaurant_vector.id
+            )
+            """,
+            (list(place_ids),),
+        )
+        return {row[0] for row in cursor.fetchall()}
+    finally:
+        cursor.close()
 
-                saved_count += 1
 
-            except Exception as e:
-                print(f"Error saving restaurant {place_id}: {str(e)}")
-                continue
+def build_restaurant_rows(restaurants_data, existing_place_ids):
+    """
+    식당 데이터를 MySQL용, PostgreSQL용 행 목록으로 변환합니다.
+    이미 저장된 placeId와 파일 안에서 중복된 placeId는 건너뜁니다.
+    """
+    restaurant_rows = []
+    recommend_rows = []
+    invalid_location_count = 0
+    seen_place_ids = set(existing_place_ids)
+
+    for restaurant in restaurants_data:
+        place_id = restaurant.get("placeId")
+        if not place_id:
+            print(f"No placeId for restaurant {restaurant.get('name')}, skipping")
+            continue
+        if place_id in seen_place_ids:
+            continue
+        seen_place_ids.add(place_id)
+
+        # placeId 기반 결정적 UUID (재처리 시에도 같은 id)
+        restaurant_id = restaurant_id_for(place_id)
+
+        name = restaurant.get("name")
+        address = restaurant.get("address")
+        latitude = restaurant.get("latitude") or 0.0
+        longitude = restaurant.get("longitude") or 0.0
+        thumbnail = restaurant.get("thumbnail") or ""
+
+        # 좌표가 없거나 0.0/0.0이면 geohash를 NULL로 저장해 지리 필터에서 제외
+        geohash = geo_cell(latitude, longitude)
+        if geohash is None:
+            invalid_location_count += 1
+            print(f"Invalid location for restaurant {place_id}: ({latitude}, {longitude})")
+
+        restaurant_rows.append(
+            (restaurant_id, name, address, latitude, longitude, thumbnail)
+        )
+        recommend_rows.append(
+            {
+                "restaurant_id": restaurant_id,
+                "place_id": place_id,
+                "latitude": latitude,
+                "longitude": longitude,
+                "geohash": geohash,
+            }
+        )
+
+    if invalid_location_count:
+        print(f"Flagged {invalid_location_count} restaurants with invalid location")
+
+    return restaurant_rows, recommend_rows
+
+
+def insert_restaurant_rows(connection, rows):
+    """Restaurant DB(MySQL)에 multi-row INSERT IGNORE로 저장하고 실제 삽입된 행 수를 반환합니다."""
+    cursor = connection.cursor()
+    inserted_count = 0
+    try:
+        for chunk in chunked(rows, DB_WRITE_CHUNK_SIZE):
+            placeholders = ", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(chunk))
+            cursor.execute(
+                f"""
+                INSERT IGNORE INTO restaurant (
+                    id, name, address, latitude, longitude, thumbnail
+                ) VALUES {placeholders}
+                """,
+                [value for row in chunk for value in row],
+            )
+            inserted_count += cursor.rowcount
+    finally:
+        cursor.close()
+    return inserted_count
 
-        # 변경사항 커밋
-        restaurant_connection.commit()
-        recommend_connection.commit()
-        print(f"Successfully saved {saved_count} restaurants to both databases")
 
-    except Exception as e:
-        print(f"Database error: {str(e)}")
-        if restaurant_connection:
-            restaurant_connection.rollback()
-        if recommend_connection:
-            recommend_connection.rollback()
-        raise e
+def insert_recommend_rows(connection, rows):
+    """Recommend DB(PostgreSQL)에 공용 writer로 저장하고 실제 삽입된 행 수를 반환합니다."""
+    writer = RecommendWriter(connection, "pg8000", {"restaurant_vector": DB_WRITE_CHUNK_SIZE})
+    return writer.insert_restaurant_vectors(rows)
+
+
+def run_db_writer(get_connection, insert_rows, rows):
+    """
+    하나의 DB에 연결해 행을 쓰고, 커밋하지 않은 연결과 소요 시간을 반환합니다.
+    실패하면 자신의 트랜잭션을 롤백하고 예외를 그대로 올립니다.
+    """
+    started_at = time.perf_counter()
+    connection = get_connection()
+    connected_at = time.perf_counter()
+    try:
+        inserted_count = insert_rows(connection, rows)
+    except Exception:
+        connection.rollback()
+        connection.close()
+        raise
+
+    return {
+        "connection": connection,
+        "inserted_count": inserted_count,
+        "connect_seconds": connected_at - started_at,
+        "write_seconds": time.perf_counter() - connected_at,
+    }
+
+
+def save_restaurants_to_db(restaurants_data):
+    """
+    식당 데이터를 두 개의 DB에 저장합니다.
+    반환: (recommend DB에 실제 삽입된 식당 수, 리뷰까지 저장되어 다시 처리할 필요가 없는 placeId 집합)
+    MySQL과 PostgreSQL writer를 별도 스레드에서 동시에 실행하고,
+    둘 다 성공했을 때만 커밋합니다. 쓰기 중 하나라도 실패하면 양쪽 모두 롤백합니다.
+
+    두 DB를 묶는 분산 트랜잭션은 없어서 커밋 사이에 실패하면 앞쪽 커밋만 남습니다.
+    그래서 COMMIT_ORDER대로 MySQL을 먼저, 저장 여부 판단 기준인 recommend를 마지막에 커밋합니다.
+    recommend 커밋이 실패하면 재시도에서 그 식당들은 아직 저장되지 않은 것으로 보이고,
+    양쪽 INSERT가 모두 중복을 무시하므로(INSERT IGNORE / ON CONFLICT DO NOTHING) 다시 실행해도 안전합니다.
+    반대 순서였다면 MySQL 행 없이 restaurant_vector만 남아 재시도에서도 건너뛰게 됩니다.
+    """
+    # 이미 저장된 식당은 INSERT 전에 한 번의 조회로 걸러냄
+    recommend_connection = get_recommend_db_connection()
+    try:
+        existing_place_ids = find_existing_place_ids(
+            recommend_connection,
+            {r.get("placeId") for r in restaurants_data if r.get("placeId")},
+        )
+        reviewed_place_ids = find_reviewed_place_ids(recommend_connection, existing_place_ids)
+    except Exception:
+        recommend_connection.close()
+        raise
+    print(
+        f"Skipping {len(existing_place_ids)} restaurants already saved "
+        f"({len(reviewed_place_ids)} with reviews)"
+    )
+
+    restaurant_rows, recommend_rows = build_restaurant_rows(
+        restaurants_data, existing_place_ids
+    )
+    if not restaurant_rows:
+        recommend_connection.close()
+        return 0, reviewed_place_ids
+
+    writers = {
+        "restaurant": (get_restaurant_db_connection, insert_restaurant_rows, restaurant_rows),
+        "recommend": (lambda: recommend_connection, insert_recommend_rows, recommend_rows),
+    }
+
+    results = {}
+    errors = {}
+    with ThreadPoolExecutor(max_workers=len(writers)) as executor:
+        futures = {
+            name: executor.submit(run_db_writer, *writer) for name, writer in writers.items()
+        }
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                errors[name] = e
+
+    try:
+        if errors:
+            for name, e in errors.items():
+                print(f"Database error ({name}): {str(e)}")
+            for result in results.values():
+                result["connection"].rollback()
+            raise next(iter(errors.values()))
+
+        # 두 writer가 모두 성공한 뒤에만 COMMIT_ORDER대로 커밋
+        committed = []
+        for name in COMMIT_ORDER:
+            result = results[name]
+            started_at = time.perf_counter()
+            try:
+                result["connection"].commit()
+            except Exception as e:
+                # 어느 쪽이 커밋되었는지 남기고 예외를 올려 Step Functions 재시도로 나머지를 채움
+                print(
+                    f"Commit failed ({name}) after committing {committed or 'nothing'}: {str(e)}. "
+                    f"Retry re-inserts {len(writers[name][2])} rows idempotently"
+                )
+                raise
+            result["commit_seconds"] = time.perf_counter() - started_at
+            committed.append(name)
 
     finally:
-        if restaurant_cursor:
-            restaurant_cursor.close()
-        if recommend_cursor:
-            recommend_cursor.close()
-        if restaurant_connection:
-            restaurant_connection.close()
-        if recommend_connection:
-            recommend_connection.close()
+        for result in results.values():
+            result["connection"].close()
+
+    for name, result in results.items():
+        print(
+            f"[{name}] inserted {result['inserted_count']}/{len(writers[name][2])} rows, "
+            f"connect {result['connect_seconds']:.3f}s, write {result['write_seconds']:.3f}s, "
+            f"commit {result['commit_seconds']:.3f}s"
+        )
+        emit(
+            f"db_write_{name}",
+            {
+                "Duration": round(result["write_seconds"] * 1000, 3),
+                "ConnectDuration": round(result["connect_seconds"] * 1000, 3),
+                "CommitDuration": round(result["commit_seconds"] * 1000, 3),
+                "Rows": result["inserted_count"],
+            },
+        )
+
+    saved_count = results["recommend"]["inserted_count"]
+    print(
+        f"Successfully saved {saved_count} restaurants to both databases "
+        f"(restaurant DB inserted {results['restaurant']['inserted_count']})"
+    )
+    return saved_count, reviewed_place_ids
+
 
-    return saved_count
+def read_restaurants(s3_bucket_name, restaurant_bucket_directory, query):
+    """검색어 하나의 식당 파일을 읽어 식당 목록을 반환합니다."""
+    # 파일 키 생성 (query 기반) - URL encoding 적용
+    file_key = f"{restaurant_bucket_directory}/{unquote_plus(query)}.json"
+
+    with span("s3_read", s3Key=file_key) as metric:
+        body = read_object(get_client("s3"), s3_bucket_name, file_key)
+        metric.add_bytes(len(body))
+    with span("json_parse") as metric:
+        restaurants_data = json.loads(body.decode("utf-8"))
+        metric.add_rows(len(restaurants_data))
+
+    # 데이터가 리스트인지 확인
+    if not isinstance(restaurants_data, list):
+        raise ValueError(f"Expected list of restaurants for {query} but got different data type")
+    return restaurants_data
+
+
+def search_queries(event):
+    """SEARCH_QUERIES(여러 검색어)가 있으면 중복을 뺀 목록을, 없으면 SEARCH_QUERY 하나를 목록으로 반환합니다."""
+    if "SEARCH_QUERIES" not in event:
+        return [event.get("SEARCH_QUERY", "공덕역 식당")]
+    queries = event["SEARCH_QUERIES"]
+    if isinstance(queries, str):
+        queries = [queries]
+    # 같은 검색어가 두 번 들어와도 한 번만 읽음
+    queries = list(dict.fromkeys(queries))
+    if not queries:
+        raise ValueError("SEARCH_QUERIES is empty")
+    return queries
 
 
 def handler(event, context):
     """
     S3에서 식당 데이터를 읽어와서 DB에 저장하고 place_id 리스트를 추출
-    Input: {"SEARCH_QUERY": "강남역 맛집", "S3_DIRECTORY": "restaurants", "S3_BUCKET_NAME": "my-bucket"}
-    Output: {"placeIds": [{"placeId": "123"}, {"placeId": "124"}, ...]}
+    Input: {"SEARCH_QUERY": "강남역 맛집", "S3_DIRECTORY": "restaurants", "S3_BUCKET_NAME": "my-bucket",
+            "OUTPUT_MODE": "inline" | "manifest"}
+           또는 {"SEARCH_QUERIES": ["강남역 식당", "역삼역 식당"], ...}
+    Output (inline): {"placeIds": [{"placeId": "123"}, {"placeId": "124"}, ...]}
+    Output (manifest): {"manifestBucket": "my-bucket", "manifestKey": "manifest/강남역 맛집.jsonl", "placeCount": 2}
+    manifest 모드면 같은 파일을 다시 읽는 extract_place_ids 단계 없이 분산 Map이 manifest를 바로 읽습니다.
+    SEARCH_QUERIES면 검색어별 파일을 동시에 읽고 앞선 검색어 순서대로 placeId 중복을 제거해(merge_place_ids)
+    겹치는 식당의 크롤링/카테고리/임베딩을 한 번만 하며, overlapReport를 함께 반환합니다.
+    리뷰까지 저장된 식당은 placeId 목록에서 빼서 크롤링/카테고리/임베딩을 다시 하지 않습니다.
     """
-    query = event.get("SEARCH_QUERY", "공덕역 식당")
+    queries = search_queries(event)
+    multi_query = "SEARCH_QUERIES" in event
+    mode = output_mode(event)
     restaurant_bucket_directory = event.get("S3_DIRECTORY")
     s3_bucket_name = event.get("S3_BUCKET_NAME")
 
-    # 파일 키 생성 (query 기반) - URL encoding 적용
-    file_key = f"{restaurant_bucket_directory}/{unquote_plus(query)}.json"
-
     try:
-        # S3에서 파일 읽기
-        response = s3_client.get_object(Bucket=s3_bucket_name, Key=file_key)
-        restaurants_data = json.loads(response["Body"].read().decode("utf-8"))
-
-        # 데이터가 리스트인지 확인
-        if not isinstance(restaurants_data, list):
-            raise ValueError("Expected list of restaurants but got different data type")
+        # S3에서 검색어별 파일 읽기 (결과는 검색어 순서 유지)
+        with ThreadPoolExecutor(max_workers=max(1, min(READ_MAX_WORKERS, len(queries)))) as executor:
+            results = list(
+                executor.map(
+                    lambda query: (
+                        query,
+                        read_restaurants(s3_bucket_name, restaurant_bucket_directory, query),
+                    ),
+                    queries,
+                )
+            )
+        # 같은 placeId는 build_restaurant_rows에서 처음 나온 것만 저장
+        restaurants_data = [restaurant for _, restaurants in results for restaurant in restaurants]
 
         print(f"Found {len(restaurants_data)} restaurants in S3")
 
         # DB에 식당 데이터 저장
-        saved_count = save_restaurants_to_db(restaurants_data)
+        with span("db_write") as metric:
+            saved_count, reviewed_place_ids = save_restaurants_to_db(restaurants_data)
+            metric.add_rows(saved_count)
         print(f"Saved {saved_count} restaurants to database")
 
-        # place_id를 객체로 추출
-        place_ids = []
-        for restaurant in restaurants_data:
-            place_id = restaurant.get("placeId")
-            if place_id:
-                place_ids.append({"placeId": place_id})  # 객체로 변경
-
-        print(f"Extracted {len(place_ids)} place IDs")
-        print(place_ids)
-
-        return {"placeIds": place_ids, "query": query}
+        # 검색어 사이 중복을 뺀 place_id 객체 목록 (리뷰까지 저장된 식당 제외)
+        merged_place_ids, overlap_report = merge_place_ids(
+            [(query, extract_place_ids(restaurants)) for query, restaurants in results]
+        )
+        place_ids = [
+            item for item in merged_place_ids if item["placeId"] not in reviewed_place_ids
+        ]
+        print(f"Extracted {len(place_ids)} place IDs ({len(reviewed_place_ids)} already processed)")
+
+        output = {"query": queries[0]}
+        if multi_query:
+            output = {"queries": queries, "overlapReport": overlap_report}
+            emit(
+                "place_dedup",
+                {
+                    "Rows": overlap_report["uniquePlaceCount"],
+                    "DuplicatePlaces": overlap_report["avoidedPlaceCount"],
+                },
+            )
+            print(
+                f"Skipped {overlap_report['avoidedPlaceCount']}/{overlap_report['totalPlaceCount']} "
+                f"duplicate places across {len(queries)} queries: "
+                f"{json.dumps(overlap_report['queries'], ensure_ascii=False)}"
+            )
+
+        if mode == "inline":
+            return {"placeIds": place_ids, **output}
+
+        # 목록은 S3 manifest로 내보내고 상태에는 위치와 개수만 반환
+        name = manifest_name(queries)
+        with span("s3_write", s3Key=manifest_key(name)) as metric:
+            manifest = write_place_manifest(get_client("s3"), s3_bucket_name, name, place_ids)
+            metric.add_rows(manifest["placeCount"])
+        return {**manifest, **output}
 
     except Exception as e:
         print(f"Error: {str(e)}")
@@ -1,15 +1,23 @@
 import json
-import gzip
-import boto3
 import os
-import pg8000
 from urllib.parse import unquote_plus
+from pipeline_common.vector_index import prepare_bulk_load
+from pipeline_common.recommend_writer import RecommendWriter
+from pipeline_common.matryoshka import FACETS, truncate_normalize
+from pipeline_common.s3_reader import read_object
+from pipeline_common.metrics import span
+from pipeline_common.review_bloom import get_review_bloom, find_existing_hashes, record_bloom_metrics
+from pipeline_common.aws_clients import get_client
 
-s3_client = boto3.client("s3")
+
+# 리뷰 hash Bloom 필터를 저장하는 버킷
+S3_BUCKET_NAME = os.environ.get("S3_BUCKET_NAME")
 
 
 def get_recommend_db_connection():
     """recommend 데이터베이스 연결을 생성합니다. (PostgreSQL with pg8000)"""
+    import pg8000
+
     return pg8000.connect(
         host=os.environ.get("RECOMMEND_DB_HOST"),
         user=os.environ.get("RECOMMEND_DB_USER"),
@@ -19,107 +27,111 @@ def get_recommend_db_connection():
     )
 
 
+def get_restaurant_vector_ids(cursor, place_ids):
+    """place_id 목록에 해당하는 restaurant_vector id를 한 번의 조회로 가져옵니다."""
+    if not place_ids:
+        return {}
+    cursor.execute(
+        "SELECT place_id, id FROM restaurant_vector WHERE place_id = ANY(%s)", (place_ids,)
+    )
+    return {place_id: restaurant_vector_id for place_id, restaurant_vector_id in cursor.fetchall()}
+
+
 def save_reviews_to_db(reviews_data):
-    """크롤링 리뷰 데이터를 DB에 저장합니다."""
+    """
+    크롤링 리뷰 데이터를 DB에 저장합니다.
+    저장된 리뷰 수, restaurant_vector에 없어 건너뛴 placeId 목록, 중복 필터 통계를 반환합니다.
+    """
     connection = None
     cursor = None
     saved_count = 0
     skipped_count = 0
+    missing_place_ids = []
+    bloom_stats = {}
 
     try:
         connection = get_recommend_db_connection()
         cursor = connection.cursor()
 
+        # Bloom 필터로 이미 저장된 리뷰를 벡터와 함께 보내기 전에 걸러냄 (읽기 전용, 갱신은 예약 작업)
+        try:
+            bloom = get_review_bloom(get_client("s3"), S3_BUCKET_NAME)
+        except Exception as e:
+            print(f"Review bloom filter unavailable, checking all hashes in DB: {str(e)}")
+            bloom = None
+        existing_hashes, bloom_stats = find_existing_hashes(
+            cursor, bloom, [review.get("id") for review in reviews_data]
+        )
+
         # placeId별로 리뷰 그룹화
         reviews_by_place = {}
+        new_review_count = 0
         for review in reviews_data:
             place_id = review.get("placeId")
+            if review.get("id") in existing_hashes:
+                continue
             if place_id:
+                new_review_count += 1
                 if place_id not in reviews_by_place:
                     reviews_by_place[place_id] = []
                 reviews_by_place[place_id].append(review)
 
-        # 각 placeId별로 restaurant_id 조회 후 리뷰 저장
+        # 대량 적재면 벡터 인덱스를 트랜잭션 밖에서 내려둠 (재생성은 recommend-db-maintenance 예약 작업)
+        load_state = prepare_bulk_load(connection, "crawling_review", new_review_count)
+
+        # 모든 placeId의 restaurant_vector id를 한 번에 조회
+        restaurant_vector_ids = get_restaurant_vector_ids(cursor, list(reviews_by_place))
+        missing_place_ids = [
+            place_id for place_id in reviews_by_place if place_id not in restaurant_vector_ids
+        ]
+        if missing_place_ids:
+            missing_review_count = sum(
+                len(reviews_by_place[place_id]) for place_id in missing_place_ids
+            )
+            skipped_count += missing_review_count
+            print(
+                f"Restaurant not found for {len(missing_place_ids)} place_ids, "
+                f"skipping {missing_review_count} reviews: {missing_place_ids}"
+            )
+
+        # 저장할 리뷰 행을 모아 묶음 단위로 INSERT (벡터가 없으면 768차원 0 벡터)
+        review_rows = []
         for place_id, place_reviews in reviews_by_place.items():
-            try:
-                # restaurant_vector에서 해당 place_id의 id 조회
-                cursor.execute(
-                    "SELECT id FROM restaurant_vector WHERE place_id = %s", (place_id,)
-                )
-                result = cursor.fetchone()
-
-                if not result:
-                    print(
-                        f"Restaurant not found for place_id: {place_id}, skipping {len(place_reviews)} reviews"
-                    )
-                    skipped_count += len(place_reviews)
-                    continue
-
-                restaurant_vector_id = result[0]
-
-                # 해당 restaurant의 모든 리뷰 저장
-                for review in place_reviews:
-                    try:
-                        review_id = review.get("id")  # hash 값
-                        content = review.get("content", "")
-                        embeddings = review.get("embeddings", {})
-
-                        # 벡터 데이터 추출 (없으면 768차원 0 벡터)
-                        vibe_vector = embeddings.get("vibe", [0.0] * 768)
-                        food_vector = embeddings.get("food", [0.0] * 768)
-                        companion_vector = embeddings.get("companion", [0.0] * 768)
-                        purpose_vector = embeddings.get("purpose", [0.0] * 768)
-
-                        # 벡터를 PostgreSQL 형식 문자열로 변환
-                        vibe_vector_str = "[" + ",".join(map(str, vibe_vector)) + "]"
-                        food_vector_str = "[" + ",".join(map(str, food_vector)) + "]"
-                        companion_vector_str = (
-                            "[" + ",".join(map(str, companion_vector)) + "]"
-                        )
-                        purpose_vector_str = (
-                            "[" + ",".join(map(str, purpose_vector)) + "]"
-                        )
-
-                        # CrawlingReview 테이블에 저장
-                        insert_query = """
-                            INSERT INTO crawling_review (
-                                content, hash, restaurant_id,
-                                vibe_vector, food_vector, companion_vector, purpose_vector
-                            ) VALUES (
-                                %s, %s, %s,
-                                %s::vector, %s::vector, %s::vector, %s::vector
-                            )
-                            ON CONFLICT (hash) DO NOTHING
-                        """
-
-                        cursor.execute(
-                            insert_query,
-                            (
-                                content,
-                                review_id,
-                                restaurant_vector_id,
-                                vibe_vector_str,
-                                food_vector_str,
-                                companion_vector_str,
-                                purpose_vector_str,
-                            ),
-                        )
-
-                        saved_count += 1
-
-                    except Exception as e:
-                        print(f"Error saving review {review.get('id')}: {str(e)}")
-                        continue
-
-            except Exception as e:
-                print(f"Error processing place_id {place_id}: {str(e)}")
+            restaurant_vector_id = restaurant_vector_ids.get(place_id)
+            if restaurant_vector_id is None:
                 continue
+            for review in place_reviews:
+                embeddings = review.get("embeddings", {})
+                row = {
+                    "hash": review.get("id"),
+                    "content": review.get("content", ""),
+                    "restaurant_id": restaurant_vector_id,
+                    "vibe_vector": embeddings.get("vibe", [0.0] * 768),
+                    "food_vector": embeddings.get("food", [0.0] * 768),
+                    "companion_vector": embeddings.get("companion", [0.0] * 768),
+                    "purpose_vector": embeddings.get("purpose", [0.0] * 768),
+                }
+                # save-embedding이 만든 128차원 사본을 쓰고, 없는 facet(이전 형식 파일, 0 벡터)만 여기서 만듦
+                prefilter = review.get("prefilterEmbeddings") or {}
+                for facet in FACETS:
+                    vector = prefilter.get(facet)
+                    row[f"{facet}_prefilter_vector"] = (
+                        vector if vector else truncate_normalize(row[f"{facet}_vector"])
+                    )
+                review_rows.append(row)
+
+        writer = RecommendWriter(connection, "pg8000")
+        saved_count = writer.insert_reviews(review_rows)
+        # ON CONFLICT로 빠진 행(동시에 다른 실행이 저장한 리뷰)도 건너뛴 수에 포함
+        skipped_count += len(review_rows) - saved_count
 
         # 변경사항 커밋
         connection.commit()
         print(
             f"Successfully saved {saved_count} reviews, skipped {skipped_count} reviews"
         )
+        if load_state["dropped_indexes"]:
+            print(f"Vector indexes queued for rebuild: {', '.join(load_state['dropped_indexes'])}")
 
     except Exception as e:
         print(f"Database error: {str(e)}")
@@ -133,7 +145,7 @@ def save_reviews_to_db(reviews_data):
         if connection:
             connection.close()
 
-    return saved_count
+    return saved_count, missing_place_ids, bloom_stats
 
 
 def handler(event, context):
@@ -142,6 +154,8 @@ def handler(event, context):
     Input: {"SEARCH_QUERY": "강남역-reviews", "S3_DIRECTORY": "reviews", "S3_BUCKET_NAME": "my-bucket"}
     Output: {"reviewCount": 123, "query": "강남역-reviews"}
     """
+    import gzip
+
     query = event.get("SEARCH_QUERY", "공덕역-reviews")
     review_bucket_directory = event.get("S3_DIRECTORY")
     s3_bucket_name = event.get("S3_BUCKET_NAME")
@@ -153,12 +167,16 @@ def handler(event, context):
     try:
         # S3에서 압축 파일 읽기
         print(f"Reading file from S3: {file_key}")
-        response = s3_client.get_object(Bucket=s3_bucket_name, Key=file_key)
+        with span("s3_read", s3Key=file_key) as metric:
+            compressed_content = read_object(get_client("s3"), s3_bucket_name, file_key)
+            metric.add_bytes(len(compressed_content))
 
         # gzip 압축 해제
-        compressed_content = response["Body"].read()
-        decompressed_content = gzip.decompress(compressed_content)
-        reviews_data = json.loads(decompressed_content.decode("utf-8"))
+        with span("json_parse") as metric:
+            decompressed_content = gzip.decompress(compressed_content)
+            metric.add_bytes(len(decompressed_content))
+            reviews_data = json.loads(decompressed_content.decode("utf-8"))
+            metric.add_rows(len(reviews_data))
 
         # 데이터가 리스트인지 확인
         if not isinstance(reviews_data, list):
@@ -167,12 +185,17 @@ def handler(event, context):
         print(f"Found {len(reviews_data)} reviews in S3")
 
         # DB에 리뷰 데이터 저장
-        saved_count = save_reviews_to_db(reviews_data)
+        with span("db_write") as metric:
+            saved_count, missing_place_ids, bloom_stats = save_reviews_to_db(reviews_data)
+            metric.add_rows(saved_count)
+            record_bloom_metrics(metric, bloom_stats)
         print(f"Saved {saved_count} reviews to database")
 
         return {
             "reviewCount": saved_count,
             "totalReviews": len(reviews_data),
+            "missingPlaceIds": missing_place_ids,
+            "duplicateSkipped": bloom_stats.get("skipped", 0),
             "query": query,
         }
 